@@ -0,0 +1,51 @@
+"""Compares two benchmark runs of the same suite.
+
+    PYTHONPATH=src python -m benchmarks.compare base.json new.json
+
+Exits with code 1 if any result regressed by more than ``--threshold``.
+"""
+
+import argparse
+import sys
+
+from benchmarks import results
+
+
+def compare(base: results.Run, new: results.Run, threshold: float) -> int:
+    if base.suite != new.suite:
+        print(f"Suites differ: {base.suite} and {new.suite}")
+        return 2
+
+    print(f"suite {new.suite}: {base.commit} -> {new.commit}")
+    base_results = {result.name: result for result in base.results}
+    regressions = 0
+    width = max((len(r.name) for r in new.results), default=0)
+    for result in new.results:
+        previous = base_results.get(result.name)
+        if previous is None or previous.value == 0:
+            print(f"{result.name:<{width}}  {result.value:12.3f} {result.unit}  (new)")
+            continue
+
+        change = (result.value - previous.value) / previous.value
+        worse = -change if result.higher_is_better else change
+        mark = ""
+        if worse > threshold:
+            mark = "  REGRESSION"
+            regressions += 1
+        elif worse < -threshold:
+            mark = "  improvement"
+        print(
+            f"{result.name:<{width}}  {previous.value:12.3f} -> {result.value:12.3f}"
+            f" {result.unit:<6} {change:+8.1%}{mark}"
+        )
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+    sys.exit(compare(results.load(args.base), results.load(args.new), args.threshold))
@@ -0,0 +1,212 @@
+"""Fills users and authorizations with synthetic data.
+
+Every user gets a login history spread over the last ``--days`` days:
+most authorizations are logged out or expired, recent ones are still
+active. Generation is deterministic for a given seed. All users share
+the same password, so load tests are able to log in as any of them.
+
+    PYTHONPATH=src python -m benchmarks.datagen --dsn postgresql+pg8000://... \\
+        --users 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
+
+import sqlalchemy as sa
+
+from auth import domain
+from auth.adapter.repository import Authorization, User, UserStore
+from auth.domain import UserKind
+from auth.domain.service import hash_password
+from common.sharding import slot_of
+
+__all__ = ["DataSpec", "generate", "generate_store", "email_of"]
+
+PASSWORD = "password"
+
+FIRST_NAMES = ["John", "Jane", "Alex", "Maria", "Ivan", "Olga", "Sam", "Kate"]
+LAST_NAMES = ["Doe", "Smith", "Ivanov", "Petrova", "Brown", "Garcia", "Lee"]
+
+
+@dataclass(frozen=True)
+class DataSpec:
+    users: int = 10_000
+    # Mean number of logins per user, counts are exponentially distributed
+    logins: float = 8.0
+    days: int = 90
+    coach_share: float = 0.1
+    logout_share: float = 0.6
+    seed: int = 0
+    batch_size: int = 5_000
+
+
+def email_of(index: int) -> str:
+    return f"user{index}@bench.example.com"
+
+
+def generate(engine: sa.Engine, spec: DataSpec) -> tuple[int, int]:
+    """Inserts users and their authorizations, returns numbers of both."""
+    rng = random.Random(spec.seed)
+    now = datetime.now(timezone.utc)
+    users = authorizations = 0
+
+    for user_rows, auth_rows in _batches(rng, spec, now):
+        with engine.begin() as conn:
+            conn.execute(sa.insert(User), user_rows)
+            if auth_rows:
+                conn.execute(sa.insert(Authorization), auth_rows)
+        users += len(user_rows)
+        authorizations += len(auth_rows)
+
+    return users, authorizations
+
+
+def generate_store(store: UserStore, spec: DataSpec) -> tuple[int, int]:
+    """Fills store of the in-memory backend with the same data."""
+    rng = random.Random(spec.seed)
+    now = datetime.now(timezone.utc)
+    users = authorizations = 0
+
+    for user_rows, auth_rows in _batches(rng, spec, now):
+        by_user = dict[uuid.UUID, list[domain.Authorization]]()
+        for row in auth_rows:
+            logout_at = row["logout_at"]
+            by_user.setdefault(row["user_id"], []).append(
+                domain.Authorization(
+                    authorization_id=row["authorization_id"],
+                    active_until=row["active_until"],
+                    logout_at=logout_at.replace(tzinfo=timezone.utc)
+                    if logout_at
+                    else None,
+                    created_at=row["created_at"],
+                )
+            )
+
+        with store.lock:
+            for row in user_rows:
+                user = domain.User(
+                    kind=row["kind"],
+                    user_id=row["user_id"],
+                    email=row["email"],
+                    first_name=row["first_name"],
+                    last_name=row["last_name"],
+                    is_active=row["is_active"],
+                    password_hash=row["password_hash"],
+                    salt=row["salt"],
+                    authorizations=by_user.get(row["user_id"], []),
+                )
+                store.users[user.id] = user
+                store.by_email[user.email] = user.id
+                for auth in user.authorizations:
+                    if auth.logout_at is None:
+                        store.by_authorization[auth.authorization_id] = user.id
+        users += len(user_rows)
+        authorizations += len(auth_rows)
+
+    return users, authorizations
+
+
+def _batches(
+    rng: random.Random, spec: DataSpec, now: datetime
+) -> Iterator[tuple[list[dict], list[dict]]]:
+    user_rows, auth_rows = list[dict](), list[dict]()
+    for index in range(spec.users):
+        user_id = _uuid(rng)
+        # Salt is drawn from the seeded generator to keep data reproducible
+        salt = "%016x" % rng.getrandbits(64)
+        password_hash, _ = hash_password(PASSWORD, salt)
+        created_at = now - timedelta(days=spec.days, seconds=rng.random() * 86400)
+        user_rows.append(
+            {
+                "user_id": user_id,
+                "kind": UserKind.COACH
+                if rng.random() < spec.coach_share
+                else UserKind.TRAINEE,
+                "email": email_of(index),
+                "password_hash": password_hash,
+                "salt": salt,
+                "first_name": rng.choice(FIRST_NAMES),
+                "last_name": rng.choice(LAST_NAMES),
+                "is_active": True,
+                "failed_logins": 0,
+                "slot": slot_of(user_id),
+                "created_at": created_at,
+                "updated_at": created_at,
+            }
+        )
+        auth_rows.extend(_login_history(rng, spec, user_id, now))
+
+        if len(user_rows) >= spec.batch_size:
+            yield user_rows, auth_rows
+            user_rows, auth_rows = [], []
+
+    if user_rows:
+        yield user_rows, auth_rows
+
+
+def _login_history(
+    rng: random.Random, spec: DataSpec, user_id: uuid.UUID, now: datetime
+) -> Iterator[dict]:
+    logins = int(rng.expovariate(1 / spec.logins)) if spec.logins > 0 else 0
+    for _ in range(logins):
+        login_at = now - timedelta(seconds=rng.random() * spec.days * 86400)
+        logout_at = None
+        if rng.random() < spec.logout_share:
+            logout_at = login_at + timedelta(seconds=rng.expovariate(1 / 3600))
+        yield {
+            "authorization_id": _uuid(rng),
+            "user_id": user_id,
+            "active_until": login_at + timedelta(days=7),
+            # Column is timezone naive, see the initial migration
+            "logout_at": logout_at.replace(tzinfo=None) if logout_at else None,
+            "created_at": login_at,
+            "updated_at": logout_at or login_at,
+        }
+
+
+def _uuid(rng: random.Random) -> uuid.UUID:
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def main(args: argparse.Namespace) -> None:
+    engine = sa.create_engine(args.dsn)
+    if args.truncate:
+        with engine.begin() as conn:
+            conn.execute(sa.delete(Authorization))
+            conn.execute(sa.delete(User))
+
+    spec = DataSpec(
+        users=args.users,
+        logins=args.logins,
+        days=args.days,
+        seed=args.seed,
+        batch_size=args.batch_size,
+    )
+    start = time.perf_counter()
+    users, authorizations = generate(engine, spec)
+    elapsed = time.perf_counter() - start
+    print(
+        f"Inserted {users} users and {authorizations} authorizations"
+        f" in {elapsed:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dsn", required=True, help="SQLAlchemy URL of the database")
+    parser.add_argument("--users", type=int, default=DataSpec.users)
+    parser.add_argument("--logins", type=float, default=DataSpec.logins)
+    parser.add_argument("--days", type=int, default=DataSpec.days)
+    parser.add_argument("--seed", type=int, default=DataSpec.seed)
+    parser.add_argument("--batch-size", type=int, default=DataSpec.batch_size)
+    parser.add_argument(
+        "--truncate", action="store_true", help="Delete existing users first"
+    )
+    main(parser.parse_args())
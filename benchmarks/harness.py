@@ -0,0 +1,126 @@
+"""Runs the application in process for benchmarks.
+
+The application is built by ``init_app`` with the benchmarked engine
+and started through its own lifespan, which connects nowhere else. By
+default it is a SQLite file created from the models, a dockerless
+stand-in for Postgres. Pass a DSN of a migrated database to measure the
+real thing, or select the in-memory backend to leave the database out.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Iterable
+
+import sqlalchemy as sa
+from fastapi import FastAPI
+from starlette.types import Message, Scope
+
+from common.sql import Base
+from health.app import init_app
+from health.config import Config
+
+__all__ = [
+    "Response",
+    "build_config",
+    "create_engine",
+    "http_scope",
+    "request",
+    "running_app",
+]
+
+
+def build_config(**sections: dict) -> Config:
+    data = {
+        "db": {
+            "host": "localhost",
+            "database": "health",
+            "username": "health",
+            "password": "health",
+            "sslmode": "disable",
+        },
+        "app": {"secret": "benchmark"},
+        "log": {"level": "warning"},
+        "admission": {"enabled": False},
+        "rate_limit": {"enabled": False},
+    }
+    for name, values in sections.items():
+        data[name] = {**data.get(name, {}), **values}
+    return Config.model_validate(data)
+
+
+def create_engine(dsn: str | None, directory: str | Path, **options) -> sa.Engine:
+    if dsn is not None:
+        return sa.create_engine(dsn, **options)
+
+    engine = sa.create_engine(f"sqlite:///{Path(directory) / 'bench.db'}")
+    Base.metadata.create_all(engine)
+    return engine
+
+
+@contextlib.asynccontextmanager
+async def running_app(
+    dsn: str | None = None, cfg: Config | None = None
+) -> AsyncIterator[FastAPI]:
+    cfg = cfg or build_config()
+    if cfg.db.backend == "memory":
+        app = init_app(cfg)
+        async with app.router.lifespan_context(app):
+            yield app
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(dsn, tmp)
+        app = init_app(cfg, engine=engine)
+        async with app.router.lifespan_context(app):
+            yield app
+
+
+def http_scope(
+    method: str,
+    path: str,
+    query_string: bytes = b"",
+    headers: Iterable[tuple[bytes, bytes]] = (),
+) -> Scope:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string,
+        "root_path": "",
+        "headers": [(b"host", b"bench"), *headers],
+        "client": ("127.0.0.1", 1),
+        "server": ("bench", 80),
+    }
+
+
+@dataclass
+class Response:
+    status: int
+    body: bytes
+
+
+async def request(app: FastAPI, scope: Scope, body: bytes = b"") -> Response:
+    """Sends a single request to the application, bypassing the network."""
+    response = Response(status=0, body=b"")
+    chunks = list[bytes]()
+
+    async def receive() -> Message:
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message: Message) -> None:
+        if message["type"] == "http.response.start":
+            response.status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(dict(scope), receive, send)
+    response.body = b"".join(chunks)
+    return response
@@ -0,0 +1,172 @@
+"""Measures overhead of request instrumentation.
+
+End-to-end A/B runs of a threadpool backed endpoint are dominated by
+scheduling noise, so the cost is accounted piecewise instead:
+
+* middleware cost per request, against a bare ASGI app;
+* engine events cost per SQL statement, against an uninstrumented
+  connection;
+* latency and SQL statement count of a representative request,
+  ``GET /users/{user_id}`` of the application running on SQLite.
+
+SQLite is much faster than a round trip to Postgres, so the reported
+relative overhead is an upper bound for production. Pass ``--dsn`` to
+measure the request against a real database.
+
+    PYTHONPATH=src python -m benchmarks.instrumentation
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+from typing import Awaitable, Callable
+
+import sqlalchemy as sa
+from fastapi import FastAPI
+from sqlalchemy.orm import sessionmaker
+from starlette.types import Message, Receive, Scope, Send
+
+from auth.domain import UserKind
+from auth.service_layer import SQLUserUnitOfWork, auth
+from benchmarks.harness import http_scope, running_app
+from common import AbstractMessageBus
+from health.instrumentation import (
+    STATEMENT_LISTENERS,
+    InstrumentationMiddleware,
+    RequestStats,
+    current_request_stats,
+)
+
+
+def create_user(engine: sa.Engine) -> uuid.UUID:
+    user_id = uuid.uuid4()
+    uow = SQLUserUnitOfWork(AbstractMessageBus(), sessionmaker(engine))
+    auth.create_user(
+        uow,
+        user_id=user_id,
+        kind=UserKind.TRAINEE,
+        email=f"{user_id}@example.com",
+        password="password",
+        first_name="John",
+        last_name="Doe",
+    )
+    return user_id
+
+
+async def receive() -> Message:
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message: Message) -> None:
+    if message["type"] == "http.response.start" and message["status"] != 200:
+        raise RuntimeError(f"Unexpected status {message['status']}")
+
+
+async def bare_app(scope: Scope, receive: Receive, send: Send) -> None:
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def time_async(call: Callable[[], Awaitable[None]], number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        await call()
+    return (time.perf_counter() - start) / number
+
+
+def time_sync(call: Callable[[], None], number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        call()
+    return (time.perf_counter() - start) / number
+
+
+async def middleware_cost(args: argparse.Namespace) -> float:
+    instrumented = InstrumentationMiddleware(bare_app)
+    scope = http_scope("GET", "/")
+    base, instr = list[float](), list[float]()
+    for _ in range(args.rounds):
+        base.append(
+            await time_async(lambda: bare_app(scope, receive, send), args.number)
+        )
+        instr.append(
+            await time_async(lambda: instrumented(scope, receive, send), args.number)
+        )
+    return min(instr) - min(base)
+
+
+def statement_cost(args: argparse.Namespace) -> float:
+    engine = sa.create_engine("sqlite://")
+    query = sa.text("SELECT 1")
+    token = current_request_stats.set(RequestStats())
+    try:
+        with engine.connect() as conn:
+            base, instr = list[float](), list[float]()
+            for _ in range(args.rounds):
+                base.append(time_sync(lambda: conn.execute(query), args.number))
+                for name, listener in STATEMENT_LISTENERS.items():
+                    sa.event.listen(engine, name, listener)
+                instr.append(time_sync(lambda: conn.execute(query), args.number))
+                for name, listener in STATEMENT_LISTENERS.items():
+                    sa.event.remove(engine, name, listener)
+    finally:
+        current_request_stats.reset(token)
+    return min(instr) - min(base)
+
+
+async def request_latency(
+    app: FastAPI, path: str, args: argparse.Namespace
+) -> tuple[float, int]:
+    scope = http_scope("GET", path)
+    statements = 0
+
+    def count(*_) -> None:
+        nonlocal statements
+        statements += 1
+
+    sa.event.listen(app.engine, "after_cursor_execute", count)
+    await app(dict(scope), receive, send)
+    sa.event.remove(app.engine, "after_cursor_execute", count)
+
+    samples = list[float]()
+    for _ in range(args.rounds):
+        samples.append(
+            await time_async(lambda: app(dict(scope), receive, send), args.requests)
+        )
+    return statistics.median(samples), statements
+
+
+async def main(args: argparse.Namespace) -> int:
+    async with running_app(args.dsn) as app:
+        user_id = create_user(app.engine)
+        per_request = await middleware_cost(args)
+        per_statement = statement_cost(args)
+        latency, statements = await request_latency(app, f"/users/{user_id}", args)
+
+    cost = per_request + statements * per_statement
+    overhead = cost / latency
+    print(f"middleware:        {per_request * 1e6:8.2f} us/request")
+    print(f"engine events:     {per_statement * 1e6:8.2f} us/statement")
+    print(f"request latency:   {latency * 1e6:8.2f} us/request")
+    print(f"statements:        {statements:8d} per request")
+    print(f"overhead:          {cost * 1e6:8.2f} us/request ({overhead:.2%})")
+
+    if overhead > args.max_overhead:
+        print(f"FAIL: overhead is above {args.max_overhead:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--dsn", help="SQLAlchemy URL of a migrated database, defaults to SQLite"
+    )
+    parser.add_argument("--number", type=int, default=20_000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--max-overhead", type=float, default=0.02)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,259 @@
+"""In-process HTTP load test of the auth routes.
+
+Requests are sent straight to the ASGI application, which runs with its
+middleware, threadpool and database, but without the network and server
+in front of it. Each route is loaded by ``--concurrency`` clients for
+``--duration`` seconds, its p50/p99 latency and throughput are reported.
+
+The database is seeded by the data generator first. Without ``--dsn``
+a SQLite file is used instead of Postgres, ``--backend memory`` runs
+the in-memory repositories to separate framework cost from the database.
+
+    PYTHONPATH=src python -m benchmarks.load --users 10000 -o load.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import statistics
+import time
+import urllib.parse
+import uuid
+from dataclasses import dataclass
+from typing import Callable
+
+import sqlalchemy as sa
+from fastapi import FastAPI
+from starlette.types import Scope
+
+from auth.adapter.repository import User
+from benchmarks import datagen, results
+from benchmarks.harness import build_config, http_scope, request, running_app
+
+JSON = (b"content-type", b"application/json")
+FORM = (b"content-type", b"application/x-www-form-urlencoded")
+
+
+@dataclass
+class Fixture:
+    user_ids: list[uuid.UUID]
+    emails: list[str]
+    access_tokens: list[str]
+    refresh_tokens: list[str]
+
+
+@dataclass
+class Call:
+    scope: Scope
+    body: bytes
+    expected_status: int
+
+
+def _with_body(
+    method: str, path: str, body: bytes, content_type: tuple, expected_status: int
+) -> Call:
+    headers = [content_type, (b"content-length", str(len(body)).encode())]
+    return Call(http_scope(method, path, headers=headers), body, expected_status)
+
+
+def _bearer(token: str) -> tuple[bytes, bytes]:
+    return b"authorization", f"Bearer {token}".encode()
+
+
+def create_user(rng: random.Random, fixture: Fixture) -> Call:
+    user_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+    body = {
+        "kind": "trainee",
+        "email": f"{user_id}@load.example.com",
+        "first_name": "John",
+        "last_name": "Doe",
+        "password": datagen.PASSWORD,
+    }
+    return _with_body("POST", f"/users/{user_id}", json.dumps(body).encode(), JSON, 201)
+
+
+def get_user_by_id(rng: random.Random, fixture: Fixture) -> Call:
+    user_id = rng.choice(fixture.user_ids)
+    return Call(http_scope("GET", f"/users/{user_id}"), b"", 200)
+
+
+def get_current_user(rng: random.Random, fixture: Fixture) -> Call:
+    headers = [_bearer(rng.choice(fixture.access_tokens))]
+    return Call(http_scope("GET", "/users/", headers=headers), b"", 200)
+
+
+def list_sessions(rng: random.Random, fixture: Fixture) -> Call:
+    headers = [_bearer(rng.choice(fixture.access_tokens))]
+    return Call(http_scope("GET", "/users/sessions", headers=headers), b"", 200)
+
+
+def login(rng: random.Random, fixture: Fixture) -> Call:
+    form = {"username": rng.choice(fixture.emails), "password": datagen.PASSWORD}
+    body = urllib.parse.urlencode(form).encode()
+    return _with_body("POST", "/users/auth/login", body, FORM, 200)
+
+
+def refresh(rng: random.Random, fixture: Fixture) -> Call:
+    scope = http_scope(
+        "POST",
+        "/users/auth/refresh",
+        query_string=b"grant_type=refresh_token",
+        headers=[_bearer(rng.choice(fixture.refresh_tokens))],
+    )
+    return Call(scope, b"", 200)
+
+
+ROUTES: dict[str, Callable[[random.Random, Fixture], Call]] = {
+    "create_user": create_user,
+    "get_user_by_id": get_user_by_id,
+    "get_current_user": get_current_user,
+    "list_sessions": list_sessions,
+    "login": login,
+    "refresh": refresh,
+}
+
+
+async def prepare(app: FastAPI, args: argparse.Namespace) -> Fixture:
+    spec = datagen.DataSpec(users=args.users, seed=args.seed)
+    if args.backend == "memory":
+        datagen.generate_store(app.user_store, spec)
+        users = itertools.islice(app.user_store.users.values(), args.sample)
+        rows = [(user.id, user.email) for user in users]
+    else:
+        if not args.skip_datagen:
+            datagen.generate(app.engine, spec)
+        with app.engine.connect() as conn:
+            rows = conn.execute(
+                sa.select(User.user_id, User.email)
+                .where(User.email.like("%@bench.example.com"))
+                .limit(args.sample)
+            ).all()
+    if not rows:
+        raise RuntimeError(
+            "Database has no generated users, run without --skip-datagen"
+        )
+
+    fixture = Fixture([row[0] for row in rows], [row[1] for row in rows], [], [])
+    rng = random.Random(args.seed)
+    for email in fixture.emails[: args.sessions]:
+        call = login(rng, Fixture([], [email], [], []))
+        response = await request(app, call.scope, call.body)
+        if response.status != 200:
+            raise RuntimeError(f"Can't log in as {email}: {response.status}")
+        tokens = json.loads(response.body)
+        fixture.access_tokens.append(tokens["access_token"])
+        fixture.refresh_tokens.append(tokens["refresh_token"])
+    return fixture
+
+
+async def load_route(
+    app: FastAPI,
+    build: Callable[[random.Random, Fixture], Call],
+    fixture: Fixture,
+    args: argparse.Namespace,
+) -> tuple[list[float], int, float]:
+    latencies = list[float]()
+    errors = 0
+    # Seeded apart from the data generator, otherwise created ids collide
+    rng = random.Random(f"{build.__name__}:{args.seed}")
+
+    async def client(deadline: float, record: bool) -> None:
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            call = build(rng, fixture)
+            start = time.perf_counter()
+            try:
+                response = await request(app, call.scope, call.body)
+                ok = response.status == call.expected_status
+            except Exception:
+                # Unhandled errors are re-raised by the server error middleware
+                ok = False
+            if record:
+                latencies.append(time.perf_counter() - start)
+                errors += not ok
+
+    for duration, record in ((args.warmup, False), (args.duration, True)):
+        start = time.perf_counter()
+        async with asyncio.TaskGroup() as group:
+            for _ in range(args.concurrency):
+                group.create_task(client(start + duration, record))
+    elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def summarize(
+    route: str, latencies: list[float], errors: int, elapsed: float
+) -> list[results.Result]:
+    if len(latencies) < 2:
+        return []
+    percentiles = statistics.quantiles(latencies, n=100)
+    extra = {"requests": len(latencies), "errors": errors}
+    return [
+        results.Result(f"{route}.p50", "ms", percentiles[49] * 1e3, extra=extra),
+        results.Result(f"{route}.p99", "ms", percentiles[98] * 1e3, extra=extra),
+        results.Result(
+            f"{route}.throughput",
+            "req/s",
+            len(latencies) / elapsed,
+            higher_is_better=True,
+            extra=extra,
+        ),
+    ]
+
+
+async def main(args: argparse.Namespace) -> None:
+    routes = args.routes or list(ROUTES)
+    run_results = list[results.Result]()
+    backend = "memory" if args.backend == "memory" else "postgres"
+    cfg = build_config(db={"backend": backend})
+    async with running_app(args.dsn, cfg) as app:
+        fixture = await prepare(app, args)
+        for route in routes:
+            latencies, errors, elapsed = await load_route(
+                app, ROUTES[route], fixture, args
+            )
+            run_results.extend(summarize(route, latencies, errors, elapsed))
+
+    run = results.Run(
+        suite="load",
+        results=run_results,
+        params={
+            "backend": args.backend if args.dsn is None else "postgres",
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+        },
+    )
+    run.print()
+    if args.output:
+        results.save(run, args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--dsn", help="SQLAlchemy URL of a migrated database, defaults to SQLite"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["sqlite", "memory"],
+        default="sqlite",
+        help="Backend used without --dsn, memory leaves the database out",
+    )
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--skip-datagen", action="store_true", help="Use already generated data"
+    )
+    parser.add_argument("--sample", type=int, default=1000, help="Users to request")
+    parser.add_argument("--sessions", type=int, default=100, help="Logged in users")
+    parser.add_argument("--routes", nargs="*", choices=list(ROUTES))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=1.0)
+    parser.add_argument("-o", "--output", help="Write results as JSON")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,146 @@
+"""Microbenchmarks of the hot functions of the service.
+
+PYTHONPATH=src python -m benchmarks.micro -o micro.json
+"""
+
+import argparse
+import json
+import timeit
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from auth.adapter.api.models import UserGet
+from auth.adapter.repository import Authorization, User, UserRepository
+from auth.domain import UserKind
+from auth.domain.service import hash_password
+from auth.service_layer import auth
+from benchmarks import results
+from measurements.adapter.api.payloads import parse_ndjson
+from measurements.adapter.repository import _copy_text
+from measurements.domain import SampleSlice, SampleBatch, rollups, validate
+
+SECRET = "benchmark"
+
+
+def db_user(authorizations: int) -> User:
+    now = datetime.now(timezone.utc)
+    user_id = uuid.uuid4()
+    password_hash, salt = hash_password("password")
+    return User(
+        user_id=user_id,
+        kind=UserKind.TRAINEE,
+        email="johndoe@example.com",
+        password_hash=password_hash,
+        salt=salt,
+        first_name="John",
+        last_name="Doe",
+        is_active=True,
+        failed_logins=0,
+        locked_until=None,
+        authorizations=[
+            Authorization(
+                authorization_id=uuid.uuid4(),
+                active_until=now + timedelta(days=7),
+                logout_at=None,
+                user_id=user_id,
+            )
+            for _ in range(authorizations)
+        ],
+    )
+
+
+def ndjson_samples(count: int) -> bytes:
+    now = int(datetime.now(timezone.utc).timestamp() * 1000)
+    return "\n".join(
+        json.dumps({"kind": "heart_rate", "at": now - i * 1000, "value": 60 + i % 40})
+        for i in range(count)
+    ).encode()
+
+
+def day_slice(count: int, trainees: int = 1000) -> SampleSlice:
+    samples = SampleSlice(trainee_ids=[uuid.uuid4() for _ in range(trainees)])
+    for i in range(count):
+        samples.trainees.append(i % trainees)
+        samples.kinds.append(1 + i % 3)
+        samples.values.append(60 + i % 40)
+    return samples
+
+
+def cases(args: argparse.Namespace) -> dict[str, Callable[[], object]]:
+    repo = UserRepository(session=None)
+    model = db_user(args.authorizations)
+    user = repo._to_domain(model)
+    token = auth.issue_access_token(user, SECRET)
+    payload = ndjson_samples(args.samples)
+    now = datetime.now(timezone.utc)
+    samples = validate(parse_ndjson(payload), now).samples
+    batch = SampleBatch.new(uuid.uuid4(), uuid.uuid4(), samples)
+    day = day_slice(args.samples)
+
+    return {
+        "hash_password": lambda: hash_password("password"),
+        "issue_access_token": lambda: auth.issue_access_token(user, SECRET),
+        "validate_token": lambda: auth.validate_token(token, SECRET),
+        "UserRepository._to_domain": lambda: repo._to_domain(model),
+        "UserGet.from_domain": lambda: UserGet.from_domain(user),
+        "parse_ndjson+validate": lambda: validate(parse_ndjson(payload), now),
+        "SampleRepository._copy_text": lambda: _copy_text(batch),
+        "rollups.compute_days": lambda: rollups.compute_days(day, now.date()),
+    }
+
+
+def measure(call: Callable[[], object], repeat: int) -> tuple[float, float]:
+    timer = timeit.Timer(call)
+    number, _ = timer.autorange()
+    timings = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return min(timings), sorted(timings)[len(timings) // 2]
+
+
+def main(args: argparse.Namespace) -> None:
+    run_results = list[results.Result]()
+    for name, call in cases(args).items():
+        if args.filter and args.filter not in name:
+            continue
+        best, median = measure(call, args.repeat)
+        run_results.append(
+            results.Result(
+                name=name,
+                unit="us",
+                value=best * 1e6,
+                extra={"median_us": median * 1e6},
+            )
+        )
+
+    run = results.Run(
+        suite="micro",
+        results=run_results,
+        params={
+            "repeat": args.repeat,
+            "authorizations": args.authorizations,
+            "samples": args.samples,
+        },
+    )
+    run.print()
+    if args.output:
+        results.save(run, args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument(
+        "--authorizations",
+        type=int,
+        default=8,
+        help="Authorizations of the converted user",
+    )
+    parser.add_argument(
+        "--samples",
+        type=int,
+        default=1000,
+        help="Samples of the ingested measurement batch",
+    )
+    parser.add_argument("--filter", help="Run only benchmarks containing this")
+    parser.add_argument("-o", "--output", help="Write results as JSON")
+    main(parser.parse_args())
@@ -0,0 +1,168 @@
+"""Queries per second of UserRepository lookups.
+
+Repository statements are built once and executed with bound parameters.
+For comparison the same lookups are run with statements constructed on
+every call, as the repository did before. Server side prepared
+statements only apply to Postgres with the psycopg driver, pass a
+``postgresql+psycopg://`` DSN together with ``--prepare-threshold``.
+
+    PYTHONPATH=src python -m benchmarks.queries -o queries.json
+"""
+
+import argparse
+import random
+import tempfile
+import time
+import uuid
+from typing import Callable
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session, selectinload, sessionmaker
+
+from auth.adapter.repository import Authorization, User, UserRepository, one_or_none
+from benchmarks import datagen, results
+from benchmarks.harness import create_engine
+
+Lookup = Callable[[UserRepository, object], object]
+
+
+def adhoc_get(repo: UserRepository, user_id: uuid.UUID) -> object:
+    query = (
+        sa.select(User)
+        .where(User.user_id == user_id)
+        .options(selectinload(User.authorizations))
+    )
+    return one_or_none(repo._find_all(query))
+
+
+def adhoc_get_by_email(repo: UserRepository, email: str) -> object:
+    query = (
+        sa.select(User)
+        .where(sa.func.lower(User.email) == email)
+        .options(selectinload(User.authorizations))
+    )
+    return one_or_none(repo._find_all(query))
+
+
+def adhoc_get_by_authorization(repo: UserRepository, auth_id: uuid.UUID) -> object:
+    query = (
+        sa.select(User)
+        .join(User.authorizations)
+        .where(
+            Authorization.logout_at.is_(None)
+            & (Authorization.authorization_id == auth_id)
+        )
+        .options(selectinload(User.authorizations))
+    )
+    return one_or_none(repo._find_all(query))
+
+
+LOOKUPS: dict[str, tuple[str, Lookup, Lookup]] = {
+    "get": ("user_id", UserRepository.get, adhoc_get),
+    "get_by_email": ("email", UserRepository.get_by_email, adhoc_get_by_email),
+    "get_by_authorization": (
+        "authorization_id",
+        UserRepository.get_by_authorization,
+        adhoc_get_by_authorization,
+    ),
+}
+
+
+def sample_keys(engine: sa.Engine, size: int) -> dict[str, list]:
+    with engine.connect() as conn:
+        users = conn.execute(sa.select(User.user_id, User.email).limit(size)).all()
+        authorizations = conn.execute(
+            sa.select(Authorization.authorization_id)
+            .where(Authorization.logout_at.is_(None))
+            .limit(size)
+        ).scalars()
+        return {
+            "user_id": [row[0] for row in users],
+            "email": [row[1] for row in users],
+            "authorization_id": list(authorizations),
+        }
+
+
+def queries_per_second(
+    session_factory: sessionmaker[Session],
+    lookup: Lookup,
+    keys: list,
+    duration: float,
+) -> float:
+    rng = random.Random(0)
+    calls = 0
+    with session_factory() as session:
+        repo = UserRepository(session)
+        deadline = time.perf_counter() + duration
+        start = time.perf_counter()
+        while time.perf_counter() < deadline:
+            for key in rng.choices(keys, k=100):
+                lookup(repo, key)
+            calls += 100
+            # Keep identity map from growing over the run
+            session.expunge_all()
+        return calls / (time.perf_counter() - start)
+
+
+def main(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        options = {}
+        if args.dsn and args.dsn.startswith("postgresql+psycopg"):
+            options["connect_args"] = {"prepare_threshold": args.prepare_threshold}
+        engine = create_engine(args.dsn, tmp, **options)
+        if args.dsn is None or not args.skip_datagen:
+            datagen.generate(engine, datagen.DataSpec(users=args.users))
+        keys = sample_keys(engine, args.sample)
+        session_factory = sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+        run_results = list[results.Result]()
+        for name, (key, cached, adhoc) in LOOKUPS.items():
+            for variant, lookup in (("cached", cached), ("adhoc", adhoc)):
+                qps = max(
+                    queries_per_second(
+                        session_factory, lookup, keys[key], args.duration
+                    )
+                    for _ in range(args.rounds)
+                )
+                run_results.append(
+                    results.Result(
+                        f"{name}.{variant}", "q/s", qps, higher_is_better=True
+                    )
+                )
+        engine.dispose()
+
+    run = results.Run(
+        suite="queries",
+        results=run_results,
+        params={
+            "backend": engine.dialect.name,
+            "driver": engine.dialect.driver,
+            "users": args.users,
+            "prepare_threshold": args.prepare_threshold,
+        },
+    )
+    run.print()
+    if args.output:
+        results.save(run, args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--dsn", help="SQLAlchemy URL of a migrated database, defaults to SQLite"
+    )
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument(
+        "--skip-datagen", action="store_true", help="Use already generated data"
+    )
+    parser.add_argument(
+        "--prepare-threshold",
+        type=lambda value: None if value == "none" else int(value),
+        default=5,
+        help="psycopg prepare threshold, 'none' disables prepared statements",
+    )
+    parser.add_argument("--sample", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=2.0)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("-o", "--output", help="Write results as JSON")
+    main(parser.parse_args())
@@ -0,0 +1,87 @@
+"""JSON format of benchmark results.
+
+Every run of a suite is stored as a single document, so runs made on
+different commits can be compared with ``python -m benchmarks.compare``::
+
+    {
+      "suite": "micro",
+      "commit": "6f156ce",
+      "created_at": "2024-05-01T12:00:00+00:00",
+      "python": "3.11.9",
+      "platform": "Linux-6.1-x86_64",
+      "params": {"repeat": 7},
+      "results": [
+        {"name": "hash_password", "unit": "us", "value": 1.52,
+         "higher_is_better": false, "extra": {}}
+      ]
+    }
+"""
+
+from __future__ import annotations
+
+import json
+import platform
+import subprocess
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+__all__ = ["Result", "Run", "load", "save"]
+
+
+@dataclass
+class Result:
+    name: str
+    unit: str
+    # Headline number of the benchmark, compared across runs
+    value: float
+    higher_is_better: bool = False
+    extra: dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class Run:
+    suite: str
+    results: list[Result]
+    params: dict[str, Any] = field(default_factory=dict)
+    commit: str | None = field(default_factory=lambda: _git_commit())
+    created_at: str = field(
+        default_factory=lambda: datetime.now(timezone.utc).isoformat()
+    )
+    python: str = field(default_factory=platform.python_version)
+    platform: str = field(default_factory=platform.platform)
+
+    def print(self) -> None:
+        width = max((len(r.name) for r in self.results), default=0)
+        for result in self.results:
+            extra = "  ".join(f"{k}={v:.6g}" for k, v in result.extra.items())
+            print(
+                f"{result.name:<{width}}  {result.value:12.3f} {result.unit:<6} {extra}"
+            )
+
+
+def save(run: Run, path: str | Path) -> None:
+    with open(path, "w") as file:
+        json.dump(asdict(run), file, indent=2)
+        file.write("\n")
+
+
+def load(path: str | Path) -> Run:
+    with open(path) as file:
+        data = json.load(file)
+    data["results"] = [Result(**result) for result in data["results"]]
+    return Run(**data)
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,164 @@
+"""Latency of GET /users/search with and without the result cache.
+
+Queries are names, their prefixes and email fragments of the generated
+users, drawn with Zipf-like popularity. Requests are sent one at a time,
+so latency is not affected by queueing. The uncached phase runs with
+the cache disabled, it measures the trigram query itself; the cached
+phase shows what popular queries cost once they are cached.
+
+Without ``--dsn`` a SQLite file is used, which scans users and computes
+similarity in Python. Index backed numbers need Postgres with pg_trgm
+and the migrations applied, e.g. at 10M users:
+
+    PYTHONPATH=src python -m benchmarks.datagen --dsn postgresql+pg8000://... \\
+        --users 10000000
+    PYTHONPATH=src python -m benchmarks.search --dsn postgresql+pg8000://... \\
+        --skip-datagen -o search.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import urllib.parse
+
+import sqlalchemy as sa
+from fastapi import FastAPI
+
+from auth.adapter.repository import User
+from auth.domain import UserKind
+from benchmarks import datagen, results
+from benchmarks.harness import build_config, http_scope, request, running_app
+from common.cache import LRUCache
+
+
+def build_queries(rng: random.Random, count: int) -> list[str]:
+    names = datagen.FIRST_NAMES + datagen.LAST_NAMES
+    queries = list[str]()
+    for name in names:
+        queries.append(name.lower())
+        # Prefixes as typed into a search box
+        queries.extend(name.lower()[:n] for n in range(3, len(name)))
+    queries.extend(
+        datagen.email_of(rng.randrange(1000)).partition("@")[0] for _ in range(20)
+    )
+    rng.shuffle(queries)
+    # Popularity of the i-th query is proportional to 1 / (i + 1)
+    weights = [1 / (rank + 1) for rank in range(len(queries))]
+    return rng.choices(queries, weights=weights, k=count)
+
+
+async def coach_token(app: FastAPI) -> str:
+    with app.engine.connect() as conn:
+        email = conn.execute(
+            sa.select(User.email)
+            .where(
+                (User.kind == UserKind.COACH) & User.email.like("%@bench.example.com")
+            )
+            .limit(1)
+        ).scalar_one_or_none()
+    if email is None:
+        raise RuntimeError("Database has no generated coaches")
+
+    body = urllib.parse.urlencode(
+        {"username": email, "password": datagen.PASSWORD}
+    ).encode()
+    headers = [
+        (b"content-type", b"application/x-www-form-urlencoded"),
+        (b"content-length", str(len(body)).encode()),
+    ]
+    response = await request(
+        app, http_scope("POST", "/users/auth/login", headers=headers), body
+    )
+    if response.status != 200:
+        raise RuntimeError(f"Can't log in as {email}: {response.status}")
+    return json.loads(response.body)["access_token"]
+
+
+async def run_queries(
+    app: FastAPI, token: str, queries: list[str], limit: int
+) -> tuple[list[float], list[int]]:
+    headers = [(b"authorization", f"Bearer {token}".encode())]
+    latencies, matches = list[float](), list[int]()
+    for query in queries:
+        scope = http_scope(
+            "GET",
+            "/users/search",
+            urllib.parse.urlencode({"q": query, "limit": limit}).encode(),
+            headers,
+        )
+        start = time.perf_counter()
+        response = await request(app, scope)
+        latencies.append(time.perf_counter() - start)
+        if response.status != 200:
+            raise RuntimeError(f"Search for {query!r} failed: {response.status}")
+        matches.append(len(json.loads(response.body)["users"]))
+    return latencies, matches
+
+
+def summarize(
+    phase: str, latencies: list[float], matches: list[int]
+) -> list[results.Result]:
+    percentiles = statistics.quantiles(latencies, n=100)
+    extra = {"requests": len(latencies), "matches": statistics.fmean(matches)}
+    return [
+        results.Result(f"{phase}.p50", "ms", percentiles[49] * 1e3, extra=extra),
+        results.Result(f"{phase}.p99", "ms", percentiles[98] * 1e3, extra=extra),
+    ]
+
+
+async def main(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    queries = build_queries(rng, args.requests)
+    cfg = build_config(search={"cache_size": args.cache_size})
+    run_results = list[results.Result]()
+
+    async with running_app(args.dsn, cfg) as app:
+        if args.dsn is None or not args.skip_datagen:
+            datagen.generate(app.engine, datagen.DataSpec(users=args.users))
+        token = await coach_token(app)
+
+        cache = app.search_cache
+        app.search_cache = LRUCache("search", 0, 1)
+        latencies, matches = await run_queries(app, token, queries, args.limit)
+        run_results.extend(summarize("uncached", latencies, matches))
+
+        app.search_cache = cache
+        latencies, matches = await run_queries(app, token, queries, args.limit)
+        run_results.extend(summarize("cached", latencies, matches))
+
+    run = results.Run(
+        suite="search",
+        results=run_results,
+        params={
+            "backend": "sqlite" if args.dsn is None else "postgres",
+            "users": args.users,
+            "requests": args.requests,
+            "limit": args.limit,
+            "cache_size": args.cache_size,
+        },
+    )
+    run.print()
+    if args.output:
+        results.save(run, args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--dsn", help="SQLAlchemy URL of a migrated database, defaults to SQLite"
+    )
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument(
+        "--skip-datagen", action="store_true", help="Use already generated data"
+    )
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--cache-size", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write results as JSON")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,170 @@
+"""Cold start of the server, from process start to the first response.
+
+Two things are measured, each in fresh interpreters:
+
+* import time of the application modules, as reported by
+  ``python -X importtime``, with the modules costing the most;
+* time from spawning ``python -m health serve`` until it answers
+  ``GET /metrics``, which includes imports, config parsing, forking the
+  worker and running the lifespan.
+
+The server runs the in-memory backend, so no database is needed and
+connection setup is not accounted. The target is 300 ms to the first
+response::
+
+    PYTHONPATH=src python -m benchmarks.startup -o startup.json
+"""
+
+import argparse
+import http.client
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks import results
+
+TARGET_MS = 300
+MODULES = ["health.run", "health.app", "health.config"]
+
+CONFIG = """\
+db:
+  host: localhost
+  database: health
+  username: health
+  password: health
+  sslmode: disable
+  backend: memory
+app:
+  host: 127.0.0.1
+  port: {port}
+  workers: 1
+  secret: startup
+log:
+  level: warning
+"""
+
+
+def import_times(module: str) -> dict[str, float]:
+    """Runs a fresh interpreter importing the module, returns ms per module."""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    # Lines are "import time: self [us] | cumulative | imported package",
+    # top level imports are not indented
+    total, own = 0.0, dict[str, float]()
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        own[name.strip()] = int(self_us) / 1e3
+        if not name[1:].startswith(" "):
+            total += int(cumulative_us) / 1e3
+    own["total"] = total
+    return own
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_response(config_dir: Path, timeout: float) -> float:
+    port = free_port()
+    config_path = config_dir / f"startup-{port}.yaml"
+    config_path.write_text(CONFIG.format(port=port))
+
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "health", "serve", "--config", str(config_path)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited with code {server.returncode}")
+            # Connections are accepted by the listening socket of the master
+            # before a worker serves them, so wait for a response
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            try:
+                connection.request("GET", "/metrics")
+                if connection.getresponse().status == 200:
+                    return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.002)
+            finally:
+                connection.close()
+        raise RuntimeError(f"Server did not respond within {timeout}s")
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+
+
+def main(args: argparse.Namespace) -> None:
+    run_results = list[results.Result]()
+
+    for module in MODULES:
+        runs = [import_times(module) for _ in range(args.repeat)]
+        totals = [run["total"] for run in runs]
+        # Modules costing the most on their own, by the median run
+        median_run = sorted(runs, key=lambda run: run["total"])[len(runs) // 2]
+        heaviest = sorted(
+            ((name, ms) for name, ms in median_run.items() if name != "total"),
+            key=lambda item: item[1],
+            reverse=True,
+        )[: args.top]
+        run_results.append(
+            results.Result(
+                f"import.{module}",
+                "ms",
+                statistics.median(totals),
+                extra=dict(heaviest),
+            )
+        )
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        starts = [
+            time_to_first_response(Path(config_dir), args.timeout) * 1e3
+            for _ in range(args.repeat)
+        ]
+    ready = statistics.median(starts)
+    run_results.append(
+        results.Result(
+            "first_response",
+            "ms",
+            ready,
+            extra={"min": min(starts), "max": max(starts), "target": TARGET_MS},
+        )
+    )
+
+    run = results.Run(
+        suite="startup",
+        results=run_results,
+        params={"repeat": args.repeat, "cpus": os.cpu_count()},
+    )
+    run.print()
+    if ready > TARGET_MS:
+        print(f"First response after {ready:.0f} ms, target is {TARGET_MS} ms")
+    if args.output:
+        results.save(run, args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--top", type=int, default=10, help="Heaviest modules reported per import"
+    )
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("-o", "--output", help="Write results as JSON")
+    main(parser.parse_args())
@@ -0,0 +1,11 @@
+from .domain import UserActivity
+from .store import AbstractActivityStore, InMemoryActivityStore, SQLActivityStore
+from .tracker import ActivityTracker
+
+__all__ = [
+    "UserActivity",
+    "AbstractActivityStore",
+    "InMemoryActivityStore",
+    "SQLActivityStore",
+    "ActivityTracker",
+]
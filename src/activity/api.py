@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import uuid
+from datetime import datetime
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request, status
+from pydantic import BaseModel
+
+from activity.domain import UserActivity
+from activity.store import AbstractActivityStore, SQLActivityStore
+from auth.adapter.api.dependencies import get_current_user_id
+
+__all__ = ["router", "init_activity_store"]
+
+
+class ActivityGet(BaseModel):
+    last_seen_at: datetime
+    requests: int
+
+    @classmethod
+    def from_domain(cls, activity: UserActivity) -> ActivityGet:
+        return cls(last_seen_at=activity.last_seen_at, requests=activity.requests)
+
+
+def init_activity_store(app: FastAPI) -> AbstractActivityStore:
+    if app.config.db.backend == "memory":
+        return app.activity_store
+    return SQLActivityStore(app.engine)
+
+
+def get_activity_store(request: Request) -> AbstractActivityStore:
+    return init_activity_store(request.app)
+
+
+router = APIRouter(
+    prefix="/activity",
+    tags=["activity"],
+)
+
+
+@router.get(
+    "/me",
+    summary="Returns when current user was last seen and how many requests they made",
+    response_model=ActivityGet,
+    responses={
+        200: {},
+        401: {},
+        404: {},
+    },
+)
+def my_activity(
+    user_id: Annotated[uuid.UUID, Depends(get_current_user_id)],
+    store: Annotated[AbstractActivityStore, Depends(get_activity_store)],
+) -> ActivityGet:
+    # Requests show up once the workers which served them have flushed
+    activity = store.get(user_id)
+    if activity is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No activity recorded yet",
+        )
+    return ActivityGet.from_domain(activity)
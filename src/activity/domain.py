@@ -0,0 +1,13 @@
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+
+__all__ = ["UserActivity"]
+
+
+@dataclass(frozen=True, slots=True)
+class UserActivity:
+    user_id: uuid.UUID
+    last_seen_at: datetime
+    # Authenticated requests, an addition to the stored count when flushed
+    requests: int
@@ -0,0 +1,119 @@
+import abc
+import threading
+import uuid
+from typing import Sequence
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+
+from activity.domain import UserActivity
+from common.sql import Base, TZDateTime, greatest
+
+__all__ = [
+    "USER_ACTIVITY",
+    "AbstractActivityStore",
+    "InMemoryActivityStore",
+    "SQLActivityStore",
+]
+
+# Kept apart from users, whose updates bump updated_at and touch their
+# indexes. Nothing updated here is indexed, with free space the migration
+# leaves in pages Postgres updates rows in place
+USER_ACTIVITY = sa.Table(
+    "user_activity",
+    Base.metadata,
+    sa.Column("user_id", sa.Uuid(), primary_key=True),
+    sa.Column("last_seen_at", TZDateTime(), nullable=False),
+    sa.Column("requests", sa.BigInteger(), nullable=False),
+)
+
+GET_ACTIVITY = sa.select(USER_ACTIVITY).where(
+    USER_ACTIVITY.c.user_id == sa.bindparam("user_id")
+)
+
+
+class AbstractActivityStore(abc.ABC):
+    @abc.abstractmethod
+    def add(self, activities: Sequence[UserActivity]) -> None:
+        """Adds requests of the users and moves their last seen time on."""
+
+    @abc.abstractmethod
+    def get(self, user_id: uuid.UUID) -> UserActivity | None:
+        pass
+
+
+class InMemoryActivityStore(AbstractActivityStore):
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._activities = dict[uuid.UUID, UserActivity]()
+
+    def add(self, activities: Sequence[UserActivity]) -> None:
+        with self._lock:
+            for activity in activities:
+                stored = self._activities.get(activity.user_id)
+                if stored is not None:
+                    activity = UserActivity(
+                        user_id=activity.user_id,
+                        last_seen_at=max(stored.last_seen_at, activity.last_seen_at),
+                        requests=stored.requests + activity.requests,
+                    )
+                self._activities[activity.user_id] = activity
+
+    def get(self, user_id: uuid.UUID) -> UserActivity | None:
+        with self._lock:
+            return self._activities.get(user_id)
+
+
+class SQLActivityStore(AbstractActivityStore):
+    """Activity in the user_activity table, a batch is a single statement.
+
+    Workers flush the same users concurrently, rows are written in the
+    order of ids so their locks are taken in the same order.
+    """
+
+    # Rows of a single statement, keeps bound parameters within SQLite limits
+    UPSERT_ROWS = 300
+
+    def __init__(self, engine: sa.Engine) -> None:
+        self._engine = engine
+
+    def add(self, activities: Sequence[UserActivity]) -> None:
+        rows = [
+            {
+                "user_id": activity.user_id,
+                "last_seen_at": activity.last_seen_at,
+                "requests": activity.requests,
+            }
+            for activity in sorted(activities, key=lambda a: a.user_id)
+        ]
+        with self._engine.begin() as conn:
+            for start in range(0, len(rows), self.UPSERT_ROWS):
+                conn.execute(
+                    _upsert(conn).values(rows[start : start + self.UPSERT_ROWS])
+                )
+
+    def get(self, user_id: uuid.UUID) -> UserActivity | None:
+        with self._engine.connect() as conn:
+            row = conn.execute(GET_ACTIVITY, {"user_id": user_id}).one_or_none()
+        if row is None:
+            return None
+        return UserActivity(
+            user_id=row.user_id,
+            last_seen_at=row.last_seen_at,
+            requests=row.requests,
+        )
+
+
+def _upsert(conn: sa.Connection):
+    insert = postgresql.insert if conn.dialect.name == "postgresql" else sqlite.insert
+    statement = insert(USER_ACTIVITY)
+    # Flushes of other workers may be behind this one
+    return statement.on_conflict_do_update(
+        index_elements=[USER_ACTIVITY.c.user_id],
+        set_={
+            "last_seen_at": greatest(
+                USER_ACTIVITY.c.last_seen_at, statement.excluded.last_seen_at
+            ),
+            "requests": USER_ACTIVITY.c.requests + statement.excluded.requests,
+        },
+    )
@@ -0,0 +1,176 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable
+
+from loguru import logger
+
+from activity.domain import UserActivity
+from activity.store import AbstractActivityStore
+from common.metrics import Counter, Gauge, Histogram
+
+__all__ = ["ActivityTracker"]
+
+ACTIVITY_TOUCHES = Counter(
+    "activity_touches_total",
+    "Authenticated requests counted towards user activity",
+    ["result"],
+)
+
+ACTIVITY_FLUSH_DURATION = Histogram(
+    "activity_flush_duration_seconds",
+    "Duration of writing pending user activity",
+)
+
+ACTIVITY_FLUSH_LAG = Histogram(
+    "activity_flush_lag_seconds",
+    "Age of the oldest request of a flushed batch, how stale stored activity gets",
+    buckets=(1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+
+ACTIVITY_PENDING = Gauge(
+    "activity_pending_users",
+    "Users with activity waiting to be flushed",
+)
+
+
+class _Pending:
+    __slots__ = ("last_seen", "requests")
+
+    def __init__(self, last_seen: float, requests: int) -> None:
+        self.last_seen = last_seen
+        self.requests = requests
+
+
+class ActivityTracker:
+    """Coalesces activity of the worker's users and writes it periodically.
+
+    Every request only moves the user's last seen time and adds to the
+    count in memory, a background thread writes all of them every
+    ``flush_interval`` seconds. Activity of more than ``max_users`` users
+    flushes early, users beyond twice as many are not counted until then.
+    Activity of a crashed worker is lost.
+    """
+
+    def __init__(
+        self,
+        store_factory: Callable[[], AbstractActivityStore],
+        flush_interval: float,
+        max_users: int,
+        lag_warning: float,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self._store_factory = store_factory
+        self._flush_interval = flush_interval
+        self._max_users = max_users
+        self._lag_warning = lag_warning
+        self._clock = clock
+        self._pending = dict[uuid.UUID, _Pending]()
+        # Time of the first request since the last flush
+        self._oldest: float | None = None
+        self._changed = threading.Condition()
+        self._stopping = False
+        self._thread: threading.Thread | None = None
+        ACTIVITY_PENDING.set_function(lambda: [((), len(self._pending))])
+
+    def touch(self, user_id: uuid.UUID) -> None:
+        now = self._clock()
+        with self._changed:
+            pending = self._pending.get(user_id)
+            if pending is not None:
+                pending.last_seen = max(pending.last_seen, now)
+                pending.requests += 1
+            elif len(self._pending) >= 2 * self._max_users:
+                ACTIVITY_TOUCHES.inc(1, "dropped")
+                return
+            else:
+                self._pending[user_id] = _Pending(now, 1)
+                if self._oldest is None:
+                    self._oldest = now
+                if len(self._pending) == self._max_users:
+                    self._changed.notify_all()
+        ACTIVITY_TOUCHES.inc(1, "recorded")
+
+    def flush(self) -> int:
+        """Writes pending activity, returns of how many users."""
+        with self._changed:
+            pending, self._pending = self._pending, {}
+            oldest, self._oldest = self._oldest, None
+        if not pending:
+            return 0
+
+        activities = [
+            UserActivity(
+                user_id=user_id,
+                last_seen_at=datetime.fromtimestamp(p.last_seen, timezone.utc),
+                requests=p.requests,
+            )
+            for user_id, p in pending.items()
+        ]
+        try:
+            with ACTIVITY_FLUSH_DURATION.time():
+                self._store_factory().add(activities)
+        except Exception:
+            self._restore(pending, oldest)
+            raise
+
+        if oldest is not None:
+            lag = self._clock() - oldest
+            ACTIVITY_FLUSH_LAG.observe(lag)
+            if lag > self._lag_warning:
+                logger.warning(f"User activity was flushed {lag:.1f}s late")
+        return len(activities)
+
+    def start(self) -> None:
+        self._stopping = False
+        self._thread = threading.Thread(
+            target=self._run, name="activity-tracker", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._changed:
+            self._stopping = True
+            self._changed.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Can't flush user activity on shutdown")
+
+    def _run(self) -> None:
+        while True:
+            with self._changed:
+                self._changed.wait_for(
+                    lambda: self._stopping or len(self._pending) >= self._max_users,
+                    self._flush_interval,
+                )
+                if self._stopping:
+                    return
+
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Can't flush user activity")
+                # Retried on the next interval rather than right away
+                with self._changed:
+                    self._changed.wait_for(lambda: self._stopping, self._flush_interval)
+
+    def _restore(
+        self, pending: dict[uuid.UUID, _Pending], oldest: float | None
+    ) -> None:
+        # Requests made meanwhile are merged in, nothing is counted twice
+        with self._changed:
+            for user_id, p in pending.items():
+                current = self._pending.get(user_id)
+                if current is None:
+                    self._pending[user_id] = p
+                else:
+                    current.last_seen = max(current.last_seen, p.last_seen)
+                    current.requests += p.requests
+            if oldest is not None:
+                self._oldest = min(oldest, self._oldest or oldest)
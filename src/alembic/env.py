@@ -24,16 +24,28 @@ if config.config_file_name is not None:
 # target_metadata = mymodel.Base.metadata
 from common.sql import Base  # noqa: E402
 
-for module in ["auth.adapter.repository"]:
+for module in [
+    "activity.store",
+    "audit.store",
+    "auth.adapter.repository",
+    "auth.adapter.sharding",
+    "common.idempotency",
+    "common.sharding",
+    "measurements.adapter.repository",
+    "roster.adapter.repository",
+]:
     importlib.import_module(module)
 
 target_metadata = Base.metadata
 
 db = health_config.db
-url = (
-    f"postgresql+pg8000://{db.username}:{db.password}@{db.host}:{db.port}/{db.database}"
-)
-config.set_main_option("sqlalchemy.url", url)
+# Shards share the schema of the main database, offline mode only renders
+# the main one
+urls = [
+    f"postgresql+pg8000://{d.username}:{d.password}@{d.host}:{d.port}/{d.database}"
+    for d in [db, *db.shards]
+]
+config.set_main_option("sqlalchemy.url", urls[0])
 
 
 # other values from the config, defined by the needs of env.py,
@@ -60,6 +72,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        transaction_per_migration=True,
     )
 
     with context.begin_transaction():
@@ -73,17 +86,26 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
-    connectable = engine_from_config(
-        config.get_section(config.config_ini_section, {}),
-        prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
-    )
-
-    with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
-
-        with context.begin_transaction():
-            context.run_migrations()
+    for url in urls:
+        section = config.get_section(config.config_ini_section, {})
+        section["sqlalchemy.url"] = url
+        connectable = engine_from_config(
+            section,
+            prefix="sqlalchemy.",
+            poolclass=pool.NullPool,
+        )
+
+        with connectable.connect() as connection:
+            # Concurrent index builds and backfills commit as they go, a
+            # failure must not roll back migrations applied before it
+            context.configure(
+                connection=connection,
+                target_metadata=target_metadata,
+                transaction_per_migration=True,
+            )
+
+            with context.begin_transaction():
+                context.run_migrations()
 
 
 if context.is_offline_mode():
@@ -0,0 +1,65 @@
+"""Add measurements
+
+Revision ID: a4f7c2e9d1b6
+Revises: e5b2d8c1a9f4
+Create Date: 2026-10-23 09:18:52.640913
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from common.sql import TZDateTime
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a4f7c2e9d1b6"
+down_revision: Union[str, None] = "e5b2d8c1a9f4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # New and empty, so nothing here has to be built concurrently
+    op.create_table(
+        "measurements",
+        sa.Column("trainee_id", sa.Uuid(), nullable=False),
+        sa.Column("kind", sa.SmallInteger(), nullable=False),
+        sa.Column("at", TZDateTime(), nullable=False),
+        sa.Column("value", sa.Double(), nullable=False),
+        postgresql_partition_by="RANGE (at)",
+    )
+    # Indexes of the partitioned table are created on every partition
+    op.create_index(
+        "ix_measurements_at", "measurements", ["at"], postgresql_using="brin"
+    )
+    op.create_index(
+        "ix_measurements_trainee_id_kind_at",
+        "measurements",
+        ["trainee_id", "kind", "at"],
+    )
+    op.create_table(
+        "measurement_batches",
+        sa.Column("batch_id", sa.Uuid(), nullable=False),
+        sa.Column("trainee_id", sa.Uuid(), nullable=False),
+        sa.Column("received_at", TZDateTime(), nullable=False),
+        sa.Column("samples", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("batch_id"),
+    )
+
+    # Monthly partitions are created by workers ahead of time, the default
+    # one keeps samples of a month they missed
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(
+            "CREATE TABLE measurements_default PARTITION OF measurements DEFAULT"
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("measurement_batches")
+    # Partitions are dropped along with the table
+    op.drop_index("ix_measurements_trainee_id_kind_at", table_name="measurements")
+    op.drop_index("ix_measurements_at", table_name="measurements")
+    op.drop_table("measurements")
@@ -0,0 +1,43 @@
+"""Add user search indexes
+
+Revision ID: a7c2e9f4b1d8
+Revises: f2b5c8d1e4a6
+Create Date: 2026-10-19 20:03:51.266417
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a7c2e9f4b1d8"
+down_revision: Union[str, None] = "f2b5c8d1e4a6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = ["first_name", "last_name", "email"]
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    with op.get_context().autocommit_block():
+        for column in COLUMNS:
+            op.create_index(
+                f"ix_users_{column}_trgm",
+                "users",
+                [column],
+                postgresql_using="gin",
+                postgresql_ops={column: "gin_trgm_ops"},
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for column in COLUMNS:
+            op.drop_index(
+                f"ix_users_{column}_trgm", "users", postgresql_concurrently=True
+            )
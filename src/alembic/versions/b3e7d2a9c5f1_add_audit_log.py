@@ -0,0 +1,52 @@
+"""Add audit log
+
+Revision ID: b3e7d2a9c5f1
+Revises: d8f3b1a6c4e2
+Create Date: 2026-10-20 10:41:07.204518
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from common.sql import TZDateTime
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b3e7d2a9c5f1"
+down_revision: Union[str, None] = "d8f3b1a6c4e2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # New and empty, so nothing here has to be built concurrently
+    op.create_table(
+        "audit_log",
+        sa.Column("at", TZDateTime(), nullable=False),
+        sa.Column("user_id", sa.Uuid(), nullable=True),
+        sa.Column("email", sa.String(length=255), nullable=True),
+        sa.Column("action", sa.String(length=32), nullable=False),
+        sa.Column("success", sa.Boolean(), nullable=False),
+        sa.Column("ip", sa.String(length=45), nullable=True),
+        sa.Column("user_agent", sa.String(length=512), nullable=True),
+        sa.Column("reason", sa.String(length=32), nullable=True),
+        postgresql_partition_by="RANGE (at)",
+    )
+    # Indexes of the partitioned table are created on every partition
+    op.create_index("ix_audit_log_at", "audit_log", ["at"], postgresql_using="brin")
+    op.create_index("ix_audit_log_user_id_at", "audit_log", ["user_id", "at"])
+
+    # Monthly partitions are created by workers ahead of time, the default
+    # one keeps events of a month they missed
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("CREATE TABLE audit_log_default PARTITION OF audit_log DEFAULT")
+
+
+def downgrade() -> None:
+    # Partitions are dropped along with the table
+    op.drop_index("ix_audit_log_user_id_at", table_name="audit_log")
+    op.drop_index("ix_audit_log_at", table_name="audit_log")
+    op.drop_table("audit_log")
@@ -0,0 +1,36 @@
+"""Add roster acceptance
+
+Revision ID: b4e9c2f7a3d1
+Revises: d1f8a3c6e9b2
+Create Date: 2026-10-26 11:18:42.519307
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from common.migrations import with_lock_timeout
+from common.sql import TZDateTime
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b4e9c2f7a3d1"
+down_revision: Union[str, None] = "d1f8a3c6e9b2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Links assigned before are left pending, none of their trainees
+    # agreed to them
+    with_lock_timeout(
+        lambda: op.add_column(
+            "coach_trainees", sa.Column("accepted_at", TZDateTime(), nullable=True)
+        )
+    )
+
+
+def downgrade() -> None:
+    with_lock_timeout(lambda: op.drop_column("coach_trainees", "accepted_at"))
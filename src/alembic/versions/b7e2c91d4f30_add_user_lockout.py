@@ -0,0 +1,35 @@
+"""Add user lockout
+
+Revision ID: b7e2c91d4f30
+Revises: 5ac914408637
+Create Date: 2026-10-19 10:12:41.503918
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b7e2c91d4f30"
+down_revision: Union[str, None] = "5ac914408637"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "users",
+        sa.Column("failed_logins", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "users",
+        sa.Column("locked_until", sa.DateTime(timezone=True), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("users", "locked_until")
+    op.drop_column("users", "failed_logins")
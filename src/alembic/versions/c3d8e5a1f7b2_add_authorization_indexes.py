@@ -0,0 +1,54 @@
+"""Add authorization indexes
+
+Revision ID: c3d8e5a1f7b2
+Revises: b7e2c91d4f30
+Create Date: 2026-10-19 14:05:12.830144
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c3d8e5a1f7b2"
+down_revision: Union[str, None] = "b7e2c91d4f30"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Built concurrently not to block logins on a large table, which
+    # can't be done inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_authorizations_user_id",
+            "authorizations",
+            ["user_id"],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_authorizations_active",
+            "authorizations",
+            ["user_id", "created_at", "authorization_id"],
+            postgresql_where=sa.text("logout_at IS NULL"),
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_authorizations_logout_at",
+            "authorizations",
+            ["logout_at"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in (
+            "ix_authorizations_logout_at",
+            "ix_authorizations_active",
+            "ix_authorizations_user_id",
+        ):
+            op.drop_index(name, "authorizations", postgresql_concurrently=True)
@@ -0,0 +1,44 @@
+"""Add audit event ids
+
+Revision ID: d1f8a3c6e9b2
+Revises: f6c3a8d2b7e4
+Create Date: 2026-10-25 09:47:21.306518
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from common.migrations import backfill, with_lock_timeout
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d1f8a3c6e9b2"
+down_revision: Union[str, None] = "f6c3a8d2b7e4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+
+
+def upgrade() -> None:
+    # Nullable column is added without rewriting the partitions
+    with_lock_timeout(
+        lambda: op.add_column("audit_log", sa.Column("event_id", sa.Uuid()))
+    )
+    # Rows have no key, ctid is unique within a partition only
+    if op.get_bind().dialect.name == "postgresql":
+        backfill(
+            "UPDATE audit_log SET event_id = gen_random_uuid()"
+            " WHERE event_id IS NULL AND (tableoid, ctid) IN ("
+            " SELECT tableoid, ctid FROM audit_log WHERE event_id IS NULL"
+            " LIMIT :batch_size)",
+            batch_size=BATCH_SIZE,
+            description="Numbering audit events",
+        )
+
+
+def downgrade() -> None:
+    with_lock_timeout(lambda: op.drop_column("audit_log", "event_id"))
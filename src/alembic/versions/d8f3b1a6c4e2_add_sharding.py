@@ -0,0 +1,59 @@
+"""Add sharding
+
+Revision ID: d8f3b1a6c4e2
+Revises: a7c2e9f4b1d8
+Create Date: 2026-10-19 23:12:40.518203
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from common.migrations import (
+    create_index_concurrently,
+    drop_index_concurrently,
+    with_lock_timeout,
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d8f3b1a6c4e2"
+down_revision: Union[str, None] = "a7c2e9f4b1d8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Both tables are only used in the first database, the schema is
+    # the same in every shard
+    op.create_table(
+        "shard_slots",
+        sa.Column("slot", sa.SmallInteger(), autoincrement=False, nullable=False),
+        sa.Column("shard", sa.SmallInteger(), nullable=False),
+        sa.Column("frozen", sa.Boolean(), server_default=sa.false(), nullable=False),
+        sa.PrimaryKeyConstraint("slot"),
+    )
+    op.create_table(
+        "user_directory",
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("user_id", sa.Uuid(), nullable=False),
+        sa.PrimaryKeyConstraint("email"),
+    )
+
+    # Nullable column is added without rewriting the table, slots of
+    # existing users are filled by "python -m health.reshard prepare"
+    with_lock_timeout(
+        lambda: op.add_column(
+            "users", sa.Column("slot", sa.SmallInteger(), nullable=True)
+        )
+    )
+    create_index_concurrently("ix_users_slot", "users", ["slot"])
+
+
+def downgrade() -> None:
+    drop_index_concurrently("ix_users_slot", "users")
+    with_lock_timeout(lambda: op.drop_column("users", "slot"))
+    op.drop_table("user_directory")
+    op.drop_table("shard_slots")
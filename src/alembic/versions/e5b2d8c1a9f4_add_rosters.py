@@ -0,0 +1,60 @@
+"""Add rosters
+
+Revision ID: e5b2d8c1a9f4
+Revises: c9a4f1e7b3d5
+Create Date: 2026-10-22 10:31:07.204518
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from common.sql import TZDateTime
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e5b2d8c1a9f4"
+down_revision: Union[str, None] = "c9a4f1e7b3d5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "coach_trainees",
+        sa.Column("coach_id", sa.Uuid(), nullable=False),
+        sa.Column("trainee_id", sa.Uuid(), nullable=False),
+        sa.Column("assigned_at", TZDateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("coach_id", "trainee_id"),
+    )
+    op.create_index(
+        "ix_coach_trainees_trainee_id_coach_id",
+        "coach_trainees",
+        ["trainee_id", "coach_id"],
+    )
+    op.create_table(
+        "rosters",
+        sa.Column("coach_id", sa.Uuid(), nullable=False),
+        sa.Column("trainee_count", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("coach_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("rosters")
+    op.drop_index("ix_coach_trainees_trainee_id_coach_id", table_name="coach_trainees")
+    op.drop_table("coach_trainees")
@@ -0,0 +1,76 @@
+"""Normalize user emails
+
+Revision ID: f2b5c8d1e4a6
+Revises: e1a4b6c9d2f3
+Create Date: 2026-10-19 18:20:37.402915
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f2b5c8d1e4a6"
+down_revision: Union[str, None] = "e1a4b6c9d2f3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    duplicates = conn.execute(
+        sa.text(
+            "SELECT lower(email) FROM users GROUP BY lower(email) HAVING count(*) > 1"
+        )
+    ).scalars()
+    duplicates = list(duplicates)
+    if duplicates:
+        raise RuntimeError(
+            "Users differing only in email case have to be merged first: "
+            + ", ".join(duplicates)
+        )
+
+    # Steps run in their own transactions, none of them blocks writes.
+    # A failed concurrent build leaves an invalid index, drop it and rerun
+    with op.get_context().autocommit_block():
+        # Built first, so rows written during the backfill can't collide
+        op.create_index(
+            "ix_users_email_lower",
+            "users",
+            [sa.text("lower(email)")],
+            unique=True,
+            postgresql_concurrently=True,
+        )
+
+        # Short batches keep row locks brief for concurrent logins
+        while True:
+            updated = conn.execute(
+                sa.text(
+                    "UPDATE users SET email = lower(email) WHERE user_id IN ("
+                    " SELECT user_id FROM users WHERE email <> lower(email)"
+                    " LIMIT :batch_size)"
+                ),
+                {"batch_size": BATCH_SIZE},
+            ).rowcount
+            if updated < BATCH_SIZE:
+                break
+
+        op.drop_index("ix_users_email", "users", postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    # Emails stay lowercase, original case is not kept
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_users_email",
+            "users",
+            ["email"],
+            unique=True,
+            postgresql_concurrently=True,
+        )
+        op.drop_index("ix_users_email_lower", "users", postgresql_concurrently=True)
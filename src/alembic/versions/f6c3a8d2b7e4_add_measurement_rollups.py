@@ -0,0 +1,42 @@
+"""Add measurement rollups
+
+Revision ID: f6c3a8d2b7e4
+Revises: a4f7c2e9d1b6
+Create Date: 2026-10-24 11:05:37.918264
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f6c3a8d2b7e4"
+down_revision: Union[str, None] = "a4f7c2e9d1b6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "measurement_rollups",
+        sa.Column("trainee_id", sa.Uuid(), nullable=False),
+        sa.Column("kind", sa.SmallInteger(), nullable=False),
+        sa.Column("tier", sa.String(length=8), nullable=False),
+        sa.Column("start", sa.Date(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("total", sa.Double(), nullable=False),
+        sa.Column("mean", sa.Double(), nullable=False),
+        sa.Column("minimum", sa.Double(), nullable=False),
+        sa.Column("maximum", sa.Double(), nullable=False),
+        sa.Column("p50", sa.Double(), nullable=False),
+        sa.Column("p90", sa.Double(), nullable=False),
+        sa.Column("trend", sa.Double(), nullable=True),
+        sa.PrimaryKeyConstraint("trainee_id", "kind", "tier", "start"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("measurement_rollups")
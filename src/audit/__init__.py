@@ -0,0 +1,12 @@
+from .domain import AuditAction, AuditEvent
+from .store import AbstractAuditStore, InMemoryAuditStore, SQLAuditStore
+from .writer import AuditWriter
+
+__all__ = [
+    "AuditAction",
+    "AuditEvent",
+    "AbstractAuditStore",
+    "InMemoryAuditStore",
+    "SQLAuditStore",
+    "AuditWriter",
+]
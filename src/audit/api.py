@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import base64
+import uuid
+from datetime import datetime
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request, status
+from pydantic import BaseModel
+
+from audit.domain import AuditAction, AuditEvent
+from audit.store import AbstractAuditStore, SQLAuditStore
+from auth.adapter.api.dependencies import get_access_claims
+from auth.service_layer import auth
+
+__all__ = ["router", "init_audit_store"]
+
+
+class AuditEntryGet(BaseModel):
+    action: AuditAction
+    at: datetime
+    success: bool
+    ip: str | None
+    user_agent: str | None
+    reason: str | None
+
+    @classmethod
+    def from_domain(cls, event: AuditEvent) -> AuditEntryGet:
+        return cls(
+            action=event.action,
+            at=event.at,
+            success=event.success,
+            ip=event.ip,
+            user_agent=event.user_agent,
+            reason=event.reason,
+        )
+
+
+class AuditPage(BaseModel):
+    entries: list[AuditEntryGet]
+    # Pass as cursor to get the next page, absent on the last one
+    next_cursor: str | None = None
+
+
+def encode_cursor(event: AuditEvent) -> str:
+    raw = f"{event.at.isoformat()}|{event.event_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    """Raises ValueError on malformed cursors."""
+    try:
+        at, _, event_id = (
+            base64.urlsafe_b64decode(cursor.encode()).decode().partition("|")
+        )
+        return datetime.fromisoformat(at), uuid.UUID(event_id)
+    except (ValueError, UnicodeError) as e:
+        raise ValueError("Malformed cursor") from e
+
+
+def init_audit_store(app: FastAPI) -> AbstractAuditStore:
+    if app.config.db.backend == "memory":
+        return app.audit_store
+    return SQLAuditStore(app.engine, app.config.audit.use_copy)
+
+
+def get_audit_store(request: Request) -> AbstractAuditStore:
+    return init_audit_store(request.app)
+
+
+router = APIRouter(
+    prefix="/audit",
+    tags=["audit"],
+)
+
+
+@router.get(
+    "/history",
+    summary="Returns logins and logouts of current user, newest first",
+    response_model=AuditPage,
+    responses={
+        200: {},
+        400: {},
+        401: {},
+    },
+)
+def history(
+    claims: Annotated[auth.AccessTokenClaims, Depends(get_access_claims)],
+    store: Annotated[AbstractAuditStore, Depends(get_audit_store)],
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: Annotated[str | None, Query()] = None,
+) -> AuditPage:
+    try:
+        before = decode_cursor(cursor) if cursor is not None else None
+    except ValueError:
+        raise HTTPException(
+            detail="Invalid cursor",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+
+    # Events show up once the worker which recorded them has flushed
+    events = store.history(claims.user_id, limit, before)
+    return AuditPage(
+        entries=[AuditEntryGet.from_domain(e) for e in events],
+        next_cursor=encode_cursor(events[-1]) if len(events) == limit else None,
+    )
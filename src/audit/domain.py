@@ -0,0 +1,28 @@
+import enum
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+
+__all__ = ["AuditAction", "AuditEvent"]
+
+
+class AuditAction(str, enum.Enum):
+    LOGIN = "login"
+    LOGOUT = "logout"
+    LOGOUT_ALL = "logout_all"
+
+
+@dataclass(frozen=True, slots=True)
+class AuditEvent:
+    action: AuditAction
+    at: datetime
+    success: bool = True
+    # Unknown for login attempts of emails nobody has
+    user_id: uuid.UUID | None = None
+    email: str | None = None
+    ip: str | None = None
+    user_agent: str | None = None
+    # Why the action failed, e.g. "invalid_password"
+    reason: str | None = None
+    # Orders events of the same time, pages of the history end between them
+    event_id: uuid.UUID = field(default_factory=uuid.uuid4)
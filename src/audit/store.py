@@ -0,0 +1,205 @@
+import abc
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Sequence
+
+import sqlalchemy as sa
+
+from audit.domain import AuditAction, AuditEvent
+from common.sql import (
+    Base,
+    TZDateTime,
+    copy_text,
+    create_month_partitions,
+    next_month,
+)
+
+__all__ = [
+    "AUDIT_LOG",
+    "AbstractAuditStore",
+    "InMemoryAuditStore",
+    "SQLAuditStore",
+]
+
+# Append-only and read by time, so rows are partitioned by month on
+# Postgres. BRIN index of the time is tiny, rows are inserted in its order
+AUDIT_LOG = sa.Table(
+    "audit_log",
+    Base.metadata,
+    sa.Column("at", TZDateTime(), nullable=False),
+    sa.Column("user_id", sa.Uuid(), nullable=True),
+    sa.Column("email", sa.String(255), nullable=True),
+    sa.Column("action", sa.String(32), nullable=False),
+    sa.Column("success", sa.Boolean(), nullable=False),
+    sa.Column("ip", sa.String(45), nullable=True),
+    sa.Column("user_agent", sa.String(512), nullable=True),
+    sa.Column("reason", sa.String(32), nullable=True),
+    # Nullable, added without rewriting the table and backfilled
+    sa.Column("event_id", sa.Uuid(), nullable=True),
+    sa.Index("ix_audit_log_at", "at", postgresql_using="brin"),
+    sa.Index("ix_audit_log_user_id_at", "user_id", "at"),
+    postgresql_partition_by="RANGE (at)",
+)
+
+COLUMNS = [column.name for column in AUDIT_LOG.columns]
+
+HISTORY = (
+    sa.select(AUDIT_LOG)
+    .where(AUDIT_LOG.c.user_id == sa.bindparam("user_id"))
+    .order_by(AUDIT_LOG.c.at.desc(), AUDIT_LOG.c.event_id.desc())
+    .limit(sa.bindparam("limit"))
+)
+
+HISTORY_BEFORE = HISTORY.where(
+    sa.tuple_(AUDIT_LOG.c.at, AUDIT_LOG.c.event_id)
+    < sa.tuple_(
+        sa.bindparam("at", type_=AUDIT_LOG.c.at.type),
+        sa.bindparam("event_id", type_=AUDIT_LOG.c.event_id.type),
+    )
+)
+
+
+class AbstractAuditStore(abc.ABC):
+    @abc.abstractmethod
+    def append(self, events: Sequence[AuditEvent]) -> None:
+        pass
+
+    @abc.abstractmethod
+    def history(
+        self,
+        user_id: uuid.UUID,
+        limit: int,
+        before: tuple[datetime, uuid.UUID] | None = None,
+    ) -> list[AuditEvent]:
+        """Returns events of the user, newest first.
+
+        ``before`` is the time and id of the last event of the previous page.
+        """
+
+    def prepare(self, now: datetime) -> None:
+        """Creates storage for events of the current and the next month."""
+
+
+class InMemoryAuditStore(AbstractAuditStore):
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._events = list[AuditEvent]()
+
+    def append(self, events: Sequence[AuditEvent]) -> None:
+        with self._lock:
+            self._events.extend(events)
+
+    def history(
+        self,
+        user_id: uuid.UUID,
+        limit: int,
+        before: tuple[datetime, uuid.UUID] | None = None,
+    ) -> list[AuditEvent]:
+        with self._lock:
+            events = [
+                event
+                for event in self._events
+                if event.user_id == user_id
+                and (before is None or (event.at, event.event_id) < before)
+            ]
+        events.sort(key=lambda event: (event.at, event.event_id), reverse=True)
+        return events[:limit]
+
+
+class SQLAuditStore(AbstractAuditStore):
+    """Events in the audit_log table, appended with COPY on Postgres.
+
+    Other dialects, or Postgres with ``copy`` off, get multi-row INSERTs.
+    """
+
+    # Rows of a single INSERT, keeps bound parameters within SQLite limits
+    INSERT_ROWS = 500
+
+    def __init__(self, engine: sa.Engine, copy: bool = True) -> None:
+        self._engine = engine
+        self._copy = copy and engine.dialect.name == "postgresql"
+
+    def append(self, events: Sequence[AuditEvent]) -> None:
+        rows = [_to_row(event) for event in events]
+        with self._engine.begin() as conn:
+            if self._copy:
+                copy_text(conn, COPY, _copy_text(rows))
+                return
+            for start in range(0, len(rows), self.INSERT_ROWS):
+                chunk = rows[start : start + self.INSERT_ROWS]
+                conn.execute(sa.insert(AUDIT_LOG).values(chunk))
+
+    def history(
+        self,
+        user_id: uuid.UUID,
+        limit: int,
+        before: tuple[datetime, uuid.UUID] | None = None,
+    ) -> list[AuditEvent]:
+        query, params = HISTORY, {"user_id": user_id, "limit": limit}
+        if before is not None:
+            query = HISTORY_BEFORE
+            params["at"], params["event_id"] = before
+        with self._engine.connect() as conn:
+            return [_to_domain(row) for row in conn.execute(query, params)]
+
+    def prepare(self, now: datetime) -> None:
+        if self._engine.dialect.name != "postgresql":
+            return
+        # Rows without a partition of their month go to the default one,
+        # which then blocks creating that month's partition
+        first = now.date().replace(day=1)
+        with self._engine.begin() as conn:
+            create_month_partitions(conn, "audit_log", first, next_month(first))
+
+
+def _to_row(event: AuditEvent) -> dict[str, Any]:
+    return {
+        "at": event.at,
+        "user_id": event.user_id,
+        "email": event.email,
+        "action": event.action.value,
+        "success": event.success,
+        "ip": event.ip,
+        "user_agent": event.user_agent[:512] if event.user_agent else None,
+        "reason": event.reason,
+        "event_id": event.event_id,
+    }
+
+
+def _to_domain(row: sa.Row) -> AuditEvent:
+    return AuditEvent(
+        action=AuditAction(row.action),
+        at=row.at,
+        success=row.success,
+        user_id=row.user_id,
+        email=row.email,
+        ip=row.ip,
+        user_agent=row.user_agent,
+        reason=row.reason,
+        event_id=row.event_id,
+    )
+
+
+COPY = f"COPY audit_log ({', '.join(COLUMNS)}) FROM STDIN"
+
+
+def _copy_text(rows: list[dict[str, Any]]) -> bytes:
+    lines = ["\t".join(_copy_value(row[column]) for column in COLUMNS) for row in rows]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _copy_value(value: Any) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
@@ -0,0 +1,160 @@
+import collections
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Literal
+
+from loguru import logger
+
+from audit.domain import AuditEvent
+from audit.store import AbstractAuditStore
+from common.metrics import Counter, Gauge, Histogram
+
+__all__ = ["AuditWriter"]
+
+AUDIT_EVENTS = Counter(
+    "audit_events_total",
+    "Audit events by what happened to them",
+    ["result"],
+)
+
+AUDIT_FLUSH_DURATION = Histogram(
+    "audit_flush_duration_seconds",
+    "Duration of appending a batch of audit events",
+)
+
+AUDIT_BUFFERED = Gauge(
+    "audit_buffered_events",
+    "Audit events waiting to be flushed",
+)
+
+# Partitions are made for the next month as well, checking once in a
+# while is enough
+PREPARE_INTERVAL = 3600.0
+
+
+class AuditWriter:
+    """Buffers audit events of the worker and appends them in batches.
+
+    A batch is flushed once ``batch_size`` events are buffered or
+    ``flush_interval`` seconds passed, by a background thread. Writers of
+    a full buffer are blocked for up to ``block_timeout`` seconds until a
+    flush makes room, events are dropped after that. Buffered events are
+    flushed on stop, events of a crashed worker are lost.
+    """
+
+    def __init__(
+        self,
+        store_factory: Callable[[], AbstractAuditStore],
+        buffer_size: int,
+        batch_size: int,
+        flush_interval: float,
+        overflow: Literal["block", "drop_new"] = "block",
+        block_timeout: float = 0.1,
+    ) -> None:
+        self._store_factory = store_factory
+        self._buffer_size = buffer_size
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._overflow = overflow
+        self._block_timeout = block_timeout
+        self._buffer = collections.deque[AuditEvent]()
+        # Wakes the flusher when a batch is full and writers when there is room
+        self._changed = threading.Condition()
+        self._stopping = False
+        self._thread: threading.Thread | None = None
+        self._prepared_at = float("-inf")
+        AUDIT_BUFFERED.set_function(lambda: [((), len(self._buffer))])
+
+    def write(self, event: AuditEvent) -> bool:
+        with self._changed:
+            if len(self._buffer) >= self._buffer_size and self._overflow == "block":
+                self._changed.wait_for(
+                    lambda: len(self._buffer) < self._buffer_size,
+                    self._block_timeout,
+                )
+            if len(self._buffer) >= self._buffer_size:
+                AUDIT_EVENTS.inc(1, "dropped")
+                return False
+
+            self._buffer.append(event)
+            if len(self._buffer) >= self._batch_size:
+                self._changed.notify_all()
+        AUDIT_EVENTS.inc(1, "buffered")
+        return True
+
+    def flush(self) -> int:
+        """Appends buffered events, returns how many were written."""
+        written, store = 0, None
+        while True:
+            with self._changed:
+                batch = [
+                    self._buffer.popleft()
+                    for _ in range(min(self._batch_size, len(self._buffer)))
+                ]
+                self._changed.notify_all()
+            if not batch:
+                return written
+            store = store or self._store_factory()
+
+            try:
+                with AUDIT_FLUSH_DURATION.time():
+                    store.append(batch)
+            except Exception:
+                # Put back in front, events keep their order
+                with self._changed:
+                    self._buffer.extendleft(reversed(batch))
+                raise
+            written += len(batch)
+            AUDIT_EVENTS.inc(len(batch), "written")
+
+    def start(self) -> None:
+        self._stopping = False
+        self._thread = threading.Thread(
+            target=self._run, name="audit-writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._changed:
+            self._stopping = True
+            self._changed.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Can't flush audit events on shutdown")
+            AUDIT_EVENTS.inc(len(self._buffer), "lost")
+            self._buffer.clear()
+
+    def _run(self) -> None:
+        while True:
+            # Partitions are made before the first flush of the worker
+            self._prepare()
+            with self._changed:
+                self._changed.wait_for(
+                    lambda: self._stopping or len(self._buffer) >= self._batch_size,
+                    self._flush_interval,
+                )
+                if self._stopping:
+                    return
+
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Can't flush audit events")
+                # Retried on the next interval rather than right away
+                with self._changed:
+                    self._changed.wait_for(lambda: self._stopping, self._flush_interval)
+
+    def _prepare(self) -> None:
+        if time.monotonic() - self._prepared_at < PREPARE_INTERVAL:
+            return
+        try:
+            self._store_factory().prepare(datetime.now(timezone.utc))
+            self._prepared_at = time.monotonic()
+        except Exception:
+            logger.exception("Can't create audit log partitions")
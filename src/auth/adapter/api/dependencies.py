@@ -1,16 +1,34 @@
+import math
 import uuid
+from datetime import timedelta
 import jwt
-from fastapi import Depends, Request, HTTPException, status, Query
+from fastapi import Depends, FastAPI, Request, HTTPException, status, Query
 from typing import Annotated, Literal
 from sqlalchemy import Engine
 from sqlalchemy.orm import sessionmaker, Session
-from auth.service_layer import UserUnitOfWork, auth
+from auth.service_layer import (
+    InMemoryUserUnitOfWork,
+    RevocationCache,
+    SQLUserUnitOfWork,
+    ShardedUserUnitOfWork,
+    UserUnitOfWork,
+    auth,
+)
+from activity import ActivityTracker
+from audit import AuditWriter
 from common import AbstractMessageBus
+from common.idempotency import (
+    AbstractIdempotencyStore,
+    Idempotency,
+    SQLIdempotencyStore,
+)
 from fastapi.security import (
     OAuth2PasswordBearer,
+    OAuth2PasswordRequestForm,
     HTTPBearer,
     HTTPAuthorizationCredentials,
 )
+from common.ratelimit import SlidingWindowLimiter
 from health.config import Config
 
 
@@ -31,19 +49,74 @@ def get_sessionmaker(
 
 
 def get_unit_of_work(
+    request: Request,
     bus: Annotated[AbstractMessageBus, Depends()],
-    sessionmaker_: Annotated[sessionmaker[Session], Depends(get_sessionmaker)],
 ) -> UserUnitOfWork:
-    return UserUnitOfWork(bus, sessionmaker_)
+    return init_unit_of_work(request.app, bus)
+
+
+def init_unit_of_work(app: FastAPI, bus: AbstractMessageBus) -> UserUnitOfWork:
+    if app.config.db.backend == "memory":
+        return InMemoryUserUnitOfWork(bus, app.user_store)
+    if app.shards is not None:
+        return ShardedUserUnitOfWork(bus, app.shards)
+    return SQLUserUnitOfWork(bus, get_sessionmaker(app.engine), app.breaker)
+
+
+def require_database(request: Request) -> None:
+    """Fails writes fast while the database is down.
+
+    Units of work check the breaker as well, this covers writes which
+    reach the database before them, e.g. idempotency keys.
+    """
+    breaker = request.app.breaker
+    if breaker is not None:
+        breaker.check()
+
+
+def get_revocations(request: Request) -> RevocationCache:
+    return request.app.revocations
+
+
+def get_search_cache(request: Request) -> auth.SearchCache:
+    return request.app.search_cache
+
+
+def get_user_cache(request: Request) -> auth.UserCache:
+    return request.app.user_cache
+
+
+def get_idempotency(request: Request) -> Idempotency | None:
+    cfg = request.app.config.idempotency
+    if not cfg.enabled:
+        return None
+    return Idempotency(
+        init_idempotency_store(request.app),
+        request.app.idempotency_cache,
+        ttl=timedelta(seconds=cfg.ttl),
+        lock_timeout=timedelta(seconds=cfg.lock_timeout),
+    )
+
+
+def init_idempotency_store(app: FastAPI) -> AbstractIdempotencyStore:
+    if app.config.db.backend == "memory":
+        return app.idempotency_store
+    return SQLIdempotencyStore(app.engine)
+
+
+def get_activity(request: Request) -> ActivityTracker | None:
+    return request.app.activity
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/auth/login")
 
 
-def get_current_user_id(
+def get_access_claims(
     token: Annotated[str, Depends(oauth2_scheme)],
     config: Annotated[Config, Depends(get_config)],
-) -> uuid.UUID:
+    revocations: Annotated[RevocationCache, Depends(get_revocations)],
+    activity: Annotated[ActivityTracker | None, Depends(get_activity)],
+) -> auth.AccessTokenClaims:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -54,6 +127,19 @@ def get_current_user_id(
     except jwt.PyJWTError:
         raise credentials_exception
 
+    if claims.session_id is not None and revocations.is_revoked(claims.session_id):
+        raise credentials_exception
+
+    # Dependencies are resolved once a request, get_current_user_id and the
+    # rest count it once as well
+    if activity is not None:
+        activity.touch(claims.user_id)
+    return claims
+
+
+def get_current_user_id(
+    claims: Annotated[auth.AccessTokenClaims, Depends(get_access_claims)],
+) -> uuid.UUID:
     return claims.user_id
 
 
@@ -66,3 +152,48 @@ def get_refresh_token(
 ) -> str:
     assert grant_type == "refresh_token"
     return token.credentials
+
+
+def get_rate_limiters(request: Request) -> dict[str, SlidingWindowLimiter]:
+    return request.app.rate_limiters
+
+
+def get_client_host(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+def get_user_agent(request: Request) -> str | None:
+    return request.headers.get("user-agent")
+
+
+def get_audit(request: Request) -> AuditWriter | None:
+    return request.app.audit
+
+
+def enforce_rate_limit(limiter: SlidingWindowLimiter | None, key: str) -> None:
+    if limiter is None:
+        return
+
+    decision = limiter.hit(key)
+    if not decision.allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={"Retry-After": str(math.ceil(decision.retry_after))},
+        )
+
+
+def limit_login_attempts(
+    form: Annotated[OAuth2PasswordRequestForm, Depends()],
+    client_host: Annotated[str, Depends(get_client_host)],
+    limiters: Annotated[dict[str, SlidingWindowLimiter], Depends(get_rate_limiters)],
+) -> None:
+    enforce_rate_limit(limiters.get("login_ip"), client_host)
+    enforce_rate_limit(limiters.get("login_email"), form.username.strip().lower())
+
+
+def limit_user_creation(
+    client_host: Annotated[str, Depends(get_client_host)],
+    limiters: Annotated[dict[str, SlidingWindowLimiter], Depends(get_rate_limiters)],
+) -> None:
+    enforce_rate_limit(limiters.get("create_ip"), client_host)
@@ -1,12 +1,15 @@
 from __future__ import annotations
 
+import base64
 import enum
 import uuid
+from datetime import datetime
 from typing import Literal
 
 from pydantic import BaseModel, Field, EmailStr
 
 from auth import domain
+from auth.service_layer.auth import AccessTokenClaims
 
 
 class UserKind(str, enum.Enum):
@@ -41,6 +44,18 @@ class UserGet(BaseModel):
             is_active=user.is_active,
         )
 
+    @classmethod
+    def from_claims(cls, claims: AccessTokenClaims) -> UserGet:
+        # Token of an inactive user would not have been issued
+        return cls(
+            user_id=claims.user_id,
+            kind=claims.kind,
+            email=claims.email,
+            first_name=claims.first_name,
+            last_name=claims.last_name,
+            is_active=True,
+        )
+
 
 class UserPatch(BaseModel):
     first_name: str | None = Field(examples=["John", "Иван"])
@@ -51,3 +66,91 @@ class IssuedToken(BaseModel):
     access_token: str
     refresh_token: str
     token_type: Literal["bearer"] = Field(default="bearer")
+
+
+class SessionGet(BaseModel):
+    session_id: uuid.UUID
+    created_at: datetime | None
+    active_until: datetime
+    current: bool
+
+    @classmethod
+    def from_domain(
+        cls, auth: domain.Authorization, current_id: uuid.UUID | None
+    ) -> SessionGet:
+        return cls(
+            session_id=auth.authorization_id,
+            created_at=auth.created_at,
+            active_until=auth.active_until,
+            current=auth.authorization_id == current_id,
+        )
+
+
+class SessionPage(BaseModel):
+    sessions: list[SessionGet]
+    # Pass as cursor to get the next page, absent on the last one
+    next_cursor: str | None = None
+
+
+class LoggedOut(BaseModel):
+    revoked: int
+
+
+class UserFound(BaseModel):
+    user_id: uuid.UUID
+    kind: UserKind
+    email: str
+    first_name: str
+    last_name: str
+    score: float
+
+    @classmethod
+    def from_domain(cls, match: domain.UserMatch) -> UserFound:
+        return cls(
+            user_id=match.user_id,
+            kind=match.kind,
+            email=match.email,
+            first_name=match.first_name,
+            last_name=match.last_name,
+            score=match.score,
+        )
+
+
+class SearchPage(BaseModel):
+    users: list[UserFound]
+    # Pass as cursor to get the next page, absent on the last one
+    next_cursor: str | None = None
+
+
+def encode_cursor(auth: domain.Authorization) -> str:
+    return _encode_cursor(auth.created_at.isoformat(), str(auth.authorization_id))
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    """Raises ValueError on malformed cursors."""
+    created_at, auth_id = _decode_cursor(cursor)
+    return datetime.fromisoformat(created_at), uuid.UUID(auth_id)
+
+
+def encode_search_cursor(match: domain.UserMatch) -> str:
+    # repr keeps the float exact, keyset compares scores for equality
+    return _encode_cursor(repr(match.score), str(match.user_id))
+
+
+def decode_search_cursor(cursor: str) -> tuple[float, uuid.UUID]:
+    """Raises ValueError on malformed cursors."""
+    score, user_id = _decode_cursor(cursor)
+    return float(score), uuid.UUID(user_id)
+
+
+def _encode_cursor(*parts: str) -> str:
+    return base64.urlsafe_b64encode("|".join(parts).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    except (ValueError, UnicodeError) as e:
+        raise ValueError("Malformed cursor") from e
+    first, _, second = raw.partition("|")
+    return first, second
@@ -1,18 +1,64 @@
+import json
+import math
 import uuid
+from datetime import datetime, timedelta, timezone
 from typing import Annotated
 
-from fastapi import APIRouter, Path, Body, Depends, Response, status, HTTPException
+from fastapi import (
+    APIRouter,
+    Path,
+    Body,
+    Depends,
+    Header,
+    Query,
+    Response,
+    status,
+    HTTPException,
+)
 from fastapi.security import OAuth2PasswordRequestForm
 
 from health.config import Config
 from .dependencies import (
     get_unit_of_work,
+    get_access_claims,
+    get_audit,
+    get_client_host,
     get_current_user_id,
     get_config,
+    get_idempotency,
+    get_revocations,
+    get_search_cache,
+    get_user_cache,
     get_refresh_token,
+    get_user_agent,
+    limit_login_attempts,
+    limit_user_creation,
+    require_database,
+)
+from .models import (
+    UserCreate,
+    UserGet,
+    UserPatch,
+    IssuedToken,
+    LoggedOut,
+    SessionGet,
+    SessionPage,
+    SearchPage,
+    UserFound,
+    decode_cursor,
+    decode_search_cursor,
+    encode_cursor,
+    encode_search_cursor,
+)
+from audit import AuditAction, AuditEvent, AuditWriter
+from auth.service_layer import RevocationCache, UserUnitOfWork, auth
+from common.breaker import CircuitOpenError
+from common.idempotency import (
+    Idempotency,
+    KeyInProgressError,
+    KeyMismatchError,
+    fingerprint,
 )
-from .models import UserCreate, UserGet, UserPatch, IssuedToken
-from auth.service_layer import UserUnitOfWork, auth
 
 router = APIRouter(
     prefix="/users",
@@ -27,13 +73,68 @@ router = APIRouter(
     responses={
         201: {},
         400: {},
+        409: {},
+        422: {},
         429: {},
+        503: {},
     },
+    dependencies=[Depends(require_database), Depends(limit_user_creation)],
 )
 def create_user(
     user_id: Annotated[uuid.UUID, Path()],
     user_data: Annotated[UserCreate, Body()],
     uow: Annotated[UserUnitOfWork, Depends(get_unit_of_work)],
+    idempotency: Annotated[Idempotency | None, Depends(get_idempotency)],
+    idempotency_key: Annotated[
+        str | None, Header(alias="Idempotency-Key", max_length=200)
+    ] = None,
+) -> Response:
+    if idempotency is None or idempotency_key is None:
+        return _create_user(user_id, user_data, uow)
+
+    key = f"create_user:{idempotency_key}"
+    # Password is left out, fingerprints are stored unsalted
+    request_fingerprint = fingerprint(
+        str(user_id), user_data.model_dump_json(exclude={"password"})
+    )
+    try:
+        stored = idempotency.begin(key, request_fingerprint)
+    except KeyInProgressError as e:
+        raise HTTPException(
+            detail=e.args[0],
+            status_code=status.HTTP_409_CONFLICT,
+            headers={"Retry-After": "1"},
+        )
+    except KeyMismatchError as e:
+        raise HTTPException(
+            detail=e.args[0],
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+
+    if stored is not None:
+        return Response(
+            content=stored.body,
+            status_code=stored.status_code,
+            media_type="application/json" if stored.body else None,
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    try:
+        response = _create_user(user_id, user_data, uow)
+    except HTTPException as e:
+        body = json.dumps({"detail": e.detail}, separators=(",", ":")).encode()
+        idempotency.complete(key, request_fingerprint, e.status_code, body)
+        raise
+    except BaseException:
+        idempotency.release(key)
+        raise
+
+    idempotency.complete(key, request_fingerprint, response.status_code, b"")
+    return response
+
+
+def _create_user(
+    user_id: uuid.UUID, user_data: UserCreate, uow: UserUnitOfWork
 ) -> Response:
     try:
         auth.create_user(
@@ -53,6 +154,83 @@ def create_user(
         )
 
 
+# Declared before "/{user_id}", which would match the path otherwise
+@router.get(
+    "/sessions",
+    summary="Returns active sessions of current user, newest first",
+    response_model=SessionPage,
+    responses={
+        200: {},
+        400: {},
+        401: {},
+    },
+)
+def list_sessions(
+    claims: Annotated[auth.AccessTokenClaims, Depends(get_access_claims)],
+    uow: Annotated[UserUnitOfWork, Depends(get_unit_of_work)],
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: Annotated[str | None, Query()] = None,
+) -> SessionPage:
+    try:
+        after = decode_cursor(cursor) if cursor is not None else None
+    except ValueError:
+        raise HTTPException(
+            detail="Invalid cursor",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+
+    sessions = auth.list_sessions(uow, claims.user_id, limit, after)
+    return SessionPage(
+        sessions=[SessionGet.from_domain(s, claims.session_id) for s in sessions],
+        next_cursor=encode_cursor(sessions[-1]) if len(sessions) == limit else None,
+    )
+
+
+@router.get(
+    "/search",
+    summary="Searches trainees by name or email, best matches first",
+    response_model=SearchPage,
+    responses={
+        200: {},
+        400: {},
+        401: {},
+        403: {},
+    },
+)
+def search_users(
+    q: Annotated[str, Query(min_length=1, max_length=100)],
+    claims: Annotated[auth.AccessTokenClaims, Depends(get_access_claims)],
+    uow: Annotated[UserUnitOfWork, Depends(get_unit_of_work)],
+    cache: Annotated[auth.SearchCache, Depends(get_search_cache)],
+    config: Annotated[Config, Depends(get_config)],
+    limit: Annotated[int, Query(ge=1)] = 20,
+    cursor: Annotated[str | None, Query()] = None,
+) -> SearchPage:
+    limit = min(limit, config.search.max_limit)
+    try:
+        after = decode_search_cursor(cursor) if cursor is not None else None
+    except ValueError:
+        raise HTTPException(
+            detail="Invalid cursor",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        matches = auth.search_users(uow, cache, claims, q, limit, after)
+    except auth.PermissionDenied as e:
+        raise HTTPException(
+            detail=e.args[0],
+            status_code=status.HTTP_403_FORBIDDEN,
+        )
+
+    return SearchPage(
+        users=[UserFound.from_domain(m) for m in matches],
+        next_cursor=encode_search_cursor(matches[-1])
+        if len(matches) == limit
+        else None,
+    )
+
+
 @router.get(
     "/{user_id}",
     summary="Returns user by id",
@@ -66,8 +244,9 @@ def create_user(
 def get_user_by_id(
     user_id: Annotated[uuid.UUID, Path()],
     uow: Annotated[UserUnitOfWork, Depends(get_unit_of_work)],
+    cache: Annotated[auth.UserCache, Depends(get_user_cache)],
 ) -> UserGet:
-    user = auth.get_user_by_id(uow, user_id)
+    user = auth.get_user_by_id(uow, user_id, cache)
     return UserGet.from_domain(user)
 
 
@@ -82,10 +261,17 @@ def get_user_by_id(
     },
 )
 def get_current_user(
-    user_id: Annotated[uuid.UUID, Depends(get_current_user_id)],
+    claims: Annotated[auth.AccessTokenClaims, Depends(get_access_claims)],
     uow: Annotated[UserUnitOfWork, Depends(get_unit_of_work)],
+    cache: Annotated[auth.UserCache, Depends(get_user_cache)],
 ) -> UserGet | None:
-    user = auth.get_user_by_id(uow, user_id)
+    try:
+        user = auth.get_user_by_id(uow, claims.user_id, cache)
+    except CircuitOpenError:
+        # Signed claims are as fresh as the token, older tokens lack kind
+        if claims.kind is None:
+            raise
+        return UserGet.from_claims(claims)
     return UserGet.from_domain(user)
 
 
@@ -110,13 +296,59 @@ def patch_user_by_id(
     "/auth/login",
     summary="Log user in and returns refresh and access token",
     response_model=IssuedToken,
+    responses={
+        200: {},
+        401: {},
+        429: {},
+        503: {},
+    },
+    dependencies=[Depends(require_database), Depends(limit_login_attempts)],
 )
 def login(
     form: Annotated[OAuth2PasswordRequestForm, Depends()],
     uow: Annotated[UserUnitOfWork, Depends(get_unit_of_work)],
     config: Annotated[Config, Depends(get_config)],
+    cache: Annotated[auth.UserCache, Depends(get_user_cache)],
+    audit: Annotated[AuditWriter | None, Depends(get_audit)],
+    client_host: Annotated[str, Depends(get_client_host)],
+    user_agent: Annotated[str | None, Depends(get_user_agent)],
 ) -> IssuedToken:
-    token = auth.login(form.username, form.password, uow, config.app.secret)
+    # Attempts are written once the transaction of the login is over, a
+    # blocking audit queue can't hold its row locks
+    def observe(user_id: uuid.UUID | None, reason: str | None) -> None:
+        if audit is not None:
+            audit.write(
+                AuditEvent(
+                    AuditAction.LOGIN,
+                    datetime.now(timezone.utc),
+                    success=reason is None,
+                    user_id=user_id,
+                    email=form.username,
+                    ip=client_host,
+                    user_agent=user_agent,
+                    reason=reason,
+                )
+            )
+
+    try:
+        token = auth.login(form.username, form.password, uow, config.app.secret, cache)
+    except auth.UserLocked as e:
+        observe(e.user_id, e.reason)
+        retry_after = (e.locked_until - datetime.now(timezone.utc)).total_seconds()
+        raise HTTPException(
+            detail=e.args[0],
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+    except auth.InvalidCredentials as e:
+        observe(e.user_id, e.reason)
+        raise HTTPException(
+            detail=e.args[0],
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    observe(token.user_id, None)
     return IssuedToken(
         access_token=token.access_token,
         refresh_token=token.refresh_token,
@@ -132,9 +364,18 @@ def refresh(
     token: Annotated[str, Depends(get_refresh_token)],
     uow: Annotated[UserUnitOfWork, Depends(get_unit_of_work)],
     config: Annotated[Config, Depends(get_config)],
+    cache: Annotated[auth.UserCache, Depends(get_user_cache)],
+    revocations: Annotated[RevocationCache, Depends(get_revocations)],
 ) -> IssuedToken:
     try:
-        tokens = auth.refresh(token, uow, config.app.secret)
+        tokens = auth.refresh(
+            token,
+            uow,
+            config.app.secret,
+            cache,
+            revocations,
+            timedelta(seconds=config.breaker.degraded_token_ttl),
+        )
 
         return IssuedToken(
             access_token=tokens.access_token,
@@ -148,3 +389,83 @@ def refresh(
                 "WWW-Authenticate": "Bearer",
             },
         )
+    except auth.InvalidCredentials as e:
+        raise HTTPException(
+            detail=e.args[0],
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+@router.post(
+    "/auth/logout",
+    summary="Logs out session of the access token",
+    response_model=LoggedOut,
+    responses={
+        200: {},
+        400: {},
+        401: {},
+        503: {},
+    },
+    dependencies=[Depends(require_database)],
+)
+def logout(
+    claims: Annotated[auth.AccessTokenClaims, Depends(get_access_claims)],
+    uow: Annotated[UserUnitOfWork, Depends(get_unit_of_work)],
+    revocations: Annotated[RevocationCache, Depends(get_revocations)],
+    audit: Annotated[AuditWriter | None, Depends(get_audit)],
+    client_host: Annotated[str, Depends(get_client_host)],
+    user_agent: Annotated[str | None, Depends(get_user_agent)],
+) -> LoggedOut:
+    if claims.session_id is None:
+        raise HTTPException(
+            detail="Access token is not bound to a session",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+
+    revoked = auth.logout(uow, revocations, claims.user_id, claims.session_id)
+    if audit is not None:
+        audit.write(
+            AuditEvent(
+                AuditAction.LOGOUT,
+                datetime.now(timezone.utc),
+                success=revoked,
+                user_id=claims.user_id,
+                ip=client_host,
+                user_agent=user_agent,
+            )
+        )
+    return LoggedOut(revoked=int(revoked))
+
+
+@router.post(
+    "/auth/logout-all",
+    summary="Logs out all sessions of current user",
+    response_model=LoggedOut,
+    responses={
+        200: {},
+        401: {},
+        503: {},
+    },
+    dependencies=[Depends(require_database)],
+)
+def logout_all(
+    user_id: Annotated[uuid.UUID, Depends(get_current_user_id)],
+    uow: Annotated[UserUnitOfWork, Depends(get_unit_of_work)],
+    revocations: Annotated[RevocationCache, Depends(get_revocations)],
+    audit: Annotated[AuditWriter | None, Depends(get_audit)],
+    client_host: Annotated[str, Depends(get_client_host)],
+    user_agent: Annotated[str | None, Depends(get_user_agent)],
+) -> LoggedOut:
+    revoked = auth.logout_all(uow, revocations, user_id)
+    if audit is not None:
+        audit.write(
+            AuditEvent(
+                AuditAction.LOGOUT_ALL,
+                datetime.now(timezone.utc),
+                user_id=user_id,
+                ip=client_host,
+                user_agent=user_agent,
+            )
+        )
+    return LoggedOut(revoked=len(revoked))
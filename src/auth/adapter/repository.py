@@ -1,11 +1,14 @@
 from __future__ import annotations
 
+import abc
+import dataclasses
 import heapq
+import threading
 import uuid
 from typing import Iterable, Iterator, TypeVar
 
 import sqlalchemy as sa
-from datetime import datetime
+from datetime import datetime, timezone
 
 from sqlalchemy.orm import (
     Session,
@@ -17,53 +20,176 @@ from sqlalchemy.orm import (
 )
 
 from common.domain import DomainEvent
-from common.repository import AbstractRepository
-from common.sql import Base, TimeMixin
+from common.repository import AbstractRepository, InMemoryRepository
+from common.unit_of_work import ConflictError
+from common.sharding import slot_of
+from common.sql import (
+    Base,
+    TimeMixin,
+    TZDateTime,
+    TRIGRAM_THRESHOLD,
+    greatest,
+    trigram_match,
+    trigram_similarity,
+)
 from auth import domain
+from auth.domain.service import normalize_email
+
+__all__ = [
+    "AbstractUserRepository",
+    "UserRepository",
+    "InMemoryUserRepository",
+    "UserStore",
+]
+
+
+class AbstractUserRepository(AbstractRepository[domain.User, uuid.UUID]):
+    @abc.abstractmethod
+    def get_by_email(self, email: str) -> domain.User | None:
+        pass
+
+    @abc.abstractmethod
+    def get_by_authorization(self, auth_id: uuid.UUID) -> domain.User | None:
+        pass
+
+    @abc.abstractmethod
+    def logout(self, user_id: uuid.UUID, auth_id: uuid.UUID) -> bool:
+        """Logs out an active authorization of the user, if there is one."""
 
-__all__ = ["UserRepository"]
+    @abc.abstractmethod
+    def logout_all(self, user_id: uuid.UUID) -> list[uuid.UUID]:
+        """Logs out all active authorizations of the user, returns their ids."""
 
+    @abc.abstractmethod
+    def list_sessions(
+        self,
+        user_id: uuid.UUID,
+        limit: int,
+        after: tuple[datetime, uuid.UUID] | None = None,
+    ) -> list[domain.Authorization]:
+        """Returns active authorizations of the user, newest first.
 
-class UserRepository(AbstractRepository):
+        ``after`` is the creation time and id of the last authorization of
+        the previous page.
+        """
+
+    @abc.abstractmethod
+    def revoked_since(self, since: datetime) -> list[uuid.UUID]:
+        """Returns ids of authorizations logged out after ``since``."""
+
+    @abc.abstractmethod
+    def kinds(self, user_ids: Iterable[uuid.UUID]) -> dict[uuid.UUID, domain.UserKind]:
+        """Returns kinds of the users by their ids, unknown ids are left out."""
+
+    @abc.abstractmethod
+    def search(
+        self,
+        query: str,
+        kind: domain.UserKind,
+        limit: int,
+        after: tuple[float, uuid.UUID] | None = None,
+    ) -> list[domain.UserMatch]:
+        """Returns users with names or email similar to the query.
+
+        Best matches go first, ``after`` is the score and id of the last
+        match of the previous page.
+        """
+
+    def warm_up(self) -> None:
+        """Runs hot lookups once before serving, with keys matching nothing."""
+
+
+class UserRepository(AbstractUserRepository):
     def __init__(self, session: Session) -> None:
         self.session = session
         self.__seen = set[domain.User]()
 
     def add(self, user: domain.User) -> None:
         self.session.add(self._to_db_model(user))
+        self.__seen.add(user)
 
     def persist(self, user: domain.User) -> None:
         merged = self.session.merge(
             self._to_db_model(user), options=[joinedload(User.authorizations)]
         )
         self.session.add(merged)
+        self.__seen.add(user)
 
     def get(self, user_id: uuid.UUID) -> domain.User | None:
-        query = (
-            sa.select(User)
-            .where(User.user_id == user_id)
-            .options(selectinload(User.authorizations))
-        )
-        return one_or_none(self._find_all(query))
+        return one_or_none(self._find_all(GET_USER, {"user_id": user_id}))
 
     def get_by_email(self, email: str) -> domain.User | None:
-        query = (
-            sa.select(User)
-            .where(User.email == email)
-            .options(selectinload(User.authorizations))
+        return one_or_none(
+            self._find_all(GET_USER_BY_EMAIL, {"email": normalize_email(email)})
         )
-        return one_or_none(self._find_all(query))
 
     def get_by_authorization(self, auth_id: uuid.UUID) -> domain.User | None:
-        query = (
-            sa.select(User)
-            .where(
-                Authorization.logout_at.is_(None)
-                & (Authorization.authorization_id == auth_id)
-            )
-            .options(selectinload(User.authorizations))
+        return one_or_none(
+            self._find_all(GET_USER_BY_AUTHORIZATION, {"authorization_id": auth_id})
+        )
+
+    # Logouts are single UPDATE statements, they neither load the aggregate
+    # nor emit its events
+
+    def logout(self, user_id: uuid.UUID, auth_id: uuid.UUID) -> bool:
+        result = self.session.execute(
+            LOGOUT,
+            {"owner_id": user_id, "auth_id": auth_id, "now": _utcnow()},
         )
-        return one_or_none(self._find_all(query))
+        return result.rowcount > 0
+
+    def logout_all(self, user_id: uuid.UUID) -> list[uuid.UUID]:
+        result = self.session.execute(
+            LOGOUT_ALL, {"owner_id": user_id, "now": _utcnow()}
+        )
+        return list(result.scalars())
+
+    def list_sessions(
+        self,
+        user_id: uuid.UUID,
+        limit: int,
+        after: tuple[datetime, uuid.UUID] | None = None,
+    ) -> list[domain.Authorization]:
+        query = LIST_SESSIONS
+        params = {"user_id": user_id, "now": domain.User.now(), "limit": limit}
+        if after is not None:
+            query = LIST_SESSIONS_AFTER
+            params["created_at"], params["authorization_id"] = after
+        result = self.session.execute(query, params)
+        return [self._auth_to_domain(auth) for auth in result.scalars()]
+
+    def revoked_since(self, since: datetime) -> list[uuid.UUID]:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        return list(self.session.execute(REVOKED_SINCE, {"since": since}).scalars())
+
+    def kinds(self, user_ids: Iterable[uuid.UUID]) -> dict[uuid.UUID, domain.UserKind]:
+        rows = self.session.execute(GET_KINDS, {"user_ids": list(user_ids)})
+        return {row.user_id: row.kind for row in rows}
+
+    def search(
+        self,
+        query: str,
+        kind: domain.UserKind,
+        limit: int,
+        after: tuple[float, uuid.UUID] | None = None,
+    ) -> list[domain.UserMatch]:
+        statement = SEARCH_USERS
+        params = {"q": query, "kind": kind, "limit": limit}
+        if after is not None:
+            statement = SEARCH_USERS_AFTER
+            params["score"], params["after_id"] = after
+        return [
+            domain.UserMatch(*row) for row in self.session.execute(statement, params)
+        ]
+
+    def warm_up(self) -> None:
+        # Statements are compiled on first execution and kept by the engine
+        nobody = uuid.UUID(int=0)
+        self.get(nobody)
+        self.get_by_email("")
+        self.get_by_authorization(nobody)
+        self.list_sessions(nobody, 1)
+        self.revoked_since(datetime.now(timezone.utc))
 
     def collect_events(self) -> Iterable[DomainEvent]:
         heap = list[DomainEvent]()
@@ -73,10 +199,12 @@ class UserRepository(AbstractRepository):
 
         return heap
 
-    def _find_all(self, query) -> Iterator[domain.User]:
-        with self.session.execute(query) as result:
-            for user in result.scalars().all():
-                yield self._to_domain(user)
+    def _find_all(self, query, params: dict | None = None) -> Iterator[domain.User]:
+        with self.session.execute(query, params) as result:
+            for db_model in result.scalars().all():
+                user = self._to_domain(db_model)
+                self.__seen.add(user)
+                yield user
 
     def _to_domain(self, db_model: User) -> domain.User:
         return domain.User(
@@ -89,6 +217,8 @@ class UserRepository(AbstractRepository):
             is_active=db_model.is_active,
             authorizations=[self._auth_to_domain(t) for t in db_model.authorizations],
             kind=db_model.kind,
+            failed_logins=db_model.failed_logins,
+            locked_until=db_model.locked_until,
         )
 
     def _to_db_model(self, user: domain.User) -> User:
@@ -104,6 +234,9 @@ class UserRepository(AbstractRepository):
                 self._auth_to_db_model(user.id, t) for t in user.authorizations
             ],
             kind=user.kind,
+            failed_logins=user.failed_logins,
+            locked_until=user.locked_until,
+            slot=slot_of(user.id),
         )
 
     def _auth_to_db_model(
@@ -114,6 +247,9 @@ class UserRepository(AbstractRepository):
             logout_at=auth.logout_at,
             active_until=auth.active_until,
             user_id=user_id,
+            # Issue time keeps session keyset order exact, server default
+            # of SQLite has a precision of seconds only
+            created_at=auth.created_at,
         )
 
     def _auth_to_domain(self, db_model: Authorization) -> domain.Authorization:
@@ -121,14 +257,253 @@ class UserRepository(AbstractRepository):
             authorization_id=db_model.authorization_id,
             active_until=db_model.active_until,
             logout_at=db_model.logout_at,
+            created_at=db_model.created_at,
+        )
+
+
+class UserStore:
+    """Committed users of in-memory repositories, shared by units of work.
+
+    Stored users are never mutated, a commit replaces them with copies,
+    so readers may copy them without holding the lock.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.users = dict[uuid.UUID, domain.User]()
+        self.by_email = dict[str, uuid.UUID]()
+        # Only authorizations which are not logged out are indexed
+        self.by_authorization = dict[uuid.UUID, uuid.UUID]()
+
+
+class InMemoryUserRepository(AbstractUserRepository, InMemoryRepository):
+    def __init__(self, store: UserStore) -> None:
+        self._store = store
+        self._added = dict[uuid.UUID, domain.User]()
+        self._persisted = dict[uuid.UUID, domain.User]()
+        self.__seen = set[domain.User]()
+
+    def add(self, user: domain.User) -> None:
+        self._added[user.id] = user
+        self.__seen.add(user)
+
+    def persist(self, user: domain.User) -> None:
+        self._persisted[user.id] = user
+        self.__seen.add(user)
+
+    def get(self, user_id: uuid.UUID) -> domain.User | None:
+        staged = self._added.get(user_id) or self._persisted.get(user_id)
+        if staged is not None:
+            return staged
+        return self._load(self._store.users.get(user_id))
+
+    def get_by_email(self, email: str) -> domain.User | None:
+        email = normalize_email(email)
+        for user in self._staged():
+            if user.email == email:
+                return user
+        return self._load(self._store.users.get(self._store.by_email.get(email)))
+
+    def get_by_authorization(self, auth_id: uuid.UUID) -> domain.User | None:
+        for user in self._staged():
+            auth = user.find_authorization(auth_id)
+            if auth is not None and auth.logout_at is None:
+                return user
+        user_id = self._store.by_authorization.get(auth_id)
+        return self._load(self._store.users.get(user_id))
+
+    def logout(self, user_id: uuid.UUID, auth_id: uuid.UUID) -> bool:
+        user = self.get(user_id)
+        auth = user.find_authorization(auth_id) if user is not None else None
+        if auth is None or auth.logout_at is not None:
+            return False
+        auth.logout_at = user.now()
+        self.persist(user)
+        return True
+
+    def logout_all(self, user_id: uuid.UUID) -> list[uuid.UUID]:
+        user = self.get(user_id)
+        if user is None:
+            return []
+        now = user.now()
+        revoked = list[uuid.UUID]()
+        for auth in user.authorizations:
+            if auth.logout_at is None:
+                auth.logout_at = now
+                revoked.append(auth.authorization_id)
+        if revoked:
+            self.persist(user)
+        return revoked
+
+    def list_sessions(
+        self,
+        user_id: uuid.UUID,
+        limit: int,
+        after: tuple[datetime, uuid.UUID] | None = None,
+    ) -> list[domain.Authorization]:
+        user = self.get(user_id)
+        if user is None:
+            return []
+        now = user.now()
+        sessions = sorted(
+            (
+                a
+                for a in user.authorizations
+                if a.logout_at is None and a.active_until > now
+            ),
+            key=lambda a: (a.created_at, a.authorization_id),
+            reverse=True,
+        )
+        if after is not None:
+            sessions = [
+                a for a in sessions if (a.created_at, a.authorization_id) < after
+            ]
+        return sessions[:limit]
+
+    def search(
+        self,
+        query: str,
+        kind: domain.UserKind,
+        limit: int,
+        after: tuple[float, uuid.UUID] | None = None,
+    ) -> list[domain.UserMatch]:
+        with self._store.lock:
+            users = list(self._store.users.values())
+
+        matches = list[domain.UserMatch]()
+        for user in users:
+            if user.kind != kind:
+                continue
+            score = max(
+                trigram_similarity(user.first_name, query),
+                trigram_similarity(user.last_name, query),
+                trigram_similarity(user.email, query),
+            )
+            if score < TRIGRAM_THRESHOLD:
+                continue
+            if after is not None and (-score, user.id) <= (-after[0], after[1]):
+                continue
+            matches.append(
+                domain.UserMatch(
+                    user.id,
+                    user.kind,
+                    user.email,
+                    user.first_name,
+                    user.last_name,
+                    score,
+                )
+            )
+        matches.sort(key=lambda m: (-m.score, m.user_id))
+        return matches[:limit]
+
+    def revoked_since(self, since: datetime) -> list[uuid.UUID]:
+        with self._store.lock:
+            users = list(self._store.users.values())
+        return [
+            auth.authorization_id
+            for user in users
+            for auth in user.authorizations
+            if auth.logout_at is not None and auth.logout_at > since
+        ]
+
+    def kinds(self, user_ids: Iterable[uuid.UUID]) -> dict[uuid.UUID, domain.UserKind]:
+        users = self._store.users
+        return {i: users[i].kind for i in user_ids if i in users}
+
+    def collect_events(self) -> Iterable[DomainEvent]:
+        heap = list[DomainEvent]()
+        for user in self.__seen:
+            while event := user.pop_event():
+                heapq.heappush(heap, event)
+
+        return heap
+
+    @property
+    def lock(self) -> threading.Lock:
+        return self._store.lock
+
+    def check(self) -> None:
+        store = self._store
+        for user in self._added.values():
+            if user.id in store.users:
+                raise ConflictError(f"User {user.id} already exists")
+        for user in self._staged():
+            owner = store.by_email.get(user.email)
+            if owner is not None and owner != user.id:
+                raise ConflictError(f"Email {user.email} is already taken")
+
+    def apply(self) -> None:
+        for user in self._staged():
+            self._save(self._copy(user))
+
+        self._added.clear()
+        self._persisted.clear()
+
+    def rollback(self) -> None:
+        self._added.clear()
+        self._persisted.clear()
+
+    def _staged(self) -> Iterator[domain.User]:
+        yield from self._added.values()
+        yield from self._persisted.values()
+
+    def _load(self, stored: domain.User | None) -> domain.User | None:
+        if stored is None:
+            return None
+        user = self._copy(stored)
+        self.__seen.add(user)
+        return user
+
+    def _save(self, user: domain.User) -> None:
+        store = self._store
+        previous = store.users.get(user.id)
+        if previous is not None:
+            store.by_email.pop(previous.email, None)
+            for auth in previous.authorizations:
+                store.by_authorization.pop(auth.authorization_id, None)
+
+        store.users[user.id] = user
+        store.by_email[user.email] = user.id
+        for auth in user.authorizations:
+            if auth.logout_at is None:
+                store.by_authorization[auth.authorization_id] = user.id
+
+    @staticmethod
+    def _copy(user: domain.User) -> domain.User:
+        # Pending events stay with the original aggregate
+        return domain.User(
+            user_id=user.id,
+            email=user.email,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            password_hash=user.password_hash,
+            salt=user.salt,
+            is_active=user.is_active,
+            authorizations=[dataclasses.replace(a) for a in user.authorizations],
+            kind=user.kind,
+            failed_logins=user.failed_logins,
+            locked_until=user.locked_until,
         )
 
 
 class Authorization(Base, TimeMixin):
     __tablename__ = "authorizations"
+    __table_args__ = (
+        sa.Index("ix_authorizations_user_id", "user_id"),
+        # Active sessions of a user in keyset order, logouts only touch it
+        sa.Index(
+            "ix_authorizations_active",
+            "user_id",
+            "created_at",
+            "authorization_id",
+            postgresql_where=sa.text("logout_at IS NULL"),
+            sqlite_where=sa.text("logout_at IS NULL"),
+        ),
+        sa.Index("ix_authorizations_logout_at", "logout_at"),
+    )
 
     authorization_id: Mapped[uuid.UUID] = mapped_column(primary_key=True)
-    active_until: Mapped[datetime] = mapped_column(sa.DateTime(timezone=True))
+    active_until: Mapped[datetime] = mapped_column(TZDateTime())
     logout_at: Mapped[datetime] = mapped_column(nullable=True)
     user_id: Mapped[uuid.UUID] = mapped_column(sa.ForeignKey("users.user_id"))
 
@@ -138,17 +513,155 @@ class User(Base, TimeMixin):
 
     user_id: Mapped[uuid.UUID] = mapped_column(primary_key=True)
     kind: Mapped[domain.UserKind] = mapped_column()
-    email: Mapped[str] = mapped_column(unique=True, index=True)
+    email: Mapped[str] = mapped_column()
     password_hash: Mapped[str] = mapped_column()
     salt: Mapped[str] = mapped_column()
     first_name: Mapped[str] = mapped_column()
     last_name: Mapped[str] = mapped_column()
     is_active: Mapped[bool] = mapped_column()
+    failed_logins: Mapped[int] = mapped_column(default=0, server_default="0")
+    locked_until: Mapped[datetime | None] = mapped_column(TZDateTime(), nullable=True)
+    # Shard slot of the user, empty for users written before it was added
+    slot: Mapped[int | None] = mapped_column(
+        sa.SmallInteger(), nullable=True, index=True
+    )
     authorizations: Mapped[list[Authorization]] = relationship(
         "Authorization", lazy="joined", cascade="all, delete-orphan"
     )
 
 
+# Emails are stored normalized, the index keeps them unique for rows
+# written before as well. Lookups must compare the same expression
+sa.Index("ix_users_email_lower", sa.func.lower(User.email), unique=True)
+
+# Trigram indexes of user search, they require the pg_trgm extension
+for _column in (User.first_name, User.last_name, User.email):
+    sa.Index(
+        f"ix_users_{_column.key}_trgm",
+        _column,
+        postgresql_using="gin",
+        postgresql_ops={_column.key: "gin_trgm_ops"},
+    )
+
+# Statements are built once and take their values as bound parameters,
+# so every call hits the compiled cache without rebuilding the construct
+GET_USER = (
+    sa.select(User)
+    .where(User.user_id == sa.bindparam("user_id"))
+    .options(selectinload(User.authorizations))
+)
+
+GET_USER_BY_EMAIL = (
+    sa.select(User)
+    .where(sa.func.lower(User.email) == sa.bindparam("email"))
+    .options(selectinload(User.authorizations))
+)
+
+GET_USER_BY_AUTHORIZATION = (
+    sa.select(User)
+    .join(User.authorizations)
+    .where(
+        Authorization.logout_at.is_(None)
+        & (Authorization.authorization_id == sa.bindparam("authorization_id"))
+    )
+    .options(selectinload(User.authorizations))
+)
+
+# Bound names differ from column names, update statements reserve those
+LOGOUT = (
+    sa.update(Authorization)
+    .where(
+        (Authorization.authorization_id == sa.bindparam("auth_id"))
+        & (Authorization.user_id == sa.bindparam("owner_id"))
+        & Authorization.logout_at.is_(None)
+    )
+    .values(logout_at=sa.bindparam("now"), updated_at=sa.func.now())
+    .execution_options(synchronize_session=False)
+)
+
+LOGOUT_ALL = (
+    sa.update(Authorization)
+    .where(
+        (Authorization.user_id == sa.bindparam("owner_id"))
+        & Authorization.logout_at.is_(None)
+    )
+    .values(logout_at=sa.bindparam("now"), updated_at=sa.func.now())
+    .returning(Authorization.authorization_id)
+    .execution_options(synchronize_session=False)
+)
+
+LIST_SESSIONS = (
+    sa.select(Authorization)
+    .where(
+        (Authorization.user_id == sa.bindparam("user_id"))
+        & Authorization.logout_at.is_(None)
+        & (Authorization.active_until > sa.bindparam("now"))
+    )
+    .order_by(Authorization.created_at.desc(), Authorization.authorization_id.desc())
+    .limit(sa.bindparam("limit"))
+)
+
+LIST_SESSIONS_AFTER = LIST_SESSIONS.where(
+    sa.tuple_(Authorization.created_at, Authorization.authorization_id)
+    < sa.tuple_(
+        sa.bindparam("created_at", type_=Authorization.created_at.type),
+        sa.bindparam("authorization_id", type_=Authorization.authorization_id.type),
+    )
+)
+
+GET_KINDS = sa.select(User.user_id, User.kind).where(
+    User.user_id.in_(sa.bindparam("user_ids", expanding=True))
+)
+
+REVOKED_SINCE = sa.select(Authorization.authorization_id).where(
+    Authorization.logout_at > sa.bindparam("since")
+)
+
+
+_SEARCH_QUERY = sa.bindparam("q", type_=sa.String())
+
+# Best similarity of the fields, every one of them has a trigram index
+_SEARCH_SCORE = greatest(
+    sa.func.similarity(User.first_name, _SEARCH_QUERY),
+    sa.func.similarity(User.last_name, _SEARCH_QUERY),
+    sa.func.similarity(User.email, _SEARCH_QUERY),
+)
+
+SEARCH_USERS = (
+    sa.select(
+        User.user_id,
+        User.kind,
+        User.email,
+        User.first_name,
+        User.last_name,
+        _SEARCH_SCORE.label("score"),
+    )
+    .where(
+        (User.kind == sa.bindparam("kind"))
+        & sa.or_(
+            trigram_match(User.first_name, _SEARCH_QUERY),
+            trigram_match(User.last_name, _SEARCH_QUERY),
+            trigram_match(User.email, _SEARCH_QUERY),
+        )
+    )
+    .order_by(sa.desc("score"), User.user_id)
+    .limit(sa.bindparam("limit"))
+)
+
+SEARCH_USERS_AFTER = SEARCH_USERS.where(
+    (_SEARCH_SCORE < sa.bindparam("score", type_=sa.Float()))
+    | (
+        (_SEARCH_SCORE == sa.bindparam("score", type_=sa.Float()))
+        & (User.user_id > sa.bindparam("after_id", type_=User.user_id.type))
+    )
+)
+
+
+def _utcnow() -> datetime:
+    # Column is timezone naive, see the initial migration
+    return domain.User.now().replace(tzinfo=None)
+
+
 T = TypeVar("T")
 
 
@@ -0,0 +1,425 @@
+from __future__ import annotations
+
+import collections
+import functools
+import heapq
+import time
+import uuid
+from datetime import datetime
+from typing import Iterable, Sequence
+
+import sqlalchemy as sa
+from loguru import logger
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Mapped, mapped_column
+
+from auth import domain
+from auth.adapter.repository import (
+    AbstractUserRepository,
+    Authorization,
+    User,
+    UserRepository,
+)
+from auth.domain.service import normalize_email
+from common.domain import DomainEvent
+from common.sharding import (
+    SLOTS,
+    ShardSessions,
+    ShardSet,
+    ShardSlot,
+    slot_of,
+    slot_of_tagged,
+)
+from common.sql import Base
+
+__all__ = ["ShardedUserRepository", "SlotMover", "UserDirectoryEntry"]
+
+
+class UserDirectoryEntry(Base):
+    """Owner of an email, kept by the first shard for all of them."""
+
+    __tablename__ = "user_directory"
+
+    email: Mapped[str] = mapped_column(primary_key=True)
+    user_id: Mapped[uuid.UUID] = mapped_column()
+
+
+GET_DIRECTORY_ENTRY = sa.select(UserDirectoryEntry.user_id).where(
+    UserDirectoryEntry.email == sa.bindparam("email")
+)
+
+DELETE_DIRECTORY_ENTRY = sa.delete(UserDirectoryEntry).where(
+    (UserDirectoryEntry.email == sa.bindparam("entry_email"))
+    & (UserDirectoryEntry.user_id == sa.bindparam("owner_id"))
+)
+
+
+class ShardedUserRepository(AbstractUserRepository):
+    """Users spread over shards by a hash of their id.
+
+    Every call is routed to the repository of the shard owning the user.
+    Emails are resolved to ids by the directory, authorization ids carry
+    the slot of their user. Listings of all users are gathered from every
+    shard.
+    """
+
+    def __init__(self, sessions: ShardSessions) -> None:
+        self._sessions = sessions
+        self._repos = dict[int, UserRepository]()
+
+    def add(self, user: domain.User) -> None:
+        self._owner(user.id, write=True).add(user)
+        # Directory is committed first, a taken email fails the unit of work
+        # before the user is written
+        self._sessions.shard(0).add(
+            UserDirectoryEntry(email=user.email, user_id=user.id)
+        )
+        self._sessions.on_partial_commit(functools.partial(self._unregister, user))
+
+    def persist(self, user: domain.User) -> None:
+        self._owner(user.id, write=True).persist(user)
+
+    def get(self, user_id: uuid.UUID) -> domain.User | None:
+        return self._owner(user_id).get(user_id)
+
+    def get_by_email(self, email: str) -> domain.User | None:
+        email = normalize_email(email)
+        user_id = (
+            self._sessions.shard(0)
+            .execute(GET_DIRECTORY_ENTRY, {"email": email})
+            .scalar_one_or_none()
+        )
+        if user_id is None:
+            return None
+        user = self.get(user_id)
+        # Entry may outlive a user whose shard failed to commit
+        return user if user is not None and user.email == email else None
+
+    def get_by_authorization(self, auth_id: uuid.UUID) -> domain.User | None:
+        slot = slot_of_tagged(auth_id)
+        if slot is not None:
+            index = self._sessions.slots.shard_of_slot(slot)
+            return self._shard(index).get_by_authorization(auth_id)
+
+        # Ids issued before sharding carry no slot
+        for index in range(len(self._sessions)):
+            user = self._shard(index).get_by_authorization(auth_id)
+            if user is not None and self._owns(index, user.id):
+                return user
+        return None
+
+    def logout(self, user_id: uuid.UUID, auth_id: uuid.UUID) -> bool:
+        return self._owner(user_id, write=True).logout(user_id, auth_id)
+
+    def logout_all(self, user_id: uuid.UUID) -> list[uuid.UUID]:
+        return self._owner(user_id, write=True).logout_all(user_id)
+
+    def list_sessions(
+        self,
+        user_id: uuid.UUID,
+        limit: int,
+        after: tuple[datetime, uuid.UUID] | None = None,
+    ) -> list[domain.Authorization]:
+        return self._owner(user_id).list_sessions(user_id, limit, after)
+
+    def revoked_since(self, since: datetime) -> list[uuid.UUID]:
+        return [
+            auth_id
+            for index in range(len(self._sessions))
+            for auth_id in self._shard(index).revoked_since(since)
+        ]
+
+    def kinds(self, user_ids: Iterable[uuid.UUID]) -> dict[uuid.UUID, domain.UserKind]:
+        # A single query a shard for the ids it owns
+        by_shard = collections.defaultdict[int, list[uuid.UUID]](list)
+        for user_id in user_ids:
+            by_shard[self._sessions.shard_index(user_id)].append(user_id)
+        return {
+            user_id: kind
+            for index, ids in by_shard.items()
+            for user_id, kind in self._shard(index).kinds(ids).items()
+        }
+
+    def search(
+        self,
+        query: str,
+        kind: domain.UserKind,
+        limit: int,
+        after: tuple[float, uuid.UUID] | None = None,
+    ) -> list[domain.UserMatch]:
+        # Every shard returns its best page, the best of them are merged.
+        # Users copied to a shard they don't belong to yet are skipped
+        matches = [
+            match
+            for index in range(len(self._sessions))
+            for match in self._shard(index).search(query, kind, limit, after)
+            if self._owns(index, match.user_id)
+        ]
+        matches.sort(key=lambda m: (-m.score, m.user_id))
+        return matches[:limit]
+
+    def warm_up(self) -> None:
+        for index in range(len(self._sessions)):
+            self._shard(index).warm_up()
+        self._sessions.shard(0).execute(GET_DIRECTORY_ENTRY, {"email": ""})
+
+    def collect_events(self) -> Iterable[DomainEvent]:
+        return list(
+            heapq.merge(*(repo.collect_events() for repo in self._repos.values()))
+        )
+
+    def _shard(self, index: int) -> UserRepository:
+        repo = self._repos.get(index)
+        if repo is None:
+            repo = self._repos[index] = UserRepository(self._sessions.shard(index))
+        return repo
+
+    def _owner(self, user_id: uuid.UUID, write: bool = False) -> UserRepository:
+        return self._shard(self._sessions.shard_index(user_id, write))
+
+    def _owns(self, index: int, user_id: uuid.UUID) -> bool:
+        return self._sessions.slots.shard_of(user_id) == index
+
+    def _unregister(self, user: domain.User) -> None:
+        directory = self._sessions.shard(0)
+        directory.execute(
+            DELETE_DIRECTORY_ENTRY, {"entry_email": user.email, "owner_id": user.id}
+        )
+        directory.commit()
+
+
+_SLOTS = sa.bindparam("slots", expanding=True)
+_USER_IDS = sa.bindparam("user_ids", expanding=True)
+
+SLOT_USERS = (
+    sa.select(User.__table__)
+    .where(User.slot.in_(_SLOTS))
+    .order_by(User.user_id)
+    .limit(sa.bindparam("limit"))
+)
+
+SLOT_USERS_AFTER = SLOT_USERS.where(
+    User.user_id > sa.bindparam("after", type_=User.user_id.type)
+)
+
+USERS_AUTHORIZATIONS = sa.select(Authorization.__table__).where(
+    Authorization.user_id.in_(_USER_IDS)
+)
+
+SLOT_USER_IDS = (
+    sa.select(User.user_id).where(User.slot.in_(_SLOTS)).limit(sa.bindparam("limit"))
+)
+
+DELETE_AUTHORIZATIONS = sa.delete(Authorization).where(
+    Authorization.user_id.in_(_USER_IDS)
+)
+
+DELETE_USERS = sa.delete(User).where(User.user_id.in_(_USER_IDS))
+
+UNSLOTTED_USER_IDS = (
+    sa.select(User.user_id).where(User.slot.is_(None)).limit(sa.bindparam("limit"))
+)
+
+SET_SLOT = (
+    sa.update(User)
+    .where(User.user_id == sa.bindparam("owner_id"))
+    .values(slot=sa.bindparam("user_slot"))
+)
+
+USER_EMAILS = (
+    sa.select(User.user_id, sa.func.lower(User.email).label("email"))
+    .order_by(User.user_id)
+    .limit(sa.bindparam("limit"))
+)
+
+USER_EMAILS_AFTER = USER_EMAILS.where(
+    User.user_id > sa.bindparam("after", type_=User.user_id.type)
+)
+
+
+class SlotMover:
+    """Moves users of slots between shards while the service is running.
+
+    Slots are frozen first: writes of their users fail and units of work
+    begun before are given ``settle`` seconds to finish. Reads keep being
+    served by the source shard while rows are copied, then the slots are
+    assigned to the target and the source is cleaned up once reads begun
+    before have finished. Moving a few slots at a time keeps the freeze
+    short. A failed move is resumed by running it again.
+
+    ``settle`` must exceed the slot map poll interval of workers plus the
+    duration of their longest unit of work.
+    """
+
+    def __init__(self, shards: ShardSet, settle: float, batch_size: int = 1000) -> None:
+        self._shards = shards
+        self._settle = settle
+        self._batch_size = batch_size
+
+    def prepare(self) -> None:
+        """Fills slots and directory entries of users written before sharding."""
+        for index, engine in enumerate(self._shards.engines):
+            filled = self._fill_slots(engine)
+            registered = self._fill_directory(engine)
+            logger.info(
+                f"Shard {index}: filled {filled} slots, "
+                f"registered {registered} emails"
+            )
+
+    def move(self, slots: Iterable[int], target: int) -> int:
+        """Moves the slots to the target shard, returns how many users moved."""
+        current = self._shards.refresh()
+        by_source = collections.defaultdict[int, list[int]](list)
+        for slot in slots:
+            source = current.shard_of_slot(slot)
+            if source != target:
+                by_source[source].append(slot)
+
+        moved = 0
+        for source, group in by_source.items():
+            started_at = time.monotonic()
+            self._assign(group, source, frozen=True)
+            time.sleep(self._settle)
+            copied = self._copy(source, target, group)
+            self._assign(group, target, frozen=False)
+            time.sleep(self._settle)
+            self._delete(source, group)
+
+            moved += copied
+            logger.info(
+                f"Moved {len(group)} slots with {copied} users from shard {source} "
+                f"to {target} in {time.monotonic() - started_at:.1f}s"
+            )
+        return moved
+
+    def purge(self) -> int:
+        """Deletes users left on shards which don't own their slots."""
+        current = self._shards.refresh()
+        deleted = 0
+        for index in range(len(self._shards)):
+            foreign = [
+                slot for slot in range(SLOTS) if current.shard_of_slot(slot) != index
+            ]
+            deleted += self._delete(index, foreign)
+        return deleted
+
+    def _assign(self, slots: Sequence[int], shard: int, frozen: bool) -> None:
+        with self._shards.engines[0].begin() as conn:
+            _upsert(
+                conn,
+                ShardSlot.__table__,
+                [{"slot": slot, "shard": shard, "frozen": frozen} for slot in slots],
+                "slot",
+            )
+        self._shards.refresh()
+
+    def _copy(self, source: int, target: int, slots: Sequence[int]) -> int:
+        source_engine = self._shards.engines[source]
+        target_engine = self._shards.engines[target]
+        params = {"slots": list(slots), "limit": self._batch_size}
+        copied = 0
+        while True:
+            with source_engine.connect() as conn:
+                query = SLOT_USERS if "after" not in params else SLOT_USERS_AFTER
+                users = conn.execute(query, params).mappings().all()
+                if not users:
+                    return copied
+                user_ids = [user["user_id"] for user in users]
+                authorizations = (
+                    conn.execute(USERS_AUTHORIZATIONS, {"user_ids": user_ids})
+                    .mappings()
+                    .all()
+                )
+
+            # Upserts make a copy interrupted before safe to repeat
+            with target_engine.begin() as conn:
+                _upsert(conn, User.__table__, users, "user_id")
+                if authorizations:
+                    _upsert(
+                        conn,
+                        Authorization.__table__,
+                        authorizations,
+                        "authorization_id",
+                    )
+            copied += len(users)
+            params["after"] = user_ids[-1]
+
+    def _delete(self, index: int, slots: Sequence[int]) -> int:
+        deleted = 0
+        while slots:
+            with self._shards.engines[index].begin() as conn:
+                user_ids = (
+                    conn.execute(
+                        SLOT_USER_IDS,
+                        {"slots": list(slots), "limit": self._batch_size},
+                    )
+                    .scalars()
+                    .all()
+                )
+                if not user_ids:
+                    break
+                conn.execute(DELETE_AUTHORIZATIONS, {"user_ids": user_ids})
+                conn.execute(DELETE_USERS, {"user_ids": user_ids})
+            deleted += len(user_ids)
+        return deleted
+
+    def _fill_slots(self, engine: sa.Engine) -> int:
+        filled = 0
+        while True:
+            with engine.begin() as conn:
+                user_ids = (
+                    conn.execute(UNSLOTTED_USER_IDS, {"limit": self._batch_size})
+                    .scalars()
+                    .all()
+                )
+                if not user_ids:
+                    return filled
+                conn.execute(
+                    SET_SLOT,
+                    [
+                        {"owner_id": user_id, "user_slot": slot_of(user_id)}
+                        for user_id in user_ids
+                    ],
+                )
+            filled += len(user_ids)
+
+    def _fill_directory(self, engine: sa.Engine) -> int:
+        params = dict[str, object](limit=self._batch_size)
+        registered = 0
+        while True:
+            with engine.connect() as conn:
+                query = USER_EMAILS if "after" not in params else USER_EMAILS_AFTER
+                rows = conn.execute(query, params).all()
+            if not rows:
+                return registered
+            with self._shards.engines[0].begin() as conn:
+                _insert_missing(
+                    conn,
+                    UserDirectoryEntry.__table__,
+                    [{"email": row.email, "user_id": row.user_id} for row in rows],
+                )
+            registered += len(rows)
+            params["after"] = rows[-1].user_id
+
+
+def _insert(conn: sa.Connection):
+    return postgresql.insert if conn.dialect.name == "postgresql" else sqlite.insert
+
+
+def _upsert(
+    conn: sa.Connection, table: sa.Table, rows: Sequence[dict], key: str
+) -> None:
+    statement = _insert(conn)(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[key],
+        set_={
+            column.name: statement.excluded[column.name]
+            for column in table.columns
+            if column.name != key
+        },
+    )
+    conn.execute(statement, [dict(row) for row in rows])
+
+
+def _insert_missing(conn: sa.Connection, table: sa.Table, rows: Sequence[dict]) -> None:
+    conn.execute(_insert(conn)(table).on_conflict_do_nothing(), list(rows))
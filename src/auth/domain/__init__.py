@@ -1,3 +1,11 @@
-from .models import User, UserKind, Authorization
+from .models import User, UserKind, Authorization, UserLockedError, UserMatch
 
-__all__ = ["models", "User", "service", "UserKind", "Authorization"]
+__all__ = [
+    "models",
+    "User",
+    "service",
+    "UserKind",
+    "Authorization",
+    "UserLockedError",
+    "UserMatch",
+]
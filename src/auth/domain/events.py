@@ -1,5 +1,6 @@
 import uuid
 from dataclasses import dataclass
+from datetime import datetime
 from typing import Literal
 
 from common.domain import DomainEvent
@@ -10,3 +11,9 @@ class UserCreated(DomainEvent):
     user_id: uuid.UUID
     email: str
     kind: Literal["coach", "trainee"]
+
+
+@dataclass(frozen=True)
+class UserLockedOut(DomainEvent):
+    user_id: uuid.UUID
+    locked_until: datetime
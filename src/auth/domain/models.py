@@ -5,12 +5,12 @@ import uuid
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 
-from common.domain import Aggregate
+from common.domain import Aggregate, DomainError, slot_of, tagged_id
 
 from . import events
-from .service import hash_password, validate_password
+from .service import hash_password, normalize_email, validate_password
 
-__all__ = ["User", "UserKind", "Authorization"]
+__all__ = ["User", "UserKind", "Authorization", "UserLockedError", "UserMatch"]
 
 
 class UserKind(str, enum.Enum):
@@ -18,8 +18,17 @@ class UserKind(str, enum.Enum):
     TRAINEE = "trainee"
 
 
+class UserLockedError(DomainError):
+    def __init__(self, locked_until: datetime) -> None:
+        super().__init__(f"User is locked until {locked_until.isoformat()}")
+        self.locked_until = locked_until
+
+
 class User(Aggregate[uuid.UUID]):
     TOKEN_TTL = timedelta(days=7)
+    LOCKOUT_THRESHOLD = 5
+    LOCKOUT_BASE = timedelta(seconds=30)
+    LOCKOUT_MAX = timedelta(hours=1)
 
     def __init__(
         self,
@@ -32,6 +41,8 @@ class User(Aggregate[uuid.UUID]):
         password_hash: str,
         salt: str,
         authorizations: list[Authorization],
+        failed_logins: int = 0,
+        locked_until: datetime | None = None,
     ) -> None:
         super().__init__(user_id)
         self.kind = kind
@@ -42,6 +53,8 @@ class User(Aggregate[uuid.UUID]):
         self.salt = salt
         self.is_active = is_active
         self.authorizations = authorizations
+        self.failed_logins = failed_logins
+        self.locked_until = locked_until
 
     @classmethod
     def new(
@@ -54,6 +67,7 @@ class User(Aggregate[uuid.UUID]):
         password: str,
     ) -> User:
         password_hash, salt = hash_password(password)
+        email = normalize_email(email)
 
         user = User(
             kind, user_id, email, first_name, last_name, True, password_hash, salt, []
@@ -63,9 +77,16 @@ class User(Aggregate[uuid.UUID]):
         return user
 
     def auth(self, password: str) -> Authorization | None:
+        now = self.now()
+        if self.is_locked(now):
+            raise UserLockedError(self.locked_until)
+
         if not validate_password(password, self.password_hash, self.salt):
+            self._register_failed_login(now)
             return None
 
+        self.failed_logins = 0
+        self.locked_until = None
         auth = self._issue_token()
         self.authorizations.append(auth)
         return auth
@@ -81,12 +102,30 @@ class User(Aggregate[uuid.UUID]):
         except StopIteration:
             return None
 
-    @classmethod
-    def _issue_token(cls) -> Authorization:
+    def is_locked(self, now: datetime | None = None) -> bool:
+        if self.locked_until is None:
+            return False
+        return self.locked_until > (now or self.now())
+
+    def _register_failed_login(self, now: datetime) -> None:
+        self.failed_logins += 1
+        excess = self.failed_logins - self.LOCKOUT_THRESHOLD
+        if excess < 0:
+            return
+
+        # Lockout doubles with every failure past the threshold
+        lockout = min(self.LOCKOUT_BASE * 2 ** min(excess, 16), self.LOCKOUT_MAX)
+        self.locked_until = now + lockout
+        self.push_event(events.UserLockedOut(now, self.id, self.locked_until))
+
+    def _issue_token(self) -> Authorization:
+        now = self.now()
         return Authorization(
-            authorization_id=uuid.uuid4(),
-            active_until=cls.now() + cls.TOKEN_TTL,
+            # Id carries the slot of the user, it leads to the user's shard
+            authorization_id=tagged_id(slot_of(self.id)),
+            active_until=now + self.TOKEN_TTL,
             logout_at=None,
+            created_at=now,
         )
 
 
@@ -95,6 +134,7 @@ class Authorization:
     authorization_id: uuid.UUID
     active_until: datetime
     logout_at: datetime | None = None
+    created_at: datetime | None = None
 
 
 def authorization_is_active(token: Authorization, now: datetime | None = None) -> bool:
@@ -102,3 +142,16 @@ def authorization_is_active(token: Authorization, now: datetime | None = None) -
         now = datetime.now(timezone.utc)
 
     return token.logout_at is None and token.active_until < now
+
+
+@dataclass(frozen=True)
+class UserMatch:
+    """User found by a search, without authorizations of the aggregate."""
+
+    user_id: uuid.UUID
+    kind: UserKind
+    email: str
+    first_name: str
+    last_name: str
+    # Similarity of the best matching field, from 0 to 1
+    score: float
@@ -14,5 +14,14 @@ def hash_password(password: str, salt: str | None = None) -> tuple[str, str]:
     return password_hash, salt
 
 
+def normalize_email(email: str) -> str:
+    # Addresses are compared case-insensitively, as mail providers do
+    return email.strip().lower()
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
 def validate_password(password: str, password_hash: str, salt: str) -> bool:
     return hash_password(password, salt)[0] == password_hash
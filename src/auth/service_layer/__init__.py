@@ -1,3 +1,16 @@
-from .uow import UserUnitOfWork
+from .uow import (
+    UserUnitOfWork,
+    SQLUserUnitOfWork,
+    ShardedUserUnitOfWork,
+    InMemoryUserUnitOfWork,
+)
+from .revocation import RevocationCache
 
-__all__ = ["UserUnitOfWork", "auth"]
+__all__ = [
+    "UserUnitOfWork",
+    "SQLUserUnitOfWork",
+    "ShardedUserUnitOfWork",
+    "InMemoryUserUnitOfWork",
+    "RevocationCache",
+    "auth",
+]
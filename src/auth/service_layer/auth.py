@@ -4,29 +4,56 @@ from datetime import datetime, timezone, timedelta
 from typing import Callable
 
 import jwt
-import sqlalchemy.exc
 
-from auth.domain import User, UserKind
+from auth.domain import Authorization, User, UserKind, UserLockedError, UserMatch
+from auth.domain.service import normalize_query
+from common import ConflictError
+from common.breaker import CircuitOpenError
+from common.cache import LRUCache
+from common.metrics import Counter, Histogram
 from pydantic import BaseModel, Field, ConfigDict
 
-from auth.service_layer import UserUnitOfWork
+from auth.service_layer import RevocationCache, UserUnitOfWork
+
+ACCESS_TOKEN_TTL = timedelta(hours=1)
+# Access tokens refreshed while the database is down are checked against
+# cached data only, they expire sooner
+DEGRADED_ACCESS_TOKEN_TTL = timedelta(minutes=5)
 
 
 @dataclass(frozen=True)
 class TokensPair:
     access_token: str
     refresh_token: str
+    user_id: uuid.UUID
     token_type: str = field(default="bearer", init=False)
 
 
 class InvalidCredentials(Exception):
-    pass
+    def __init__(
+        self,
+        message: str,
+        user_id: uuid.UUID | None = None,
+        reason: str | None = None,
+    ) -> None:
+        super().__init__(message)
+        # User of the failed login, if the email is known, and why it failed
+        self.user_id = user_id
+        self.reason = reason
 
 
 class AuthorizationExpired(InvalidCredentials):
     pass
 
 
+class UserLocked(InvalidCredentials):
+    def __init__(
+        self, message: str, locked_until: datetime, user_id: uuid.UUID | None = None
+    ) -> None:
+        super().__init__(message, user_id, "locked")
+        self.locked_until = locked_until
+
+
 class UserAlreadyExistsError(Exception):
     pass
 
@@ -35,6 +62,19 @@ class UserNotFoundError(Exception):
     pass
 
 
+FAILED_LOGINS = Counter(
+    "auth_failed_logins_total",
+    "Rejected login attempts by reason",
+    ["reason"],
+)
+
+AUTH_DURATION = Histogram(
+    "auth_operation_duration_seconds",
+    "Duration of password hashing and token operations",
+    ["operation"],
+)
+
+
 def create_user(
     uow: UserUnitOfWork,
     user_id: uuid.UUID,
@@ -45,29 +85,49 @@ def create_user(
     last_name: str,
 ) -> User:
     with uow:
-        user = User.new(
-            user_id=user_id,
-            kind=kind,
-            email=email,
-            first_name=first_name,
-            last_name=last_name,
-            password=password,
-        )
+        with AUTH_DURATION.time("hash_password"):
+            user = User.new(
+                user_id=user_id,
+                kind=kind,
+                email=email,
+                first_name=first_name,
+                last_name=last_name,
+                password=password,
+            )
         uow.user_repo.add(user)
         try:
             uow.commit()
-        except sqlalchemy.exc.IntegrityError:
+        except ConflictError:
             raise UserAlreadyExistsError("user with given id or email already exists")
         return user
 
 
-def get_user_by_id(uow: UserUnitOfWork, user_id: uuid.UUID) -> User | None:
-    with uow:
-        return uow.user_repo.get(user_id)
+# Users read while the database is up, served while it is down
+UserCache = LRUCache[uuid.UUID, User]
+
+
+def get_user_by_id(
+    uow: UserUnitOfWork, user_id: uuid.UUID, cache: UserCache | None = None
+) -> User | None:
+    try:
+        with uow:
+            user = uow.user_repo.get(user_id)
+    except CircuitOpenError:
+        cached = cache.get(user_id) if cache is not None else None
+        if cached is None:
+            raise
+        return cached
+
+    if cache is not None and user is not None:
+        cache.put(user_id, user)
+    return user
 
 
 class AccessTokenClaims(BaseModel):
     user_id: uuid.UUID = Field(alias="sub")
+    # Authorization the token was issued for, absent in older tokens
+    session_id: uuid.UUID | None = Field(default=None, alias="sid")
+    kind: UserKind | None = Field(default=None, alias="kind")
     issued_at: datetime = Field(alias="iat")
     expires_at: datetime = Field(alias="exp")
     email: str = Field(alias="email")
@@ -82,12 +142,15 @@ class AccessTokenClaims(BaseModel):
 def issue_access_token(
     user: User,
     secret: str,
+    auth_id: uuid.UUID | None = None,
     now: Callable[[], datetime] = lambda: datetime.now(timezone.utc),
-    ttl: timedelta = timedelta(hours=1),
+    ttl: timedelta = ACCESS_TOKEN_TTL,
 ) -> str:
     now_ = now()
     claims = AccessTokenClaims(
         user_id=user.id,
+        session_id=auth_id,
+        kind=user.kind,
         issued_at=now_,
         expires_at=now_ + ttl,
         email=user.email,
@@ -95,7 +158,8 @@ def issue_access_token(
         last_name=user.last_name,
     )
 
-    return jwt.encode(claims.model_dump(mode="json"), secret, algorithm="HS256")
+    with AUTH_DURATION.time("jwt_encode"):
+        return jwt.encode(claims.model_dump(mode="json"), secret, algorithm="HS256")
 
 
 class RefreshTokenClaims(BaseModel):
@@ -124,58 +188,199 @@ def issue_refresh_token(
         expires_at=now_ + ttl,
     )
 
-    return jwt.encode(claims.model_dump(mode="json"), secret, algorithm="HS256")
+    with AUTH_DURATION.time("jwt_encode"):
+        return jwt.encode(claims.model_dump(mode="json"), secret, algorithm="HS256")
 
 
 def decode_refresh_token(
     token: str,
     secret: str,
 ) -> RefreshTokenClaims:
-    return RefreshTokenClaims.model_validate(
-        jwt.decode(token, secret, "HS256", verify=False)
-    )
+    with AUTH_DURATION.time("jwt_decode"):
+        return RefreshTokenClaims.model_validate(
+            jwt.decode(token, secret, "HS256", verify=False)
+        )
 
 
 def validate_token(token: str, secret: str) -> AccessTokenClaims:
-    raw_claims = jwt.decode(token, secret, algorithms=["HS256"], verify=True)
-    return AccessTokenClaims.model_validate(raw_claims)
+    with AUTH_DURATION.time("jwt_decode"):
+        raw_claims = jwt.decode(token, secret, algorithms=["HS256"], verify=True)
+        return AccessTokenClaims.model_validate(raw_claims)
 
 
-def login(email: str, password: str, uow: UserUnitOfWork, secret: str) -> TokensPair:
+def login(
+    email: str,
+    password: str,
+    uow: UserUnitOfWork,
+    secret: str,
+    cache: UserCache | None = None,
+) -> TokensPair:
+    """Logs the user in, failures carry the user and the reason to audit."""
     with uow:
         user = uow.user_repo.get_by_email(email)
         if user is None:
-            raise InvalidCredentials("User with provided email does not exist")
+            FAILED_LOGINS.inc(1, "unknown_user")
+            raise InvalidCredentials(
+                "User with provided email does not exist", reason="unknown_user"
+            )
 
-        if (auth := user.auth(password)) is None:
-            raise InvalidCredentials("Invalid credentials")
+        try:
+            with AUTH_DURATION.time("validate_password"):
+                auth = user.auth(password)
+        except UserLockedError as e:
+            FAILED_LOGINS.inc(1, "locked")
+            raise UserLocked(e.args[0], e.locked_until, user.id)
 
+        # Failed attempts are persisted as well, they drive the lockout
         uow.user_repo.persist(user)
         uow.commit()
 
-        access_token = issue_access_token(user, secret)
-        refresh_token = issue_refresh_token(user.id, auth.authorization_id, secret)
+    if auth is None:
+        FAILED_LOGINS.inc(1, "invalid_password")
+        raise InvalidCredentials("Invalid credentials", user.id, "invalid_password")
 
-        return TokensPair(access_token, refresh_token)
+    if cache is not None:
+        cache.put(user.id, user)
+    access_token = issue_access_token(user, secret, auth.authorization_id)
+    refresh_token = issue_refresh_token(user.id, auth.authorization_id, secret)
+
+    return TokensPair(access_token, refresh_token, user.id)
 
 
 def refresh(
     refresh_token: str,
     uow: UserUnitOfWork,
     secret: str,
+    cache: UserCache | None = None,
+    revocations: RevocationCache | None = None,
+    degraded_ttl: timedelta = DEGRADED_ACCESS_TOKEN_TTL,
 ) -> TokensPair:
-    with uow:
-        now = datetime.now(timezone.utc)
-        claims = decode_refresh_token(refresh_token, secret)
-        user = uow.user_repo.get_by_authorization(claims.authorization_id)
+    now = datetime.now(timezone.utc)
+    claims = decode_refresh_token(refresh_token, secret)
+    try:
+        with uow:
+            user = uow.user_repo.get_by_authorization(claims.authorization_id)
+    except CircuitOpenError:
+        user = _cached_authorized_user(claims, cache, revocations)
+        if user is None:
+            raise
+        ttl = degraded_ttl
+    else:
         if user is None:
             raise InvalidCredentials("Invalid refresh token")
+        if cache is not None:
+            cache.put(user.id, user)
+        ttl = ACCESS_TOKEN_TTL
 
-        if user.find_authorization(claims.authorization_id).active_until < now:
-            raise AuthorizationExpired(
-                f"Authorization {claims.authorization_id} has expired"
-            )
+    if user.find_authorization(claims.authorization_id).active_until < now:
+        raise AuthorizationExpired(
+            f"Authorization {claims.authorization_id} has expired"
+        )
 
-        access_token = issue_access_token(user, secret)
+    access_token = issue_access_token(user, secret, claims.authorization_id, ttl=ttl)
+
+    return TokensPair(access_token, refresh_token, user.id)
+
+
+def _cached_authorized_user(
+    claims: RefreshTokenClaims,
+    cache: UserCache | None,
+    revocations: RevocationCache | None,
+) -> User | None:
+    # Logouts are known from the revocation cache, an authorization missing
+    # from the cached user was made after caching and can't be checked
+    if cache is None or revocations is None:
+        return None
+    if revocations.is_revoked(claims.authorization_id):
+        raise InvalidCredentials("Invalid refresh token")
+    user = cache.get(claims.user_id)
+    authorization = (
+        user.find_authorization(claims.authorization_id) if user is not None else None
+    )
+    if authorization is None:
+        return None
+    if authorization.logout_at is not None:
+        raise InvalidCredentials("Invalid refresh token")
+    return user
+
+
+def warm_up(uow: UserUnitOfWork) -> None:
+    with uow:
+        uow.user_repo.warm_up()
+
+
+def logout(
+    uow: UserUnitOfWork,
+    revocations: RevocationCache,
+    user_id: uuid.UUID,
+    auth_id: uuid.UUID,
+) -> bool:
+    with uow:
+        revoked = uow.user_repo.logout(user_id, auth_id)
+        uow.commit()
+
+    if revoked:
+        revocations.revoke([auth_id])
+    return revoked
+
+
+def logout_all(
+    uow: UserUnitOfWork,
+    revocations: RevocationCache,
+    user_id: uuid.UUID,
+) -> list[uuid.UUID]:
+    with uow:
+        revoked = uow.user_repo.logout_all(user_id)
+        uow.commit()
+
+    revocations.revoke(revoked)
+    return revoked
+
+
+def list_sessions(
+    uow: UserUnitOfWork,
+    user_id: uuid.UUID,
+    limit: int,
+    after: tuple[datetime, uuid.UUID] | None = None,
+) -> list[Authorization]:
+    with uow:
+        return uow.user_repo.list_sessions(user_id, limit, after)
+
+
+class PermissionDenied(Exception):
+    pass
+
+
+SearchCache = LRUCache[tuple[str, UserKind, int], list[UserMatch]]
+
+
+def search_users(
+    uow: UserUnitOfWork,
+    cache: SearchCache,
+    claims: AccessTokenClaims,
+    query: str,
+    limit: int,
+    after: tuple[float, uuid.UUID] | None = None,
+) -> list[UserMatch]:
+    kind = claims.kind
+    if kind is None:
+        # Token issued before kind was added to claims
+        user = get_user_by_id(uow, claims.user_id)
+        kind = user.kind if user is not None else None
+    if kind != UserKind.COACH:
+        raise PermissionDenied("Only coaches are allowed to search users")
+
+    query = normalize_query(query)
+    # Only first pages are cached, popular queries are typed prefixes
+    key = (query, UserKind.TRAINEE, limit)
+    if after is None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    with uow:
+        matches = uow.user_repo.search(query, UserKind.TRAINEE, limit, after)
 
-        return TokensPair(access_token, refresh_token)
+    if after is None:
+        cache.put(key, matches)
+    return matches
@@ -0,0 +1,101 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable
+
+from loguru import logger
+
+from auth.service_layer.uow import UserUnitOfWork
+from common.metrics import Counter
+
+__all__ = ["RevocationCache"]
+
+REVOKED_SESSIONS = Counter(
+    "auth_sessions_revoked_total",
+    "Authorizations added to the revocation cache by source",
+    ["source"],
+)
+
+
+class RevocationCache:
+    """Ids of logged out authorizations, checked on every access token.
+
+    Access tokens are verified without a database round trip, so a logout
+    only takes effect once the worker knows about it. Logouts made by the
+    worker are added right away, logouts of other workers are picked up
+    by polling the database. Ids are kept until access tokens issued for
+    them have expired.
+    """
+
+    # Logouts are stamped before their transaction commits, polls overlap
+    # by this much not to miss slow commits
+    OVERLAP = timedelta(seconds=5)
+
+    def __init__(self, retention: timedelta) -> None:
+        self._retention = retention.total_seconds()
+        self._lock = threading.Lock()
+        self._revoked = dict[uuid.UUID, float]()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def revoke(self, auth_ids: Iterable[uuid.UUID], source: str = "local") -> None:
+        expires_at = time.monotonic() + self._retention
+        added = 0
+        with self._lock:
+            for auth_id in auth_ids:
+                if auth_id not in self._revoked:
+                    added += 1
+                self._revoked[auth_id] = expires_at
+        if added:
+            REVOKED_SESSIONS.inc(added, source)
+
+    def is_revoked(self, auth_id: uuid.UUID) -> bool:
+        expires_at = self._revoked.get(auth_id)
+        return expires_at is not None and expires_at > time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    def sync(self, uow: UserUnitOfWork, since: datetime) -> None:
+        with uow:
+            revoked = uow.user_repo.revoked_since(since)
+        self.revoke(revoked, "poll")
+        self._prune()
+
+    def start(self, uow_factory: Callable[[], UserUnitOfWork], interval: float) -> None:
+        """Polls logouts of other workers every ``interval`` seconds."""
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._poll,
+            args=(uow_factory, interval),
+            name="revocation-poller",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _poll(self, uow_factory: Callable[[], UserUnitOfWork], interval: float) -> None:
+        # Tokens of authorizations logged out earlier have expired already
+        since = datetime.now(timezone.utc) - timedelta(seconds=self._retention)
+        while not self._stop.wait(interval):
+            started_at = datetime.now(timezone.utc)
+            try:
+                self.sync(uow_factory(), since)
+                since = started_at - self.OVERLAP
+            except Exception:
+                logger.exception("Can't poll revoked authorizations")
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                k for k, expires_at in self._revoked.items() if expires_at <= now
+            ]
+            for auth_id in expired:
+                del self._revoked[auth_id]
@@ -1,14 +1,59 @@
+import abc
+import functools
 from typing import cast
 
-from auth.adapter.repository import UserRepository
-from common import SQLUnitOfWork, AbstractMessageBus
+from auth.adapter.repository import (
+    AbstractUserRepository,
+    InMemoryUserRepository,
+    UserRepository,
+    UserStore,
+)
+from auth.adapter.sharding import ShardedUserRepository
+from common import (
+    AbstractMessageBus,
+    AbstractUnitOfWork,
+    InMemoryUnitOfWork,
+    SQLUnitOfWork,
+)
+from common.breaker import CircuitBreaker
+from common.sharding import ShardedSQLUnitOfWork, ShardSet
 from sqlalchemy.orm import sessionmaker, Session
 
 
-class UserUnitOfWork(SQLUnitOfWork):
-    def __init__(self, bus: AbstractMessageBus, sessionmaker_: sessionmaker[Session]):
-        super().__init__(bus, sessionmaker_, [UserRepository])
+class UserUnitOfWork(AbstractUnitOfWork):
+    @property
+    @abc.abstractmethod
+    def user_repo(self) -> AbstractUserRepository:
+        pass
+
+
+class SQLUserUnitOfWork(SQLUnitOfWork, UserUnitOfWork):
+    def __init__(
+        self,
+        bus: AbstractMessageBus,
+        sessionmaker_: sessionmaker[Session],
+        breaker: CircuitBreaker | None = None,
+    ):
+        super().__init__(bus, sessionmaker_, [UserRepository], breaker)
 
     @property
     def user_repo(self) -> UserRepository:
         return cast(UserRepository, self._repositories[UserRepository])
+
+
+class ShardedUserUnitOfWork(ShardedSQLUnitOfWork, UserUnitOfWork):
+    def __init__(self, bus: AbstractMessageBus, shards: ShardSet):
+        super().__init__(bus, shards, [ShardedUserRepository])
+
+    @property
+    def user_repo(self) -> ShardedUserRepository:
+        return cast(ShardedUserRepository, self._repositories[ShardedUserRepository])
+
+
+class InMemoryUserUnitOfWork(InMemoryUnitOfWork, UserUnitOfWork):
+    def __init__(self, bus: AbstractMessageBus, store: UserStore):
+        super().__init__(bus, [functools.partial(InMemoryUserRepository, store)])
+
+    @property
+    def user_repo(self) -> InMemoryUserRepository:
+        return cast(InMemoryUserRepository, self._repositories[InMemoryUserRepository])
@@ -1,13 +1,23 @@
 from .domain import DomainEvent
-from .repository import AbstractRepository
-from .service_layer import AbstractMessageBus
-from .unit_of_work import AbstractUnitOfWork, SQLUnitOfWork, UnitOfWorkError
+from .repository import AbstractRepository, InMemoryRepository
+from .service_layer import AbstractMessageBus, MessageBus
+from .unit_of_work import (
+    AbstractUnitOfWork,
+    ConflictError,
+    InMemoryUnitOfWork,
+    SQLUnitOfWork,
+    UnitOfWorkError,
+)
 
 __all__ = [
     "DomainEvent",
     "AbstractRepository",
+    "InMemoryRepository",
     "AbstractMessageBus",
+    "MessageBus",
     "AbstractUnitOfWork",
     "SQLUnitOfWork",
+    "InMemoryUnitOfWork",
+    "ConflictError",
     "UnitOfWorkError",
 ]
@@ -0,0 +1,189 @@
+"""Circuit breaker failing calls fast while a dependency is down.
+
+Outcomes of calls are counted in a sliding time window. Once enough of
+them failed or were slow the breaker opens and rejects calls for a while,
+so callers don't pile up waiting for timeouts. Then a few trial calls are
+let through: if they succeed the breaker closes, a failure opens it again.
+"""
+
+import collections
+import enum
+import threading
+import time
+from typing import Callable
+
+from common.metrics import Counter, Gauge
+from common.unit_of_work import UnitOfWorkError
+
+__all__ = ["CircuitState", "CircuitOpenError", "CircuitBreaker"]
+
+
+class CircuitState(enum.IntEnum):
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+
+BREAKER_STATE = Gauge(
+    "circuit_breaker_state",
+    "State of circuit breakers, 0 is closed, 1 half-open, 2 open",
+    ["breaker"],
+)
+
+BREAKER_TRANSITIONS = Counter(
+    "circuit_breaker_transitions_total",
+    "State changes of circuit breakers by the new state",
+    ["breaker", "state"],
+)
+
+BREAKER_REJECTED = Counter(
+    "circuit_breaker_rejected_total",
+    "Calls failed fast by circuit breakers",
+    ["breaker"],
+)
+
+
+class CircuitOpenError(UnitOfWorkError):
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Breaker of a single dependency, shared by threads of the worker.
+
+    ``allow`` is called before a call and raises ``CircuitOpenError`` when
+    the call must not be made, ``record`` is called with the outcome of
+    every call made. They don't have to be paired: a unit of work is
+    admitted once and records each of its statements.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        window: float = 10.0,
+        min_calls: int = 20,
+        failure_rate: float = 0.5,
+        slow_call_duration: float = 1.0,
+        slow_call_rate: float = 0.8,
+        open_duration: float = 5.0,
+        trial_calls: int = 3,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self._window = window
+        self._min_calls = min_calls
+        self._failure_rate = failure_rate
+        self._slow_call_duration = slow_call_duration
+        self._slow_call_rate = slow_call_rate
+        self._open_duration = open_duration
+        self._trial_calls = trial_calls
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._state = CircuitState.CLOSED
+        self._changed_at = clock()
+        # Second -> [calls, failures, slow calls], totals are kept alongside
+        self._buckets = collections.OrderedDict[int, list[int]]()
+        self._calls = self._failures = self._slow = 0
+        self._admitted = self._succeeded = 0
+        BREAKER_STATE.set(CircuitState.CLOSED, name)
+
+    @property
+    def state(self) -> CircuitState:
+        return self._state
+
+    def allow(self) -> None:
+        # Closed breaker is read without the lock, it is the hot path
+        if self._state == CircuitState.CLOSED:
+            return
+
+        with self._lock:
+            now = self._clock()
+            if (
+                self._state == CircuitState.OPEN
+                and now - self._changed_at >= self._open_duration
+            ):
+                self._transition(CircuitState.HALF_OPEN, now)
+
+            if self._state == CircuitState.HALF_OPEN:
+                # Trials which recorded nothing, e.g. stuck on a pool
+                # checkout, are replaced by new ones after a while
+                if now - self._changed_at >= self._open_duration:
+                    self._changed_at = now
+                    self._admitted = self._succeeded = 0
+                if self._admitted < self._trial_calls:
+                    self._admitted += 1
+                    return
+
+            if self._state == CircuitState.CLOSED:
+                return
+            retry_after = max(self._changed_at + self._open_duration - now, 0.0)
+
+        BREAKER_REJECTED.inc(1, self.name)
+        raise CircuitOpenError(f"{self.name} is unavailable", retry_after)
+
+    def check(self) -> None:
+        """Raises like ``allow`` while open, but doesn't take a trial."""
+        if self._state != CircuitState.OPEN:
+            return
+        retry_after = self._changed_at + self._open_duration - self._clock()
+        if retry_after > 0:
+            BREAKER_REJECTED.inc(1, self.name)
+            raise CircuitOpenError(f"{self.name} is unavailable", retry_after)
+
+    def record(self, elapsed: float, failed: bool = False) -> None:
+        slow = elapsed >= self._slow_call_duration
+        with self._lock:
+            now = self._clock()
+            if self._state == CircuitState.HALF_OPEN:
+                if failed or slow:
+                    self._transition(CircuitState.OPEN, now)
+                else:
+                    self._succeeded += 1
+                    if self._succeeded >= self._trial_calls:
+                        self._transition(CircuitState.CLOSED, now)
+            elif self._state == CircuitState.CLOSED:
+                self._count(now, failed, slow)
+                if self._should_open():
+                    self._transition(CircuitState.OPEN, now)
+            # Calls started before the breaker opened are ignored
+
+    def _count(self, now: float, failed: bool, slow: bool) -> None:
+        second = int(now)
+        bucket = self._buckets.get(second)
+        if bucket is None:
+            bucket = self._buckets[second] = [0, 0, 0]
+            while next(iter(self._buckets)) <= second - self._window:
+                calls, failures, slows = self._buckets.popitem(last=False)[1]
+                self._calls -= calls
+                self._failures -= failures
+                self._slow -= slows
+
+        bucket[0] += 1
+        self._calls += 1
+        if failed:
+            bucket[1] += 1
+            self._failures += 1
+        if slow:
+            bucket[2] += 1
+            self._slow += 1
+
+    def _should_open(self) -> bool:
+        if self._calls < self._min_calls:
+            return False
+        return (
+            self._failures >= self._failure_rate * self._calls
+            or self._slow >= self._slow_call_rate * self._calls
+        )
+
+    def _transition(self, state: CircuitState, now: float) -> None:
+        self._state = state
+        self._changed_at = now
+        self._admitted = self._succeeded = 0
+        if state == CircuitState.CLOSED:
+            self._buckets.clear()
+            self._calls = self._failures = self._slow = 0
+        BREAKER_STATE.set(state, self.name)
+        BREAKER_TRANSITIONS.inc(1, self.name, state.name.lower())
@@ -0,0 +1,71 @@
+import collections
+import threading
+import time
+from typing import Generic, Hashable, TypeVar
+
+from common.metrics import Counter
+
+__all__ = ["LRUCache"]
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total",
+    "Lookups of in-process caches by result",
+    ["cache", "result"],
+)
+
+
+class LRUCache(Generic[K, V]):
+    """Bounded cache of the worker, entries expire ``ttl`` seconds after put.
+
+    Least recently used entries are evicted first once it is full.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float) -> None:
+        self.name = name
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (expires at, value)
+        self._entries = collections.OrderedDict[K, tuple[float, V]]()
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        CACHE_LOOKUPS.inc(1, self.name, "miss" if entry is None else "hit")
+        return entry[1] if entry is not None else None
+
+    def put(self, key: K, value: V) -> None:
+        if self._maxsize == 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self._ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def resize(self, maxsize: int, ttl: float) -> None:
+        """Evicts least recently used entries beyond the new size.
+
+        Entries already cached keep their expiry time.
+        """
+        with self._lock:
+            self._maxsize = maxsize
+            self._ttl = ttl
+            while len(self._entries) > maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
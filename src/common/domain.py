@@ -1,4 +1,7 @@
+import hashlib
 import heapq
+import os
+import uuid
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from functools import total_ordering
@@ -44,3 +47,31 @@ class Aggregate(Generic[ID]):
     @staticmethod
     def now() -> datetime:
         return datetime.now(timezone.utc)
+
+
+# Upper bound of shards, slots are the unit of moving data
+SLOTS = 1024
+
+
+def slot_of(key: uuid.UUID) -> int:
+    # Keys may come from clients, so their bits are hashed rather than
+    # trusted to be random
+    digest = hashlib.blake2b(key.bytes, digest_size=4).digest()
+    return int.from_bytes(digest, "big") % SLOTS
+
+
+def tagged_id(slot: int) -> uuid.UUID:
+    """Random id carrying the slot, in the first 16 bits of a version 8 UUID."""
+    raw = bytearray(os.urandom(16))
+    raw[0:2] = slot.to_bytes(2, "big")
+    raw[6] = (raw[6] & 0x0F) | 0x80
+    raw[8] = (raw[8] & 0x3F) | 0x80
+    return uuid.UUID(bytes=bytes(raw))
+
+
+def slot_of_tagged(id_: uuid.UUID) -> int | None:
+    """Slot of an id made by ``tagged_id``, None for other ids."""
+    if id_.version != 8:
+        return None
+    slot = int.from_bytes(id_.bytes[:2], "big")
+    return slot if slot < SLOTS else None
@@ -0,0 +1,414 @@
+import abc
+import collections
+import hashlib
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+import sqlalchemy as sa
+import sqlalchemy.exc
+from loguru import logger
+from sqlalchemy.orm import Mapped, mapped_column
+
+from common.metrics import Counter
+from common.sql import Base, TZDateTime
+
+__all__ = [
+    "IdempotencyRecord",
+    "IdempotencyError",
+    "KeyInProgressError",
+    "KeyMismatchError",
+    "AbstractIdempotencyStore",
+    "InMemoryIdempotencyStore",
+    "SQLIdempotencyStore",
+    "IdempotencyCache",
+    "Idempotency",
+    "IdempotencyReaper",
+    "fingerprint",
+]
+
+IDEMPOTENT_REPLAYS = Counter(
+    "idempotent_replays_total",
+    "Requests answered with a stored response by where it was found",
+    ["source"],
+)
+
+
+class IdempotencyError(Exception):
+    pass
+
+
+class KeyInProgressError(IdempotencyError):
+    """Another request with the same key has not completed yet."""
+
+
+class KeyMismatchError(IdempotencyError):
+    """Key was used before for a different request."""
+
+
+@dataclass(frozen=True)
+class IdempotencyRecord:
+    key: str
+    fingerprint: str
+    expires_at: datetime
+    # Both are None until the request holding the key completes
+    status_code: int | None = None
+    body: bytes | None = None
+
+    @property
+    def completed(self) -> bool:
+        return self.status_code is not None
+
+
+def fingerprint(*parts: str | bytes) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode() if isinstance(part, str) else part)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class AbstractIdempotencyStore(abc.ABC):
+    @abc.abstractmethod
+    def claim(
+        self, key: str, fingerprint_: str, ttl: timedelta, lock_timeout: timedelta
+    ) -> IdempotencyRecord | None:
+        """Claims the key, returns its record instead if it is held already.
+
+        A claim which has not completed within ``lock_timeout`` is taken
+        over, its holder is assumed to have crashed.
+        """
+
+    @abc.abstractmethod
+    def complete(self, key: str, status_code: int, body: bytes) -> None:
+        """Stores the response of the claim, a claim gone meanwhile is skipped.
+
+        The request is done either way, failing it would hide its result.
+        """
+
+    @abc.abstractmethod
+    def release(self, key: str) -> None:
+        """Drops an uncompleted claim, so the request may be retried."""
+
+    @abc.abstractmethod
+    def reap(self, now: datetime, batch_size: int) -> int:
+        """Deletes a batch of expired keys, returns how many were deleted."""
+
+
+class InMemoryIdempotencyStore(AbstractIdempotencyStore):
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # key -> (record, claimed at)
+        self._records = dict[str, tuple[IdempotencyRecord, datetime]]()
+
+    def claim(
+        self, key: str, fingerprint_: str, ttl: timedelta, lock_timeout: timedelta
+    ) -> IdempotencyRecord | None:
+        now = _now()
+        with self._lock:
+            entry = self._records.get(key)
+            if entry is not None:
+                record, claimed_at = entry
+                stale = not record.completed and claimed_at < now - lock_timeout
+                if record.expires_at > now and not stale:
+                    return record
+            self._records[key] = IdempotencyRecord(key, fingerprint_, now + ttl), now
+            return None
+
+    def complete(self, key: str, status_code: int, body: bytes) -> None:
+        with self._lock:
+            entry = self._records.get(key)
+            if entry is None:
+                # Reaped or released meanwhile, as the update of no rows
+                return
+            record, claimed_at = entry
+            self._records[key] = (
+                IdempotencyRecord(
+                    key, record.fingerprint, record.expires_at, status_code, body
+                ),
+                claimed_at,
+            )
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            entry = self._records.get(key)
+            if entry is not None and not entry[0].completed:
+                del self._records[key]
+
+    def reap(self, now: datetime, batch_size: int) -> int:
+        with self._lock:
+            expired = [
+                key
+                for key, (record, _) in self._records.items()
+                if record.expires_at <= now
+            ][:batch_size]
+            for key in expired:
+                del self._records[key]
+            return len(expired)
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    key: Mapped[str] = mapped_column(sa.String(255), primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(sa.String(64))
+    status_code: Mapped[int | None] = mapped_column(nullable=True)
+    body: Mapped[bytes | None] = mapped_column(sa.LargeBinary(), nullable=True)
+    claimed_at: Mapped[datetime] = mapped_column(TZDateTime())
+    expires_at: Mapped[datetime] = mapped_column(TZDateTime(), index=True)
+
+
+CLAIM = sa.insert(IdempotencyKey)
+
+GET_KEY = sa.select(IdempotencyKey).where(IdempotencyKey.key == sa.bindparam("k"))
+
+# Bound names differ from column names, update statements reserve those
+TAKE_OVER = (
+    sa.update(IdempotencyKey)
+    .where(
+        (IdempotencyKey.key == sa.bindparam("k"))
+        & (
+            (IdempotencyKey.expires_at <= sa.bindparam("now"))
+            | (
+                IdempotencyKey.status_code.is_(None)
+                & (IdempotencyKey.claimed_at < sa.bindparam("stale_before"))
+            )
+        )
+    )
+    .values(
+        fingerprint=sa.bindparam("fp"),
+        status_code=None,
+        body=None,
+        claimed_at=sa.bindparam("now"),
+        expires_at=sa.bindparam("expires"),
+    )
+)
+
+COMPLETE = (
+    sa.update(IdempotencyKey)
+    .where(IdempotencyKey.key == sa.bindparam("k"))
+    .values(status_code=sa.bindparam("status"), body=sa.bindparam("content"))
+)
+
+RELEASE = sa.delete(IdempotencyKey).where(
+    (IdempotencyKey.key == sa.bindparam("k")) & IdempotencyKey.status_code.is_(None)
+)
+
+REAP = sa.delete(IdempotencyKey).where(
+    IdempotencyKey.key.in_(
+        sa.select(IdempotencyKey.key)
+        .where(IdempotencyKey.expires_at <= sa.bindparam("now"))
+        .limit(sa.bindparam("batch_size"))
+        .scalar_subquery()
+    )
+)
+
+
+class SQLIdempotencyStore(AbstractIdempotencyStore):
+    """Keys shared by all workers, every call runs in its own transaction.
+
+    Claims are committed before the request does its work, so they are
+    seen by concurrent retries on other workers.
+    """
+
+    def __init__(self, engine: sa.Engine) -> None:
+        self._engine = engine
+
+    def claim(
+        self, key: str, fingerprint_: str, ttl: timedelta, lock_timeout: timedelta
+    ) -> IdempotencyRecord | None:
+        now = _now()
+        values = {
+            "key": key,
+            "fingerprint": fingerprint_,
+            "claimed_at": now,
+            "expires_at": now + ttl,
+        }
+        try:
+            with self._engine.begin() as conn:
+                conn.execute(CLAIM, values)
+                return None
+        except sqlalchemy.exc.IntegrityError:
+            pass
+
+        with self._engine.begin() as conn:
+            taken_over = conn.execute(
+                TAKE_OVER,
+                {
+                    "k": key,
+                    "fp": fingerprint_,
+                    "now": now,
+                    "expires": now + ttl,
+                    "stale_before": now - lock_timeout,
+                },
+            )
+            if taken_over.rowcount > 0:
+                return None
+
+            row = conn.execute(GET_KEY, {"k": key}).one_or_none()
+            if row is None:
+                # Released or reaped meanwhile, the client retries anyway
+                raise KeyInProgressError(f"Key {key} is being released")
+            return IdempotencyRecord(
+                key=row.key,
+                fingerprint=row.fingerprint,
+                expires_at=row.expires_at,
+                status_code=row.status_code,
+                body=row.body,
+            )
+
+    def complete(self, key: str, status_code: int, body: bytes) -> None:
+        with self._engine.begin() as conn:
+            conn.execute(COMPLETE, {"k": key, "status": status_code, "content": body})
+
+    def release(self, key: str) -> None:
+        with self._engine.begin() as conn:
+            conn.execute(RELEASE, {"k": key})
+
+    def reap(self, now: datetime, batch_size: int) -> int:
+        with self._engine.begin() as conn:
+            return conn.execute(REAP, {"now": now, "batch_size": batch_size}).rowcount
+
+
+class IdempotencyCache:
+    """Completed records of the worker, least recently used are evicted.
+
+    Answers retries without a round trip to the store. Only completed
+    records are cached, they do not change until they expire.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+        self._records = collections.OrderedDict[str, IdempotencyRecord]()
+
+    def get(self, key: str) -> IdempotencyRecord | None:
+        with self._lock:
+            record = self._records.get(key)
+            if record is None:
+                return None
+            if record.expires_at <= _now():
+                del self._records[key]
+                return None
+            self._records.move_to_end(key)
+            return record
+
+    def put(self, record: IdempotencyRecord) -> None:
+        if self._maxsize == 0:
+            return
+        with self._lock:
+            self._records[record.key] = record
+            self._records.move_to_end(record.key)
+            while len(self._records) > self._maxsize:
+                self._records.popitem(last=False)
+
+    def resize(self, maxsize: int) -> None:
+        with self._lock:
+            self._maxsize = maxsize
+            while len(self._records) > maxsize:
+                self._records.popitem(last=False)
+
+
+class Idempotency:
+    """Replays stored responses of requests retried with the same key.
+
+    ``begin`` either claims the key for the request or returns the stored
+    response. The request then either ``complete``-s the key with its
+    response or ``release``-s it when it failed before having any effect.
+    """
+
+    def __init__(
+        self,
+        store: AbstractIdempotencyStore,
+        cache: IdempotencyCache,
+        ttl: timedelta,
+        lock_timeout: timedelta,
+    ) -> None:
+        self._store = store
+        self._cache = cache
+        self._ttl = ttl
+        self._lock_timeout = lock_timeout
+
+    def begin(self, key: str, fingerprint_: str) -> IdempotencyRecord | None:
+        record = self._cache.get(key)
+        if record is not None:
+            IDEMPOTENT_REPLAYS.inc(1, "cache")
+        else:
+            record = self._store.claim(key, fingerprint_, self._ttl, self._lock_timeout)
+            if record is None:
+                return None
+            if record.completed:
+                IDEMPOTENT_REPLAYS.inc(1, "store")
+                self._cache.put(record)
+
+        if record.fingerprint != fingerprint_:
+            raise KeyMismatchError(f"Key {key} was used for a different request")
+        if not record.completed:
+            raise KeyInProgressError(f"Request with key {key} is in progress")
+        return record
+
+    def complete(
+        self, key: str, fingerprint_: str, status_code: int, body: bytes
+    ) -> None:
+        self._store.complete(key, status_code, body)
+        self._cache.put(
+            IdempotencyRecord(key, fingerprint_, _now() + self._ttl, status_code, body)
+        )
+
+    def release(self, key: str) -> None:
+        self._store.release(key)
+
+
+class IdempotencyReaper:
+    """Deletes expired keys in batches, keeping delete transactions short."""
+
+    def __init__(
+        self,
+        store_factory: Callable[[], AbstractIdempotencyStore],
+        interval: float,
+        batch_size: int,
+    ) -> None:
+        self._store_factory = store_factory
+        self._interval = interval
+        self._batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def reap(self) -> int:
+        store = self._store_factory()
+        now = _now()
+        total = 0
+        while not self._stop.is_set():
+            deleted = store.reap(now, self._batch_size)
+            total += deleted
+            if deleted < self._batch_size:
+                break
+        return total
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="idempotency-reaper", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            try:
+                deleted = self.reap()
+            except Exception:
+                logger.exception("Can't reap expired idempotency keys")
+                continue
+            if deleted:
+                logger.debug(f"Reaped {deleted} expired idempotency keys")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
@@ -0,0 +1,278 @@
+import abc
+import bisect
+import contextlib
+import math
+import threading
+import time
+from typing import Callable, Generic, Iterable, Iterator, Sequence, TypeVar
+
+__all__ = [
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "Registry",
+    "REGISTRY",
+    "render_text",
+]
+
+LabelValues = tuple[str, ...]
+GaugeFunction = Callable[[], Iterable[tuple[LabelValues, float]]]
+ChildT = TypeVar("ChildT")
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics = dict[str, "Metric"]()
+        self._lock = threading.Lock()
+
+    def register(self, metric: "Metric") -> None:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def collect(self) -> Iterator["Metric"]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        yield from metrics
+
+
+REGISTRY = Registry()
+
+
+class Metric(abc.ABC, Generic[ChildT]):
+    kind: str
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Registry | None = REGISTRY,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = dict[LabelValues, ChildT]()
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *labelvalues: str) -> ChildT:
+        child = self._children.get(labelvalues)
+        if child is not None:
+            return child
+
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        with self._lock:
+            return self._children.setdefault(labelvalues, self._new_child())
+
+    def children(self) -> list[tuple[LabelValues, ChildT]]:
+        with self._lock:
+            return list(self._children.items())
+
+    @abc.abstractmethod
+    def _new_child(self) -> ChildT:
+        pass
+
+    @abc.abstractmethod
+    def render(self) -> Iterable[str]:
+        pass
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter(Metric[_CounterChild]):
+    """Monotonic counter, optionally partitioned by label values."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, *labelvalues: str) -> None:
+        self.labels(*labelvalues).inc(amount)
+
+    def value(self, *labelvalues: str) -> float:
+        child = self._children.get(labelvalues)
+        return child.value if child is not None else 0
+
+    def samples(self) -> list[tuple[LabelValues, float]]:
+        return [(labels, child.value) for labels, child in self.children()]
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def render(self) -> Iterable[str]:
+        for labels, value in self.samples():
+            yield _sample(self.name, self.labelnames, labels, value)
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+
+class Gauge(Metric[_GaugeChild]):
+    """Gauge either set directly or computed by a callback on collection."""
+
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._function: GaugeFunction | None = None
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        self.labels(*labelvalues).set(value)
+
+    def set_function(self, function: GaugeFunction | None) -> None:
+        self._function = function
+
+    def samples(self) -> list[tuple[LabelValues, float]]:
+        if self._function is not None:
+            return list(self._function())
+        return [(labels, child.value) for labels, child in self.children()]
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def render(self) -> Iterable[str]:
+        for labels, value in self.samples():
+            yield _sample(self.name, self.labelnames, labels, value)
+
+
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class _HistogramChild:
+    __slots__ = ("_upper_bounds", "counts", "sum", "_lock")
+
+    def __init__(self, upper_bounds: tuple[float, ...]) -> None:
+        self._upper_bounds = upper_bounds
+        # The last bucket is +Inf
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self._upper_bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextlib.contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self) -> tuple[list[int], float]:
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class Histogram(Metric[_HistogramChild]):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        registry: Registry | None = REGISTRY,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        self.labels(*labelvalues).observe(value)
+
+    def time(self, *labelvalues: str) -> contextlib.AbstractContextManager[None]:
+        return self.labels(*labelvalues).time()
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def render(self) -> Iterable[str]:
+        names = self.labelnames + ("le",)
+        for labels, child in self.children():
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(bound)
+                yield _sample(f"{self.name}_bucket", names, labels + (le,), cumulative)
+            yield _sample(f"{self.name}_sum", self.labelnames, labels, total)
+            yield _sample(f"{self.name}_count", self.labelnames, labels, cumulative)
+
+
+def render_text(registry: Registry = REGISTRY) -> str:
+    """Renders metrics in Prometheus text exposition format."""
+    lines = list[str]()
+    for metric in registry.collect():
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    lines.append("")
+    return "\n".join(lines)
+
+
+def _sample(
+    name: str, labelnames: Sequence[str], labelvalues: LabelValues, value: float
+) -> str:
+    if not labelnames:
+        return f"{name} {_format_value(value)}"
+
+    labels = ",".join(
+        f'{label}="{_escape(value)}"' for label, value in zip(labelnames, labelvalues)
+    )
+    return f"{name}{{{labels}}} {_format_value(value)}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
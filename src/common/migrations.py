@@ -0,0 +1,180 @@
+"""Helpers of migrations which run against a database under load.
+
+Postgres takes locks blocking writes for plain index builds and for the
+whole of a large UPDATE. The helpers build indexes concurrently outside
+of the migration transaction, backfill in short batches committed one
+by one and bound how long DDL may wait for its lock. On other dialects
+they fall back to the plain operations.
+"""
+
+import contextlib
+import logging
+import time
+from typing import Any, Callable, Sequence
+
+import sqlalchemy as sa
+import sqlalchemy.exc
+from alembic import op
+
+__all__ = [
+    "create_index_concurrently",
+    "drop_index_concurrently",
+    "with_lock_timeout",
+    "backfill",
+]
+
+logger = logging.getLogger("alembic.online")
+
+# Postgres error code of lock_timeout expiring
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+def _is_postgres() -> bool:
+    return op.get_bind().dialect.name == "postgresql"
+
+
+def create_index_concurrently(
+    name: str,
+    table: str,
+    columns: Sequence[str | sa.TextClause],
+    **kw: Any,
+) -> None:
+    """Builds an index without blocking writes to the table.
+
+    A concurrent build which failed before leaves an invalid index
+    behind, it is dropped and built again.
+    """
+    if not _is_postgres():
+        op.create_index(name, table, columns, **kw)
+        return
+
+    with op.get_context().autocommit_block():
+        if _index_is_invalid(name):
+            logger.warning(f"Dropping invalid index {name} left by a failed build")
+            op.drop_index(name, table, postgresql_concurrently=True)
+        op.create_index(
+            name,
+            table,
+            columns,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+            **kw,
+        )
+
+
+def drop_index_concurrently(name: str, table: str) -> None:
+    if not _is_postgres():
+        op.drop_index(name, table)
+        return
+
+    with op.get_context().autocommit_block():
+        op.drop_index(name, table, postgresql_concurrently=True, if_exists=True)
+
+
+def _index_is_invalid(name: str) -> bool:
+    return bool(
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT NOT indisvalid FROM pg_index"
+                " WHERE indexrelid = to_regclass(:name)"
+            ),
+            {"name": name},
+        )
+        .scalar()
+    )
+
+
+def with_lock_timeout(
+    operation: Callable[[], None],
+    timeout: str = "2s",
+    attempts: int = 5,
+    delay: float = 1.0,
+) -> None:
+    """Runs DDL which takes an exclusive lock, giving up on it quickly.
+
+    DDL waiting for its lock blocks every query of the table queued
+    after it. With a short lock_timeout it fails instead and is retried
+    after a pause, while the queries get through.
+    """
+    if not _is_postgres():
+        operation()
+        return
+
+    conn = op.get_bind()
+    for attempt in range(1, attempts + 1):
+        savepoint = conn.begin_nested()
+        try:
+            conn.execute(sa.text(f"SET LOCAL lock_timeout = '{timeout}'"))
+            operation()
+        except sqlalchemy.exc.DBAPIError as e:
+            savepoint.rollback()
+            if _sqlstate(e) != LOCK_NOT_AVAILABLE or attempt == attempts:
+                raise
+            logger.warning(
+                f"Lock not acquired within {timeout}, attempt {attempt} of {attempts}"
+            )
+            time.sleep(delay * attempt)
+        else:
+            savepoint.commit()
+            break
+
+    conn.execute(sa.text("SET LOCAL lock_timeout = DEFAULT"))
+
+
+def _sqlstate(error: sqlalchemy.exc.DBAPIError) -> str | None:
+    # psycopg exposes the code as an attribute, pg8000 in a dict argument
+    sqlstate = getattr(error.orig, "sqlstate", None)
+    if sqlstate is None and error.orig.args and isinstance(error.orig.args[0], dict):
+        sqlstate = error.orig.args[0].get("C")
+    return sqlstate
+
+
+def backfill(
+    statement: str,
+    params: dict[str, Any] | None = None,
+    *,
+    batch_size: int = 5000,
+    pause: float = 0.1,
+    total: int | None = None,
+    description: str = "backfill",
+) -> int:
+    """Runs a batched UPDATE or DELETE until it touches no more rows.
+
+    ``statement`` must change at most ``:batch_size`` rows per execution
+    and skip rows which are done already. Every batch is committed on
+    its own, so row locks are held briefly and a failed run resumes
+    where it stopped. ``pause`` seconds between batches leave room for
+    production queries and replication. Returns the number of rows.
+    """
+    params = {**(params or {}), "batch_size": batch_size}
+    query = sa.text(statement)
+    done = 0
+    started_at = time.monotonic()
+
+    # Only Postgres runs DDL in the migration transaction
+    autocommit = (
+        op.get_context().autocommit_block()
+        if _is_postgres()
+        else contextlib.nullcontext()
+    )
+    with autocommit:
+        conn = op.get_bind()
+        while True:
+            changed = conn.execute(query, params).rowcount
+            done += changed
+            _report(description, done, total, time.monotonic() - started_at)
+            if changed < batch_size:
+                break
+            time.sleep(pause)
+
+    return done
+
+
+def _report(description: str, done: int, total: int | None, elapsed: float) -> None:
+    rate = done / elapsed if elapsed > 0 else 0.0
+    progress = f"{description}: {done} rows, {rate:.0f} rows/s"
+    if total:
+        remaining = max(total - done, 0) / rate if rate > 0 else float("inf")
+        progress += f", {min(done / total, 1):.1%} done, ~{remaining:.0f}s left"
+    logger.info(progress)
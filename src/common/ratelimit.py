@@ -0,0 +1,220 @@
+import abc
+import math
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+from common.metrics import Counter
+
+__all__ = [
+    "Rate",
+    "RateLimitDecision",
+    "AbstractCounterStore",
+    "InMemoryCounterStore",
+    "SQLiteCounterStore",
+    "SlidingWindowLimiter",
+]
+
+RATE_LIMITED = Counter(
+    "rate_limited_total",
+    "Requests rejected by a rate limiter",
+    ["limiter"],
+)
+
+
+@dataclass(frozen=True)
+class Rate:
+    limit: int
+    period: float
+
+
+@dataclass(frozen=True)
+class RateLimitDecision:
+    allowed: bool
+    remaining: int
+    retry_after: float = 0.0
+
+
+class AbstractCounterStore(abc.ABC):
+    """Stores hit counters of fixed windows, keyed by ``(key, window)``."""
+
+    @abc.abstractmethod
+    def incr(self, key: str, window: int, ttl: float) -> tuple[int, int]:
+        """Increments counter of the window atomically.
+
+        Returns counters of the previous and the given window, the latter
+        with the increment, so concurrent hits see distinct values.
+        """
+
+    @abc.abstractmethod
+    def decr(self, key: str, window: int) -> None:
+        """Takes back an increment of the window."""
+
+
+class InMemoryCounterStore(AbstractCounterStore):
+    def __init__(self, max_keys: int = 100_000) -> None:
+        # key -> [window, previous window count, current window count]
+        self._counters = dict[str, list[int]]()
+        self._max_keys = max_keys
+        self._lock = threading.Lock()
+
+    def incr(self, key: str, window: int, ttl: float) -> tuple[int, int]:
+        with self._lock:
+            entry = self._counters.get(key)
+            if entry is None:
+                if len(self._counters) >= self._max_keys:
+                    self._evict(window)
+                entry = self._counters[key] = [window, 0, 0]
+            previous, current = self._shift(entry, window)
+            entry[:] = [window, previous, current + 1]
+            return previous, current + 1
+
+    def decr(self, key: str, window: int) -> None:
+        with self._lock:
+            entry = self._counters.get(key)
+            if entry is not None and entry[0] == window and entry[2] > 0:
+                entry[2] -= 1
+
+    @staticmethod
+    def _shift(entry: list[int], window: int) -> tuple[int, int]:
+        stored_window, previous, current = entry
+        if stored_window == window:
+            return previous, current
+        if stored_window == window - 1:
+            return current, 0
+        return 0, 0
+
+    def _evict(self, window: int) -> None:
+        stale = [k for k, (w, _, _) in self._counters.items() if w < window - 1]
+        for key in stale:
+            del self._counters[key]
+
+        # Every key is still live, drop the oldest half to stay bounded
+        if len(self._counters) >= self._max_keys:
+            for key in list(self._counters)[: self._max_keys // 2]:
+                del self._counters[key]
+
+
+class SQLiteCounterStore(AbstractCounterStore):
+    """Counter store shared by all worker processes of a host.
+
+    Local stand-in for a Redis backed store: every worker opens the same
+    database file, so limits hold across processes.
+    """
+
+    PURGE_EVERY = 1000
+
+    def __init__(self, path: str | Path) -> None:
+        self._path = str(path)
+        self._local = threading.local()
+        self._ops = 0
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS counters ("
+                " key TEXT NOT NULL,"
+                " window INTEGER NOT NULL,"
+                " count INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " PRIMARY KEY (key, window))"
+            )
+
+    def incr(self, key: str, window: int, ttl: float) -> tuple[int, int]:
+        conn = self._connection()
+        now = time.time()
+        # Connections are in autocommit mode, both counters are read in
+        # one write transaction of the increment
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            (count,) = conn.execute(
+                "INSERT INTO counters (key, window, count, expires_at)"
+                " VALUES (?, ?, 1, ?)"
+                " ON CONFLICT (key, window) DO UPDATE SET count = count + 1"
+                " RETURNING count",
+                (key, window, now + ttl),
+            ).fetchone()
+            row = conn.execute(
+                "SELECT count FROM counters WHERE key = ? AND window = ?",
+                (key, window - 1),
+            ).fetchone()
+
+            self._ops += 1
+            if self._ops % self.PURGE_EVERY == 0:
+                conn.execute("DELETE FROM counters WHERE expires_at < ?", (now,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return row[0] if row is not None else 0, count
+
+    def decr(self, key: str, window: int) -> None:
+        self._connection().execute(
+            "UPDATE counters SET count = count - 1"
+            " WHERE key = ? AND window = ? AND count > 0",
+            (key, window),
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+
+class SlidingWindowLimiter:
+    """Sliding window counter limiter.
+
+    Approximates a sliding window by weighting the previous fixed window
+    by the part of it that still overlaps the sliding one. Every hit is
+    counted before the decision, so concurrent hits can't pass on the same
+    count. Rejected ones are taken back, a client hammering the endpoint
+    is let through again as soon as the window slides.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: Rate,
+        store: AbstractCounterStore,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.name = name
+        self.rate = rate
+        self._store = store
+        self._clock = clock
+
+    def hit(self, key: str) -> RateLimitDecision:
+        period = self.rate.period
+        now = self._clock()
+        window = int(now // period)
+        elapsed = now - window * period
+
+        store_key = f"{self.name}:{key}"
+        previous, current = self._store.incr(store_key, window, ttl=2 * period)
+        estimated = previous * (1 - elapsed / period) + current
+        if estimated > self.rate.limit:
+            self._store.decr(store_key, window)
+            RATE_LIMITED.inc(1, self.name)
+            return RateLimitDecision(
+                allowed=False,
+                remaining=0,
+                retry_after=self._retry_after(previous, current - 1, elapsed),
+            )
+
+        return RateLimitDecision(
+            allowed=True,
+            remaining=max(0, self.rate.limit - math.ceil(estimated)),
+        )
+
+    def _retry_after(self, previous: int, current: int, elapsed: float) -> float:
+        period = self.rate.period
+        budget = self.rate.limit - 1
+        if current > budget or previous == 0:
+            # Wait for the next window, where current hits become "previous"
+            return (period - elapsed) + period * max(0.0, 1 - budget / max(current, 1))
+        return max(0.0, period * (1 - (budget - current) / previous) - elapsed)
@@ -1,4 +1,5 @@
 import abc
+import threading
 from typing import TypeVar, Generic, Iterable
 
 from .domain import DomainEvent
@@ -23,3 +24,29 @@ class AbstractRepository(abc.ABC, Generic[T, TID]):
     @abc.abstractmethod
     def collect_events(self) -> Iterable[DomainEvent]:
         pass
+
+
+class InMemoryRepository(AbstractRepository[T, TID]):
+    """Repository keeping aggregates in process memory.
+
+    Changes are staged by the repository and applied to the shared state
+    only when the unit of work commits. It holds locks of the stores of
+    all its repositories, checks every one of them and only then applies
+    them, so a conflict in one leaves the others untouched.
+    """
+
+    @property
+    @abc.abstractmethod
+    def lock(self) -> threading.Lock:
+        """Lock of the shared state."""
+
+    def check(self) -> None:
+        """Raises ConflictError when staged changes can't be applied."""
+
+    @abc.abstractmethod
+    def apply(self) -> None:
+        """Applies staged changes, once every repository has been checked."""
+
+    @abc.abstractmethod
+    def rollback(self) -> None:
+        pass
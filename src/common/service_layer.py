@@ -1,4 +1,8 @@
 import abc
+import collections
+from typing import Callable
+
+from loguru import logger
 
 from common.domain import DomainEvent
 
@@ -6,3 +10,29 @@ from common.domain import DomainEvent
 class AbstractMessageBus(abc.ABC):
     def publish(self, *events: DomainEvent):
         pass
+
+
+class MessageBus(AbstractMessageBus):
+    """Calls handlers subscribed to the type of each event, in order.
+
+    Events are published after the commit of their unit of work, a failing
+    handler is logged and does not fail the commit or other handlers.
+    """
+
+    def __init__(self) -> None:
+        self._handlers = collections.defaultdict[
+            type[DomainEvent], list[Callable[[DomainEvent], None]]
+        ](list)
+
+    def subscribe(
+        self, event_type: type[DomainEvent], handler: Callable[[DomainEvent], None]
+    ) -> None:
+        self._handlers[event_type].append(handler)
+
+    def publish(self, *events: DomainEvent):
+        for event in events:
+            for handler in self._handlers.get(type(event), ()):
+                try:
+                    handler(event)
+                except Exception:
+                    logger.exception(f"Can't handle {type(event).__name__}")
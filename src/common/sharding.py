@@ -0,0 +1,284 @@
+"""Hash sharding of aggregates over several databases.
+
+Keys are hashed into a fixed number of slots and every slot is assigned
+to a shard. Assignments are kept by the first database, which also holds
+slots not assigned elsewhere, so a single database is a shard owning
+every slot and data written before sharding stays where it is. Data is
+moved between shards a slot at a time: the slot is frozen, which fails
+writes of its keys, its rows are copied and it is assigned to the new
+shard.
+"""
+
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, Mapping, Self, Type
+
+import sqlalchemy as sa
+import sqlalchemy.exc
+from loguru import logger
+from sqlalchemy.orm import Mapped, Session, mapped_column, sessionmaker
+
+from common.breaker import CircuitBreaker
+from common.domain import SLOTS, slot_of, slot_of_tagged, tagged_id
+from common.repository import AbstractRepository
+from common.service_layer import AbstractMessageBus
+from common.sql import Base
+from common.unit_of_work import (
+    UOW_DURATION,
+    AbstractUnitOfWork,
+    ConflictError,
+    UnitOfWorkError,
+)
+
+__all__ = [
+    "SLOTS",
+    "slot_of",
+    "tagged_id",
+    "slot_of_tagged",
+    "SlotMap",
+    "ShardSlot",
+    "ShardingError",
+    "SlotFrozenError",
+    "ShardSet",
+    "ShardSessions",
+    "ShardedSQLUnitOfWork",
+]
+
+
+@dataclass(frozen=True)
+class SlotMap:
+    shards: int = 1
+    # Slots which are not listed stay on the first shard
+    assignments: Mapping[int, int] = field(default_factory=dict)
+    # Slots being moved, their keys can't be written
+    frozen: frozenset[int] = frozenset()
+
+    def shard_of_slot(self, slot: int) -> int:
+        return self.assignments.get(slot, 0)
+
+    def shard_of(self, key: uuid.UUID) -> int:
+        return self.shard_of_slot(slot_of(key))
+
+
+class ShardSlot(Base):
+    __tablename__ = "shard_slots"
+
+    slot: Mapped[int] = mapped_column(
+        sa.SmallInteger(), primary_key=True, autoincrement=False
+    )
+    shard: Mapped[int] = mapped_column(sa.SmallInteger())
+    frozen: Mapped[bool] = mapped_column(default=False, server_default=sa.false())
+
+
+GET_SLOTS = sa.select(ShardSlot.slot, ShardSlot.shard, ShardSlot.frozen)
+
+
+class ShardingError(Exception):
+    pass
+
+
+class SlotFrozenError(UnitOfWorkError):
+    """Keys of the slot can't be written while it is moved, retry later."""
+
+
+class ShardSet:
+    """Engines of the shards, the first one keeps the slot map.
+
+    Every worker polls the slot map, so all of them see a slot frozen or
+    reassigned within the poll interval.
+    """
+
+    def __init__(
+        self,
+        engines: list[sa.Engine],
+        breakers: list[CircuitBreaker | None] | None = None,
+    ) -> None:
+        self.engines = engines
+        self.breakers = breakers or [None] * len(engines)
+        self.sessionmakers = [
+            sessionmaker(engine, autoflush=False, expire_on_commit=False)
+            for engine in engines
+        ]
+        # Replaced as a whole, units of work keep the map they began with
+        self.slots = SlotMap(len(engines))
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def __len__(self) -> int:
+        return len(self.engines)
+
+    def refresh(self) -> SlotMap:
+        with self.engines[0].connect() as conn:
+            rows = conn.execute(GET_SLOTS).all()
+
+        slots = SlotMap(
+            len(self.engines),
+            {row.slot: row.shard for row in rows},
+            frozenset(row.slot for row in rows if row.frozen),
+        )
+        unknown = {shard for shard in slots.assignments.values() if shard >= len(self)}
+        if unknown:
+            raise ShardingError(
+                f"Slots are assigned to shards {sorted(unknown)}, "
+                f"only {len(self)} are configured"
+            )
+        self.slots = slots
+        return slots
+
+    def start(self, interval: float) -> None:
+        """Reloads the slot map every ``interval`` seconds."""
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._poll, args=(interval,), name="slot-map-poller", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _poll(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Can't reload the slot map")
+
+
+class ShardSessions:
+    """Sessions of a unit of work, the one of a shard begins on first use."""
+
+    def __init__(self, shards: ShardSet) -> None:
+        self._shards = shards
+        self.slots = shards.slots
+        self._sessions = dict[int, Session]()
+        self._compensations = list[Callable[[], None]]()
+
+    def __len__(self) -> int:
+        return len(self._shards)
+
+    def shard(self, index: int) -> Session:
+        session = self._sessions.get(index)
+        if session is None:
+            breaker = self._shards.breakers[index]
+            if breaker is not None:
+                breaker.allow()
+            session = self._shards.sessionmakers[index]()
+            session.begin()
+            self._sessions[index] = session
+        return session
+
+    def shard_index(self, key: uuid.UUID, write: bool = False) -> int:
+        slot = slot_of(key)
+        if write and slot in self.slots.frozen:
+            raise SlotFrozenError(f"Slot {slot} is being moved to another shard")
+        return self.slots.shard_of_slot(slot)
+
+    def on_partial_commit(self, compensation: Callable[[], None]) -> None:
+        """Registers an undo of writes, run if a later shard fails to commit.
+
+        Shards commit one after another, the first one goes first.
+        """
+        self._compensations.append(compensation)
+
+    def commit(self) -> None:
+        committed = False
+        try:
+            for index in sorted(self._sessions):
+                self._sessions[index].commit()
+                committed = True
+        except Exception:
+            if committed:
+                self._compensate()
+            raise
+        finally:
+            self._compensations.clear()
+
+    def rollback(self) -> None:
+        for session in self._sessions.values():
+            session.rollback()
+
+    def close(self) -> None:
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
+
+    def _compensate(self) -> None:
+        self.rollback()
+        for compensation in self._compensations:
+            try:
+                compensation()
+            except Exception:
+                logger.exception("Can't undo writes of a partially committed unit")
+
+
+class ShardedSQLUnitOfWork(AbstractUnitOfWork):
+    """Unit of work over shards, atomic only within a single shard.
+
+    Aggregates live in one shard each, writes of other shards made by
+    repositories must be undone with ``ShardSessions.on_partial_commit``.
+    """
+
+    def __init__(
+        self,
+        bus: AbstractMessageBus,
+        shards: ShardSet,
+        repo_factories: list[Callable[[ShardSessions], AbstractRepository]],
+    ) -> None:
+        self._bus = bus
+        self._shards = shards
+        self._repo_factories = repo_factories
+        self._repositories = dict[Type, AbstractRepository]()
+        self._sessions: ShardSessions | None = None
+        self._started_at = 0.0
+
+    def __enter__(self) -> Self:
+        if self._sessions is not None:
+            raise UnitOfWorkError(
+                "Can't begin new session until previous one is not finished"
+            )
+
+        self._started_at = time.perf_counter()
+        self._sessions = ShardSessions(self._shards)
+        for factory in self._repo_factories:
+            repo = factory(self._sessions)
+            self._repositories[type(repo)] = repo
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if self._sessions is None:
+            raise UnitOfWorkError(
+                "Can't finish not started session. Maybe a race condition"
+            )
+
+        self.rollback()
+        self._repositories = {}
+        self._sessions.close()
+
+        result = super().__exit__(exc_type, exc_val, exc_tb)
+        self._sessions = None
+        UOW_DURATION.observe(time.perf_counter() - self._started_at, "transaction")
+        return result
+
+    def commit(self) -> None:
+        if self._sessions is None:
+            raise UnitOfWorkError("Can't commit not started session")
+        with UOW_DURATION.time("commit"):
+            try:
+                self._sessions.commit()
+            except sqlalchemy.exc.IntegrityError as e:
+                raise ConflictError(str(e.orig)) from e
+        self._bus.publish(*self.publish_events())
+
+    def rollback(self) -> None:
+        if self._sessions is None:
+            raise UnitOfWorkError("Can't rollback not started session")
+        with UOW_DURATION.time("rollback"):
+            self._sessions.rollback()
+
+    def _publish_events(self, new_events) -> None:
+        self._bus.publish(*new_events)
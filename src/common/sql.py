@@ -1,12 +1,34 @@
+import io
+import re
+import sqlite3
+
 import sqlalchemy as sa
 from sqlalchemy import func
-from datetime import datetime
+from datetime import date, datetime, timezone
 
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import declarative_base, Mapped, mapped_column
+from sqlalchemy.sql.functions import GenericFunction
 
 Base = declarative_base()
 
 
+class TZDateTime(sa.TypeDecorator):
+    """Timezone aware datetime on every backend.
+
+    Postgres returns aware values already, SQLite used as a local stand-in
+    drops the offset, so naive values are read back as UTC.
+    """
+
+    impl = sa.DateTime(timezone=True)
+    cache_ok = True
+
+    def process_result_value(self, value: datetime | None, dialect) -> datetime | None:
+        if value is not None and value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value
+
+
 class TimeMixin:
     created_at: Mapped[datetime] = mapped_column(
         sa.DateTime(timezone=True), server_default=func.now()
@@ -17,3 +39,110 @@ class TimeMixin:
         server_default=func.now(),
         server_onupdate=func.now(),
     )
+
+
+# pg_trgm matches strings with similarity at least of its default
+# pg_trgm.similarity_threshold
+TRIGRAM_THRESHOLD = 0.3
+
+
+def trigrams(text: str) -> set[str]:
+    # Same as pg_trgm: words are lowercased and padded with two spaces in
+    # front and one behind
+    result = set[str]()
+    for word in re.findall(r"[^\W_]+", text.lower()):
+        padded = f"  {word} "
+        result.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def trigram_similarity(left: str | None, right: str | None) -> float:
+    left_trigrams, right_trigrams = trigrams(left or ""), trigrams(right or "")
+    if not left_trigrams or not right_trigrams:
+        return 0.0
+    shared = len(left_trigrams & right_trigrams)
+    return shared / len(left_trigrams | right_trigrams)
+
+
+class greatest(GenericFunction):
+    type = sa.Float()
+    inherit_cache = True
+
+
+@compiles(greatest, "sqlite")
+def _greatest_sqlite(element, compiler, **kw) -> str:
+    # Scalar max of SQLite takes any number of arguments
+    return f"max({compiler.process(element.clauses, **kw)})"
+
+
+class trigram_match(GenericFunction):
+    """``left % right`` of pg_trgm, the operator its indexes support."""
+
+    type = sa.Boolean()
+    inherit_cache = True
+
+
+@compiles(trigram_match)
+def _trigram_match(element, compiler, **kw) -> str:
+    left, right = element.clauses
+    # Custom operator lets the dialect escape "%" for its paramstyle
+    return compiler.process(left.op("%", is_comparison=True)(right), **kw)
+
+
+@compiles(trigram_match, "sqlite")
+def _trigram_match_sqlite(element, compiler, **kw) -> str:
+    left, right = element.clauses
+    similarity = sa.func.similarity(left, right) >= TRIGRAM_THRESHOLD
+    return f"({compiler.process(similarity, **kw)})"
+
+
+@sa.event.listens_for(sa.Engine, "connect")
+def _register_sqlite_functions(dbapi_connection, connection_record) -> None:
+    # SQLite stands in for Postgres locally, give it pg_trgm similarity
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function(
+            "similarity", 2, trigram_similarity, deterministic=True
+        )
+
+
+def next_month(first: date) -> date:
+    if first.month == 12:
+        return first.replace(year=first.year + 1, month=1)
+    return first.replace(month=first.month + 1)
+
+
+def create_month_partitions(
+    conn: sa.Connection, table: str, first: date, last: date
+) -> None:
+    """Creates partitions of the table by month for months first to last.
+
+    The table is partitioned by RANGE on Postgres, partitions are named
+    ``<table>_y<year>m<month>``.
+    """
+    start = first.replace(day=1)
+    while start <= last:
+        name = f"{table}_y{start.year}m{start.month:02d}"
+        conn.execute(
+            sa.text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table}"
+                f" FOR VALUES FROM ('{start}') TO ('{next_month(start)}')"
+            )
+        )
+        start = next_month(start)
+
+
+def copy_text(conn: sa.Connection, statement: str, data: bytes) -> None:
+    """Runs ``COPY ... FROM STDIN`` of rows in the text format on Postgres."""
+    # COPY is not a statement SQLAlchemy executes, the driver runs it on
+    # the connection of the transaction
+    dbapi_connection = conn.connection.dbapi_connection
+    cursor = dbapi_connection.cursor()
+    try:
+        if hasattr(cursor, "copy"):
+            with cursor.copy(statement) as copy:
+                copy.write(data)
+        else:
+            # pg8000 streams a file
+            cursor.execute(statement, stream=io.BytesIO(data))
+    finally:
+        cursor.close()
@@ -1,18 +1,35 @@
 import abc
-from typing import Callable, Iterable, Self, TypeVar, Type
+import contextlib
+import time
+from typing import TYPE_CHECKING, Callable, Iterable, Self, TypeVar, Type
 
+import sqlalchemy.exc
 from sqlalchemy.orm import sessionmaker, Session
-from common.repository import AbstractRepository
+from common.repository import AbstractRepository, InMemoryRepository
 from common.domain import DomainEvent
 from common.service_layer import AbstractMessageBus
+from common.metrics import Histogram
+
+if TYPE_CHECKING:
+    from common.breaker import CircuitBreaker
 
 TID = TypeVar("TID")
 
+UOW_DURATION = Histogram(
+    "uow_operation_duration_seconds",
+    "Duration of unit of work operations",
+    ["operation"],
+)
+
 
 class UnitOfWorkError(Exception):
     pass
 
 
+class ConflictError(UnitOfWorkError):
+    """Commit violates uniqueness of stored data."""
+
+
 class AbstractUnitOfWork(abc.ABC):
     _repositories: dict[Type, AbstractRepository]
 
@@ -36,7 +53,7 @@ class AbstractUnitOfWork(abc.ABC):
         for repo in self._repositories.values():
             all_events.extend(repo.collect_events())
 
-        all_events.sort(key=lambda event: event.time)
+        all_events.sort(key=lambda event: event.at)
         return all_events
 
     @abc.abstractmethod
@@ -50,12 +67,15 @@ class SQLUnitOfWork(AbstractUnitOfWork):
         bus: AbstractMessageBus,
         sessionmaker_: sessionmaker[Session],
         repo_factories: list[Callable[[Session], AbstractRepository]],
+        breaker: "CircuitBreaker | None" = None,
     ) -> None:
         self._bus = bus
         self._storage_factories = repo_factories
         self._repositories = dict[Type, AbstractRepository]()
         self._sessionmaker = sessionmaker_
+        self._breaker = breaker
         self._session: Session | None = None
+        self._started_at = 0.0
 
     def _init_repositories(self) -> None:
         for factory in self._storage_factories:
@@ -70,10 +90,16 @@ class SQLUnitOfWork(AbstractUnitOfWork):
             raise UnitOfWorkError(
                 "Can't begin new session until previous one is not finished"
             )
-
-        self._session = self._sessionmaker()
-        self._session.begin()
-        self._init_repositories()
+        # Session checks out a connection on first use, while the database
+        # is down the unit fails before that
+        if self._breaker is not None:
+            self._breaker.allow()
+
+        with UOW_DURATION.time("begin"):
+            self._started_at = time.perf_counter()
+            self._session = self._sessionmaker()
+            self._session.begin()
+            self._init_repositories()
         return super().__enter__()
 
     def __exit__(self, exc_type, exc_val, exc_tb) -> None:
@@ -89,18 +115,85 @@ class SQLUnitOfWork(AbstractUnitOfWork):
 
         result = super().__exit__(exc_type, exc_val, exc_tb)
         self._session = None
+        UOW_DURATION.observe(time.perf_counter() - self._started_at, "transaction")
         return result
 
     def commit(self) -> None:
         if self._session is None:
             raise UnitOfWorkError("Can't commit not started session")
-        self._session.commit()
+        with UOW_DURATION.time("commit"):
+            try:
+                self._session.commit()
+            except sqlalchemy.exc.IntegrityError as e:
+                raise ConflictError(str(e.orig)) from e
         self._bus.publish(*self.publish_events())
 
     def rollback(self) -> None:
         if self._session is None:
             raise UnitOfWorkError("Can't rollback not started session")
-        self._session.rollback()
+        with UOW_DURATION.time("rollback"):
+            self._session.rollback()
+
+    def _publish_events(self, new_events: Iterable[DomainEvent]) -> None:
+        self._bus.publish(*new_events)
+
+
+class InMemoryUnitOfWork(AbstractUnitOfWork):
+    def __init__(
+        self,
+        bus: AbstractMessageBus,
+        repo_factories: list[Callable[[], InMemoryRepository]],
+    ) -> None:
+        self._bus = bus
+        self._repo_factories = repo_factories
+        self._repositories = dict[Type, AbstractRepository]()
+        self._active = False
+
+    def __enter__(self) -> Self:
+        if self._active:
+            raise UnitOfWorkError(
+                "Can't begin new session until previous one is not finished"
+            )
+
+        self._active = True
+        for factory in self._repo_factories:
+            repo = factory()
+            self._repositories[type(repo)] = repo
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if not self._active:
+            raise UnitOfWorkError(
+                "Can't finish not started session. Maybe a race condition"
+            )
+
+        self.rollback()
+        result = super().__exit__(exc_type, exc_val, exc_tb)
+        self._repositories = {}
+        self._active = False
+        return result
+
+    def commit(self) -> None:
+        if not self._active:
+            raise UnitOfWorkError("Can't commit not started session")
+        repos = list(self._repositories.values())
+        # Taken in the same order by every unit, repositories may share
+        # a store
+        locks = {id(repo.lock): repo.lock for repo in repos}
+        with contextlib.ExitStack() as stack:
+            for _, lock in sorted(locks.items()):
+                stack.enter_context(lock)
+            for repo in repos:
+                repo.check()
+            for repo in repos:
+                repo.apply()
+        self._bus.publish(*self.publish_events())
+
+    def rollback(self) -> None:
+        if not self._active:
+            raise UnitOfWorkError("Can't rollback not started session")
+        for repo in self._repositories.values():
+            repo.rollback()
 
     def _publish_events(self, new_events: Iterable[DomainEvent]) -> None:
         self._bus.publish(*new_events)
@@ -1,12 +1,33 @@
-import uvicorn
-from .run import cfg
+import sys
 
-if __name__ == "__main__":
+from . import config
+
+
+def main() -> int:
+    args = config.parse_args(sys.argv[1:])
+    cfg = config.parse_yaml(args.config_path)
+
+    if args.command == "serve":
+        from .app import init_app
+        from .logger import prepare_logger
+        from .server import ProcessManager
+
+        prepare_logger(cfg.log)
+        return ProcessManager(init_app(cfg, args.config_path), cfg).run()
+
+    import uvicorn
+
+    # Reloader imports the application in a fresh process on every change
     uvicorn.run(
-        app="health.run:app",
+        app="health.run:create_app",
+        factory=True,
         reload=True,
-        workers=cfg.app.workers,
         host=cfg.app.host,
         port=cfg.app.port,
         log_level=cfg.log.level,
     )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,29 @@
+"""Access to admin endpoints, by the bearer token ``app.admin_token``."""
+
+import hmac
+from typing import Annotated
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+__all__ = ["require_admin"]
+
+admin_bearer = HTTPBearer(auto_error=False)
+
+
+def require_admin(
+    request: Request,
+    credentials: Annotated[HTTPAuthorizationCredentials | None, Depends(admin_bearer)],
+) -> None:
+    token = request.app.config.app.admin_token
+    # Endpoints don't exist without a token configured
+    if token is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if credentials is None or not hmac.compare_digest(
+        credentials.credentials.encode(), token.encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
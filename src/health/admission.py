@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import enum
+import json
+import math
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from common.metrics import Counter
+
+__all__ = [
+    "RouteClass",
+    "GradientLimit",
+    "AdmissionControlMiddleware",
+    "classify",
+]
+
+REJECTED = Counter(
+    "admission_rejected_total",
+    "Requests shed by admission control",
+    ["route_class", "reason"],
+)
+
+
+class RouteClass(str, enum.Enum):
+    READ = "read"
+    REFRESH = "refresh"
+    LOGIN = "login"
+    CREATE = "create"
+    WRITE = "write"
+
+
+HIGH_PRIORITY = frozenset({RouteClass.READ, RouteClass.REFRESH})
+
+EXEMPT_PATHS = (
+    "/docs",
+    "/redoc",
+    "/openapi.json",
+    "/metrics",
+    "/livez",
+    "/readyz",
+    "/admin",
+)
+
+
+def classify(method: str, path: str) -> RouteClass | None:
+    if path.startswith(EXEMPT_PATHS):
+        return None
+    if path.endswith("/auth/refresh"):
+        return RouteClass.REFRESH
+    if path.endswith("/auth/login"):
+        return RouteClass.LOGIN
+    if method in ("GET", "HEAD", "OPTIONS"):
+        return RouteClass.READ
+    if method == "POST" and path.startswith("/users/") and path.count("/") == 2:
+        return RouteClass.CREATE
+    return RouteClass.WRITE
+
+
+class GradientLimit:
+    """Concurrency limit adapted to observed latency.
+
+    Every route class keeps its own no-load latency, so a slow login does
+    not look like queueing to a fast read. The limit follows the gradient
+    between no-load and smoothed latency and backs off multiplicatively
+    when requests fail.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int,
+        max_limit: int,
+        tolerance: float = 2.0,
+        smoothing: float = 0.2,
+        backoff: float = 0.9,
+        probe_every: int = 1000,
+    ) -> None:
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self._tolerance = tolerance
+        self._smoothing = smoothing
+        self._backoff = backoff
+        self._probe_every = probe_every
+        self._samples = 0
+        self._min_rtt = dict[RouteClass, float]()
+        self._ratio = 1.0
+
+    def update(self, route_class: RouteClass, rtt: float, inflight: int) -> None:
+        self._samples += 1
+        min_rtt = self._min_rtt.get(route_class)
+        if min_rtt is None or rtt < min_rtt or self._samples % self._probe_every == 0:
+            # Periodically forget no-load latency, it drifts with data size
+            self._min_rtt[route_class] = min_rtt = rtt
+
+        self._ratio += (rtt / min_rtt - self._ratio) * self._smoothing
+        gradient = max(0.5, min(1.0, self._tolerance / self._ratio))
+        if gradient == 1.0 and inflight < self.limit / 2:
+            # Server is not saturated, there is no evidence for growing
+            return
+
+        target = self.limit * gradient + math.sqrt(self.limit)
+        limit = self.limit + (target - self.limit) * self._smoothing
+        self.limit = max(self.min_limit, min(self.max_limit, limit))
+
+    def on_failure(self) -> None:
+        self.limit = max(self.min_limit, self.limit * self._backoff)
+
+
+class AdmissionControlMiddleware:
+    """Sheds load before it queues up in the threadpool.
+
+    Each route class is capped by its own concurrency limit. On top of
+    that all requests share an adaptive limit, of which expensive login
+    and create requests may only use a part, so refreshes and reads keep
+    going when the server is overloaded.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        limit: GradientLimit,
+        caps: dict[RouteClass, int],
+        low_priority_share: float = 0.75,
+        retry_after: int = 1,
+    ) -> None:
+        self.app = app
+        self.limit = limit
+        self._caps = caps
+        self._low_priority_share = low_priority_share
+        self._retry_after = retry_after
+        self._inflight = 0
+        self._class_inflight = dict.fromkeys(RouteClass, 0)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route_class = classify(scope["method"], scope["path"])
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        if self._class_inflight[route_class] >= self._caps.get(route_class, math.inf):
+            REJECTED.inc(1, route_class.value, "class_cap")
+            await self._reject(send, 429, "Too many concurrent requests")
+            return
+
+        available = self.limit.limit
+        if route_class not in HIGH_PRIORITY:
+            available *= self._low_priority_share
+        if self._inflight >= available:
+            REJECTED.inc(1, route_class.value, "overload")
+            await self._reject(send, 503, "Server is overloaded")
+            return
+
+        self._inflight += 1
+        self._class_inflight[route_class] += 1
+        inflight = self._inflight
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self._inflight -= 1
+            self._class_inflight[route_class] -= 1
+            if status_code >= 500:
+                self.limit.on_failure()
+            else:
+                rtt = time.perf_counter() - start
+                self.limit.update(route_class, rtt, inflight)
+
+    async def _reject(self, send: Send, status_code: int, detail: str) -> None:
+        body = json.dumps({"detail": detail}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status_code,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(self._retry_after).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -1,35 +1,465 @@
 import contextlib
+import math
+from pathlib import Path
+from typing import Any
 
 import sqlalchemy as sa
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response, status
+from fastapi.responses import JSONResponse
+from loguru import logger
+from activity import ActivityTracker, InMemoryActivityStore
+from activity.api import init_activity_store
+from activity.api import router as activity_router
+from audit import AuditWriter, InMemoryAuditStore
+from audit.api import init_audit_store
+from audit.api import router as audit_router
 from auth.adapter.api import router
+from auth.adapter.api.dependencies import init_idempotency_store, init_unit_of_work
+from auth.adapter.repository import UserStore
+from auth.service_layer import RevocationCache, auth
+from auth.service_layer.auth import ACCESS_TOKEN_TTL
 
 __all__ = ["init_app"]
 
-from health.config import Config
-from health.logger import intercept_logs
+from common import AbstractMessageBus, MessageBus
+from common.breaker import CircuitBreaker, CircuitOpenError
+from common.cache import LRUCache
+from common.idempotency import (
+    IdempotencyCache,
+    IdempotencyReaper,
+    InMemoryIdempotencyStore,
+)
+from common.sharding import ShardSet, SlotFrozenError
+from common.ratelimit import (
+    AbstractCounterStore,
+    InMemoryCounterStore,
+    Rate,
+    SQLiteCounterStore,
+    SlidingWindowLimiter,
+)
+from health.admission import AdmissionControlMiddleware, GradientLimit, RouteClass
+from health.config import Breaker, Config, Database, RateLimit
+from health.instrumentation import InstrumentationMiddleware, instrument_engine
+from health.instrumentation import router as metrics_router
+from health.logger import flush_logs, intercept_logs, prepare_logger
+from health.profiling import Profiler, ProfilingMiddleware, profile_endpoints
+from health.profiling import router as profiling_router
+from health.readiness import DatabaseProbe, warm_up_pool
+from health.readiness import router as readiness_router
+from health.reload import POOL_SETTINGS, ConfigReload, ReloadRejectedError
+from health.reload import router as reload_router
+from measurements import router as measurements_router
+from measurements.adapter.api.dependencies import init_measurement_unit_of_work
+from measurements.adapter.repository import MeasurementStore
+from measurements.domain.events import SamplesRecorded
+from measurements.service_layer import RollupEngine, SampleWriter
+from roster import router as roster_router
+from roster.adapter.repository import RosterStore
 
 
 @contextlib.asynccontextmanager
 async def lifespan(app: FastAPI) -> None:
     db = app.config.db
-    url = f"postgresql+pg8000://{db.username}:{db.password}@{db.host}:{db.port}/{db.database}"
 
-    engine = sa.create_engine(url)
+    engine = breaker = None
+    if db.backend == "memory":
+        setattr(app, "user_store", UserStore())
+        setattr(app, "idempotency_store", InMemoryIdempotencyStore())
+        setattr(app, "audit_store", InMemoryAuditStore())
+        setattr(app, "activity_store", InMemoryActivityStore())
+        setattr(app, "roster_store", RosterStore())
+        setattr(app, "measurement_store", MeasurementStore())
+    else:
+        # Given to the factory by benchmarks, built from the config otherwise
+        engine = app.engine if app.engine is not None else init_engine(db)
+        breaker = init_breaker(app.config.breaker, "db")
+        instrument_engine(engine, breaker=breaker)
     setattr(app, "engine", engine)
-    intercept_logs()
+    setattr(app, "breaker", breaker)
+
+    shards = (
+        init_shards(db, engine, breaker, app.config.breaker)
+        if engine is not None and db.shards
+        else None
+    )
+    if shards is not None:
+        shards.start(db.slot_refresh_interval)
+    setattr(app, "shards", shards)
+    setattr(app, "rate_limiters", init_rate_limiters(app.config.rate_limit))
+    intercept_logs(app.config.log)
+
+    revocations = RevocationCache(retention=ACCESS_TOKEN_TTL)
+    # In-memory store is not shared between workers, there is nothing
+    # to pick up. Unit of work is built per poll, as the engine may be
+    # replaced meanwhile
+    if engine is not None:
+        revocations.start(
+            lambda: init_unit_of_work(app, AbstractMessageBus()),
+            app.config.app.revocation_poll_interval,
+        )
+    setattr(app, "revocations", revocations)
+
+    engines = database_engines(app)
+    if engines:
+        warm_up(app, engines)
+    setattr(app, "probe", DatabaseProbe(engines, app.config.app.readiness_ttl))
+
+    search = app.config.search
+    setattr(
+        app, "search_cache", LRUCache("search", search.cache_size, search.cache_ttl)
+    )
+    breaker_cfg = app.config.breaker
+    setattr(
+        app,
+        "user_cache",
+        LRUCache("users", breaker_cfg.user_cache_size, breaker_cfg.user_cache_ttl),
+    )
+
+    idempotency = app.config.idempotency
+    setattr(app, "idempotency_cache", IdempotencyCache(idempotency.cache_size))
+    reaper = IdempotencyReaper(
+        lambda: init_idempotency_store(app),
+        idempotency.reap_interval,
+        idempotency.reap_batch_size,
+    )
+    if idempotency.enabled:
+        reaper.start()
+
+    audit = init_audit_writer(app)
+    if audit is not None:
+        audit.start()
+    setattr(app, "audit", audit)
+
+    activity = init_activity_tracker(app)
+    if activity is not None:
+        activity.start()
+    setattr(app, "activity", activity)
+
+    # Handlers of events of units of work outside of requests
+    bus = MessageBus()
+    rollup_engine = init_rollup_engine(app)
+    if rollup_engine is not None:
+        bus.subscribe(SamplesRecorded, rollup_engine.handle)
+        rollup_engine.start()
+    setattr(app, "rollup_engine", rollup_engine)
+
+    sample_writer = init_sample_writer(app, bus)
+    if sample_writer is not None:
+        sample_writer.start()
+    setattr(app, "sample_writer", sample_writer)
 
     yield
 
-    engine.dispose(close=True)
+    # Flushed before the engine is disposed, rollups after the samples
+    if sample_writer is not None:
+        sample_writer.stop()
+    if rollup_engine is not None:
+        rollup_engine.stop()
+    if activity is not None:
+        activity.stop()
+    if audit is not None:
+        audit.stop()
+    reaper.stop()
+    revocations.stop()
+    if shards is not None:
+        shards.stop()
+        for shard_engine in shards.engines[1:]:
+            shard_engine.dispose(close=True)
+    # Reloads may have swapped the engine the worker started with
+    if app.engine is not None:
+        app.engine.dispose(close=True)
+    flush_logs()
+
+
+def database_engines(app: FastAPI) -> list[sa.Engine]:
+    if app.shards is not None:
+        return app.shards.engines
+    return [app.engine] if app.engine is not None else []
+
+
+def warm_up(app: FastAPI, engines: list[sa.Engine]) -> None:
+    # Worker starts without a database as well, readiness tells it is down
+    try:
+        for engine in engines:
+            warm_up_pool(engine, app.config.db.warm_up_connections)
+        auth.warm_up(init_unit_of_work(app, AbstractMessageBus()))
+    except Exception:
+        logger.exception("Can't warm up database connections")
+
+
+def init_engine(db: Database) -> sa.Engine:
+    url = f"postgresql+{db.driver}://{db.username}:{db.password}@{db.host}:{db.port}/{db.database}"
+
+    options = dict[str, Any]()
+    if db.pool_size == 0:
+        options["poolclass"] = sa.NullPool
+    else:
+        options["pool_size"] = db.pool_size
+        # Behind a pooler extra connections only queue up in pgbouncer
+        options["max_overflow"] = 0 if db.pooler == "transaction" else db.max_overflow
+
+    connect_args = dict[str, Any]()
+    if db.driver == "psycopg":
+        # Prepared statements live in a server session, which is not kept
+        # between transactions by a transaction pooler
+        connect_args["prepare_threshold"] = (
+            None if db.pooler == "transaction" else db.prepare_threshold
+        )
+
+    return sa.create_engine(url, connect_args=connect_args, **options)
+
+
+def init_breaker(cfg: Breaker, name: str) -> CircuitBreaker | None:
+    if not cfg.enabled:
+        return None
+    return CircuitBreaker(
+        name,
+        window=cfg.window,
+        min_calls=cfg.min_calls,
+        failure_rate=cfg.failure_rate,
+        slow_call_duration=cfg.slow_call_duration,
+        slow_call_rate=cfg.slow_call_rate,
+        open_duration=cfg.open_duration,
+        trial_calls=cfg.trial_calls,
+    )
+
+
+def init_shards(
+    db: Database,
+    engine: sa.Engine,
+    breaker: CircuitBreaker | None = None,
+    breaker_cfg: Breaker | None = None,
+) -> ShardSet:
+    engines, breakers = [engine], [breaker]
+    for index, shard in enumerate(db.shards, start=1):
+        shard_engine = init_engine(db.model_copy(update=shard.model_dump()))
+        shard_breaker = (
+            init_breaker(breaker_cfg, f"db_shard_{index}")
+            if breaker_cfg is not None
+            else None
+        )
+        instrument_engine(shard_engine, pool=False, breaker=shard_breaker)
+        engines.append(shard_engine)
+        breakers.append(shard_breaker)
+
+    shards = ShardSet(engines, breakers)
+    shards.refresh()
+    return shards
+
+
+def init_audit_writer(app: FastAPI) -> AuditWriter | None:
+    cfg = app.config.audit
+    if not cfg.enabled:
+        return None
+    return AuditWriter(
+        lambda: init_audit_store(app),
+        buffer_size=cfg.buffer_size,
+        batch_size=cfg.batch_size,
+        flush_interval=cfg.flush_interval,
+        overflow=cfg.overflow,
+        block_timeout=cfg.block_timeout,
+    )
+
+
+def init_activity_tracker(app: FastAPI) -> ActivityTracker | None:
+    cfg = app.config.activity
+    if not cfg.enabled:
+        return None
+    return ActivityTracker(
+        lambda: init_activity_store(app),
+        flush_interval=cfg.flush_interval,
+        max_users=cfg.max_users,
+        lag_warning=cfg.lag_warning,
+    )
+
+
+def init_sample_writer(app: FastAPI, bus: AbstractMessageBus) -> SampleWriter | None:
+    cfg = app.config.measurements
+    if not cfg.enabled:
+        return None
+    return SampleWriter(
+        lambda: init_measurement_unit_of_work(app, bus),
+        max_pending=cfg.max_pending,
+        flush_samples=cfg.flush_samples,
+        flush_interval=cfg.flush_interval,
+    )
+
+
+def init_rollup_engine(app: FastAPI) -> RollupEngine | None:
+    cfg = app.config.measurements
+    if not cfg.enabled or not cfg.rollups:
+        return None
+    return RollupEngine(
+        lambda: init_measurement_unit_of_work(app, AbstractMessageBus()),
+        interval=cfg.rollup_interval,
+    )
+
+
+def init_rate_limiters(cfg: RateLimit) -> dict[str, SlidingWindowLimiter]:
+    if not cfg.enabled:
+        return {}
+
+    store: AbstractCounterStore
+    if cfg.store == "sqlite":
+        store = SQLiteCounterStore(cfg.sqlite_path)
+    else:
+        store = InMemoryCounterStore()
+
+    return {
+        name: SlidingWindowLimiter(name, rate, store)
+        for name, rate in rate_limit_rules(cfg).items()
+    }
+
+
+def rate_limit_rules(cfg: RateLimit) -> dict[str, Rate]:
+    rules = {
+        "login_ip": cfg.login_ip,
+        "login_email": cfg.login_email,
+        "create_ip": cfg.create_ip,
+    }
+    return {name: Rate(rule.limit, rule.period) for name, rule in rules.items()}
+
+
+def apply_config(app: FastAPI, plan: ConfigReload) -> None:
+    """Applies settings of a reload which change live.
+
+    Requests read the rest of them from the config, which the reload
+    replaces afterwards.
+    """
+    cfg = plan.config
+    # First, a pool which can't connect rejects the reload as a whole
+    if app.engine is not None and plan.changed(*POOL_SETTINGS):
+        swap_engine(app, cfg.db)
+    if plan.changed(*POOL_SETTINGS, "app.readiness_ttl"):
+        setattr(
+            app, "probe", DatabaseProbe(database_engines(app), cfg.app.readiness_ttl)
+        )
+
+    if plan.changed("log.*"):
+        prepare_logger(cfg.log)
+        intercept_logs(cfg.log)
+
+    if plan.changed("rate_limit.*"):
+        old = app.config.rate_limit
+        new = cfg.rate_limit
+        if (
+            old.enabled
+            and new.enabled
+            and (old.store, old.sqlite_path)
+            == (
+                new.store,
+                new.sqlite_path,
+            )
+        ):
+            # Counters are kept, limiters only take the new rates
+            for name, rate in rate_limit_rules(new).items():
+                app.rate_limiters[name].rate = rate
+        else:
+            setattr(app, "rate_limiters", init_rate_limiters(new))
 
+    if plan.changed("search.cache_size", "search.cache_ttl"):
+        app.search_cache.resize(cfg.search.cache_size, cfg.search.cache_ttl)
+    if plan.changed("breaker.user_cache_size", "breaker.user_cache_ttl"):
+        app.user_cache.resize(cfg.breaker.user_cache_size, cfg.breaker.user_cache_ttl)
+    if plan.changed("idempotency.cache_size"):
+        app.idempotency_cache.resize(cfg.idempotency.cache_size)
 
-def init_app(cfg: Config) -> FastAPI:
+
+def swap_engine(app: FastAPI, db: Database) -> None:
+    """Replaces the engine of the worker by one with new pool settings.
+
+    Requests take the engine when they start, those in flight finish on
+    the old one. Its idle connections are closed right away, connections
+    in use once they are returned.
+    """
+    engine = init_engine(db)
+    try:
+        with engine.connect():
+            pass
+        warm_up_pool(engine, db.warm_up_connections)
+    except Exception as e:
+        engine.dispose()
+        raise ReloadRejectedError(f"Can't connect with new pool settings: {e}") from e
+
+    instrument_engine(engine, breaker=app.breaker)
+    old = app.engine
+    setattr(app, "engine", engine)
+    old.dispose()
+
+
+async def slot_frozen_handler(request: Request, exc: SlotFrozenError) -> Response:
+    # Users of the slot are being moved between shards, which takes seconds
+    return JSONResponse(
+        {"detail": "User is being moved, try again later"},
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "5"},
+    )
+
+
+async def circuit_open_handler(request: Request, exc: CircuitOpenError) -> Response:
+    return JSONResponse(
+        {"detail": "Database is unavailable, try again later"},
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+
+def init_app(
+    cfg: Config, config_path: Path | None = None, engine: sa.Engine | None = None
+) -> FastAPI:
     app = FastAPI(
         docs_url=cfg.app.docs,
         lifespan=lifespan,
     )
     app.include_router(router)
+    app.include_router(audit_router)
+    app.include_router(activity_router)
+    app.include_router(roster_router)
+    if cfg.measurements.enabled:
+        app.include_router(measurements_router)
+    app.include_router(metrics_router)
+    app.include_router(readiness_router)
+    app.include_router(reload_router)
     setattr(app, "config", cfg)
+    setattr(app, "config_path", config_path)
+    setattr(app, "engine", engine)
+    # Set in workers of the process manager, which reloads all of them
+    setattr(app, "master_pid", None)
+
+    if cfg.profiling.enabled:
+        profiling = cfg.profiling
+        profiler = Profiler(
+            profiling.directory,
+            output=profiling.output,
+            sample_every=profiling.sample_every,
+            sampling_interval=profiling.sampling_interval,
+            header_secret=profiling.header_secret,
+            max_snapshots=profiling.max_snapshots,
+        )
+        setattr(app, "profiler", profiler)
+        app.include_router(profiling_router)
+        profile_endpoints(app)
+        # Innermost, time spent waiting for admission is not profiled
+        app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+    if cfg.admission.enabled:
+        admission = cfg.admission
+        app.add_middleware(
+            AdmissionControlMiddleware,
+            limit=GradientLimit(
+                initial=admission.initial_limit,
+                min_limit=admission.min_limit,
+                max_limit=admission.max_limit,
+            ),
+            caps={RouteClass(name): cap for name, cap in admission.caps.items()},
+            low_priority_share=admission.low_priority_share,
+            retry_after=admission.retry_after,
+        )
+
+    app.add_exception_handler(SlotFrozenError, slot_frozen_handler)
+    app.add_exception_handler(CircuitOpenError, circuit_open_handler)
+
+    # Added last to be the outermost one and see shed requests as well
+    app.add_middleware(InstrumentationMiddleware)
 
     return app
@@ -3,8 +3,6 @@ from __future__ import annotations
 import argparse
 import functools
 
-import yaml
-
 from pathlib import Path
 from typing import Literal, Sequence, TypeVar, Callable, ParamSpec
 
@@ -14,10 +12,29 @@ from pydantic import BaseModel, ValidationError, Field
 __all__ = ["Config", "parse_yaml"]
 
 
+# Sections are defined below, references to them are resolved on first
+# validation rather than on import
 class Config(BaseSettings):
     db: Database
     app: App
     log: Log
+    rate_limit: RateLimit = Field(default_factory=lambda: RateLimit())
+    admission: Admission = Field(default_factory=lambda: Admission())
+    idempotency: Idempotency = Field(default_factory=lambda: Idempotency())
+    search: Search = Field(default_factory=lambda: Search())
+    breaker: Breaker = Field(default_factory=lambda: Breaker())
+    audit: Audit = Field(default_factory=lambda: Audit())
+    activity: Activity = Field(default_factory=lambda: Activity())
+    profiling: Profiling = Field(default_factory=lambda: Profiling())
+    measurements: Measurements = Field(default_factory=lambda: Measurements())
+
+
+class Shard(BaseModel):
+    host: str
+    port: int = 5432
+    database: str
+    username: str
+    password: str
 
 
 class Database(BaseModel):
@@ -27,6 +44,27 @@ class Database(BaseModel):
     username: str
     password: str
     sslmode: Literal["disable"]
+    # In-memory backend keeps data in the process, useful as a baseline
+    # without database cost
+    backend: Literal["postgres", "memory"] = "postgres"
+    # psycopg is an optional dependency, install the "psycopg" extra to use it
+    driver: Literal["pg8000", "psycopg"] = "pg8000"
+    # psycopg prepares statements on the server after this many executions
+    # on a connection, None disables it for poolers without their support
+    prepare_threshold: int | None = 5
+    # Pool of every worker process, 0 opens a connection per checkout
+    pool_size: int = Field(default=5, ge=0)
+    max_overflow: int = Field(default=10, ge=0)
+    # Set to "transaction" behind a transaction pooling pgbouncer, server
+    # connections are then shared between transactions of all clients
+    pooler: Literal["none", "transaction"] = "none"
+    # Connections every worker opens on start, up to the pool size
+    warm_up_connections: int = Field(default=2, ge=0)
+    # Users are spread over this database and the shards by a hash of their
+    # id. This database keeps the email directory and the slot map, which
+    # every worker reloads this often
+    shards: list[Shard] = []
+    slot_refresh_interval: float = Field(default=5.0, gt=0)
 
 
 class App(BaseModel):
@@ -35,18 +73,170 @@ class App(BaseModel):
     workers: int = 1
     docs: str = "/docs"
     secret: str
+    # Event loop and HTTP parser, "auto" prefers uvloop and httptools
+    loop: Literal["auto", "asyncio", "uvloop"] = "auto"
+    http: Literal["auto", "h11", "httptools"] = "auto"
+    backlog: int = 2048
+    # Workers are recycled after serving this many requests, jitter keeps
+    # them from restarting all at once
+    max_requests: int | None = None
+    max_requests_jitter: int = 0
+    graceful_timeout: int = 30
+    # Logouts made by other workers are picked up from the database this
+    # often, until then their access tokens are still accepted
+    revocation_poll_interval: float = Field(default=2.0, gt=0)
+    # Readiness probes of the database are answered from the last one for
+    # this many seconds
+    readiness_ttl: float = Field(default=2.0, ge=0)
+    # Bearer token of admin endpoints, they don't exist without one
+    admin_token: str | None = None
 
 
 class Log(BaseModel):
     level: Literal["debug", "info", "warning", "error"] = "info"
+    format: Literal["text", "json"] = "text"
+    colorize: bool = True
+    # Rendering caller location requires inspecting frames of every record
+    caller: bool = False
+    queue_size: int = Field(default=10_000, gt=0)
+    overflow: Literal["drop_new", "drop_oldest", "block"] = "drop_new"
+    access_log_sample_rate: float = Field(default=1.0, ge=0, le=1)
+
+
+class RateLimitRule(BaseModel):
+    limit: int
+    period: float = 60
+
+
+class RateLimit(BaseModel):
+    enabled: bool = True
+    store: Literal["memory", "sqlite"] = "memory"
+    sqlite_path: Path = Path("ratelimit.sqlite3")
+    login_ip: RateLimitRule = RateLimitRule(limit=30)
+    login_email: RateLimitRule = RateLimitRule(limit=10)
+    create_ip: RateLimitRule = RateLimitRule(limit=10)
+
+
+class Admission(BaseModel):
+    enabled: bool = True
+    initial_limit: int = 32
+    min_limit: int = 4
+    max_limit: int = 256
+    low_priority_share: float = Field(default=0.75, gt=0, le=1)
+    retry_after: int = 1
+    caps: dict[Literal["read", "refresh", "login", "create", "write"], int] = {
+        "read": 128,
+        "refresh": 64,
+        "login": 16,
+        "create": 16,
+        "write": 32,
+    }
+
+
+class Idempotency(BaseModel):
+    enabled: bool = True
+    # Retries with the same key within this time get the stored response
+    ttl: float = Field(default=24 * 3600, gt=0)
+    # Claims of crashed requests are taken over after this time
+    lock_timeout: float = Field(default=60, gt=0)
+    cache_size: int = Field(default=10_000, ge=0)
+    reap_interval: float = Field(default=60, gt=0)
+    reap_batch_size: int = Field(default=1000, gt=0)
+
+
+class Search(BaseModel):
+    max_limit: int = Field(default=50, gt=0)
+    # First pages of recent queries are kept by every worker
+    cache_size: int = Field(default=10_000, ge=0)
+    cache_ttl: float = Field(default=30, gt=0)
+
+
+class Breaker(BaseModel):
+    enabled: bool = True
+    # Statements of this many last seconds decide whether to open, at least
+    # min_calls of them
+    window: float = Field(default=10, gt=0)
+    min_calls: int = Field(default=20, gt=0)
+    failure_rate: float = Field(default=0.5, gt=0, le=1)
+    slow_call_duration: float = Field(default=1.0, gt=0)
+    slow_call_rate: float = Field(default=0.8, gt=0, le=1)
+    # Open breaker fails units of work for this long, then lets trial_calls
+    # statements through to see whether the database is back
+    open_duration: float = Field(default=5, gt=0)
+    trial_calls: int = Field(default=3, gt=0)
+    # Users read while the database was up are served from this cache while
+    # it is down, refreshed access tokens then live for degraded_token_ttl
+    user_cache_size: int = Field(default=10_000, ge=0)
+    user_cache_ttl: float = Field(default=600, gt=0)
+    degraded_token_ttl: float = Field(default=300, gt=0)
+
+
+class Audit(BaseModel):
+    enabled: bool = True
+    # Events wait in memory of the worker until batch_size of them are
+    # buffered or flush_interval passes, a crashed worker loses them
+    buffer_size: int = Field(default=10_000, gt=0)
+    batch_size: int = Field(default=500, gt=0)
+    flush_interval: float = Field(default=1.0, gt=0)
+    # Requests recording to a full buffer wait for up to block_timeout,
+    # then their events are dropped
+    overflow: Literal["block", "drop_new"] = "block"
+    block_timeout: float = Field(default=0.1, ge=0)
+    # COPY on Postgres, multi-row INSERT when off
+    use_copy: bool = True
+
+
+class Activity(BaseModel):
+    enabled: bool = True
+    # Last seen time and request counts of users are coalesced in memory of
+    # the worker and written this often, a crashed worker loses them
+    flush_interval: float = Field(default=10.0, gt=0)
+    # More users than this flush early, twice as many are not counted
+    # until the flush
+    max_users: int = Field(default=10_000, gt=0)
+    # Flushes of activity older than this are logged as late
+    lag_warning: float = Field(default=60.0, gt=0)
+
+
+class Profiling(BaseModel):
+    # Nothing is installed when off, requests don't pay for it
+    enabled: bool = False
+    # Profiles of single requests, by cProfile or by sampling their stack
+    # for flamegraphs
+    output: Literal["pstats", "flamegraph"] = "pstats"
+    directory: Path = Path("profiles")
+    sampling_interval: float = Field(default=0.005, gt=0)
+    # Profiles every this many requests of a worker
+    sample_every: int | None = Field(default=None, gt=0)
+    # Requests with X-Profile signed by this secret are profiled
+    header_secret: str | None = None
+    # tracemalloc snapshots kept by every worker for diffs
+    max_snapshots: int = Field(default=4, gt=0)
+
+
+class Measurements(BaseModel):
+    enabled: bool = True
+    # Samples of a single request
+    max_samples: int = Field(default=100_000, gt=0)
+    # Accepted samples wait in memory of the worker until flush_samples of
+    # them are queued or flush_interval passes. Requests beyond max_pending
+    # are refused, devices resend batches a crashed worker lost
+    max_pending: int = Field(default=1_000_000, gt=0)
+    flush_samples: int = Field(default=50_000, gt=0)
+    flush_interval: float = Field(default=0.5, gt=0)
+    # COPY on Postgres, multi-row INSERT when off
+    use_copy: bool = True
+    # Days with new samples are rolled up this often by the worker which
+    # wrote them
+    rollups: bool = True
+    rollup_interval: float = Field(default=5.0, gt=0)
 
 
 class Args(BaseModel):
+    command: Literal["dev", "serve"] = "dev"
     config_path: Path = Field(default="config.yaml", alias="config")
 
 
-Config.update_forward_refs()
-
 ParamT = ParamSpec("ParamT")
 RetT = TypeVar("RetT")
 
@@ -68,6 +258,8 @@ def catch_pydantic_errors(func: Callable[ParamT, RetT]) -> Callable[ParamT, RetT
 
 @catch_pydantic_errors
 def parse_yaml(file_path: str | Path) -> Config:
+    import yaml
+
     if not isinstance(file_path, Path):
         file_path = Path(file_path)
 
@@ -85,6 +277,13 @@ def parse_args(args: Sequence[str]) -> Args:
         add_help=True,
     )
 
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="dev",
+        choices=["dev", "serve"],
+        help="dev runs a single reloading process, serve runs production workers",
+    )
     parser.add_argument(
         "-c", "--config", default="config.yaml", help="Path to configuration file"
     )
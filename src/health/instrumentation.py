@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import contextvars
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import sqlalchemy as sa
+from fastapi import APIRouter, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from common.breaker import CircuitBreaker
+from common.metrics import REGISTRY, Gauge, Histogram, render_text
+
+__all__ = [
+    "InstrumentationMiddleware",
+    "RequestStats",
+    "current_request_stats",
+    "instrument_engine",
+    "router",
+]
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+
+REQUEST_SQL_STATEMENTS = Histogram(
+    "http_request_sql_statements",
+    "Number of SQL statements executed per HTTP request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50),
+)
+
+REQUEST_SQL_DURATION = Histogram(
+    "http_request_sql_duration_seconds",
+    "Time spent executing SQL statements per HTTP request",
+    ["route"],
+)
+
+SQL_STATEMENT_DURATION = Histogram(
+    "db_statement_duration_seconds",
+    "Duration of single SQL statements",
+)
+
+POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Connections of the SQLAlchemy pool by state",
+    ["state"],
+)
+
+
+@dataclass
+class RequestStats:
+    sql_statements: int = 0
+    sql_seconds: float = 0.0
+
+
+# Sync endpoints run in the threadpool with a copy of the request context,
+# both sides share the same stats object.
+current_request_stats = contextvars.ContextVar[RequestStats | None](
+    "current_request_stats", default=None
+)
+
+
+class InstrumentationMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._children = dict[tuple[str, str, int], tuple]()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request_stats.reset(token)
+
+            # Router puts matched route into the scope, use its template
+            # to keep label cardinality bounded
+            route = scope.get("route")
+            template = route.path if route is not None else "unmatched"
+            duration, sql_statements, sql_duration = self._route_children(
+                scope["method"], template, status_code
+            )
+            duration.observe(elapsed)
+            sql_statements.observe(stats.sql_statements)
+            sql_duration.observe(stats.sql_seconds)
+
+    def _route_children(self, method: str, template: str, status_code: int) -> tuple:
+        key = (method, template, status_code)
+        children = self._children.get(key)
+        if children is None:
+            children = self._children[key] = (
+                REQUEST_DURATION.labels(method, template, str(status_code)),
+                REQUEST_SQL_STATEMENTS.labels(template),
+                REQUEST_SQL_DURATION.labels(template),
+            )
+        return children
+
+
+def instrument_engine(
+    engine: sa.Engine, pool: bool = True, breaker: CircuitBreaker | None = None
+) -> None:
+    listeners = STATEMENT_LISTENERS if breaker is None else _guarded(breaker)
+    for name, listener in listeners.items():
+        sa.event.listen(engine, name, listener)
+    # Gauge reports a single pool, the one of the main engine
+    if pool:
+        POOL_CONNECTIONS.set_function(lambda: _pool_stats(engine.pool))
+
+
+# Dialect level execution hooks wrap the driver call with a single listener,
+# which is noticeably cheaper than a before/after_cursor_execute pair. Each
+# of them runs the original dialect method and returns True to mark the
+# statement as executed.
+
+
+def _do_execute(cursor, statement, parameters, context) -> bool:
+    start = time.perf_counter()
+    try:
+        context.dialect.do_execute(cursor, statement, parameters, context)
+    finally:
+        _observe_statement(time.perf_counter() - start)
+    return True
+
+
+def _do_execute_no_params(cursor, statement, context) -> bool:
+    start = time.perf_counter()
+    try:
+        context.dialect.do_execute_no_params(cursor, statement, context)
+    finally:
+        _observe_statement(time.perf_counter() - start)
+    return True
+
+
+def _do_executemany(cursor, statement, parameters, context) -> bool:
+    start = time.perf_counter()
+    try:
+        context.dialect.do_executemany(cursor, statement, parameters, context)
+    finally:
+        _observe_statement(time.perf_counter() - start)
+    return True
+
+
+def _observe_statement(elapsed: float) -> None:
+    SQL_STATEMENT_DURATION.observe(elapsed)
+
+    stats = current_request_stats.get()
+    if stats is not None:
+        stats.sql_statements += 1
+        stats.sql_seconds += elapsed
+
+
+STATEMENT_LISTENERS = {
+    "do_execute": _do_execute,
+    "do_execute_no_params": _do_execute_no_params,
+    "do_executemany": _do_executemany,
+}
+
+
+def _guarded(breaker: CircuitBreaker) -> dict[str, Callable[..., Any]]:
+    """Listeners which also report outcomes of statements to the breaker.
+
+    New connections are made on pool checkout, failing to connect counts
+    as a failed call as well.
+    """
+
+    def do_execute(cursor, statement, parameters, context) -> bool:
+        start = time.perf_counter()
+        failed = True
+        try:
+            context.dialect.do_execute(cursor, statement, parameters, context)
+            failed = False
+        except Exception as e:
+            failed = _is_outage(context.dialect, e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            _observe_statement(elapsed)
+            breaker.record(elapsed, failed)
+        return True
+
+    def do_execute_no_params(cursor, statement, context) -> bool:
+        start = time.perf_counter()
+        failed = True
+        try:
+            context.dialect.do_execute_no_params(cursor, statement, context)
+            failed = False
+        except Exception as e:
+            failed = _is_outage(context.dialect, e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            _observe_statement(elapsed)
+            breaker.record(elapsed, failed)
+        return True
+
+    def do_executemany(cursor, statement, parameters, context) -> bool:
+        start = time.perf_counter()
+        failed = True
+        try:
+            context.dialect.do_executemany(cursor, statement, parameters, context)
+            failed = False
+        except Exception as e:
+            failed = _is_outage(context.dialect, e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            _observe_statement(elapsed)
+            breaker.record(elapsed, failed)
+        return True
+
+    def do_connect(dialect, connection_record, cargs, cparams):
+        start = time.perf_counter()
+        try:
+            connection = dialect.connect(*cargs, **cparams)
+        except Exception as e:
+            breaker.record(time.perf_counter() - start, _is_outage(dialect, e))
+            raise
+        breaker.record(time.perf_counter() - start)
+        return connection
+
+    return {
+        "do_execute": do_execute,
+        "do_execute_no_params": do_execute_no_params,
+        "do_executemany": do_executemany,
+        "do_connect": do_connect,
+    }
+
+
+def _is_outage(dialect: sa.Dialect, error: Exception) -> bool:
+    # Constraint violations and bad statements are answers of a working
+    # database, lost connections, timeouts and cancellations are not
+    dbapi = dialect.loaded_dbapi
+    return isinstance(error, (dbapi.OperationalError, dbapi.InterfaceError))
+
+
+def _pool_stats(pool: sa.Pool) -> list[tuple[tuple[str], float]]:
+    if not isinstance(pool, sa.QueuePool):
+        return []
+
+    return [
+        (("size",), pool.size()),
+        (("checked_out",), pool.checkedout()),
+        (("checked_in",), pool.checkedin()),
+        (("overflow",), max(0, pool.overflow())),
+    ]
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics() -> Response:
+    return Response(
+        render_text(REGISTRY),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
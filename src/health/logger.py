@@ -1,17 +1,69 @@
+import json
 import logging
+import os
+import queue
+import random
 import sys
+import threading
+import time
+import traceback
+from typing import Callable, TextIO
 
 from loguru import logger
 
+from common.metrics import Counter
+from health.config import Log
+
+__all__ = [
+    "InterceptHandler",
+    "QueueSink",
+    "prepare_logger",
+    "intercept_logs",
+    "flush_logs",
+]
+
+DROPPED = Counter(
+    "log_records_dropped_total",
+    "Log records dropped because the log queue was full",
+)
+
+Formatter = Callable[[dict], str]
+
+_LEVEL_COLORS = {
+    "TRACE": "\x1b[36m",
+    "DEBUG": "\x1b[34m",
+    "INFO": "\x1b[1m",
+    "SUCCESS": "\x1b[32m",
+    "WARNING": "\x1b[33m",
+    "ERROR": "\x1b[31m",
+    "CRITICAL": "\x1b[41m",
+}
+_GREEN, _RESET = "\x1b[32m", "\x1b[0m"
+
+_sink: "QueueSink | None" = None
+
 
 class InterceptHandler(logging.Handler):
+    def __init__(self, with_caller: bool = True, sample_rate: float = 1.0) -> None:
+        super().__init__()
+        self._with_caller = with_caller
+        self._sample_rate = sample_rate
+
     def emit(self, record):
+        if self._sample_rate < 1.0 and random.random() >= self._sample_rate:
+            return
+
         # get corresponding Loguru level if it exists
         try:
             level = logger.level(record.levelname).name
         except ValueError:
             level = record.levelno
 
+        if not self._with_caller:
+            # Caller location is not rendered, skip walking the stack
+            logger.opt(exception=record.exc_info).log(level, record.getMessage())
+            return
+
         # find caller from where originated the logged message
         frame, depth = sys._getframe(6), 6
         while frame and frame.f_code.co_filename == logging.__file__:
@@ -23,17 +75,182 @@ class InterceptHandler(logging.Handler):
         )
 
 
-def prepare_logger(level: str) -> None:
+class QueueSink:
+    """Loguru sink formatting and writing records on a background thread.
+
+    Request threads only put the record into a bounded queue. When the
+    queue is full, the record is dropped, replaces the oldest queued one
+    or the caller blocks, depending on the overflow policy.
+    """
+
+    BATCH_SIZE = 256
+
+    def __init__(
+        self,
+        stream: TextIO,
+        formatter: Formatter,
+        maxsize: int = 10_000,
+        overflow: str = "drop_new",
+    ) -> None:
+        self._stream = stream
+        self._formatter = formatter
+        self._overflow = overflow
+        self._maxsize = maxsize
+        self._start()
+
+    def _start(self) -> None:
+        self._queue = queue.Queue[dict | None](self._maxsize)
+        self._thread = threading.Thread(
+            target=self._run, name="log-writer", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, message) -> None:
+        record = message.record
+        try:
+            self._queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+
+        if self._overflow == "block":
+            self._queue.put(record)
+            return
+
+        if self._overflow == "drop_oldest":
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                self._queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                pass
+        DROPPED.inc()
+
+    # No flush(), loguru calls it after every write and would wait for
+    # the writer thread each time
+
+    def drain(self, timeout: float = 5.0) -> None:
+        """Waits until queued records are written."""
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                self._queue.all_tasks_done.wait(remaining)
+
+    def stop(self) -> None:
+        # Called by loguru when the handler is removed, also at exit
+        self._queue.put(None)
+        self._thread.join(timeout=5.0)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            records = [record for record in batch if record is not None]
+            try:
+                self._stream.write("".join(map(self._formatter, records)))
+                self._stream.flush()
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+            if stop:
+                return
+
+
+def text_formatter(colorize: bool, with_caller: bool) -> Formatter:
+    def format_record(record: dict) -> str:
+        level = record["level"].name
+        timestamp = record["time"].strftime("%H:%M:%S")
+        message = record["message"]
+        if with_caller:
+            message = (
+                f"{record['name']}:{record['function']}:{record['line']} - {message}"
+            )
+        if colorize:
+            color = _LEVEL_COLORS.get(level, "")
+            timestamp = f"{_GREEN}{timestamp}{_RESET}"
+            message = f"{color}{message}{_RESET}"
+        return f"{timestamp} | {level} | {message}\n{_format_exception(record)}"
+
+    return format_record
+
+
+def json_formatter(with_caller: bool) -> Formatter:
+    def format_record(record: dict) -> str:
+        data = {
+            "time": record["time"].isoformat(),
+            "level": record["level"].name,
+            "message": record["message"],
+        }
+        if with_caller:
+            data["logger"] = record["name"]
+            data["function"] = record["function"]
+            data["line"] = record["line"]
+        if record["extra"]:
+            data["extra"] = record["extra"]
+        if record["exception"] is not None:
+            data["exception"] = _format_exception(record)
+        return json.dumps(data, default=str) + "\n"
+
+    return format_record
+
+
+def _format_exception(record: dict) -> str:
+    if record["exception"] is None:
+        return ""
+    type_, value, tb = record["exception"]
+    return "".join(traceback.format_exception(type_, value, tb))
+
+
+def prepare_logger(cfg: Log) -> None:
+    global _sink
+
+    if cfg.format == "json":
+        formatter = json_formatter(cfg.caller)
+    else:
+        formatter = text_formatter(cfg.colorize and sys.stdout.isatty(), cfg.caller)
+
     logger.remove()
-    logger.add(
-        sys.stdout,
-        level=level,
-        colorize=True,
-        format="<green>{time:HH:mm:ss}</green> | {level} | <level>{message}</level>",
-    )
+    _sink = QueueSink(sys.stdout, formatter, cfg.queue_size, cfg.overflow)
+    # Records are rendered by the sink, loguru only hands them over
+    logger.add(_sink, level=cfg.level.upper(), colorize=False, format="{message}")
 
 
-def intercept_logs():
+def intercept_logs(cfg: Log) -> None:
     for logger_name in ["uvicorn", "uvicorn.error", "uvicorn.access"]:
         log = logging.getLogger(logger_name)
-        log.addHandler(InterceptHandler())
+        sample_rate = 1.0
+        if logger_name == "uvicorn.access":
+            sample_rate = cfg.access_log_sample_rate
+            log.disabled = sample_rate == 0
+        # Replace uvicorn handlers, otherwise every line is formatted twice
+        log.handlers = [InterceptHandler(cfg.caller, sample_rate)]
+        log.propagate = False
+        # uvicorn sets levels of its loggers on start, a reload changes them
+        log.setLevel(cfg.level.upper())
+
+
+def flush_logs(timeout: float = 5.0) -> None:
+    if _sink is not None:
+        _sink.drain(timeout)
+
+
+def _restart_sink() -> None:
+    # Writer thread does not survive fork, records queued at that moment
+    # are written by the parent
+    if _sink is not None:
+        _sink._start()
+
+
+os.register_at_fork(after_in_child=_restart_sink)
@@ -0,0 +1,473 @@
+"""Profiling of single requests and allocation snapshots, on demand.
+
+Nothing here is installed unless ``profiling.enabled`` is set. Then a
+request is profiled when it carries a signed ``X-Profile`` header, when
+an admin armed profiling of its path, or when it is every ``sample_every``
+request. Its endpoint function is profiled with cProfile into a pstats
+file or by sampling its stack into folded stacks for flamegraphs, in the
+directory of profiles of the worker.
+
+Endpoints run in the threadpool, so the profiler is enabled around the
+endpoint function in the thread running it, dependencies are not
+included.
+"""
+
+from __future__ import annotations
+
+import abc
+import asyncio
+import cProfile
+import collections
+import contextvars
+import functools
+import hashlib
+import hmac
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Annotated, Any, Callable, Literal
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    FastAPI,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.routing import APIRoute
+from loguru import logger
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from common.metrics import Counter
+from health.admin import require_admin
+
+__all__ = [
+    "Profiler",
+    "ProfilingMiddleware",
+    "profile_endpoints",
+    "sign_profile_header",
+    "router",
+]
+
+PROFILES = Counter(
+    "profiles_total",
+    "Requests profiled by what asked for it",
+    ["trigger"],
+)
+
+PROFILE_HEADER = b"x-profile"
+
+current_profile = contextvars.ContextVar["ProfileSession | None"](
+    "current_profile", default=None
+)
+
+
+def sign_profile_header(secret: str, ttl: float = 300) -> str:
+    """Value of ``X-Profile`` accepted for ``ttl`` seconds."""
+    expires = str(int(time.time() + ttl))
+    return f"{expires}.{_signature(secret, expires)}"
+
+
+def _signature(secret: str, expires: str) -> str:
+    return hmac.new(secret.encode(), expires.encode(), hashlib.sha256).hexdigest()
+
+
+class ProfileSession(abc.ABC):
+    @abc.abstractmethod
+    def enter(self) -> None:
+        """Starts profiling the calling thread."""
+
+    @abc.abstractmethod
+    def exit(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    def write(self, path: Path) -> Path:
+        """Writes the profile next to ``path``, with its own extension."""
+
+    def close(self) -> None:
+        """Called once the request is over."""
+
+
+# Since 3.12 cProfile is built on sys.monitoring, which has a single
+# profiler slot, enabling a second one at a time raises ValueError
+_cprofile_lock = threading.Lock()
+
+
+class CProfileSession(ProfileSession):
+    """Deterministic profile, one at a time in the process.
+
+    Created only by ``open``, which returns None while another session
+    is running.
+    """
+
+    @classmethod
+    def open(cls) -> CProfileSession | None:
+        if not _cprofile_lock.acquire(blocking=False):
+            return None
+        return cls()
+
+    def __init__(self) -> None:
+        self._profile = cProfile.Profile()
+
+    def enter(self) -> None:
+        self._profile.enable()
+
+    def exit(self) -> None:
+        self._profile.disable()
+
+    def write(self, path: Path) -> Path:
+        path = path.with_suffix(".prof")
+        self._profile.dump_stats(path)
+        return path
+
+    def close(self) -> None:
+        _cprofile_lock.release()
+
+
+class SamplingSession(ProfileSession):
+    """Samples stacks of the profiled thread every ``interval`` seconds.
+
+    Stacks are written folded, one ``outer;...;inner count`` line each,
+    which flamegraph.pl and speedscope render. The sampler waits for the
+    GIL like any thread, a busy endpoint is sampled about every
+    ``sys.getswitchinterval()`` at most, very short requests not at all.
+    """
+
+    def __init__(self, interval: float) -> None:
+        self._interval = interval
+        self._stacks = collections.Counter[str]()
+        self._thread_id: int | None = None
+        self._stop = threading.Event()
+        self._sampler: threading.Thread | None = None
+
+    def enter(self) -> None:
+        self._thread_id = threading.get_ident()
+        self._stop.clear()
+        self._sampler = threading.Thread(
+            target=self._run, name="profile-sampler", daemon=True
+        )
+        self._sampler.start()
+
+    def exit(self) -> None:
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+
+    def write(self, path: Path) -> Path:
+        path = path.with_suffix(".folded")
+        path.write_text(
+            "".join(f"{stack} {count}\n" for stack, count in self._stacks.items())
+        )
+        return path
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self._stacks[_fold(frame)] += 1
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(
+            f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        )
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Profiler:
+    """Decides which requests to profile and writes their profiles.
+
+    Also keeps tracemalloc snapshots of the worker taken by admins.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        output: Literal["pstats", "flamegraph"] = "pstats",
+        sample_every: int | None = None,
+        sampling_interval: float = 0.005,
+        header_secret: str | None = None,
+        max_snapshots: int = 4,
+    ) -> None:
+        self._directory = directory
+        self._output = output
+        self._sample_every = sample_every
+        self._sampling_interval = sampling_interval
+        self._header_secret = header_secret
+        self._requests = itertools.count(1)
+        self._lock = threading.Lock()
+        # Path prefix -> requests left to profile
+        self._armed = dict[str, int]()
+        self.max_snapshots = max_snapshots
+        self.snapshots = collections.OrderedDict[int, tracemalloc.Snapshot]()
+        self._snapshot_ids = itertools.count(1)
+
+    def arm(self, prefix: str, count: int) -> None:
+        with self._lock:
+            self._armed[prefix] = count
+
+    def trigger(self, scope: Scope) -> str | None:
+        """Tells why the request is profiled, None when it isn't."""
+        if self._header_secret is not None:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER and self._valid(value.decode("latin-1")):
+                    return "header"
+
+        if self._armed and self._take_armed(scope["path"]):
+            return "admin"
+
+        if self._sample_every is not None:
+            if next(self._requests) % self._sample_every == 0:
+                return "sample"
+        return None
+
+    def session(self) -> ProfileSession | None:
+        """New session, None if the request can't be profiled right now."""
+        if self._output == "flamegraph":
+            return SamplingSession(self._sampling_interval)
+        return CProfileSession.open()
+
+    def write(self, session: ProfileSession, scope: Scope) -> Path:
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+        name = f"{time.time_ns() // 1_000_000}-{os.getpid()}-{scope['method']}-{slug}"
+        self._directory.mkdir(parents=True, exist_ok=True)
+        return session.write(self._directory / name)
+
+    def take_snapshot(self) -> tuple[int, tracemalloc.Snapshot]:
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        with self._lock:
+            snapshot_id = next(self._snapshot_ids)
+            self.snapshots[snapshot_id] = snapshot
+            while len(self.snapshots) > self.max_snapshots:
+                self.snapshots.popitem(last=False)
+        return snapshot_id, snapshot
+
+    def _valid(self, value: str) -> bool:
+        expires, _, signature = value.partition(".")
+        if not expires.isdigit() or int(expires) < time.time():
+            return False
+        expected = _signature(self._header_secret, expires)
+        return hmac.compare_digest(signature.encode(), expected.encode())
+
+    def _take_armed(self, path: str) -> bool:
+        with self._lock:
+            for prefix, left in self._armed.items():
+                if path.startswith(prefix):
+                    if left <= 1:
+                        del self._armed[prefix]
+                    else:
+                        self._armed[prefix] = left - 1
+                    return True
+        return False
+
+
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp, profiler: Profiler) -> None:
+        self.app = app
+        self._profiler = profiler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        trigger = self._profiler.trigger(scope) if scope["type"] == "http" else None
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        session = self._profiler.session()
+        if session is None:
+            # Another request is being profiled, this one is let through
+            await self.app(scope, receive, send)
+            return
+
+        PROFILES.inc(1, trigger)
+        token = current_profile.set(session)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_profile.reset(token)
+            session.close()
+            try:
+                path = await run_in_threadpool(self._profiler.write, session, scope)
+                logger.info(f"Profile of {scope['path']} written to {path}")
+            except Exception:
+                logger.exception("Can't write profile")
+
+
+def profile_endpoints(app: FastAPI) -> None:
+    """Wraps endpoint functions of the app to profile their requests.
+
+    FastAPI decides whether an endpoint runs in the threadpool when its
+    route is created, wrappers keep the function sync or async.
+    """
+    for route in app.routes:
+        if isinstance(route, APIRoute):
+            route.dependant.call = _profiled(route.dependant.call)
+
+
+def _profiled(call: Callable[..., Any]) -> Callable[..., Any]:
+    if asyncio.iscoroutinefunction(call):
+
+        @functools.wraps(call)
+        async def async_wrapper(*args, **kwargs):
+            session = current_profile.get()
+            if session is None:
+                return await call(*args, **kwargs)
+            # Coroutines of other requests running meanwhile are included
+            session.enter()
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                session.exit()
+
+        return async_wrapper
+
+    @functools.wraps(call)
+    def wrapper(*args, **kwargs):
+        session = current_profile.get()
+        if session is None:
+            return call(*args, **kwargs)
+        session.enter()
+        try:
+            return call(*args, **kwargs)
+        finally:
+            session.exit()
+
+    return wrapper
+
+
+class AllocationGet(BaseModel):
+    location: str
+    size: int
+    count: int
+    # Compared to the base snapshot, in a diff only
+    size_diff: int | None = None
+    count_diff: int | None = None
+
+
+class SnapshotGet(BaseModel):
+    pid: int
+    snapshot_id: int
+    traced_memory: int
+    top: list[AllocationGet]
+
+
+def get_profiler(request: Request) -> Profiler:
+    return request.app.profiler
+
+
+router = APIRouter(
+    prefix="/admin/profiling",
+    tags=["admin"],
+    dependencies=[Depends(require_admin)],
+    include_in_schema=False,
+)
+
+
+@router.post("/arm")
+def arm(
+    profiler: Annotated[Profiler, Depends(get_profiler)],
+    path: Annotated[str, Query(min_length=1)],
+    count: Annotated[int, Query(ge=1, le=1000)] = 1,
+) -> Response:
+    # Requests of this worker only, other workers are armed separately
+    profiler.arm(path, count)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.post("/tracemalloc/start")
+def start_tracemalloc(
+    frames: Annotated[int, Query(ge=1, le=64)] = 1,
+) -> Response:
+    # Allocations are slower while tracing, stop it when done
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.post("/tracemalloc/stop")
+def stop_tracemalloc(profiler: Annotated[Profiler, Depends(get_profiler)]) -> Response:
+    tracemalloc.stop()
+    profiler.snapshots.clear()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.post("/tracemalloc/snapshots", response_model=SnapshotGet)
+def take_snapshot(
+    profiler: Annotated[Profiler, Depends(get_profiler)],
+    limit: Annotated[int, Query(ge=1, le=200)] = 20,
+) -> SnapshotGet:
+    _require_tracing()
+    snapshot_id, snapshot = profiler.take_snapshot()
+    top = [
+        AllocationGet(location=str(stat.traceback), size=stat.size, count=stat.count)
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+    return SnapshotGet(
+        pid=os.getpid(),
+        snapshot_id=snapshot_id,
+        traced_memory=tracemalloc.get_traced_memory()[0],
+        top=top,
+    )
+
+
+@router.get("/tracemalloc/diff", response_model=SnapshotGet)
+def diff_snapshots(
+    profiler: Annotated[Profiler, Depends(get_profiler)],
+    base: int,
+    against: int | None = None,
+    limit: Annotated[int, Query(ge=1, le=200)] = 20,
+) -> SnapshotGet:
+    """Compares a snapshot to a later one, or to a new one by default."""
+    _require_tracing()
+    base_snapshot = profiler.snapshots.get(base)
+    if against is None:
+        against, snapshot = profiler.take_snapshot()
+    else:
+        snapshot = profiler.snapshots.get(against)
+    if base_snapshot is None or snapshot is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Snapshot is not kept by this worker",
+        )
+
+    top = [
+        AllocationGet(
+            location=str(stat.traceback),
+            size=stat.size,
+            count=stat.count,
+            size_diff=stat.size_diff,
+            count_diff=stat.count_diff,
+        )
+        for stat in snapshot.compare_to(base_snapshot, "lineno")[:limit]
+    ]
+    return SnapshotGet(
+        pid=os.getpid(),
+        snapshot_id=against,
+        traced_memory=tracemalloc.get_traced_memory()[0],
+        top=top,
+    )
+
+
+def _require_tracing() -> None:
+    if not tracemalloc.is_tracing():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="tracemalloc is not started",
+        )
@@ -0,0 +1,87 @@
+"""Liveness and readiness endpoints, warm-up of a starting worker.
+
+Workers warm up in the lifespan, before they accept connections, so a
+worker being started is simply not reached by the load balancer. Liveness
+only tells that the event loop answers. Readiness tells that the database
+answers as well, its probe result is shared by probes for a while so
+they don't add load to the database.
+"""
+
+import contextlib
+import threading
+import time
+
+import sqlalchemy as sa
+from fastapi import APIRouter, Request, Response, status
+from fastapi.responses import JSONResponse
+from loguru import logger
+
+__all__ = ["DatabaseProbe", "warm_up_pool", "router"]
+
+PING = sa.text("SELECT 1")
+
+
+class DatabaseProbe:
+    """Pings every engine, the result is reused for ``ttl`` seconds."""
+
+    def __init__(self, engines: list[sa.Engine], ttl: float) -> None:
+        self._engines = engines
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._ready = False
+        self._expires_at = 0.0
+
+    def check(self) -> bool:
+        if time.monotonic() < self._expires_at:
+            return self._ready
+        # A single probe runs at a time, concurrent ones get the last result
+        # rather than queueing up on a slow database
+        if not self._lock.acquire(blocking=False):
+            return self._ready
+        try:
+            self._ready = all(self._ping(engine) for engine in self._engines)
+            self._expires_at = time.monotonic() + self._ttl
+        finally:
+            self._lock.release()
+        return self._ready
+
+    @staticmethod
+    def _ping(engine: sa.Engine) -> bool:
+        try:
+            with engine.connect() as conn:
+                conn.execute(PING)
+        except Exception as e:
+            logger.warning(f"Database {engine.url.host} is not ready: {e}")
+            return False
+        return True
+
+
+def warm_up_pool(engine: sa.Engine, connections: int) -> None:
+    """Opens connections ahead of the first requests.
+
+    Connections are held at once so each of them is a new one, they stay
+    in the pool when returned. More than the pool size would be closed.
+    """
+    if not isinstance(engine.pool, sa.QueuePool):
+        return
+    with contextlib.ExitStack() as stack:
+        for _ in range(min(connections, engine.pool.size())):
+            stack.enter_context(engine.connect())
+
+
+router = APIRouter()
+
+
+@router.get("/livez", include_in_schema=False)
+async def livez() -> Response:
+    return JSONResponse({"status": "ok"})
+
+
+@router.get("/readyz", include_in_schema=False)
+def readyz(request: Request) -> Response:
+    if request.app.probe.check():
+        return JSONResponse({"status": "ready"})
+    return JSONResponse(
+        {"status": "unavailable"},
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
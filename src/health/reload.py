@@ -0,0 +1,236 @@
+"""Reloading configuration without a restart.
+
+SIGHUP to the master or ``POST /admin/config/reload`` re-reads the YAML
+file every worker was started with. Settings of objects created per
+request or able to change in place are applied live, including a swap of
+the connection pool for its settings. The rest waits for a restart, and
+a change of what the workers connect to, or of the token secret, rejects
+the whole reload.
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import os
+import signal
+import threading
+from dataclasses import dataclass, field
+
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request, status
+from loguru import logger
+from pydantic import BaseModel, ValidationError
+
+from health.admin import require_admin
+from health.config import Config, parse_yaml
+
+__all__ = [
+    "ConfigReload",
+    "ReloadRejectedError",
+    "plan_reload",
+    "read_config",
+    "reload",
+    "handle_sighup",
+    "router",
+]
+
+# Pool settings, changing them replaces the engine of the worker
+POOL_SETTINGS = (
+    "db.pool_size",
+    "db.max_overflow",
+    "db.pooler",
+    "db.prepare_threshold",
+    "db.driver",
+    "db.username",
+    "db.password",
+)
+
+LIVE_SETTINGS = (
+    *POOL_SETTINGS,
+    "db.warm_up_connections",
+    "app.workers",
+    "app.readiness_ttl",
+    "app.admin_token",
+    "log.*",
+    "rate_limit.*",
+    "search.*",
+    "breaker.user_cache_size",
+    "breaker.user_cache_ttl",
+    "breaker.degraded_token_ttl",
+    "idempotency.ttl",
+    "idempotency.lock_timeout",
+    "idempotency.cache_size",
+    "audit.use_copy",
+    "measurements.max_samples",
+    "measurements.use_copy",
+)
+
+# Data of users would be read from elsewhere or their tokens invalidated
+REJECTED_SETTINGS = (
+    "db.host",
+    "db.port",
+    "db.database",
+    "db.sslmode",
+    "db.backend",
+    "db.shards",
+    "app.secret",
+)
+
+
+class ReloadRejectedError(Exception):
+    pass
+
+
+@dataclass
+class ConfigReload:
+    """Settings which differ from the running ones, by how they apply."""
+
+    config: Config
+    applied: list[str] = field(default_factory=list)
+    # Differ until the next restart, running ones stay in config
+    pending_restart: list[str] = field(default_factory=list)
+    rejected: list[str] = field(default_factory=list)
+
+    def changed(self, *patterns: str) -> bool:
+        return any(_matches(name, patterns) for name in self.applied)
+
+
+def plan_reload(old: Config, new: Config) -> ConfigReload:
+    """Sorts changed settings, the config only takes the applied ones."""
+    old_values, new_values = _flatten(old), _flatten(new)
+    changed = sorted(
+        name for name in new_values if old_values.get(name) != new_values[name]
+    )
+    # Main engine is shared with the shard set, which is not swapped
+    live = (
+        LIVE_SETTINGS
+        if not old.db.shards
+        else tuple(s for s in LIVE_SETTINGS if s not in POOL_SETTINGS)
+    )
+
+    plan = ConfigReload(config=old)
+    update = dict[str, dict]()
+    for name in changed:
+        if _matches(name, REJECTED_SETTINGS):
+            plan.rejected.append(name)
+        elif _matches(name, live):
+            plan.applied.append(name)
+            section, setting = name.split(".", 1)
+            update.setdefault(section, {})[setting] = getattr(
+                getattr(new, section), setting
+            )
+        else:
+            plan.pending_restart.append(name)
+
+    plan.config = old.model_copy(
+        update={
+            section: getattr(old, section).model_copy(update=settings)
+            for section, settings in update.items()
+        }
+    )
+    return plan
+
+
+def read_config(app: FastAPI) -> ConfigReload:
+    if app.config_path is None:
+        raise ReloadRejectedError("Configuration was not read from a file")
+    import yaml
+
+    try:
+        new = parse_yaml(app.config_path)
+    except (OSError, yaml.YAMLError, ValidationError) as e:
+        raise ReloadRejectedError(f"Can't read configuration: {e}") from e
+
+    plan = plan_reload(app.config, new)
+    if plan.rejected:
+        raise ReloadRejectedError(
+            f"Changing {', '.join(plan.rejected)} requires a restart"
+        )
+    return plan
+
+
+# Reloads of the worker run one at a time, a signal and a request may race
+_lock = threading.Lock()
+
+
+def reload(app: FastAPI) -> ConfigReload:
+    # Application imports this module for its router
+    from health.app import apply_config
+
+    with _lock:
+        plan = read_config(app)
+        if plan.applied:
+            apply_config(app, plan)
+            setattr(app, "config", plan.config)
+        logger.info(
+            "Configuration reloaded, applied: {}, pending restart: {}",
+            ", ".join(plan.applied) or "nothing",
+            ", ".join(plan.pending_restart) or "nothing",
+        )
+        return plan
+
+
+def handle_sighup(app: FastAPI):
+    """Handler of SIGHUP in a worker, reloads off the event loop."""
+
+    def run() -> None:
+        try:
+            reload(app)
+        except ReloadRejectedError as e:
+            logger.error(f"Configuration is not reloaded: {e}")
+        except Exception:
+            logger.exception("Can't reload configuration")
+
+    def handler(signum: int, frame) -> None:
+        threading.Thread(target=run, name="config-reload", daemon=True).start()
+
+    return handler
+
+
+def _flatten(cfg: Config) -> dict[str, object]:
+    # Settings of a section, nested models such as rate limit rules are
+    # compared as a whole
+    return {
+        f"{section}.{name}": value
+        for section, settings in cfg.model_dump().items()
+        for name, value in settings.items()
+    }
+
+
+def _matches(name: str, patterns: tuple[str, ...]) -> bool:
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+
+class ReloadGet(BaseModel):
+    applied: list[str]
+    pending_restart: list[str]
+
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(require_admin)],
+)
+
+
+@router.post(
+    "/config/reload",
+    summary="Re-reads configuration and applies what can change live",
+    response_model=ReloadGet,
+    responses={
+        200: {},
+        401: {},
+        409: {},
+    },
+    include_in_schema=False,
+)
+def reload_config(request: Request) -> ReloadGet:
+    app = request.app
+    try:
+        plan = reload(app)
+    except ReloadRejectedError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=e.args[0])
+
+    # Other workers and the master are reloaded by the master
+    if app.master_pid is not None:
+        os.kill(app.master_pid, signal.SIGHUP)
+    return ReloadGet(applied=plan.applied, pending_restart=plan.pending_restart)
@@ -0,0 +1,120 @@
+"""Moves users between shards while the service is running.
+
+    python -m health.reshard -c config.yaml prepare
+    python -m health.reshard -c config.yaml move
+    python -m health.reshard -c config.yaml move --slots 0-63 --to 2
+    python -m health.reshard -c config.yaml status
+
+``prepare`` fills slots and directory entries of users written before
+sharding was enabled, it has to run once before the first move. ``move``
+without arguments spreads all slots evenly over the configured shards.
+"""
+
+import argparse
+import collections
+import sys
+
+from loguru import logger
+
+from auth.adapter.sharding import SlotMover
+from common.sharding import SLOTS, ShardSet
+from health.app import init_engine
+from health.config import Config, parse_yaml
+
+
+def parse_slots(value: str) -> list[int]:
+    slots = list[int]()
+    for part in value.split(","):
+        first, _, last = part.partition("-")
+        slots.extend(range(int(first), int(last or first) + 1))
+    if any(not 0 <= slot < SLOTS for slot in slots):
+        raise argparse.ArgumentTypeError(f"Slots are numbered from 0 to {SLOTS - 1}")
+    return slots
+
+
+def init_shard_set(cfg: Config) -> ShardSet:
+    db = cfg.db
+    engines = [init_engine(db)]
+    engines.extend(
+        init_engine(db.model_copy(update=shard.model_dump())) for shard in db.shards
+    )
+    return ShardSet(engines)
+
+
+def status(shards: ShardSet) -> None:
+    slots = shards.refresh()
+    owned = collections.Counter(slots.shard_of_slot(slot) for slot in range(SLOTS))
+    for index in range(len(shards)):
+        print(f"shard {index}: {owned[index]} slots")
+    if slots.frozen:
+        print(f"frozen: {sorted(slots.frozen)}")
+
+
+def move(mover: SlotMover, shards: ShardSet, args: argparse.Namespace) -> None:
+    slots = args.slots if args.slots is not None else range(SLOTS)
+    # Slots of a target are moved a group at a time, so writes of only a
+    # group's users are frozen at once
+    by_target = collections.defaultdict[int, list[int]](list)
+    for slot in slots:
+        by_target[args.to if args.to is not None else slot % len(shards)].append(slot)
+
+    for target, targeted in sorted(by_target.items()):
+        for start in range(0, len(targeted), args.group_size):
+            mover.move(targeted[start : start + args.group_size], target)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        "health.reshard", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument(
+        "-c", "--config", default="config.yaml", help="Path to configuration file"
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--settle",
+        type=float,
+        help="Seconds for workers to see a slot map change, "
+        "defaults to twice the refresh interval plus one",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="Show slots of every shard")
+    commands.add_parser("prepare", help="Fill slots and the email directory")
+    move_parser = commands.add_parser("move", help="Move slots to other shards")
+    move_parser.add_argument(
+        "--slots", type=parse_slots, help="Slots to move, e.g. 0-63,128"
+    )
+    move_parser.add_argument(
+        "--to", type=int, help="Target shard, by default slot modulo shard count"
+    )
+    move_parser.add_argument("--group-size", type=int, default=8)
+    commands.add_parser("purge", help="Delete users left on shards after a failure")
+    args = parser.parse_args(sys.argv[1:])
+
+    cfg = parse_yaml(args.config)
+    shards = init_shard_set(cfg)
+    if args.command == "move" and args.to is not None and args.to >= len(shards):
+        parser.error(f"Only {len(shards)} shards are configured")
+
+    settle = args.settle
+    if settle is None:
+        settle = 2 * cfg.db.slot_refresh_interval + 1
+    mover = SlotMover(shards, settle, args.batch_size)
+
+    try:
+        if args.command == "status":
+            status(shards)
+        elif args.command == "prepare":
+            mover.prepare()
+        elif args.command == "move":
+            move(mover, shards, args)
+        else:
+            logger.info(f"Deleted {mover.purge()} users left on other shards")
+    finally:
+        for engine in shards.engines:
+            engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,29 @@
+"""Application of the development server, built by ``create_app``.
+
+Nothing is built on import, so the module is cheap to import and
+configuration is only read when the server asks for the application.
+"""
+
+from __future__ import annotations
+
 import sys
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from fastapi import FastAPI
+
+__all__ = ["create_app"]
+
+
+def create_app() -> FastAPI:
+    from health.logger import prepare_logger
 
-from health.logger import prepare_logger
-from . import config
-from .app import init_app
+    from . import config
+    from .app import init_app
 
-args = config.parse_args(sys.argv[1:])
-cfg = config.parse_yaml(args.config_path)
+    args = config.parse_args(sys.argv[1:])
+    cfg = config.parse_yaml(args.config_path)
 
-app = init_app(cfg)
-prepare_logger(cfg.log.level.upper())
+    app = init_app(cfg, args.config_path)
+    prepare_logger(cfg.log)
+    return app
@@ -0,0 +1,207 @@
+import os
+import random
+import signal
+import socket
+import time
+
+import uvicorn
+from loguru import logger
+from starlette.types import ASGIApp
+
+from health.config import Config
+from health.logger import flush_logs, intercept_logs, prepare_logger
+from health.reload import ReloadRejectedError, handle_sighup, read_config
+
+__all__ = ["ProcessManager"]
+
+
+class ProcessManager:
+    """Pre-fork process manager for production.
+
+    Config, application and its imports are loaded once in the master,
+    which binds the listening socket and forks workers sharing it. Each
+    worker runs its own uvicorn server, database engine is created by the
+    application lifespan and therefore after fork. Workers are restarted
+    when they exit, including after serving ``max_requests`` requests.
+    On SIGTERM or SIGINT workers are asked to drain and are killed after
+    the graceful timeout. On SIGHUP the config is reloaded by the master
+    and every worker, workers are started or drained to the new count.
+    """
+
+    POLL_INTERVAL = 0.2
+    # Workers exiting faster than this are restarted with a delay, so a
+    # broken deployment does not turn into a fork loop
+    MIN_UPTIME = 1.0
+
+    def __init__(self, app: ASGIApp, cfg: Config) -> None:
+        self._app = app
+        self._cfg = cfg
+        self._workers = dict[int, float]()
+        self._stopping: signal.Signals | None = None
+        self._reloading = False
+        # Drained after the count of workers went down, not restarted
+        self._retiring = set[int]()
+        self._socket: socket.socket | None = None
+
+    def run(self) -> int:
+        self._socket = self._bind()
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+        logger.info(
+            "Listening on {}:{} with {} workers",
+            self._cfg.app.host,
+            self._cfg.app.port,
+            self._cfg.app.workers,
+        )
+
+        try:
+            for _ in range(self._cfg.app.workers):
+                self._spawn()
+            while self._stopping is None:
+                if self._reloading:
+                    self._reloading = False
+                    self._reload()
+                self._reap(respawn=True)
+                time.sleep(self.POLL_INTERVAL)
+            self._drain(self._stopping)
+        finally:
+            self._socket.close()
+        return 0
+
+    def _bind(self) -> socket.socket:
+        app = self._cfg.app
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((app.host, app.port))
+        sock.listen(app.backlog)
+        sock.set_inheritable(True)
+        return sock
+
+    def _spawn(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = self._serve()
+            except BaseException:
+                logger.exception("Worker {} crashed", os.getpid())
+            finally:
+                flush_logs()
+                os._exit(code)
+
+        self._workers[pid] = time.monotonic()
+        logger.info("Started worker {}", pid)
+
+    def _serve(self) -> int:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        # Workers reload on their own, the handler only starts a thread
+        setattr(self._app, "master_pid", os.getppid())
+        signal.signal(signal.SIGHUP, handle_sighup(self._app))
+
+        app, log = self._cfg.app, self._cfg.log
+        max_requests = app.max_requests
+        if max_requests is not None:
+            max_requests += random.randint(0, app.max_requests_jitter)
+
+        # uvicorn loggers are routed to loguru before the server starts
+        intercept_logs(log)
+        server = uvicorn.Server(
+            uvicorn.Config(
+                self._app,
+                loop=app.loop,
+                http=app.http,
+                log_config=None,
+                log_level=log.level,
+                access_log=log.access_log_sample_rate > 0,
+                limit_max_requests=max_requests,
+                timeout_graceful_shutdown=app.graceful_timeout,
+            )
+        )
+        # Server installs its own handlers, SIGTERM starts graceful shutdown
+        server.run(sockets=[self._socket])
+        return 0 if server.started else 3
+
+    def _reap(self, respawn: bool) -> None:
+        while self._workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+
+            started_at = self._workers.pop(pid, None)
+            if started_at is None:
+                continue
+            logger.info(
+                "Worker {} exited with code {}", pid, os.waitstatus_to_exitcode(status)
+            )
+            if pid in self._retiring:
+                self._retiring.discard(pid)
+                continue
+            if respawn and self._stopping is None:
+                if time.monotonic() - started_at < self.MIN_UPTIME:
+                    time.sleep(self.MIN_UPTIME)
+                self._spawn()
+
+    def _drain(self, signum: signal.Signals) -> None:
+        logger.info("Received {}, draining workers", signum.name)
+        # SIGINT from a terminal is delivered to the whole process group,
+        # workers already got it and a second signal would force them out
+        if signum == signal.SIGTERM:
+            for pid in self._workers:
+                self._signal(pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + self._cfg.app.graceful_timeout + 5
+        while self._workers and time.monotonic() < deadline:
+            self._reap(respawn=False)
+            time.sleep(self.POLL_INTERVAL)
+
+        for pid in list(self._workers):
+            logger.warning("Killing worker {} after graceful timeout", pid)
+            self._signal(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            del self._workers[pid]
+
+    def _reload(self) -> None:
+        try:
+            plan = read_config(self._app)
+        except ReloadRejectedError as e:
+            logger.error(f"Configuration is not reloaded: {e}")
+            return
+
+        if plan.changed("log.*"):
+            prepare_logger(plan.config.log)
+        # Workers started from now on get the new config
+        self._cfg = plan.config
+        setattr(self._app, "config", plan.config)
+        for pid in self._workers:
+            if pid not in self._retiring:
+                self._signal(pid, signal.SIGHUP)
+        self._scale()
+
+    def _scale(self) -> None:
+        serving = [pid for pid in self._workers if pid not in self._retiring]
+        for _ in range(self._cfg.app.workers - len(serving)):
+            self._spawn()
+        # Newest workers have the least warm caches, they go first
+        serving.sort(key=self._workers.__getitem__)
+        for pid in serving[self._cfg.app.workers :]:
+            logger.info("Draining worker {}", pid)
+            self._retiring.add(pid)
+            self._signal(pid, signal.SIGTERM)
+
+    def _handle_reload(self, signum: int, frame) -> None:
+        # Reloaded by the main loop, like the stop signals
+        self._reloading = True
+
+    def _handle_stop(self, signum: int, frame) -> None:
+        # Only record the signal, workers are signalled by the main loop
+        if self._stopping is None:
+            self._stopping = signal.Signals(signum)
+
+    @staticmethod
+    def _signal(pid: int, signum: int) -> None:
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
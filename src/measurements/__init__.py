@@ -0,0 +1,3 @@
+from measurements.adapter import router
+
+__all__ = ["router"]
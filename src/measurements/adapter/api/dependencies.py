@@ -0,0 +1,37 @@
+from typing import Annotated
+
+from fastapi import Depends, FastAPI, Request
+
+from auth.adapter.api.dependencies import get_sessionmaker
+from common import AbstractMessageBus
+from measurements.service_layer import (
+    InMemoryMeasurementUnitOfWork,
+    MeasurementUnitOfWork,
+    SQLMeasurementUnitOfWork,
+    SampleWriter,
+)
+
+
+def get_measurement_unit_of_work(
+    request: Request,
+    bus: Annotated[AbstractMessageBus, Depends()],
+) -> MeasurementUnitOfWork:
+    return init_measurement_unit_of_work(request.app, bus)
+
+
+def init_measurement_unit_of_work(
+    app: FastAPI, bus: AbstractMessageBus
+) -> MeasurementUnitOfWork:
+    if app.config.db.backend == "memory":
+        return InMemoryMeasurementUnitOfWork(bus, app.measurement_store)
+    # Measurements stay in the main database when users are sharded
+    return SQLMeasurementUnitOfWork(
+        bus,
+        get_sessionmaker(app.engine),
+        app.breaker,
+        copy=app.config.measurements.use_copy,
+    )
+
+
+def get_sample_writer(request: Request) -> SampleWriter:
+    return request.app.sample_writer
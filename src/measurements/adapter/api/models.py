@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import enum
+import uuid
+from datetime import date, datetime
+
+from pydantic import BaseModel
+
+from measurements import domain
+from measurements.domain.rollups import trend
+from measurements.service_layer.ingestion import Ingested
+
+
+class MeasurementKindName(str, enum.Enum):
+    HEART_RATE = "heart_rate"
+    STEPS = "steps"
+    WEIGHT = "weight"
+
+
+class RejectionGet(BaseModel):
+    index: int
+    reason: str
+
+
+class BatchAccepted(BaseModel):
+    accepted: int
+    rejected: int
+    # First rejected samples, by their position in the payload
+    rejections: list[RejectionGet]
+
+    @classmethod
+    def from_ingested(cls, ingested: Ingested) -> BatchAccepted:
+        return cls(
+            accepted=ingested.accepted,
+            rejected=ingested.rejected,
+            rejections=[
+                RejectionGet(index=r.index, reason=r.reason)
+                for r in ingested.rejections
+            ],
+        )
+
+
+class BatchGet(BaseModel):
+    batch_id: uuid.UUID
+    received_at: datetime
+    samples: int
+
+    @classmethod
+    def from_domain(cls, batch: domain.SampleBatch) -> BatchGet:
+        return cls(
+            batch_id=batch.id, received_at=batch.received_at, samples=batch.count
+        )
+
+
+class RollupGet(BaseModel):
+    start: date
+    count: int
+    total: float
+    mean: float
+    minimum: float
+    maximum: float
+    p50: float
+    p90: float
+    trend: float | None
+
+    @classmethod
+    def from_domain(cls, rollup: domain.Rollup) -> RollupGet:
+        return cls(
+            start=rollup.start,
+            count=rollup.count,
+            total=rollup.total,
+            mean=rollup.mean,
+            minimum=rollup.minimum,
+            maximum=rollup.maximum,
+            p50=rollup.p50,
+            p90=rollup.p90,
+            trend=rollup.trend,
+        )
+
+
+class RollupPage(BaseModel):
+    rollups: list[RollupGet]
+    # Change of the mean a day over the returned rollups
+    trend: float | None
+
+    @classmethod
+    def from_domain(cls, rollups: list[domain.Rollup]) -> RollupPage:
+        return cls(
+            rollups=[RollupGet.from_domain(r) for r in rollups],
+            trend=trend(rollups),
+        )
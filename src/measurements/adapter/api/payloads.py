@@ -0,0 +1,85 @@
+"""Payloads of sample batches, read into records for bulk validation.
+
+NDJSON has a sample a line::
+
+    {"kind": "heart_rate", "at": 1760000000000, "value": 72}
+
+with the time in milliseconds since the epoch. Binary payloads are
+records of a little-endian unsigned byte of the kind's value, a 64-bit
+integer time and a 64-bit float value, 17 bytes each.
+"""
+
+import json
+import struct
+from typing import Iterator
+
+from measurements.domain import MeasurementKind
+
+__all__ = [
+    "NDJSON_TYPES",
+    "BINARY_TYPES",
+    "PayloadError",
+    "parse_ndjson",
+    "parse_binary",
+    "count_samples",
+]
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+BINARY_TYPES = ("application/octet-stream",)
+
+RECORD = struct.Struct("<Bqd")
+
+KINDS = {kind.name.lower(): kind.value for kind in MeasurementKind}
+
+Record = tuple[object, object, object]
+
+
+class PayloadError(ValueError):
+    pass
+
+
+def parse_ndjson(body: bytes) -> list[Record]:
+    lines = [line for line in body.splitlines() if line.strip()]
+    # Lines are parsed as one array, a single call of the decoder
+    try:
+        items = json.loads(b"[" + b",".join(lines) + b"]")
+    except ValueError:
+        items = None
+    if items is None or len(items) != len(lines):
+        items = [_parse_line(number, line) for number, line in enumerate(lines, 1)]
+
+    records = list[Record]()
+    append, kinds = records.append, KINDS
+    for item in items:
+        if not isinstance(item, dict):
+            append((None, None, None))
+            continue
+        kind = item.get("kind")
+        append(
+            (
+                kinds.get(kind) if isinstance(kind, str) else None,
+                item.get("at"),
+                item.get("value"),
+            )
+        )
+    return records
+
+
+def parse_binary(body: bytes) -> Iterator[Record]:
+    if len(body) % RECORD.size:
+        raise PayloadError(f"Binary payload is not made of {RECORD.size}-byte samples")
+    return RECORD.iter_unpack(body)
+
+
+def count_samples(body: bytes, binary: bool) -> int:
+    """Number of samples in the payload, without parsing it."""
+    if binary:
+        return len(body) // RECORD.size
+    return body.count(b"\n") + 1
+
+
+def _parse_line(number: int, line: bytes) -> object:
+    try:
+        return json.loads(line)
+    except ValueError:
+        raise PayloadError(f"Line {number} is not valid JSON") from None
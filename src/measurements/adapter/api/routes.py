@@ -0,0 +1,183 @@
+import uuid
+from datetime import date
+from typing import Annotated
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Path,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from starlette.concurrency import run_in_threadpool
+
+from auth.adapter.api.dependencies import get_access_claims, get_config
+from auth.service_layer import auth
+from health.config import Config
+from measurements.domain import MeasurementKind, Tier
+from measurements.service_layer import (
+    MeasurementUnitOfWork,
+    SampleWriter,
+    ingestion,
+    rollups,
+)
+from roster.adapter.api.dependencies import get_roster_unit_of_work
+from roster.service_layer import RosterUnitOfWork
+
+from .dependencies import get_measurement_unit_of_work, get_sample_writer
+from .models import BatchAccepted, BatchGet, MeasurementKindName, RollupPage
+from .payloads import (
+    BINARY_TYPES,
+    NDJSON_TYPES,
+    PayloadError,
+    count_samples,
+    parse_binary,
+    parse_ndjson,
+)
+
+router = APIRouter(
+    prefix="/measurements",
+    tags=["measurements"],
+)
+
+# Longest span of a single request, in days
+MAX_SPAN = {Tier.DAY: 366, Tier.WEEK: 7 * 104}
+
+
+@router.post(
+    "/batches/{batch_id}",
+    summary="Accepts a batch of samples, written shortly after",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=BatchAccepted,
+    responses={
+        202: {},
+        400: {},
+        401: {},
+        403: {},
+        413: {},
+        415: {},
+        503: {},
+    },
+)
+async def record_batch(
+    batch_id: Annotated[uuid.UUID, Path()],
+    request: Request,
+    response: Response,
+    claims: Annotated[auth.AccessTokenClaims, Depends(get_access_claims)],
+    writer: Annotated[SampleWriter, Depends(get_sample_writer)],
+    config: Annotated[Config, Depends(get_config)],
+) -> BatchAccepted:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in NDJSON_TYPES + BINARY_TYPES:
+        raise HTTPException(
+            detail=f"Expected one of {', '.join(NDJSON_TYPES + BINARY_TYPES)}",
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        )
+
+    body = await request.body()
+    binary = content_type in BINARY_TYPES
+    if count_samples(body, binary) > config.measurements.max_samples:
+        raise HTTPException(
+            detail=f"At most {config.measurements.max_samples} samples are accepted at once",
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+
+    # Thousands of samples take a while, the event loop keeps serving
+    try:
+        ingested = await run_in_threadpool(
+            _ingest, writer, claims, batch_id, body, binary
+        )
+    except PayloadError as e:
+        raise HTTPException(detail=e.args[0], status_code=status.HTTP_400_BAD_REQUEST)
+    except ingestion.PermissionDenied as e:
+        raise HTTPException(detail=e.args[0], status_code=status.HTTP_403_FORBIDDEN)
+    except ingestion.WriterFullError as e:
+        raise HTTPException(
+            detail=e.args[0],
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": "1"},
+        )
+
+    response.headers["Location"] = request.url_for("get_batch", batch_id=batch_id).path
+    return BatchAccepted.from_ingested(ingested)
+
+
+@router.get(
+    "/batches/{batch_id}",
+    summary="Returns the batch once its samples are written",
+    response_model=BatchGet,
+    responses={
+        200: {},
+        401: {},
+        404: {},
+    },
+)
+def get_batch(
+    batch_id: Annotated[uuid.UUID, Path()],
+    claims: Annotated[auth.AccessTokenClaims, Depends(get_access_claims)],
+    uow: Annotated[MeasurementUnitOfWork, Depends(get_measurement_unit_of_work)],
+) -> BatchGet:
+    batch = ingestion.get_batch(uow, claims, batch_id)
+    if batch is None:
+        raise HTTPException(
+            detail="Batch is not written yet",
+            status_code=status.HTTP_404_NOT_FOUND,
+        )
+    return BatchGet.from_domain(batch)
+
+
+@router.get(
+    "/trainees/{trainee_id}/rollups",
+    summary="Returns daily or weekly aggregates of the trainee's samples",
+    response_model=RollupPage,
+    responses={
+        200: {},
+        400: {},
+        401: {},
+        403: {},
+    },
+)
+def list_rollups(
+    trainee_id: Annotated[uuid.UUID, Path()],
+    kind: Annotated[MeasurementKindName, Query()],
+    since: Annotated[date, Query()],
+    until: Annotated[date, Query()],
+    claims: Annotated[auth.AccessTokenClaims, Depends(get_access_claims)],
+    uow: Annotated[MeasurementUnitOfWork, Depends(get_measurement_unit_of_work)],
+    roster_uow: Annotated[RosterUnitOfWork, Depends(get_roster_unit_of_work)],
+    tier: Annotated[Tier, Query()] = Tier.DAY,
+) -> RollupPage:
+    if not 0 <= (until - since).days < MAX_SPAN[tier]:
+        raise HTTPException(
+            detail=f"Span of {tier.value} rollups is up to {MAX_SPAN[tier]} days",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        found = rollups.list_rollups(
+            uow,
+            roster_uow,
+            claims,
+            trainee_id,
+            MeasurementKind[kind.name],
+            tier,
+            since,
+            until,
+        )
+    except rollups.PermissionDenied as e:
+        raise HTTPException(detail=e.args[0], status_code=status.HTTP_403_FORBIDDEN)
+    return RollupPage.from_domain(found)
+
+
+def _ingest(
+    writer: SampleWriter,
+    claims: auth.AccessTokenClaims,
+    batch_id: uuid.UUID,
+    body: bytes,
+    binary: bool,
+) -> ingestion.Ingested:
+    records = parse_binary(body) if binary else parse_ndjson(body)
+    return ingestion.ingest(writer, claims, batch_id, records)
@@ -0,0 +1,459 @@
+from __future__ import annotations
+
+import abc
+import heapq
+import threading
+import uuid
+from datetime import date, datetime, time, timezone
+from typing import Iterable, Sequence
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from common.domain import DomainEvent
+from common.repository import AbstractRepository, InMemoryRepository
+from common.sql import (
+    Base,
+    TZDateTime,
+    copy_text,
+    create_month_partitions,
+    next_month,
+)
+from measurements import domain
+from measurements.domain.service import MAX_AGE
+
+__all__ = [
+    "MEASUREMENTS",
+    "MEASUREMENT_BATCHES",
+    "MEASUREMENT_ROLLUPS",
+    "AbstractSampleRepository",
+    "SampleRepository",
+    "InMemorySampleRepository",
+    "MeasurementStore",
+]
+
+# Append-only and read by time, rows are partitioned by month on Postgres.
+# Samples of a batch are copied in order of arrival, which is nearly the
+# order of their time, so a BRIN index of it stays tiny. Reads of a
+# trainee go through the B-tree
+MEASUREMENTS = sa.Table(
+    "measurements",
+    Base.metadata,
+    sa.Column("trainee_id", sa.Uuid(), nullable=False),
+    sa.Column("kind", sa.SmallInteger(), nullable=False),
+    sa.Column("at", TZDateTime(), nullable=False),
+    sa.Column("value", sa.Double(), nullable=False),
+    sa.Index("ix_measurements_at", "at", postgresql_using="brin"),
+    sa.Index("ix_measurements_trainee_id_kind_at", "trainee_id", "kind", "at"),
+    postgresql_partition_by="RANGE (at)",
+)
+
+# Batches written, resent ones are skipped by their id
+MEASUREMENT_BATCHES = sa.Table(
+    "measurement_batches",
+    Base.metadata,
+    sa.Column("batch_id", sa.Uuid(), primary_key=True),
+    sa.Column("trainee_id", sa.Uuid(), nullable=False),
+    sa.Column("received_at", TZDateTime(), nullable=False),
+    sa.Column("samples", sa.Integer(), nullable=False),
+)
+
+GET_BATCH = sa.select(MEASUREMENT_BATCHES).where(
+    MEASUREMENT_BATCHES.c.batch_id == sa.bindparam("batch_id")
+)
+
+# Days and weeks of a trainee's samples by kind, recomputed as they arrive
+MEASUREMENT_ROLLUPS = sa.Table(
+    "measurement_rollups",
+    Base.metadata,
+    sa.Column("trainee_id", sa.Uuid(), primary_key=True),
+    sa.Column("kind", sa.SmallInteger(), primary_key=True),
+    sa.Column("tier", sa.String(8), primary_key=True),
+    sa.Column("start", sa.Date(), primary_key=True),
+    sa.Column("count", sa.Integer(), nullable=False),
+    sa.Column("total", sa.Double(), nullable=False),
+    sa.Column("mean", sa.Double(), nullable=False),
+    sa.Column("minimum", sa.Double(), nullable=False),
+    sa.Column("maximum", sa.Double(), nullable=False),
+    sa.Column("p50", sa.Double(), nullable=False),
+    sa.Column("p90", sa.Double(), nullable=False),
+    sa.Column("trend", sa.Double(), nullable=True),
+)
+
+LOAD_SAMPLES = sa.select(
+    MEASUREMENTS.c.trainee_id, MEASUREMENTS.c.kind, MEASUREMENTS.c.value
+).where(
+    MEASUREMENTS.c.trainee_id.in_(sa.bindparam("trainee_ids", expanding=True))
+    & (MEASUREMENTS.c.at >= sa.bindparam("since"))
+    & (MEASUREMENTS.c.at < sa.bindparam("until"))
+)
+
+LIST_ROLLUPS = (
+    sa.select(MEASUREMENT_ROLLUPS)
+    .where(
+        MEASUREMENT_ROLLUPS.c.trainee_id.in_(
+            sa.bindparam("trainee_ids", expanding=True)
+        )
+        & (MEASUREMENT_ROLLUPS.c.tier == sa.bindparam("tier"))
+        & (MEASUREMENT_ROLLUPS.c.start >= sa.bindparam("since"))
+        & (MEASUREMENT_ROLLUPS.c.start <= sa.bindparam("until"))
+    )
+    .order_by(MEASUREMENT_ROLLUPS.c.start)
+)
+
+LIST_ROLLUPS_OF_KIND = LIST_ROLLUPS.where(
+    MEASUREMENT_ROLLUPS.c.kind == sa.bindparam("kind")
+)
+
+COPY = "COPY measurements (trainee_id, kind, at, value) FROM STDIN"
+
+
+class AbstractSampleRepository(AbstractRepository[domain.SampleBatch, uuid.UUID]):
+    @abc.abstractmethod
+    def load_samples(
+        self, trainee_ids: Sequence[uuid.UUID], since: date, until: date
+    ) -> domain.SampleSlice:
+        """Returns samples of the trainees taken from ``since`` to ``until``.
+
+        Days are in UTC, the last one is not included.
+        """
+
+    @abc.abstractmethod
+    def save_rollups(self, rollups: Sequence[domain.Rollup]) -> None:
+        """Replaces stored rollups, unless they were made of more samples.
+
+        Samples are only ever added, a rollup of fewer of them was computed
+        from an older snapshot by another worker.
+        """
+
+    @abc.abstractmethod
+    def list_rollups(
+        self,
+        trainee_ids: Sequence[uuid.UUID],
+        tier: domain.Tier,
+        since: date,
+        until: date,
+        kind: domain.MeasurementKind | None = None,
+    ) -> list[domain.Rollup]:
+        """Returns rollups starting from ``since`` to ``until``, oldest first."""
+
+    def prepare(self, now: datetime) -> None:
+        """Creates storage for samples as old as accepted, and of next month."""
+
+
+class SampleRepository(AbstractSampleRepository):
+    """Samples in the measurements table, copied with COPY on Postgres.
+
+    Other dialects, or Postgres with ``copy`` off, get multi-row INSERTs.
+    """
+
+    # Rows of a single statement, keeps bound parameters within SQLite limits
+    INSERT_ROWS = 500
+    UPSERT_ROWS = 200
+
+    def __init__(self, session: Session, copy: bool = True) -> None:
+        self.session = session
+        self._copy = copy
+        self.__seen = list[domain.SampleBatch]()
+
+    def add(self, batch: domain.SampleBatch) -> None:
+        self.__seen.append(batch)
+        conn = self.session.connection()
+        dialect = conn.dialect.name
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        added = conn.execute(
+            insert(MEASUREMENT_BATCHES).on_conflict_do_nothing(),
+            {
+                "batch_id": batch.id,
+                "trainee_id": batch.trainee_id,
+                "received_at": batch.received_at,
+                "samples": batch.count,
+            },
+        )
+        if not added.rowcount:
+            # Resent after it was written, samples are there already
+            return
+
+        if self._copy and dialect == "postgresql":
+            copy_text(conn, COPY, _copy_text(batch))
+            return
+        rows = list(_rows(batch))
+        for start in range(0, len(rows), self.INSERT_ROWS):
+            conn.execute(
+                sa.insert(MEASUREMENTS).values(rows[start : start + self.INSERT_ROWS])
+            )
+
+    def persist(self, batch: domain.SampleBatch) -> None:
+        # Batches are never changed once received
+        self.add(batch)
+
+    def get(self, batch_id: uuid.UUID) -> domain.SampleBatch | None:
+        row = self.session.execute(GET_BATCH, {"batch_id": batch_id}).one_or_none()
+        if row is None:
+            return None
+        return domain.SampleBatch(
+            row.batch_id, row.trainee_id, row.received_at, row.samples
+        )
+
+    def load_samples(
+        self, trainee_ids: Sequence[uuid.UUID], since: date, until: date
+    ) -> domain.SampleSlice:
+        params = {
+            "trainee_ids": list(trainee_ids),
+            "since": datetime.combine(since, time(), timezone.utc),
+            "until": datetime.combine(until, time(), timezone.utc),
+        }
+        samples = domain.SampleSlice(trainee_ids=list(trainee_ids))
+        positions = {trainee_id: i for i, trainee_id in enumerate(trainee_ids)}
+        trainees, kinds, values = samples.trainees, samples.kinds, samples.values
+        for trainee_id, kind, value in self.session.execute(LOAD_SAMPLES, params):
+            trainees.append(positions[trainee_id])
+            kinds.append(kind)
+            values.append(value)
+        return samples
+
+    def save_rollups(self, rollups: Sequence[domain.Rollup]) -> None:
+        conn = self.session.connection()
+        rows = [_rollup_row(rollup) for rollup in rollups]
+        for start in range(0, len(rows), self.UPSERT_ROWS):
+            conn.execute(
+                _upsert_rollups(conn).values(rows[start : start + self.UPSERT_ROWS])
+            )
+
+    def list_rollups(
+        self,
+        trainee_ids: Sequence[uuid.UUID],
+        tier: domain.Tier,
+        since: date,
+        until: date,
+        kind: domain.MeasurementKind | None = None,
+    ) -> list[domain.Rollup]:
+        query = LIST_ROLLUPS
+        params = {
+            "trainee_ids": list(trainee_ids),
+            "tier": tier.value,
+            "since": since,
+            "until": until,
+        }
+        if kind is not None:
+            query = LIST_ROLLUPS_OF_KIND
+            params["kind"] = kind.value
+        return [_rollup_to_domain(row) for row in self.session.execute(query, params)]
+
+    def prepare(self, now: datetime) -> None:
+        conn = self.session.connection()
+        if conn.dialect.name != "postgresql":
+            return
+        # Rows without a partition of their month go to the default one,
+        # which then blocks creating that month's partition
+        first = (now - MAX_AGE).date()
+        create_month_partitions(conn, "measurements", first, next_month(now.date()))
+
+    def collect_events(self) -> Iterable[DomainEvent]:
+        heap = list[DomainEvent]()
+        for batch in self.__seen:
+            while event := batch.pop_event():
+                heapq.heappush(heap, event)
+        self.__seen.clear()
+        return heap
+
+
+class MeasurementStore:
+    """Committed samples of in-memory repositories, shared by units of work."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.batches = dict[uuid.UUID, domain.SampleBatch]()
+        # Samples of a trainee in order of arrival
+        self.samples = dict[uuid.UUID, domain.Samples]()
+        self.rollups = dict[tuple[uuid.UUID, int, domain.Tier, date], domain.Rollup]()
+
+
+class InMemorySampleRepository(AbstractSampleRepository, InMemoryRepository):
+    def __init__(self, store: MeasurementStore) -> None:
+        self._store = store
+        self._added = dict[uuid.UUID, domain.SampleBatch]()
+        self._rollups = dict[tuple[uuid.UUID, int, domain.Tier, date], domain.Rollup]()
+        self.__seen = list[domain.SampleBatch]()
+
+    def add(self, batch: domain.SampleBatch) -> None:
+        self._added.setdefault(batch.id, batch)
+        self.__seen.append(batch)
+
+    def persist(self, batch: domain.SampleBatch) -> None:
+        self.add(batch)
+
+    def get(self, batch_id: uuid.UUID) -> domain.SampleBatch | None:
+        with self._store.lock:
+            stored = self._store.batches.get(batch_id)
+        if stored is None:
+            return None
+        return domain.SampleBatch(
+            stored.id, stored.trainee_id, stored.received_at, stored.count
+        )
+
+    def load_samples(
+        self, trainee_ids: Sequence[uuid.UUID], since: date, until: date
+    ) -> domain.SampleSlice:
+        first, last = (
+            int(datetime.combine(day, time(), timezone.utc).timestamp() * 1000)
+            for day in (since, until)
+        )
+        samples = domain.SampleSlice(trainee_ids=list(trainee_ids))
+        with self._store.lock:
+            for position, trainee_id in enumerate(trainee_ids):
+                stored = self._store.samples.get(trainee_id)
+                if stored is None:
+                    continue
+                for kind, at, value in zip(stored.kinds, stored.times, stored.values):
+                    if first <= at < last:
+                        samples.trainees.append(position)
+                        samples.kinds.append(kind)
+                        samples.values.append(value)
+        return samples
+
+    def save_rollups(self, rollups: Sequence[domain.Rollup]) -> None:
+        for rollup in rollups:
+            self._rollups[_rollup_key(rollup)] = rollup
+
+    def list_rollups(
+        self,
+        trainee_ids: Sequence[uuid.UUID],
+        tier: domain.Tier,
+        since: date,
+        until: date,
+        kind: domain.MeasurementKind | None = None,
+    ) -> list[domain.Rollup]:
+        with self._store.lock:
+            rollups = {**self._store.rollups, **self._rollups}
+        trainees = set(trainee_ids)
+        found = [
+            rollup
+            for rollup in rollups.values()
+            if rollup.trainee_id in trainees
+            and rollup.tier == tier
+            and since <= rollup.start <= until
+            and (kind is None or rollup.kind == kind)
+        ]
+        found.sort(key=lambda rollup: rollup.start)
+        return found
+
+    def collect_events(self) -> Iterable[DomainEvent]:
+        heap = list[DomainEvent]()
+        for batch in self.__seen:
+            while event := batch.pop_event():
+                heapq.heappush(heap, event)
+        self.__seen.clear()
+        return heap
+
+    @property
+    def lock(self) -> threading.Lock:
+        return self._store.lock
+
+    def apply(self) -> None:
+        store = self._store
+        for batch in self._added.values():
+            if batch.id in store.batches:
+                continue
+            store.batches[batch.id] = batch
+            samples = store.samples.setdefault(batch.trainee_id, domain.Samples())
+            samples.kinds.extend(batch.samples.kinds)
+            samples.times.extend(batch.samples.times)
+            samples.values.extend(batch.samples.values)
+        for key, rollup in self._rollups.items():
+            stored = store.rollups.get(key)
+            if stored is None or stored.count <= rollup.count:
+                store.rollups[key] = rollup
+        self._added.clear()
+        self._rollups.clear()
+
+    def rollback(self) -> None:
+        self._added.clear()
+        self._rollups.clear()
+
+
+def _upsert_rollups(conn: sa.Connection):
+    insert = postgresql.insert if conn.dialect.name == "postgresql" else sqlite.insert
+    statement = insert(MEASUREMENT_ROLLUPS)
+    key = ("trainee_id", "kind", "tier", "start")
+    return statement.on_conflict_do_update(
+        index_elements=[MEASUREMENT_ROLLUPS.c[name] for name in key],
+        set_={
+            column.name: statement.excluded[column.name]
+            for column in MEASUREMENT_ROLLUPS.columns
+            if column.name not in key
+        },
+        where=MEASUREMENT_ROLLUPS.c.count <= statement.excluded.count,
+    )
+
+
+def _rollup_key(rollup: domain.Rollup) -> tuple[uuid.UUID, int, domain.Tier, date]:
+    return rollup.trainee_id, rollup.kind, rollup.tier, rollup.start
+
+
+def _rollup_row(rollup: domain.Rollup) -> dict:
+    return {
+        "trainee_id": rollup.trainee_id,
+        "kind": rollup.kind.value,
+        "tier": rollup.tier.value,
+        "start": rollup.start,
+        "count": rollup.count,
+        "total": rollup.total,
+        "mean": rollup.mean,
+        "minimum": rollup.minimum,
+        "maximum": rollup.maximum,
+        "p50": rollup.p50,
+        "p90": rollup.p90,
+        "trend": rollup.trend,
+    }
+
+
+def _rollup_to_domain(row: sa.Row) -> domain.Rollup:
+    return domain.Rollup(
+        trainee_id=row.trainee_id,
+        kind=domain.MeasurementKind(row.kind),
+        tier=domain.Tier(row.tier),
+        start=row.start,
+        count=row.count,
+        total=row.total,
+        mean=row.mean,
+        minimum=row.minimum,
+        maximum=row.maximum,
+        p50=row.p50,
+        p90=row.p90,
+        trend=row.trend,
+    )
+
+
+def _rows(batch: domain.SampleBatch) -> Iterable[dict]:
+    samples = batch.samples
+    for kind, at, value in zip(samples.kinds, samples.times, samples.values):
+        yield {
+            "trainee_id": batch.trainee_id,
+            "kind": kind,
+            "at": datetime.fromtimestamp(at / 1000, timezone.utc),
+            "value": value,
+        }
+
+
+def _copy_text(batch: domain.SampleBatch) -> bytes:
+    # Values are numbers and an id, nothing needs escaping. Samples of a
+    # batch share minutes, each minute is formatted once
+    trainee_id = str(batch.trainee_id)
+    samples = batch.samples
+    minutes = dict[int, str]()
+    lines = list[str]()
+    append = lines.append
+    for kind, at, value in zip(samples.kinds, samples.times, samples.values):
+        minute, millis = divmod(at, 60_000)
+        prefix = minutes.get(minute)
+        if prefix is None:
+            prefix = minutes[minute] = datetime.fromtimestamp(
+                minute * 60, timezone.utc
+            ).strftime("%Y-%m-%d %H:%M:")
+        append(
+            f"{trainee_id}\t{kind}\t{prefix}{millis // 1000:02d}.{millis % 1000:03d}"
+            f"+00\t{value!r}\n"
+        )
+    return "".join(lines).encode()
@@ -0,0 +1,19 @@
+from .models import MeasurementKind, Rejection, SampleBatch, Samples
+from .rollups import Rollup, SampleSlice, Tier
+from .service import Validated, validate
+
+__all__ = [
+    "models",
+    "events",
+    "service",
+    "rollups",
+    "MeasurementKind",
+    "Rejection",
+    "SampleBatch",
+    "Samples",
+    "Validated",
+    "SampleSlice",
+    "Rollup",
+    "Tier",
+    "validate",
+]
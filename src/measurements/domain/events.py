@@ -0,0 +1,20 @@
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+from common.domain import DomainEvent
+
+if TYPE_CHECKING:
+    from .models import MeasurementKind
+
+
+@dataclass(frozen=True)
+class SamplesRecorded(DomainEvent):
+    batch_id: uuid.UUID
+    trainee_id: uuid.UUID
+    kinds: tuple["MeasurementKind", ...]
+    # Times of the earliest and the latest sample of the batch
+    since: datetime
+    until: datetime
+    count: int
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import enum
+import uuid
+from array import array
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from common.domain import Aggregate
+
+from . import events
+
+__all__ = [
+    "MeasurementKind",
+    "Samples",
+    "SampleBatch",
+    "Rejection",
+]
+
+
+class MeasurementKind(enum.IntEnum):
+    # Values are stored, and sent by devices in binary payloads
+    HEART_RATE = 1
+    STEPS = 2
+    WEIGHT = 3
+
+
+@dataclass(frozen=True)
+class Samples:
+    """Samples of a trainee by column, index i of each is the sample i.
+
+    Times are milliseconds since the epoch in UTC.
+    """
+
+    kinds: array = field(default_factory=lambda: array("B"))
+    times: array = field(default_factory=lambda: array("q"))
+    values: array = field(default_factory=lambda: array("d"))
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+
+@dataclass(frozen=True)
+class Rejection:
+    # Position of the sample in the payload
+    index: int
+    reason: str
+
+
+class SampleBatch(Aggregate[uuid.UUID]):
+    """Samples a device of the trainee sent at once, by an id of its own.
+
+    Devices resend batches which were not acknowledged, a batch is written
+    once whatever the number of times it was received.
+    """
+
+    def __init__(
+        self,
+        batch_id: uuid.UUID,
+        trainee_id: uuid.UUID,
+        received_at: datetime,
+        count: int,
+        samples: Samples | None = None,
+    ) -> None:
+        super().__init__(batch_id)
+        self.trainee_id = trainee_id
+        self.received_at = received_at
+        self.count = count
+        # Not loaded for batches read back
+        self.samples = samples
+
+    @classmethod
+    def new(
+        cls, batch_id: uuid.UUID, trainee_id: uuid.UUID, samples: Samples
+    ) -> SampleBatch:
+        now = cls.now()
+        batch = cls(batch_id, trainee_id, now, len(samples), samples)
+        batch.push_event(
+            events.SamplesRecorded(
+                now,
+                batch_id,
+                trainee_id,
+                tuple(sorted({MeasurementKind(k) for k in set(samples.kinds)})),
+                _from_millis(min(samples.times)),
+                _from_millis(max(samples.times)),
+                len(samples),
+            )
+        )
+        return batch
+
+
+def _from_millis(millis: int) -> datetime:
+    return datetime.fromtimestamp(millis / 1000, timezone.utc)
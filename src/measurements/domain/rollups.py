@@ -0,0 +1,170 @@
+"""Daily and weekly aggregates of samples, computed for many trainees at once.
+
+Days and weeks are computed from their samples. Samples of all trainees
+of a span are sorted once with NumPy and reduced by group. Only trends
+of weeks come from their days, fitted to the daily means.
+"""
+
+from __future__ import annotations
+
+import enum
+import uuid
+from array import array
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Iterable
+
+import numpy as np
+
+from .models import MeasurementKind
+
+__all__ = [
+    "Tier",
+    "Rollup",
+    "SampleSlice",
+    "compute_days",
+    "compute_weeks",
+    "trend",
+    "week_of",
+]
+
+
+class Tier(str, enum.Enum):
+    DAY = "day"
+    WEEK = "week"
+
+
+@dataclass(frozen=True)
+class Rollup:
+    trainee_id: uuid.UUID
+    kind: MeasurementKind
+    tier: Tier
+    # Day, or Monday of the week, in UTC
+    start: date
+    count: int
+    total: float
+    mean: float
+    minimum: float
+    maximum: float
+    # Of the samples of the day or the week
+    p50: float
+    p90: float
+    # Change of the daily mean a day over the week, weeks of two days or more
+    trend: float | None = None
+
+
+@dataclass
+class SampleSlice:
+    """Samples of trainees over a span of days by column, without times."""
+
+    trainee_ids: list[uuid.UUID] = field(default_factory=list)
+    # Position of the sample's trainee in trainee_ids
+    trainees: array = field(default_factory=lambda: array("q"))
+    kinds: array = field(default_factory=lambda: array("B"))
+    values: array = field(default_factory=lambda: array("d"))
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+def week_of(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def compute_days(samples: SampleSlice, day: date) -> list[Rollup]:
+    return _compute(samples, Tier.DAY, day)
+
+
+def compute_weeks(
+    samples: SampleSlice, week: date, days: Iterable[Rollup]
+) -> list[Rollup]:
+    """Rollups of the week from its samples, trends from rollups of its days."""
+    groups = dict[tuple[uuid.UUID, MeasurementKind], list[Rollup]]()
+    for day in days:
+        groups.setdefault((day.trainee_id, day.kind), []).append(day)
+    trends = {key: trend(group) for key, group in groups.items()}
+    return _compute(samples, Tier.WEEK, week, trends)
+
+
+def trend(rollups: Iterable[Rollup]) -> float | None:
+    """Slope of the least squares line of means by day, None for one point."""
+    points = [(r.start.toordinal(), r.mean) for r in rollups]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if not spread:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+
+Reduced = tuple[int, int, int, float, float, float, float, float]
+
+
+def _compute(
+    samples: SampleSlice,
+    tier: Tier,
+    start: date,
+    trends: dict[tuple[uuid.UUID, MeasurementKind], float | None] | None = None,
+) -> list[Rollup]:
+    if not len(samples):
+        return []
+    rollups = list[Rollup]()
+    for trainee, kind, count, total, minimum, maximum, p50, p90 in _reduce(samples):
+        trainee_id, kind = samples.trainee_ids[trainee], MeasurementKind(kind)
+        rollups.append(
+            Rollup(
+                trainee_id=trainee_id,
+                kind=kind,
+                tier=tier,
+                start=start,
+                count=count,
+                total=total,
+                mean=total / count,
+                minimum=minimum,
+                maximum=maximum,
+                p50=p50,
+                p90=p90,
+                trend=trends.get((trainee_id, kind)) if trends is not None else None,
+            )
+        )
+    return rollups
+
+
+def _reduce(samples: SampleSlice) -> list[Reduced]:
+    trainees = np.frombuffer(samples.trainees, dtype=np.int64)
+    kinds = np.frombuffer(samples.kinds, dtype=np.uint8)
+    values = np.frombuffer(samples.values, dtype=np.float64)
+
+    # Sorted by group and by value within it, groups are contiguous runs.
+    # Stable sort of integer keys is a radix sort, faster than lexsort
+    keys = trainees * 256 + kinds
+    order = np.argsort(values)
+    order = order[np.argsort(keys[order], kind="stable")]
+    keys, values = keys[order], values[order]
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    counts = np.diff(np.append(starts, len(keys)))
+    totals = np.add.reduceat(values, starts)
+    ends = starts + counts - 1
+
+    def percentile(q: float):
+        # Linear interpolation between closest ranks, as numpy.percentile
+        position = (counts - 1) * q
+        low = np.floor(position).astype(np.int64)
+        high = np.minimum(low + 1, counts - 1)
+        lower, upper = values[starts + low], values[starts + high]
+        return lower + (upper - lower) * (position - low)
+
+    return list(
+        zip(
+            (keys[starts] // 256).tolist(),
+            (keys[starts] % 256).tolist(),
+            counts.tolist(),
+            totals.tolist(),
+            values[starts].tolist(),
+            values[ends].tolist(),
+            percentile(0.5).tolist(),
+            percentile(0.9).tolist(),
+        )
+    )
@@ -0,0 +1,76 @@
+"""Validation of samples in bulk.
+
+Payloads carry thousands of samples, each is checked by a few
+comparisons in a single pass and kept in typed arrays rather than a model
+of its own.
+"""
+
+from array import array
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from .models import MeasurementKind, Rejection, Samples
+
+__all__ = ["LIMITS", "Validated", "validate"]
+
+# Plausible values of a sample, steps are counted since the previous one
+LIMITS: dict[int, tuple[float, float]] = {
+    MeasurementKind.HEART_RATE: (20.0, 250.0),
+    MeasurementKind.STEPS: (0.0, 100_000.0),
+    MeasurementKind.WEIGHT: (20.0, 400.0),
+}
+
+# Devices keep samples while offline, and their clocks drift
+MAX_AGE = timedelta(days=30)
+MAX_SKEW = timedelta(minutes=5)
+
+# Rejected samples are all counted, only the first ones are explained
+MAX_REJECTIONS = 20
+
+# Compared by type, booleans of JSON are not values
+_NUMBERS = (int, float)
+
+
+@dataclass
+class Validated:
+    samples: Samples
+    rejected: int = 0
+    rejections: list[Rejection] = field(default_factory=list)
+
+
+def validate(
+    records: Iterable[tuple[object, object, object]], now: datetime
+) -> Validated:
+    """Splits records of kind, time in milliseconds and value by validity.
+
+    Records come straight from a payload, any of their fields may be of a
+    wrong type.
+    """
+    now_ms = int(now.timestamp() * 1000)
+    earliest = now_ms - MAX_AGE // timedelta(milliseconds=1)
+    latest = now_ms + MAX_SKEW // timedelta(milliseconds=1)
+
+    kinds, times, values = array("B"), array("q"), array("d")
+    rejected, rejections = 0, list[Rejection]()
+    limits = LIMITS
+    for index, (kind, at, value) in enumerate(records):
+        bounds = limits.get(kind)
+        if bounds is None:
+            reason = "Unknown kind"
+        elif not isinstance(at, int) or not earliest <= at <= latest:
+            reason = "Time is out of range"
+        # NaN compares false and lands here as well
+        elif type(value) not in _NUMBERS or not bounds[0] <= value <= bounds[1]:
+            reason = "Value is out of range"
+        else:
+            kinds.append(kind)
+            times.append(at)
+            values.append(value)
+            continue
+
+        rejected += 1
+        if len(rejections) < MAX_REJECTIONS:
+            rejections.append(Rejection(index, reason))
+
+    return Validated(Samples(kinds, times, values), rejected, rejections)
@@ -0,0 +1,17 @@
+from .uow import (
+    MeasurementUnitOfWork,
+    SQLMeasurementUnitOfWork,
+    InMemoryMeasurementUnitOfWork,
+)
+from .ingestion import SampleWriter
+from .rollups import RollupEngine
+
+__all__ = [
+    "MeasurementUnitOfWork",
+    "SQLMeasurementUnitOfWork",
+    "InMemoryMeasurementUnitOfWork",
+    "SampleWriter",
+    "RollupEngine",
+    "ingestion",
+    "rollups",
+]
@@ -0,0 +1,227 @@
+import collections
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Iterable
+
+from loguru import logger
+
+from auth.domain import UserKind
+from auth.service_layer.auth import AccessTokenClaims, PermissionDenied
+from common.metrics import Counter, Gauge, Histogram
+from measurements.domain import Rejection, SampleBatch, validate
+
+from .uow import MeasurementUnitOfWork
+
+__all__ = [
+    "Ingested",
+    "PermissionDenied",
+    "SampleWriter",
+    "WriterFullError",
+    "ingest",
+    "get_batch",
+]
+
+MEASUREMENT_SAMPLES = Counter(
+    "measurement_samples_total",
+    "Measurement samples by what happened to them",
+    ["result"],
+)
+
+MEASUREMENT_FLUSH_DURATION = Histogram(
+    "measurement_flush_duration_seconds",
+    "Duration of writing a group of measurement batches",
+)
+
+MEASUREMENT_PENDING = Gauge(
+    "measurement_pending_samples",
+    "Accepted measurement samples waiting to be written",
+)
+
+# Partitions are made for the next month as well, checking once in a
+# while is enough
+PREPARE_INTERVAL = 3600.0
+
+
+class WriterFullError(Exception):
+    pass
+
+
+class SampleWriter:
+    """Writes accepted batches of the worker in the background.
+
+    Requests are acknowledged once their batch is queued. Queued batches
+    are written together in a single transaction of up to ``flush_samples``
+    samples, once that many are queued or ``flush_interval`` seconds
+    passed. Batches beyond ``max_pending`` samples are refused rather than
+    waited for, devices send them again later. Queued batches are written
+    on stop, batches of a crashed worker are lost and resent as well.
+    """
+
+    def __init__(
+        self,
+        uow_factory: Callable[[], MeasurementUnitOfWork],
+        max_pending: int,
+        flush_samples: int,
+        flush_interval: float,
+    ) -> None:
+        self._uow_factory = uow_factory
+        self._max_pending = max_pending
+        self._flush_samples = flush_samples
+        self._flush_interval = flush_interval
+        self._queue = collections.deque[SampleBatch]()
+        self._queued_ids = set[uuid.UUID]()
+        self._pending = 0
+        # Wakes the flusher once enough samples are queued
+        self._changed = threading.Condition()
+        self._stopping = False
+        self._thread: threading.Thread | None = None
+        self._prepared_at = float("-inf")
+        MEASUREMENT_PENDING.set_function(lambda: [((), self._pending)])
+
+    def submit(self, batch: SampleBatch) -> None:
+        """Queues the batch, raises WriterFullError when there is no room."""
+        with self._changed:
+            if batch.id in self._queued_ids:
+                return
+            if self._pending + batch.count > self._max_pending:
+                MEASUREMENT_SAMPLES.inc(batch.count, "refused")
+                raise WriterFullError("Too many samples are waiting to be written")
+
+            self._queue.append(batch)
+            self._queued_ids.add(batch.id)
+            self._pending += batch.count
+            if self._pending >= self._flush_samples:
+                self._changed.notify_all()
+
+    def flush(self) -> int:
+        """Writes queued batches, returns how many samples were written."""
+        written = 0
+        while True:
+            with self._changed:
+                group, samples = list[SampleBatch](), 0
+                while self._queue and (
+                    not group or samples + self._queue[0].count <= self._flush_samples
+                ):
+                    batch = self._queue.popleft()
+                    group.append(batch)
+                    samples += batch.count
+            if not group:
+                return written
+
+            try:
+                with MEASUREMENT_FLUSH_DURATION.time():
+                    self._write(group)
+            except Exception:
+                # Put back in front, batches keep their order
+                with self._changed:
+                    self._queue.extendleft(reversed(group))
+                raise
+
+            with self._changed:
+                self._queued_ids.difference_update(batch.id for batch in group)
+                self._pending -= samples
+            written += samples
+            MEASUREMENT_SAMPLES.inc(samples, "written")
+
+    def start(self) -> None:
+        self._stopping = False
+        self._thread = threading.Thread(
+            target=self._run, name="measurement-writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._changed:
+            self._stopping = True
+            self._changed.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Can't write measurements on shutdown")
+            MEASUREMENT_SAMPLES.inc(self._pending, "lost")
+            self._queue.clear()
+            self._queued_ids.clear()
+            self._pending = 0
+
+    def _write(self, group: list[SampleBatch]) -> None:
+        uow = self._uow_factory()
+        with uow:
+            for batch in group:
+                uow.sample_repo.add(batch)
+            uow.commit()
+
+    def _run(self) -> None:
+        while True:
+            # Partitions are made before the first flush of the worker
+            self._prepare()
+            with self._changed:
+                self._changed.wait_for(
+                    lambda: self._stopping or self._pending >= self._flush_samples,
+                    self._flush_interval,
+                )
+                if self._stopping:
+                    return
+
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Can't write measurements")
+                # Retried on the next interval rather than right away
+                with self._changed:
+                    self._changed.wait_for(lambda: self._stopping, self._flush_interval)
+
+    def _prepare(self) -> None:
+        if time.monotonic() - self._prepared_at < PREPARE_INTERVAL:
+            return
+        try:
+            uow = self._uow_factory()
+            with uow:
+                uow.sample_repo.prepare(datetime.now(timezone.utc))
+                uow.commit()
+            self._prepared_at = time.monotonic()
+        except Exception:
+            logger.exception("Can't create measurement partitions")
+
+
+@dataclass
+class Ingested:
+    accepted: int
+    rejected: int
+    rejections: list[Rejection] = field(default_factory=list)
+
+
+def ingest(
+    writer: SampleWriter,
+    claims: AccessTokenClaims,
+    batch_id: uuid.UUID,
+    records: Iterable[tuple[object, object, object]],
+) -> Ingested:
+    """Validates samples of the trainee and queues the valid ones."""
+    if claims.kind != UserKind.TRAINEE:
+        raise PermissionDenied("Only trainees can record measurements")
+
+    validated = validate(records, datetime.now(timezone.utc))
+    MEASUREMENT_SAMPLES.inc(validated.rejected, "rejected")
+    accepted = len(validated.samples)
+    if accepted:
+        writer.submit(SampleBatch.new(batch_id, claims.user_id, validated.samples))
+        MEASUREMENT_SAMPLES.inc(accepted, "accepted")
+    return Ingested(accepted, validated.rejected, validated.rejections)
+
+
+def get_batch(
+    uow: MeasurementUnitOfWork, claims: AccessTokenClaims, batch_id: uuid.UUID
+) -> SampleBatch | None:
+    """Returns the batch of the trainee once it is written."""
+    with uow:
+        batch = uow.sample_repo.get(batch_id)
+    if batch is None or batch.trainee_id != claims.user_id:
+        return None
+    return batch
@@ -0,0 +1,163 @@
+import threading
+import uuid
+from datetime import date, timedelta
+from typing import Callable, Iterator
+
+from loguru import logger
+
+from auth.domain import UserKind
+from auth.service_layer.auth import AccessTokenClaims, PermissionDenied
+from common.metrics import Gauge, Histogram
+from measurements.domain import MeasurementKind, Rollup, Tier, events, rollups
+from roster.service_layer import RosterUnitOfWork
+
+from .uow import MeasurementUnitOfWork
+
+__all__ = ["PermissionDenied", "RollupEngine", "list_rollups"]
+
+ROLLUP_DURATION = Histogram(
+    "measurement_rollup_duration_seconds",
+    "Duration of recomputing rollups of changed days",
+)
+
+ROLLUP_PENDING = Gauge(
+    "measurement_rollup_pending_days",
+    "Days of trainees with samples not yet rolled up",
+)
+
+# Trainees of a single query of samples
+LOAD_TRAINEES = 500
+
+
+class RollupEngine:
+    """Keeps daily and weekly rollups up to date as samples are recorded.
+
+    Subscribed to SamplesRecorded, the engine notes days of the trainee
+    the batch covered. Every ``interval`` seconds a background thread
+    recomputes those days from their samples, for all noted trainees of a
+    day at once, then weeks of them from samples of the week. Days noted
+    by a crashed worker are recomputed on the next samples of the day.
+    """
+
+    def __init__(
+        self,
+        uow_factory: Callable[[], MeasurementUnitOfWork],
+        interval: float,
+    ) -> None:
+        self._uow_factory = uow_factory
+        self._interval = interval
+        self._dirty = set[tuple[uuid.UUID, date]]()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        ROLLUP_PENDING.set_function(lambda: [((), len(self._dirty))])
+
+    def handle(self, event: events.SamplesRecorded) -> None:
+        day, last = event.since.date(), event.until.date()
+        with self._lock:
+            while day <= last:
+                self._dirty.add((event.trainee_id, day))
+                day += timedelta(days=1)
+
+    def flush(self) -> int:
+        """Recomputes noted days and their weeks, returns how many days."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return 0
+
+        by_day = dict[date, list[uuid.UUID]]()
+        by_week = dict[date, set[uuid.UUID]]()
+        for trainee_id, day in dirty:
+            by_day.setdefault(day, []).append(trainee_id)
+            by_week.setdefault(rollups.week_of(day), set()).add(trainee_id)
+
+        try:
+            with ROLLUP_DURATION.time():
+                uow = self._uow_factory()
+                with uow:
+                    repo = uow.sample_repo
+                    for day, trainees in sorted(by_day.items()):
+                        trainees.sort()
+                        for chunk in _chunks(trainees):
+                            samples = repo.load_samples(
+                                chunk, day, day + timedelta(days=1)
+                            )
+                            repo.save_rollups(rollups.compute_days(samples, day))
+
+                    # Percentiles of a week can't be derived from its days,
+                    # weeks are reduced from their samples as days are. Days
+                    # saved above only give the trend
+                    for week, trainees in sorted(by_week.items()):
+                        last = week + timedelta(days=6)
+                        for chunk in _chunks(sorted(trainees)):
+                            samples = repo.load_samples(
+                                chunk, week, week + timedelta(days=7)
+                            )
+                            days = repo.list_rollups(chunk, Tier.DAY, week, last)
+                            repo.save_rollups(
+                                rollups.compute_weeks(samples, week, days)
+                            )
+                    uow.commit()
+        except Exception:
+            # Noted again, recomputed on the next flush
+            with self._lock:
+                self._dirty |= dirty
+            raise
+        return len(dirty)
+
+    def start(self) -> None:
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="measurement-rollups", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Can't roll up measurements on shutdown")
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self._interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Can't roll up measurements")
+
+
+def _chunks(trainee_ids: list[uuid.UUID]) -> Iterator[list[uuid.UUID]]:
+    for start in range(0, len(trainee_ids), LOAD_TRAINEES):
+        yield trainee_ids[start : start + LOAD_TRAINEES]
+
+
+def list_rollups(
+    uow: MeasurementUnitOfWork,
+    roster_uow: RosterUnitOfWork,
+    claims: AccessTokenClaims,
+    trainee_id: uuid.UUID,
+    kind: MeasurementKind,
+    tier: Tier,
+    since: date,
+    until: date,
+) -> list[Rollup]:
+    """Returns rollups of the trainee, for the trainee or one of their coaches.
+
+    Coaches see trainees who accepted them only, assigning a trainee alone
+    gives no access.
+    """
+    if claims.user_id != trainee_id:
+        if claims.kind != UserKind.COACH:
+            raise PermissionDenied("Only the trainee and their coaches can see this")
+        with roster_uow:
+            if not roster_uow.roster_repo.has_trainee(claims.user_id, trainee_id):
+                raise PermissionDenied("Trainee hasn't accepted the coach")
+
+    with uow:
+        return uow.sample_repo.list_rollups([trainee_id], tier, since, until, kind)
@@ -0,0 +1,57 @@
+import abc
+import functools
+from typing import cast
+
+from sqlalchemy.orm import Session, sessionmaker
+
+from common import (
+    AbstractMessageBus,
+    AbstractUnitOfWork,
+    InMemoryUnitOfWork,
+    SQLUnitOfWork,
+)
+from common.breaker import CircuitBreaker
+from measurements.adapter.repository import (
+    AbstractSampleRepository,
+    InMemorySampleRepository,
+    MeasurementStore,
+    SampleRepository,
+)
+
+
+class MeasurementUnitOfWork(AbstractUnitOfWork):
+    @property
+    @abc.abstractmethod
+    def sample_repo(self) -> AbstractSampleRepository:
+        pass
+
+
+class SQLMeasurementUnitOfWork(SQLUnitOfWork, MeasurementUnitOfWork):
+    def __init__(
+        self,
+        bus: AbstractMessageBus,
+        sessionmaker_: sessionmaker[Session],
+        breaker: CircuitBreaker | None = None,
+        copy: bool = True,
+    ):
+        super().__init__(
+            bus,
+            sessionmaker_,
+            [functools.partial(SampleRepository, copy=copy)],
+            breaker,
+        )
+
+    @property
+    def sample_repo(self) -> SampleRepository:
+        return cast(SampleRepository, self._repositories[SampleRepository])
+
+
+class InMemoryMeasurementUnitOfWork(InMemoryUnitOfWork, MeasurementUnitOfWork):
+    def __init__(self, bus: AbstractMessageBus, store: MeasurementStore):
+        super().__init__(bus, [functools.partial(InMemorySampleRepository, store)])
+
+    @property
+    def sample_repo(self) -> InMemorySampleRepository:
+        return cast(
+            InMemorySampleRepository, self._repositories[InMemorySampleRepository]
+        )
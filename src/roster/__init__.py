@@ -0,0 +1,3 @@
+from roster.adapter import router
+
+__all__ = ["router"]
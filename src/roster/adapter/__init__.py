@@ -0,0 +1,3 @@
+from .api.routes import router
+
+__all__ = ["router"]
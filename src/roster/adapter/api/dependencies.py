@@ -0,0 +1,25 @@
+from typing import Annotated
+
+from fastapi import Depends, FastAPI, Request
+
+from auth.adapter.api.dependencies import get_sessionmaker
+from common import AbstractMessageBus
+from roster.service_layer import (
+    InMemoryRosterUnitOfWork,
+    RosterUnitOfWork,
+    SQLRosterUnitOfWork,
+)
+
+
+def get_roster_unit_of_work(
+    request: Request,
+    bus: Annotated[AbstractMessageBus, Depends()],
+) -> RosterUnitOfWork:
+    return init_roster_unit_of_work(request.app, bus)
+
+
+def init_roster_unit_of_work(app: FastAPI, bus: AbstractMessageBus) -> RosterUnitOfWork:
+    if app.config.db.backend == "memory":
+        return InMemoryRosterUnitOfWork(bus, app.roster_store)
+    # Rosters stay in the main database when users are sharded
+    return SQLRosterUnitOfWork(bus, get_sessionmaker(app.engine), app.breaker)
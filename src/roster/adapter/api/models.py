@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import base64
+import uuid
+from datetime import datetime
+
+from pydantic import BaseModel, Field
+
+from roster import domain
+
+
+class TraineeGet(BaseModel):
+    trainee_id: uuid.UUID
+    assigned_at: datetime
+    # Empty while the trainee hasn't accepted the coach
+    accepted_at: datetime | None = None
+
+    @classmethod
+    def from_domain(cls, entry: domain.RosterEntry) -> TraineeGet:
+        return cls(
+            trainee_id=entry.trainee_id,
+            assigned_at=entry.assigned_at,
+            accepted_at=entry.accepted_at,
+        )
+
+
+class CoachGet(BaseModel):
+    coach_id: uuid.UUID
+    assigned_at: datetime
+    # Empty while the trainee hasn't accepted the coach
+    accepted_at: datetime | None = None
+
+    @classmethod
+    def from_domain(cls, entry: domain.RosterEntry) -> CoachGet:
+        return cls(
+            coach_id=entry.coach_id,
+            assigned_at=entry.assigned_at,
+            accepted_at=entry.accepted_at,
+        )
+
+
+class TraineePage(BaseModel):
+    trainee_count: int
+    trainees: list[TraineeGet]
+    # Pass as cursor to get the next page, absent on the last one
+    next_cursor: str | None = None
+
+
+class CoachPage(BaseModel):
+    coaches: list[CoachGet]
+    # Pass as cursor to get the next page, absent on the last one
+    next_cursor: str | None = None
+
+
+class TraineesChange(BaseModel):
+    trainee_ids: list[uuid.UUID] = Field(
+        min_length=1, max_length=domain.Roster.MAX_BATCH
+    )
+
+
+class RosterGet(BaseModel):
+    coach_id: uuid.UUID
+    trainee_count: int
+
+    @classmethod
+    def from_domain(cls, roster: domain.Roster) -> RosterGet:
+        return cls(coach_id=roster.id, trainee_count=roster.trainee_count)
+
+
+def encode_cursor(user_id: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(str(user_id).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> uuid.UUID:
+    """Raises ValueError on malformed cursors."""
+    try:
+        return uuid.UUID(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeError) as e:
+        raise ValueError("Malformed cursor") from e
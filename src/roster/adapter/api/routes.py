@@ -0,0 +1,215 @@
+import uuid
+from typing import Annotated
+
+from fastapi import APIRouter, Body, Depends, HTTPException, Path, Query, status
+
+from auth.adapter.api.dependencies import (
+    get_access_claims,
+    get_unit_of_work,
+    require_database,
+)
+from auth.service_layer import UserUnitOfWork, auth
+from roster.domain import LinkNotFound, RosterError
+from roster.service_layer import RosterUnitOfWork, roster
+
+from .dependencies import get_roster_unit_of_work
+from .models import (
+    CoachGet,
+    CoachPage,
+    RosterGet,
+    TraineeGet,
+    TraineePage,
+    TraineesChange,
+    decode_cursor,
+    encode_cursor,
+)
+
+router = APIRouter(tags=["roster"])
+
+
+def _decode_after(cursor: str | None) -> uuid.UUID | None:
+    try:
+        return decode_cursor(cursor) if cursor is not None else None
+    except ValueError:
+        raise HTTPException(
+            detail="Invalid cursor",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+
+
+@router.get(
+    "/coaches/{coach_id}/trainees",
+    summary="Returns trainees of the coach in pages",
+    response_model=TraineePage,
+    responses={
+        200: {},
+        400: {},
+        401: {},
+        403: {},
+    },
+)
+def list_trainees(
+    coach_id: Annotated[uuid.UUID, Path()],
+    claims: Annotated[auth.AccessTokenClaims, Depends(get_access_claims)],
+    uow: Annotated[RosterUnitOfWork, Depends(get_roster_unit_of_work)],
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    cursor: Annotated[str | None, Query()] = None,
+) -> TraineePage:
+    after = _decode_after(cursor)
+    try:
+        found, entries = roster.list_trainees(uow, claims, coach_id, limit, after)
+    except roster.PermissionDenied as e:
+        raise HTTPException(detail=e.args[0], status_code=status.HTTP_403_FORBIDDEN)
+
+    return TraineePage(
+        trainee_count=found.trainee_count,
+        trainees=[TraineeGet.from_domain(e) for e in entries],
+        next_cursor=encode_cursor(entries[-1].trainee_id)
+        if len(entries) == limit
+        else None,
+    )
+
+
+@router.post(
+    "/coaches/{coach_id}/trainees",
+    summary="Assigns trainees pending their acceptance, assigned ones are skipped",
+    response_model=RosterGet,
+    responses={
+        200: {},
+        400: {},
+        401: {},
+        403: {},
+        422: {},
+        503: {},
+    },
+    dependencies=[Depends(require_database)],
+)
+def assign_trainees(
+    coach_id: Annotated[uuid.UUID, Path()],
+    change: Annotated[TraineesChange, Body()],
+    claims: Annotated[auth.AccessTokenClaims, Depends(get_access_claims)],
+    uow: Annotated[RosterUnitOfWork, Depends(get_roster_unit_of_work)],
+    users: Annotated[UserUnitOfWork, Depends(get_unit_of_work)],
+) -> RosterGet:
+    try:
+        changed = roster.assign_trainees(
+            uow, users, claims, coach_id, change.trainee_ids
+        )
+    except roster.PermissionDenied as e:
+        raise HTTPException(detail=e.args[0], status_code=status.HTTP_403_FORBIDDEN)
+    except RosterError as e:
+        raise HTTPException(detail=e.args[0], status_code=status.HTTP_400_BAD_REQUEST)
+    return RosterGet.from_domain(changed)
+
+
+@router.post(
+    "/coaches/{coach_id}/trainees/unassign",
+    summary="Unassigns trainees from the coach, unknown ones are skipped",
+    response_model=RosterGet,
+    responses={
+        200: {},
+        400: {},
+        401: {},
+        403: {},
+        422: {},
+        503: {},
+    },
+    dependencies=[Depends(require_database)],
+)
+def unassign_trainees(
+    coach_id: Annotated[uuid.UUID, Path()],
+    change: Annotated[TraineesChange, Body()],
+    claims: Annotated[auth.AccessTokenClaims, Depends(get_access_claims)],
+    uow: Annotated[RosterUnitOfWork, Depends(get_roster_unit_of_work)],
+) -> RosterGet:
+    try:
+        changed = roster.unassign_trainees(uow, claims, coach_id, change.trainee_ids)
+    except roster.PermissionDenied as e:
+        raise HTTPException(detail=e.args[0], status_code=status.HTTP_403_FORBIDDEN)
+    except RosterError as e:
+        raise HTTPException(detail=e.args[0], status_code=status.HTTP_400_BAD_REQUEST)
+    return RosterGet.from_domain(changed)
+
+
+@router.get(
+    "/trainees/{trainee_id}/coaches",
+    summary="Returns coaches of the trainee in pages",
+    response_model=CoachPage,
+    responses={
+        200: {},
+        400: {},
+        401: {},
+        403: {},
+    },
+)
+def list_coaches(
+    trainee_id: Annotated[uuid.UUID, Path()],
+    claims: Annotated[auth.AccessTokenClaims, Depends(get_access_claims)],
+    uow: Annotated[RosterUnitOfWork, Depends(get_roster_unit_of_work)],
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: Annotated[str | None, Query()] = None,
+) -> CoachPage:
+    after = _decode_after(cursor)
+    try:
+        entries = roster.list_coaches(uow, claims, trainee_id, limit, after)
+    except roster.PermissionDenied as e:
+        raise HTTPException(detail=e.args[0], status_code=status.HTTP_403_FORBIDDEN)
+
+    return CoachPage(
+        coaches=[CoachGet.from_domain(e) for e in entries],
+        next_cursor=encode_cursor(entries[-1].coach_id)
+        if len(entries) == limit
+        else None,
+    )
+
+
+@router.post(
+    "/trainees/{trainee_id}/coaches/{coach_id}/accept",
+    summary="Accepts the coach who assigned the trainee",
+    response_model=CoachGet,
+    responses={
+        200: {},
+        401: {},
+        403: {},
+        404: {},
+        503: {},
+    },
+    dependencies=[Depends(require_database)],
+)
+def accept_coach(
+    trainee_id: Annotated[uuid.UUID, Path()],
+    coach_id: Annotated[uuid.UUID, Path()],
+    claims: Annotated[auth.AccessTokenClaims, Depends(get_access_claims)],
+    uow: Annotated[RosterUnitOfWork, Depends(get_roster_unit_of_work)],
+) -> CoachGet:
+    try:
+        link = roster.accept_coach(uow, claims, trainee_id, coach_id)
+    except roster.PermissionDenied as e:
+        raise HTTPException(detail=e.args[0], status_code=status.HTTP_403_FORBIDDEN)
+    except LinkNotFound as e:
+        raise HTTPException(detail=e.args[0], status_code=status.HTTP_404_NOT_FOUND)
+    return CoachGet.from_domain(link)
+
+
+@router.post(
+    "/trainees/{trainee_id}/coaches/{coach_id}/leave",
+    summary="Removes the trainee from the roster of the coach",
+    status_code=status.HTTP_204_NO_CONTENT,
+    responses={
+        204: {},
+        401: {},
+        403: {},
+        503: {},
+    },
+    dependencies=[Depends(require_database)],
+)
+def leave_coach(
+    trainee_id: Annotated[uuid.UUID, Path()],
+    coach_id: Annotated[uuid.UUID, Path()],
+    claims: Annotated[auth.AccessTokenClaims, Depends(get_access_claims)],
+    uow: Annotated[RosterUnitOfWork, Depends(get_roster_unit_of_work)],
+) -> None:
+    try:
+        roster.leave_coach(uow, claims, trainee_id, coach_id)
+    except roster.PermissionDenied as e:
+        raise HTTPException(detail=e.args[0], status_code=status.HTTP_403_FORBIDDEN)
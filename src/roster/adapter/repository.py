@@ -0,0 +1,398 @@
+from __future__ import annotations
+
+import abc
+import heapq
+import json
+import threading
+import uuid
+from datetime import datetime
+from typing import Iterable, Sequence
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Mapped, Session, mapped_column
+
+from common.domain import DomainEvent
+from common.repository import AbstractRepository, InMemoryRepository
+from common.sql import Base, TimeMixin, TZDateTime
+from roster import domain
+from roster.domain import events
+
+__all__ = [
+    "AbstractRosterRepository",
+    "RosterRepository",
+    "InMemoryRosterRepository",
+    "RosterStore",
+]
+
+
+class AbstractRosterRepository(AbstractRepository[domain.Roster, uuid.UUID]):
+    @abc.abstractmethod
+    def list_trainees(
+        self, coach_id: uuid.UUID, limit: int, after: uuid.UUID | None = None
+    ) -> list[domain.RosterEntry]:
+        """Returns trainees of the coach in order of their ids.
+
+        ``after`` is the id of the last trainee of the previous page.
+        """
+
+    @abc.abstractmethod
+    def list_coaches(
+        self, trainee_id: uuid.UUID, limit: int, after: uuid.UUID | None = None
+    ) -> list[domain.RosterEntry]:
+        """Returns coaches of the trainee in order of their ids.
+
+        ``after`` is the id of the last coach of the previous page.
+        """
+
+    @abc.abstractmethod
+    def get_link(
+        self, coach_id: uuid.UUID, trainee_id: uuid.UUID
+    ) -> domain.RosterEntry | None:
+        pass
+
+    @abc.abstractmethod
+    def has_trainee(self, coach_id: uuid.UUID, trainee_id: uuid.UUID) -> bool:
+        """Whether the trainee accepted the coach, pending links don't count."""
+
+
+class RosterRepository(AbstractRosterRepository):
+    """Rosters in the coach_trainees and rosters tables.
+
+    Events of a persisted roster are applied right away, each change is
+    a single statement over all of its trainees followed by an upsert of
+    the count by how many links it actually added or removed.
+    """
+
+    def __init__(self, session: Session) -> None:
+        self.session = session
+        self.__events = list[DomainEvent]()
+
+    def add(self, roster: domain.Roster) -> None:
+        self.persist(roster)
+
+    def persist(self, roster: domain.Roster) -> None:
+        dialect = self.session.get_bind().dialect.name
+        while event := roster.pop_event():
+            if isinstance(event, events.TraineesAssigned):
+                changed = self._execute(_assign(dialect), dialect, event)
+            elif isinstance(event, events.TraineesUnassigned):
+                changed = -self._execute(_unassign(dialect), dialect, event)
+            elif isinstance(event, events.TraineeAccepted):
+                self.session.execute(ACCEPT, _accept_params(event))
+                changed = 0
+            else:
+                changed = 0
+            if changed:
+                roster.trainee_count = self.session.execute(
+                    _count(dialect), {"coach_id": roster.id, "delta": changed}
+                ).scalar_one()
+            heapq.heappush(self.__events, event)
+
+    def get(self, coach_id: uuid.UUID) -> domain.Roster:
+        count = self.session.execute(GET_COUNT, {"coach_id": coach_id}).scalar()
+        return domain.Roster(coach_id, count or 0)
+
+    def list_trainees(
+        self, coach_id: uuid.UUID, limit: int, after: uuid.UUID | None = None
+    ) -> list[domain.RosterEntry]:
+        query = LIST_TRAINEES
+        params = {"coach_id": coach_id, "limit": limit}
+        if after is not None:
+            query = LIST_TRAINEES_AFTER
+            params["after_id"] = after
+        return [_to_domain(link) for link in self.session.execute(query, params)]
+
+    def list_coaches(
+        self, trainee_id: uuid.UUID, limit: int, after: uuid.UUID | None = None
+    ) -> list[domain.RosterEntry]:
+        query = LIST_COACHES
+        params = {"trainee_id": trainee_id, "limit": limit}
+        if after is not None:
+            query = LIST_COACHES_AFTER
+            params["after_id"] = after
+        return [_to_domain(link) for link in self.session.execute(query, params)]
+
+    def get_link(
+        self, coach_id: uuid.UUID, trainee_id: uuid.UUID
+    ) -> domain.RosterEntry | None:
+        params = {"coach_id": coach_id, "trainee_id": trainee_id}
+        link = self.session.execute(GET_LINK, params).first()
+        return _to_domain(link) if link is not None else None
+
+    def has_trainee(self, coach_id: uuid.UUID, trainee_id: uuid.UUID) -> bool:
+        params = {"coach_id": coach_id, "trainee_id": trainee_id}
+        return self.session.execute(HAS_TRAINEE, params).first() is not None
+
+    def collect_events(self) -> Iterable[DomainEvent]:
+        heap, self.__events = self.__events, []
+        return heap
+
+    def _execute(
+        self,
+        statement,
+        dialect: str,
+        event: events.TraineesAssigned | events.TraineesUnassigned,
+    ) -> int:
+        params = {
+            "coach_id": event.coach_id,
+            "trainee_ids": _trainee_ids_param(dialect, event.trainee_ids),
+            "now": event.at,
+        }
+        return self.session.execute(statement, params).rowcount
+
+
+class RosterStore:
+    """Committed links of in-memory repositories, shared by units of work."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # Both directions, trainees of a coach and coaches of a trainee
+        self.trainees = dict[uuid.UUID, dict[uuid.UUID, datetime]]()
+        self.coaches = dict[uuid.UUID, dict[uuid.UUID, datetime]]()
+        # Acceptance times of links by coach and trainee ids
+        self.accepted = dict[tuple[uuid.UUID, uuid.UUID], datetime]()
+
+
+class InMemoryRosterRepository(AbstractRosterRepository, InMemoryRepository):
+    def __init__(self, store: RosterStore) -> None:
+        self._store = store
+        self._staged = list[tuple[domain.Roster, DomainEvent]]()
+        self.__events = list[DomainEvent]()
+
+    def add(self, roster: domain.Roster) -> None:
+        self.persist(roster)
+
+    def persist(self, roster: domain.Roster) -> None:
+        while event := roster.pop_event():
+            self._staged.append((roster, event))
+            heapq.heappush(self.__events, event)
+
+    def get(self, coach_id: uuid.UUID) -> domain.Roster:
+        with self._store.lock:
+            count = len(self._store.trainees.get(coach_id, ()))
+        return domain.Roster(coach_id, count)
+
+    def list_trainees(
+        self, coach_id: uuid.UUID, limit: int, after: uuid.UUID | None = None
+    ) -> list[domain.RosterEntry]:
+        with self._store.lock:
+            links = dict(self._store.trainees.get(coach_id, {}))
+            ids = heapq.nsmallest(
+                limit, (i for i in links if after is None or i > after)
+            )
+            return [self._entry(coach_id, i, links[i]) for i in ids]
+
+    def list_coaches(
+        self, trainee_id: uuid.UUID, limit: int, after: uuid.UUID | None = None
+    ) -> list[domain.RosterEntry]:
+        with self._store.lock:
+            links = dict(self._store.coaches.get(trainee_id, {}))
+            ids = heapq.nsmallest(
+                limit, (i for i in links if after is None or i > after)
+            )
+            return [self._entry(i, trainee_id, links[i]) for i in ids]
+
+    def get_link(
+        self, coach_id: uuid.UUID, trainee_id: uuid.UUID
+    ) -> domain.RosterEntry | None:
+        with self._store.lock:
+            assigned_at = self._store.trainees.get(coach_id, {}).get(trainee_id)
+            if assigned_at is None:
+                return None
+            return self._entry(coach_id, trainee_id, assigned_at)
+
+    def has_trainee(self, coach_id: uuid.UUID, trainee_id: uuid.UUID) -> bool:
+        with self._store.lock:
+            return (coach_id, trainee_id) in self._store.accepted
+
+    def collect_events(self) -> Iterable[DomainEvent]:
+        heap, self.__events = self.__events, []
+        return heap
+
+    @property
+    def lock(self) -> threading.Lock:
+        return self._store.lock
+
+    def apply(self) -> None:
+        store = self._store
+        for roster, event in self._staged:
+            trainees = store.trainees.setdefault(roster.id, {})
+            if isinstance(event, events.TraineeAccepted):
+                if event.trainee_id in trainees:
+                    store.accepted.setdefault((roster.id, event.trainee_id), event.at)
+                continue
+            for trainee_id in event.trainee_ids:
+                if isinstance(event, events.TraineesAssigned):
+                    trainees.setdefault(trainee_id, event.at)
+                    coaches = store.coaches.setdefault(trainee_id, {})
+                    coaches.setdefault(roster.id, event.at)
+                elif trainees.pop(trainee_id, None) is not None:
+                    del store.coaches[trainee_id][roster.id]
+                    store.accepted.pop((roster.id, trainee_id), None)
+            roster.trainee_count = len(trainees)
+        self._staged.clear()
+
+    def rollback(self) -> None:
+        self._staged.clear()
+
+    def _entry(
+        self, coach_id: uuid.UUID, trainee_id: uuid.UUID, assigned_at: datetime
+    ) -> domain.RosterEntry:
+        accepted_at = self._store.accepted.get((coach_id, trainee_id))
+        return domain.RosterEntry(coach_id, trainee_id, assigned_at, accepted_at)
+
+
+class Roster(Base, TimeMixin):
+    """Trainee count of a coach, kept by the changes of their roster."""
+
+    __tablename__ = "rosters"
+
+    coach_id: Mapped[uuid.UUID] = mapped_column(primary_key=True)
+    trainee_count: Mapped[int] = mapped_column(
+        sa.BigInteger(), default=0, server_default="0"
+    )
+
+
+class RosterLink(Base):
+    __tablename__ = "coach_trainees"
+    __table_args__ = (
+        # Primary key serves trainees of a coach, this one coaches of a
+        # trainee. Both are in keyset order of the other id
+        sa.Index("ix_coach_trainees_trainee_id_coach_id", "trainee_id", "coach_id"),
+    )
+
+    coach_id: Mapped[uuid.UUID] = mapped_column(primary_key=True)
+    trainee_id: Mapped[uuid.UUID] = mapped_column(primary_key=True)
+    assigned_at: Mapped[datetime] = mapped_column(TZDateTime())
+    # Empty while the trainee hasn't accepted the coach
+    accepted_at: Mapped[datetime | None] = mapped_column(TZDateTime(), nullable=True)
+
+
+GET_COUNT = sa.select(Roster.trainee_count).where(
+    Roster.coach_id == sa.bindparam("coach_id")
+)
+
+_LINK_COLUMNS = (
+    RosterLink.coach_id,
+    RosterLink.trainee_id,
+    RosterLink.assigned_at,
+    RosterLink.accepted_at,
+)
+
+GET_LINK = sa.select(*_LINK_COLUMNS).where(
+    (RosterLink.coach_id == sa.bindparam("coach_id"))
+    & (RosterLink.trainee_id == sa.bindparam("trainee_id"))
+)
+
+HAS_TRAINEE = sa.select(RosterLink.trainee_id).where(
+    (RosterLink.coach_id == sa.bindparam("coach_id"))
+    & (RosterLink.trainee_id == sa.bindparam("trainee_id"))
+    & RosterLink.accepted_at.is_not(None)
+)
+
+LIST_TRAINEES = (
+    sa.select(*_LINK_COLUMNS)
+    .where(RosterLink.coach_id == sa.bindparam("coach_id"))
+    .order_by(RosterLink.trainee_id)
+    .limit(sa.bindparam("limit"))
+)
+
+LIST_TRAINEES_AFTER = LIST_TRAINEES.where(
+    RosterLink.trainee_id > sa.bindparam("after_id", type_=sa.Uuid())
+)
+
+LIST_COACHES = (
+    sa.select(*_LINK_COLUMNS)
+    .where(RosterLink.trainee_id == sa.bindparam("trainee_id"))
+    .order_by(RosterLink.coach_id)
+    .limit(sa.bindparam("limit"))
+)
+
+LIST_COACHES_AFTER = LIST_COACHES.where(
+    RosterLink.coach_id > sa.bindparam("after_id", type_=sa.Uuid())
+)
+
+
+# Bound names differ from column names, update statements reserve those
+ACCEPT = (
+    sa.update(RosterLink)
+    .where(
+        (RosterLink.coach_id == sa.bindparam("link_coach_id"))
+        & (RosterLink.trainee_id == sa.bindparam("link_trainee_id"))
+        & RosterLink.accepted_at.is_(None)
+    )
+    .values(accepted_at=sa.bindparam("now"))
+    .execution_options(synchronize_session=False)
+)
+
+
+def _trainee_ids(dialect: str) -> sa.ColumnElement:
+    # Ids of a change are a single bound array, the statement is the same
+    # for any number of them
+    if dialect == "postgresql":
+        ids = sa.bindparam("trainee_ids", type_=postgresql.ARRAY(sa.Uuid()))
+        return sa.func.unnest(ids).column_valued("trainee_id")
+    ids = sa.bindparam("trainee_ids", type_=sa.String())
+    return sa.func.json_each(ids).table_valued("value").c.value
+
+
+def _trainee_ids_param(dialect: str, trainee_ids: Sequence[uuid.UUID]):
+    if dialect == "postgresql":
+        return list(trainee_ids)
+    # SQLite stores ids as hex strings
+    return json.dumps([trainee_id.hex for trainee_id in trainee_ids])
+
+
+def _assign(dialect: str):
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    select = sa.select(
+        sa.bindparam("coach_id", type_=sa.Uuid()),
+        _trainee_ids(dialect),
+        sa.bindparam("now", type_=TZDateTime()),
+    )
+    # WHERE tells SQLite the ON CONFLICT belongs to the INSERT. Statements
+    # are of the tables, ORM bulk inserts take no SELECT
+    return (
+        insert(RosterLink.__table__)
+        .from_select(["coach_id", "trainee_id", "assigned_at"], select.where(sa.true()))
+        .on_conflict_do_nothing()
+    )
+
+
+def _accept_params(event: events.TraineeAccepted) -> dict:
+    return {
+        "link_coach_id": event.coach_id,
+        "link_trainee_id": event.trainee_id,
+        "now": event.at,
+    }
+
+
+def _unassign(dialect: str):
+    return sa.delete(RosterLink.__table__).where(
+        (RosterLink.coach_id == sa.bindparam("coach_id"))
+        & RosterLink.trainee_id.in_(sa.select(_trainee_ids(dialect)))
+    )
+
+
+def _count(dialect: str):
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    statement = insert(Roster.__table__).values(
+        coach_id=sa.bindparam("coach_id"), trainee_count=sa.bindparam("delta")
+    )
+    return statement.on_conflict_do_update(
+        index_elements=[Roster.coach_id],
+        set_={
+            "trainee_count": Roster.trainee_count + statement.excluded.trainee_count,
+            "updated_at": sa.func.now(),
+        },
+    ).returning(Roster.trainee_count)
+
+
+def _to_domain(row: sa.Row) -> domain.RosterEntry:
+    return domain.RosterEntry(
+        coach_id=row.coach_id,
+        trainee_id=row.trainee_id,
+        assigned_at=row.assigned_at,
+        accepted_at=row.accepted_at,
+    )
@@ -0,0 +1,10 @@
+from .models import LinkNotFound, Roster, RosterEntry, RosterError
+
+__all__ = [
+    "models",
+    "events",
+    "Roster",
+    "RosterEntry",
+    "RosterError",
+    "LinkNotFound",
+]
@@ -0,0 +1,22 @@
+import uuid
+from dataclasses import dataclass
+
+from common.domain import DomainEvent
+
+
+@dataclass(frozen=True)
+class TraineesAssigned(DomainEvent):
+    coach_id: uuid.UUID
+    trainee_ids: tuple[uuid.UUID, ...]
+
+
+@dataclass(frozen=True)
+class TraineesUnassigned(DomainEvent):
+    coach_id: uuid.UUID
+    trainee_ids: tuple[uuid.UUID, ...]
+
+
+@dataclass(frozen=True)
+class TraineeAccepted(DomainEvent):
+    coach_id: uuid.UUID
+    trainee_id: uuid.UUID
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable
+
+from common.domain import Aggregate, DomainError
+
+from . import events
+
+__all__ = ["Roster", "RosterEntry", "RosterError", "LinkNotFound"]
+
+
+class RosterError(DomainError):
+    pass
+
+
+class LinkNotFound(RosterError):
+    pass
+
+
+class Roster(Aggregate[uuid.UUID]):
+    """Trainees of a coach, by the coach's id.
+
+    Trainees themselves are never loaded, a coach may have hundreds of
+    thousands of them. Changes are events applied by the repository with
+    set-based statements, which keep ``trainee_count`` up to date.
+
+    Assigned trainees are pending until they accept the coach, only
+    accepted links let the coach see their data. Pending ones are
+    counted as well.
+    """
+
+    # Trainees of a single change, larger ones go in several requests
+    MAX_BATCH = 10_000
+
+    def __init__(self, coach_id: uuid.UUID, trainee_count: int = 0) -> None:
+        super().__init__(coach_id)
+        self.trainee_count = trainee_count
+
+    def assign(self, trainee_ids: Iterable[uuid.UUID]) -> None:
+        trainee_ids = self._batch(trainee_ids)
+        if self.id in trainee_ids:
+            raise RosterError("Coach can't be their own trainee")
+        self.push_event(events.TraineesAssigned(self.now(), self.id, trainee_ids))
+
+    def accept(self, trainee_id: uuid.UUID) -> None:
+        self.push_event(events.TraineeAccepted(self.now(), self.id, trainee_id))
+
+    def unassign(self, trainee_ids: Iterable[uuid.UUID]) -> None:
+        trainee_ids = self._batch(trainee_ids)
+        self.push_event(events.TraineesUnassigned(self.now(), self.id, trainee_ids))
+
+    def _batch(self, trainee_ids: Iterable[uuid.UUID]) -> tuple[uuid.UUID, ...]:
+        # Sorted, concurrent changes lock links in the same order
+        unique = tuple(sorted(set(trainee_ids)))
+        if len(unique) > self.MAX_BATCH:
+            raise RosterError(f"At most {self.MAX_BATCH} trainees can change at once")
+        return unique
+
+
+@dataclass(frozen=True)
+class RosterEntry:
+    """Link of a coach and a trainee."""
+
+    coach_id: uuid.UUID
+    trainee_id: uuid.UUID
+    assigned_at: datetime
+    # Empty while the trainee hasn't accepted the coach
+    accepted_at: datetime | None = None
+
+    @property
+    def accepted(self) -> bool:
+        return self.accepted_at is not None
@@ -0,0 +1,8 @@
+from .uow import RosterUnitOfWork, SQLRosterUnitOfWork, InMemoryRosterUnitOfWork
+
+__all__ = [
+    "RosterUnitOfWork",
+    "SQLRosterUnitOfWork",
+    "InMemoryRosterUnitOfWork",
+    "roster",
+]
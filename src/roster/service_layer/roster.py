@@ -0,0 +1,142 @@
+import uuid
+from typing import Iterable
+
+from auth.domain import UserKind
+from auth.service_layer import UserUnitOfWork
+from auth.service_layer.auth import AccessTokenClaims, PermissionDenied
+from roster.domain import LinkNotFound, Roster, RosterEntry, RosterError
+
+from .uow import RosterUnitOfWork
+
+__all__ = [
+    "PermissionDenied",
+    "assign_trainees",
+    "unassign_trainees",
+    "list_trainees",
+    "list_coaches",
+    "accept_coach",
+    "leave_coach",
+]
+
+# Ids of users which are not trainees named by the error at most
+MAX_REPORTED = 10
+
+
+def assign_trainees(
+    uow: RosterUnitOfWork,
+    users: UserUnitOfWork,
+    claims: AccessTokenClaims,
+    coach_id: uuid.UUID,
+    trainee_ids: Iterable[uuid.UUID],
+) -> Roster:
+    """Adds trainees to the roster of the coach, assigned ones are skipped.
+
+    Every id must be of a trainee. New links are pending until the
+    trainee accepts the coach.
+    """
+    _check_coach(claims, coach_id)
+    trainee_ids = set(trainee_ids)
+    with users:
+        kinds = users.user_repo.kinds(trainee_ids)
+    others = sorted(i for i in trainee_ids if kinds.get(i) != UserKind.TRAINEE)
+    if others:
+        named = ", ".join(str(i) for i in others[:MAX_REPORTED])
+        raise RosterError(f"Not trainees: {named}")
+
+    with uow:
+        roster = uow.roster_repo.get(coach_id)
+        roster.assign(trainee_ids)
+        uow.roster_repo.persist(roster)
+        uow.commit()
+    return roster
+
+
+def unassign_trainees(
+    uow: RosterUnitOfWork,
+    claims: AccessTokenClaims,
+    coach_id: uuid.UUID,
+    trainee_ids: Iterable[uuid.UUID],
+) -> Roster:
+    _check_coach(claims, coach_id)
+    with uow:
+        roster = uow.roster_repo.get(coach_id)
+        roster.unassign(trainee_ids)
+        uow.roster_repo.persist(roster)
+        uow.commit()
+    return roster
+
+
+def list_trainees(
+    uow: RosterUnitOfWork,
+    claims: AccessTokenClaims,
+    coach_id: uuid.UUID,
+    limit: int,
+    after: uuid.UUID | None = None,
+) -> tuple[Roster, list[RosterEntry]]:
+    _check_coach(claims, coach_id)
+    with uow:
+        roster = uow.roster_repo.get(coach_id)
+        return roster, uow.roster_repo.list_trainees(coach_id, limit, after)
+
+
+def list_coaches(
+    uow: RosterUnitOfWork,
+    claims: AccessTokenClaims,
+    trainee_id: uuid.UUID,
+    limit: int,
+    after: uuid.UUID | None = None,
+) -> list[RosterEntry]:
+    _check_trainee(claims, trainee_id)
+    with uow:
+        return uow.roster_repo.list_coaches(trainee_id, limit, after)
+
+
+def accept_coach(
+    uow: RosterUnitOfWork,
+    claims: AccessTokenClaims,
+    trainee_id: uuid.UUID,
+    coach_id: uuid.UUID,
+) -> RosterEntry:
+    """Accepts the coach who assigned the trainee, letting them see the data."""
+    _check_trainee(claims, trainee_id)
+    with uow:
+        link = uow.roster_repo.get_link(coach_id, trainee_id)
+        if link is None:
+            raise LinkNotFound("Coach hasn't assigned the trainee")
+        if link.accepted:
+            return link
+        roster = uow.roster_repo.get(coach_id)
+        roster.accept(trainee_id)
+        uow.roster_repo.persist(roster)
+        uow.commit()
+        # Read back for the time it was accepted at
+        link = uow.roster_repo.get_link(coach_id, trainee_id)
+    if link is None:
+        raise LinkNotFound("Coach has unassigned the trainee")
+    return link
+
+
+def leave_coach(
+    uow: RosterUnitOfWork,
+    claims: AccessTokenClaims,
+    trainee_id: uuid.UUID,
+    coach_id: uuid.UUID,
+) -> None:
+    """Removes the trainee from the roster of the coach, pending or not."""
+    _check_trainee(claims, trainee_id)
+    with uow:
+        roster = uow.roster_repo.get(coach_id)
+        roster.unassign([trainee_id])
+        uow.roster_repo.persist(roster)
+        uow.commit()
+
+
+def _check_coach(claims: AccessTokenClaims, coach_id: uuid.UUID) -> None:
+    # Tokens issued before kind was added to claims expire soon enough
+    if claims.kind != UserKind.COACH or claims.user_id != coach_id:
+        raise PermissionDenied("Only the coach can manage their roster")
+
+
+def _check_trainee(claims: AccessTokenClaims, trainee_id: uuid.UUID) -> None:
+    if claims.user_id != trainee_id:
+        raise PermissionDenied("Only the trainee can manage their coaches")
@@ -0,0 +1,51 @@
+import abc
+import functools
+from typing import cast
+
+from sqlalchemy.orm import Session, sessionmaker
+
+from common import (
+    AbstractMessageBus,
+    AbstractUnitOfWork,
+    InMemoryUnitOfWork,
+    SQLUnitOfWork,
+)
+from common.breaker import CircuitBreaker
+from roster.adapter.repository import (
+    AbstractRosterRepository,
+    InMemoryRosterRepository,
+    RosterRepository,
+    RosterStore,
+)
+
+
+class RosterUnitOfWork(AbstractUnitOfWork):
+    @property
+    @abc.abstractmethod
+    def roster_repo(self) -> AbstractRosterRepository:
+        pass
+
+
+class SQLRosterUnitOfWork(SQLUnitOfWork, RosterUnitOfWork):
+    def __init__(
+        self,
+        bus: AbstractMessageBus,
+        sessionmaker_: sessionmaker[Session],
+        breaker: CircuitBreaker | None = None,
+    ):
+        super().__init__(bus, sessionmaker_, [RosterRepository], breaker)
+
+    @property
+    def roster_repo(self) -> RosterRepository:
+        return cast(RosterRepository, self._repositories[RosterRepository])
+
+
+class InMemoryRosterUnitOfWork(InMemoryUnitOfWork, RosterUnitOfWork):
+    def __init__(self, bus: AbstractMessageBus, store: RosterStore):
+        super().__init__(bus, [functools.partial(InMemoryRosterRepository, store)])
+
+    @property
+    def roster_repo(self) -> InMemoryRosterRepository:
+        return cast(
+            InMemoryRosterRepository, self._repositories[InMemoryRosterRepository]
+        )
@@ -0,0 +1,65 @@
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+
+from auth.adapter.repository import UserStore
+from auth.service_layer import InMemoryUserUnitOfWork, SQLUserUnitOfWork
+from common.sql import Base
+from common import MessageBus
+from roster.adapter.repository import RosterStore
+from roster.service_layer import InMemoryRosterUnitOfWork
+
+
+class Clock:
+    """Clock of tests, moved forward by hand."""
+
+    def __init__(self, now: float = 1_200_000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock() -> Clock:
+    return Clock()
+
+
+@pytest.fixture
+def bus() -> MessageBus:
+    return MessageBus()
+
+
+@pytest.fixture
+def user_store() -> UserStore:
+    return UserStore()
+
+
+@pytest.fixture
+def users(bus: MessageBus, user_store: UserStore) -> InMemoryUserUnitOfWork:
+    return InMemoryUserUnitOfWork(bus, user_store)
+
+
+@pytest.fixture
+def engine(tmp_path) -> sa.Engine:
+    # SQLite stands in for Postgres, statements of the repositories are
+    # portable apart from searches and bulk copies
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'health.sqlite'}")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def sql_users(bus: MessageBus, engine: sa.Engine) -> SQLUserUnitOfWork:
+    return SQLUserUnitOfWork(
+        bus, sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    )
+
+
+@pytest.fixture
+def rosters(bus: MessageBus) -> InMemoryRosterUnitOfWork:
+    return InMemoryRosterUnitOfWork(bus, RosterStore())
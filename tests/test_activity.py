@@ -0,0 +1,96 @@
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from activity.domain import UserActivity
+from activity.store import InMemoryActivityStore, SQLActivityStore
+from activity.tracker import ActivityTracker
+
+
+class FlakyStore(InMemoryActivityStore):
+    def __init__(self, failures: int = 0) -> None:
+        super().__init__()
+        self.failures = failures
+
+    def add(self, activities) -> None:
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Database is down")
+        super().add(activities)
+
+
+def tracker(store, clock, max_users: int = 100) -> ActivityTracker:
+    return ActivityTracker(lambda: store, 60, max_users, 120, clock)
+
+
+def at(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+def test_requests_of_a_user_are_coalesced(clock):
+    store = InMemoryActivityStore()
+    activity = tracker(store, clock)
+    user_id, started = uuid.uuid4(), clock()
+    for _ in range(3):
+        activity.touch(user_id)
+        clock.advance(5)
+
+    assert activity.flush() == 1
+    assert activity.flush() == 0
+    assert store.get(user_id) == UserActivity(user_id, at(started + 10), 3)
+
+
+def test_flushes_add_to_stored_activity(clock):
+    store = InMemoryActivityStore()
+    activity = tracker(store, clock)
+    user_id = uuid.uuid4()
+    activity.touch(user_id)
+    activity.flush()
+    clock.advance(30)
+    activity.touch(user_id)
+    activity.flush()
+
+    assert store.get(user_id) == UserActivity(user_id, at(clock()), 2)
+
+
+def test_failed_flush_merges_back_with_new_requests(clock):
+    store = FlakyStore(failures=1)
+    activity = tracker(store, clock)
+    first, second = uuid.uuid4(), uuid.uuid4()
+    activity.touch(first)
+    activity.touch(first)
+
+    with pytest.raises(ConnectionError):
+        activity.flush()
+    clock.advance(10)
+    activity.touch(first)
+    activity.touch(second)
+
+    assert activity.flush() == 2
+    assert store.get(first) == UserActivity(first, at(clock()), 3)
+    assert store.get(second).requests == 1
+
+
+def test_users_beyond_twice_the_limit_are_not_counted(clock):
+    store = InMemoryActivityStore()
+    activity = tracker(store, clock, max_users=1)
+    known, other, dropped = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    activity.touch(known)
+    activity.touch(other)
+    activity.touch(dropped)
+    activity.touch(known)
+
+    assert activity.flush() == 2
+    assert store.get(known).requests == 2
+    assert store.get(dropped) is None
+
+
+def test_sql_store_keeps_the_latest_last_seen(engine, clock):
+    store = SQLActivityStore(engine)
+    user_id = uuid.uuid4()
+    store.add([UserActivity(user_id, at(clock() + 60), 2)])
+    # Flush of a worker behind the others
+    store.add([UserActivity(user_id, at(clock()), 3)])
+
+    assert store.get(user_id) == UserActivity(user_id, at(clock() + 60), 5)
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from health.admission import (
+    AdmissionControlMiddleware,
+    GradientLimit,
+    RouteClass,
+    classify,
+)
+
+
+@pytest.mark.parametrize(
+    "method, path, route_class",
+    [
+        ("GET", "/users/me", RouteClass.READ),
+        ("HEAD", "/users/me", RouteClass.READ),
+        ("POST", "/auth/refresh", RouteClass.REFRESH),
+        ("POST", "/auth/login", RouteClass.LOGIN),
+        ("POST", "/users/1b4e28ba", RouteClass.CREATE),
+        ("POST", "/users/1b4e28ba/measurements", RouteClass.WRITE),
+        ("DELETE", "/users/1b4e28ba", RouteClass.WRITE),
+        ("GET", "/metrics", None),
+        ("POST", "/admin/config/reload", None),
+    ],
+)
+def test_classify(method, path, route_class):
+    assert classify(method, path) is route_class
+
+
+def test_limit_doesnt_grow_when_idle():
+    limit = GradientLimit(initial=10, min_limit=1, max_limit=100)
+    for _ in range(50):
+        limit.update(RouteClass.READ, 0.01, inflight=1)
+
+    assert limit.limit == 10
+
+
+def test_limit_grows_when_saturated_without_queueing():
+    limit = GradientLimit(initial=10, min_limit=1, max_limit=100)
+    for _ in range(50):
+        limit.update(RouteClass.READ, 0.01, inflight=10)
+
+    assert limit.limit > 10
+
+
+def test_limit_shrinks_when_latency_grows():
+    limit = GradientLimit(initial=20, min_limit=2, max_limit=100)
+    limit.update(RouteClass.READ, 0.01, inflight=20)
+    for _ in range(50):
+        limit.update(RouteClass.READ, 0.1, inflight=20)
+
+    assert 2 <= limit.limit < 10
+
+
+def test_slow_route_class_doesnt_look_like_queueing():
+    limit = GradientLimit(initial=10, min_limit=1, max_limit=100)
+    for _ in range(50):
+        limit.update(RouteClass.LOGIN, 0.2, inflight=10)
+        limit.update(RouteClass.READ, 0.01, inflight=10)
+
+    assert limit.limit > 10
+
+
+def test_failures_back_off_down_to_min_limit():
+    limit = GradientLimit(initial=10, min_limit=4, max_limit=100, backoff=0.5)
+    limit.on_failure()
+    assert limit.limit == 5
+    limit.on_failure()
+    assert limit.limit == 4
+
+
+def client(limit: GradientLimit, caps: dict[RouteClass, int]) -> TestClient:
+    def ok(request):
+        return PlainTextResponse("ok")
+
+    app = Starlette(routes=[Route("/{path:path}", ok, methods=["GET", "POST"])])
+    return TestClient(AdmissionControlMiddleware(app, limit, caps))
+
+
+def test_requests_over_class_cap_are_rejected():
+    http = client(GradientLimit(10, 1, 100), {RouteClass.LOGIN: 0})
+
+    response = http.post("/auth/login")
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+    assert http.get("/users/me").status_code == 200
+
+
+def test_low_priority_requests_are_shed_first():
+    # Three requests in flight, login and create may use three of four
+    async def run() -> list[int]:
+        release = asyncio.Event()
+
+        async def app(scope, receive, send):
+            await release.wait()
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        middleware = AdmissionControlMiddleware(app, GradientLimit(4, 4, 4), {})
+
+        async def request(method: str, path: str) -> int:
+            statuses = list[int]()
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    statuses.append(message["status"])
+
+            scope = {"type": "http", "method": method, "path": path}
+            await middleware(scope, None, send)
+            return statuses[0]
+
+        held = [asyncio.create_task(request("GET", "/users/me")) for _ in range(3)]
+        await asyncio.sleep(0)
+        shed = await request("POST", "/auth/login")
+        admitted = asyncio.create_task(request("POST", "/auth/refresh"))
+        await asyncio.sleep(0)
+        release.set()
+        return [shed, await admitted, *await asyncio.gather(*held)]
+
+    assert asyncio.run(run()) == [503, 200, 200, 200, 200]
@@ -0,0 +1,120 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from audit.domain import AuditAction, AuditEvent
+from audit.store import InMemoryAuditStore, SQLAuditStore
+from audit.writer import AuditWriter
+
+USER_ID = uuid.uuid4()
+START = datetime(2026, 10, 19, tzinfo=timezone.utc)
+
+
+def events(count: int) -> list[AuditEvent]:
+    return [
+        AuditEvent(AuditAction.LOGIN, START + timedelta(seconds=i), user_id=USER_ID)
+        for i in range(count)
+    ]
+
+
+class RecordingStore(InMemoryAuditStore):
+    def __init__(self, failures: int = 0) -> None:
+        super().__init__()
+        self.batches = list[int]()
+        self.failures = failures
+
+    def append(self, events) -> None:
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Database is down")
+        self.batches.append(len(events))
+        super().append(events)
+
+
+def writer(store, **kw) -> AuditWriter:
+    options = dict(buffer_size=10, batch_size=4, flush_interval=60) | kw
+    return AuditWriter(lambda: store, **options)
+
+
+def test_flush_appends_batches_in_order():
+    store = RecordingStore()
+    audit = writer(store)
+    written = events(10)
+    for event in written:
+        assert audit.write(event)
+
+    assert audit.flush() == 10
+    assert store.batches == [4, 4, 2]
+    assert store.history(USER_ID, 20) == written[::-1]
+
+
+def test_full_buffer_drops_new_events():
+    store = RecordingStore()
+    audit = writer(store, buffer_size=2, overflow="drop_new")
+    results = [audit.write(event) for event in events(3)]
+
+    assert results == [True, True, False]
+    assert audit.flush() == 2
+
+
+def test_full_buffer_blocks_writers_until_timeout():
+    audit = writer(RecordingStore(), buffer_size=2, block_timeout=0.05)
+    audit.write(events(1)[0])
+    audit.write(events(1)[0])
+
+    started = time.perf_counter()
+    assert not audit.write(events(1)[0])
+    assert time.perf_counter() - started >= 0.05
+
+
+def test_flush_makes_room_for_blocked_writers():
+    audit = writer(RecordingStore(), buffer_size=2, block_timeout=5)
+    first, second, third = events(3)
+    audit.write(first)
+    audit.write(second)
+
+    threading.Timer(0.05, audit.flush).start()
+    assert audit.write(third)
+    assert audit.flush() == 1
+
+
+def test_failed_flush_puts_events_back_in_order():
+    store = RecordingStore(failures=1)
+    audit = writer(store)
+    written = events(6)
+    for event in written:
+        audit.write(event)
+
+    with pytest.raises(ConnectionError):
+        audit.flush()
+    assert audit.flush() == 6
+    assert store.history(USER_ID, 20) == written[::-1]
+
+
+def test_writer_thread_flushes_full_batches_and_the_rest_on_stop():
+    store = RecordingStore()
+    audit = writer(store)
+    audit.start()
+    for event in events(5):
+        audit.write(event)
+
+    deadline = time.monotonic() + 1
+    while not store.batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    audit.stop()
+
+    assert store.batches[0] == 4
+    assert sum(store.batches) == 5
+
+
+def test_sql_store_pages_history(engine):
+    store = SQLAuditStore(engine)
+    written = events(5)
+    store.append(written)
+
+    page = store.history(USER_ID, 3)
+    rest = store.history(USER_ID, 3, (page[-1].at, page[-1].event_id))
+    assert page + rest == written[::-1]
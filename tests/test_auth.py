@@ -0,0 +1,133 @@
+import uuid
+
+import pytest
+
+from auth.domain import User, UserKind
+from auth.service_layer import auth
+
+SECRET = "secret"
+
+
+def create(users, email: str = "john@example.com", **kw) -> User:
+    return auth.create_user(
+        users,
+        kw.get("user_id", uuid.uuid4()),
+        kw.get("kind", UserKind.TRAINEE),
+        email,
+        "password",
+        "John",
+        "Doe",
+    )
+
+
+def test_create_user_stores_the_user(users):
+    user = create(users, email=" John@Example.com ")
+
+    with users:
+        stored = users.user_repo.get(user.id)
+    assert stored.email == "john@example.com"
+    assert stored.kind == UserKind.TRAINEE
+
+
+def test_create_user_rejects_taken_email(users):
+    create(users)
+
+    with pytest.raises(auth.UserAlreadyExistsError):
+        create(users, email="JOHN@example.com")
+
+
+def test_create_user_rejects_taken_id(users):
+    user = create(users)
+
+    with pytest.raises(auth.UserAlreadyExistsError):
+        create(users, email="jane@example.com", user_id=user.id)
+
+
+def test_login_issues_tokens_of_a_session(users):
+    user = create(users)
+
+    tokens = auth.login("john@example.com", "password", users, SECRET)
+
+    claims = auth.validate_token(tokens.access_token, SECRET)
+    assert tokens.user_id == user.id
+    assert claims.user_id == user.id
+    assert claims.kind == UserKind.TRAINEE
+    with users:
+        sessions = users.user_repo.list_sessions(user.id, 10)
+    assert [s.authorization_id for s in sessions] == [claims.session_id]
+
+
+def test_login_rejects_unknown_user(users):
+    with pytest.raises(auth.InvalidCredentials) as e:
+        auth.login("nobody@example.com", "password", users, SECRET)
+    assert e.value.reason == "unknown_user"
+
+
+def test_login_rejects_wrong_password(users):
+    user = create(users)
+
+    with pytest.raises(auth.InvalidCredentials) as e:
+        auth.login("john@example.com", "wrong", users, SECRET)
+    assert (e.value.user_id, e.value.reason) == (user.id, "invalid_password")
+
+
+def test_failed_logins_lock_the_user(users):
+    create(users)
+    for _ in range(User.LOCKOUT_THRESHOLD):
+        with pytest.raises(auth.InvalidCredentials):
+            auth.login("john@example.com", "wrong", users, SECRET)
+
+    # Locked users are rejected whatever the password
+    with pytest.raises(auth.UserLocked) as e:
+        auth.login("john@example.com", "password", users, SECRET)
+    assert e.value.reason == "locked"
+    assert e.value.locked_until > User.now()
+
+
+def test_successful_login_resets_failed_logins(users):
+    user = create(users)
+    for _ in range(User.LOCKOUT_THRESHOLD - 1):
+        with pytest.raises(auth.InvalidCredentials):
+            auth.login("john@example.com", "wrong", users, SECRET)
+
+    auth.login("john@example.com", "password", users, SECRET)
+
+    with users:
+        assert users.user_repo.get(user.id).failed_logins == 0
+
+
+def test_refresh_issues_access_token_of_the_session(users):
+    user = create(users)
+    tokens = auth.login("john@example.com", "password", users, SECRET)
+
+    refreshed = auth.refresh(tokens.refresh_token, users, SECRET)
+
+    claims = auth.validate_token(refreshed.access_token, SECRET)
+    assert refreshed.refresh_token == tokens.refresh_token
+    assert claims.user_id == user.id
+    assert (
+        claims.session_id == auth.validate_token(tokens.access_token, SECRET).session_id
+    )
+
+
+def test_refresh_rejects_logged_out_session(users):
+    user = create(users)
+    tokens = auth.login("john@example.com", "password", users, SECRET)
+    with users:
+        users.user_repo.logout_all(user.id)
+        users.commit()
+
+    with pytest.raises(auth.InvalidCredentials):
+        auth.refresh(tokens.refresh_token, users, SECRET)
+
+
+@pytest.mark.parametrize("backend", ["users", "sql_users"])
+def test_email_lookup_ignores_case(request, backend):
+    uow = request.getfixturevalue(backend)
+    user = create(uow, email="John.Doe@Example.com")
+
+    with uow:
+        assert uow.user_repo.get_by_email(" JOHN.DOE@example.COM ").id == user.id
+        assert uow.user_repo.get_by_email("jane.doe@example.com") is None
+    tokens = auth.login("john.doe@EXAMPLE.com", "password", uow, SECRET)
+    assert tokens.user_id == user.id
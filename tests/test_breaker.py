@@ -0,0 +1,114 @@
+import pytest
+
+from common.breaker import CircuitBreaker, CircuitOpenError, CircuitState
+
+
+@pytest.fixture
+def breaker(clock) -> CircuitBreaker:
+    return CircuitBreaker(
+        "db",
+        window=10.0,
+        min_calls=4,
+        failure_rate=0.5,
+        slow_call_duration=1.0,
+        slow_call_rate=0.8,
+        open_duration=5.0,
+        trial_calls=2,
+        clock=clock,
+    )
+
+
+def fail(breaker: CircuitBreaker, times: int) -> None:
+    for _ in range(times):
+        breaker.allow()
+        breaker.record(0.01, failed=True)
+
+
+def test_breaker_stays_closed_below_min_calls(breaker):
+    fail(breaker, 3)
+
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_breaker_stays_closed_below_failure_rate(breaker):
+    fail(breaker, 1)
+    for _ in range(4):
+        breaker.record(0.01)
+
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_failures_open_the_breaker(breaker, clock):
+    fail(breaker, 4)
+
+    assert breaker.state == CircuitState.OPEN
+    clock.advance(2)
+    with pytest.raises(CircuitOpenError) as e:
+        breaker.allow()
+    assert e.value.retry_after == pytest.approx(3)
+
+
+def test_slow_calls_open_the_breaker(breaker):
+    for _ in range(4):
+        breaker.record(1.5)
+
+    assert breaker.state == CircuitState.OPEN
+
+
+def test_outcomes_leave_the_window(breaker, clock):
+    fail(breaker, 3)
+    clock.advance(11)
+    breaker.record(0.01, failed=True)
+
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_successful_trials_close_the_breaker(breaker, clock):
+    fail(breaker, 4)
+    clock.advance(5)
+
+    breaker.allow()
+    breaker.allow()
+    assert breaker.state == CircuitState.HALF_OPEN
+    # Trials are limited while they are running
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+    breaker.record(0.01)
+    breaker.record(0.01)
+    assert breaker.state == CircuitState.CLOSED
+    breaker.allow()
+
+
+def test_failed_trial_opens_the_breaker_again(breaker, clock):
+    fail(breaker, 4)
+    clock.advance(5)
+    breaker.allow()
+
+    breaker.record(0.01, failed=True)
+
+    assert breaker.state == CircuitState.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+
+def test_stuck_trials_are_replaced(breaker, clock):
+    fail(breaker, 4)
+    clock.advance(5)
+    breaker.allow()
+    breaker.allow()
+
+    clock.advance(5)
+    breaker.allow()
+
+    assert breaker.state == CircuitState.HALF_OPEN
+
+
+def test_check_takes_no_trial(breaker, clock):
+    fail(breaker, 4)
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    clock.advance(5)
+    breaker.check()
+    assert breaker.state == CircuitState.OPEN
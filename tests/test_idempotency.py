@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+import pytest
+
+from common.idempotency import (
+    Idempotency,
+    IdempotencyCache,
+    InMemoryIdempotencyStore,
+    KeyInProgressError,
+    KeyMismatchError,
+)
+
+
+@pytest.fixture
+def store() -> InMemoryIdempotencyStore:
+    return InMemoryIdempotencyStore()
+
+
+@pytest.fixture
+def idempotency(store) -> Idempotency:
+    return Idempotency(
+        store, IdempotencyCache(100), timedelta(hours=1), timedelta(seconds=30)
+    )
+
+
+def test_completed_request_is_replayed(idempotency):
+    assert idempotency.begin("key", "request") is None
+    idempotency.complete("key", "request", 201, b'{"id": 1}')
+
+    record = idempotency.begin("key", "request")
+
+    assert (record.status_code, record.body) == (201, b'{"id": 1}')
+
+
+def test_replay_comes_from_the_store_without_the_cache(store):
+    first = Idempotency(
+        store, IdempotencyCache(0), timedelta(hours=1), timedelta(seconds=30)
+    )
+    first.begin("key", "request")
+    first.complete("key", "request", 201, b"body")
+
+    # Another worker, with nothing cached
+    other = Idempotency(
+        store, IdempotencyCache(100), timedelta(hours=1), timedelta(seconds=30)
+    )
+    assert other.begin("key", "request").body == b"body"
+
+
+def test_request_in_progress_is_not_repeated(idempotency):
+    idempotency.begin("key", "request")
+
+    with pytest.raises(KeyInProgressError):
+        idempotency.begin("key", "request")
+
+
+def test_key_of_another_request_is_rejected(idempotency):
+    idempotency.begin("key", "request")
+    idempotency.complete("key", "request", 201, b"body")
+
+    with pytest.raises(KeyMismatchError):
+        idempotency.begin("key", "other request")
+
+
+def test_released_key_is_claimed_again(idempotency):
+    idempotency.begin("key", "request")
+    idempotency.release("key")
+
+    assert idempotency.begin("key", "request") is None
+
+
+def test_completing_released_key_is_ignored(store):
+    store.claim("key", "request", timedelta(hours=1), timedelta(seconds=30))
+    store.release("key")
+
+    store.complete("key", 201, b"body")
+
+    assert store.claim("key", "request", timedelta(hours=1), timedelta(0)) is None
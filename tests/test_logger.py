@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+from loguru import logger
+
+from health.logger import QueueSink
+
+
+class SlowStream:
+    """Stream taking a while for every write."""
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.lines = list[str]()
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def write(self, text: str) -> None:
+        self.entered.set()
+        self.release.wait()
+        time.sleep(self.delay)
+        self.lines.extend(text.splitlines())
+
+    def flush(self) -> None:
+        pass
+
+
+def message(record: dict) -> str:
+    return record["message"] + "\n"
+
+
+@pytest.fixture
+def log():
+    # Records of the test only, whatever else is logged meanwhile
+    handlers = []
+
+    def add(sink: QueueSink):
+        handlers.append(
+            logger.add(sink, format="{message}", filter=lambda r: "test" in r["extra"])
+        )
+        return logger.bind(test=True)
+
+    yield add
+    for handler in handlers:
+        logger.remove(handler)
+
+
+def test_logging_doesnt_wait_for_the_writer(log):
+    stream = SlowStream(delay=0.05)
+    sink = QueueSink(stream, message)
+    test_logger = log(sink)
+
+    started = time.perf_counter()
+    for i in range(10):
+        test_logger.info(f"record {i}")
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.05
+    sink.drain()
+    assert stream.lines == [f"record {i}" for i in range(10)]
+
+
+@pytest.mark.parametrize(
+    "overflow, kept",
+    [("drop_new", ["record 1", "record 2"]), ("drop_oldest", ["record 4", "record 5"])],
+)
+def test_full_queue_drops_records(log, overflow, kept):
+    stream = SlowStream()
+    stream.release.clear()
+    sink = QueueSink(stream, message, maxsize=2, overflow=overflow)
+    test_logger = log(sink)
+
+    # Writer holds the first record, the queue fills up behind it
+    test_logger.info("record 0")
+    assert stream.entered.wait(1.0)
+    for i in range(1, 6):
+        test_logger.info(f"record {i}")
+    stream.release.set()
+    sink.drain()
+
+    assert stream.lines == ["record 0", *kept]
+
+
+def test_drain_gives_up_after_timeout():
+    stream = SlowStream()
+    stream.release.clear()
+    sink = QueueSink(stream, message)
+    sink.write(type("Message", (), {"record": {"message": "stuck"}}))
+
+    started = time.perf_counter()
+    sink.drain(timeout=0.05)
+
+    assert 0.05 <= time.perf_counter() - started < 0.5
+    stream.release.set()
+    sink.stop()
@@ -0,0 +1,69 @@
+import pytest
+
+from common.metrics import Counter, Gauge, Histogram, Metric, Registry, render_text
+
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+
+def test_metric_without_render_cant_be_created(registry):
+    class Partial(Metric):
+        kind = "untyped"
+
+        def _new_child(self):
+            return object()
+
+    with pytest.raises(TypeError):
+        Partial("partial", "Partial metric", registry=registry)
+
+
+def test_render_counter_and_gauge(registry):
+    requests = Counter("requests_total", "Requests", ["method"], registry=registry)
+    requests.inc(1, "GET")
+    requests.inc(2, "GET")
+    requests.inc(0.5, 'P"O\\ST')
+    Gauge("pool_size", "Pool size", registry=registry).set(4)
+
+    assert render_text(registry).splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{method="GET"} 3',
+        'requests_total{method="P\\"O\\\\ST"} 0.5',
+        "# HELP pool_size Pool size",
+        "# TYPE pool_size gauge",
+        "pool_size 4",
+    ]
+
+
+def test_render_gauge_function(registry):
+    gauge = Gauge("shard_up", "Shard is up", ["shard"], registry=registry)
+    gauge.set_function(lambda: [(("0",), 1), (("1",), 0)])
+
+    assert render_text(registry).splitlines()[2:] == [
+        'shard_up{shard="0"} 1',
+        'shard_up{shard="1"} 0',
+    ]
+
+
+def test_render_histogram_buckets_are_cumulative(registry):
+    latency = Histogram(
+        "latency_seconds", "Latency", ["route"], buckets=[1, 0.1], registry=registry
+    )
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value, "/")
+
+    assert render_text(registry).splitlines()[2:] == [
+        'latency_seconds_bucket{route="/",le="0.1"} 2',
+        'latency_seconds_bucket{route="/",le="1"} 3',
+        'latency_seconds_bucket{route="/",le="+Inf"} 4',
+        'latency_seconds_sum{route="/"} 3.65',
+        'latency_seconds_count{route="/"} 4',
+    ]
+
+
+def test_registering_a_name_twice_fails(registry):
+    Counter("requests_total", "Requests", registry=registry)
+    with pytest.raises(ValueError):
+        Gauge("requests_total", "Requests", registry=registry)
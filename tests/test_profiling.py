@@ -0,0 +1,92 @@
+import pstats
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from health.profiling import (
+    Profiler,
+    ProfilingMiddleware,
+    profile_endpoints,
+    sign_profile_header,
+)
+
+SECRET = "secret"
+
+
+def scope(path: str = "/users/me", header: str | None = None) -> dict:
+    headers = [] if header is None else [(b"x-profile", header.encode())]
+    return {"type": "http", "method": "GET", "path": path, "headers": headers}
+
+
+@pytest.fixture
+def profiler(tmp_path) -> Profiler:
+    return Profiler(tmp_path, header_secret=SECRET)
+
+
+def test_signed_header_triggers_profiling(profiler):
+    assert profiler.trigger(scope(header=sign_profile_header(SECRET))) == "header"
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        sign_profile_header("other"),
+        sign_profile_header(SECRET, ttl=-10),
+        "4102444800.forged",
+        "not a header",
+    ],
+)
+def test_invalid_header_is_ignored(profiler, header):
+    assert profiler.trigger(scope(header=header)) is None
+
+
+def test_header_is_ignored_without_secret(tmp_path):
+    profiler = Profiler(tmp_path)
+
+    assert profiler.trigger(scope(header=sign_profile_header(SECRET))) is None
+
+
+def test_armed_path_is_profiled_a_number_of_times(profiler):
+    profiler.arm("/users", 2)
+
+    assert profiler.trigger(scope("/coaches/me")) is None
+    assert profiler.trigger(scope("/users/me")) == "admin"
+    assert profiler.trigger(scope("/users/me/sessions")) == "admin"
+    assert profiler.trigger(scope("/users/me")) is None
+
+
+def test_every_nth_request_is_sampled(tmp_path):
+    profiler = Profiler(tmp_path, sample_every=3)
+
+    assert [profiler.trigger(scope()) for _ in range(6)] == [
+        None,
+        None,
+        "sample",
+        None,
+        None,
+        "sample",
+    ]
+
+
+def test_profile_of_the_endpoint_is_written(profiler, tmp_path):
+    app = FastAPI()
+
+    @app.get("/users/me")
+    def me() -> dict:
+        return {"sum": sum(range(1000))}
+
+    profile_endpoints(app)
+    client = TestClient(ProfilingMiddleware(app, profiler))
+
+    assert client.get("/users/me").status_code == 200
+    assert list(tmp_path.iterdir()) == []
+
+    response = client.get(
+        "/users/me", headers={"X-Profile": sign_profile_header(SECRET)}
+    )
+    assert response.json() == {"sum": 499500}
+    [profile] = tmp_path.iterdir()
+    assert profile.suffix == ".prof"
+    functions = {name for _, _, name in pstats.Stats(str(profile)).stats}
+    assert "me" in functions
@@ -0,0 +1,69 @@
+import pytest
+
+from common.ratelimit import (
+    InMemoryCounterStore,
+    Rate,
+    SlidingWindowLimiter,
+    SQLiteCounterStore,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryCounterStore()
+    return SQLiteCounterStore(tmp_path / "counters.sqlite")
+
+
+@pytest.fixture
+def limiter(store, clock) -> SlidingWindowLimiter:
+    # Clock starts at the beginning of a window
+    return SlidingWindowLimiter("login", Rate(limit=5, period=60), store, clock)
+
+
+def test_hits_over_the_limit_are_rejected(limiter):
+    decisions = [limiter.hit("alice") for _ in range(6)]
+
+    assert [d.allowed for d in decisions] == [True] * 5 + [False]
+    assert [d.remaining for d in decisions[:5]] == [4, 3, 2, 1, 0]
+    assert decisions[-1].retry_after > 0
+
+
+def test_keys_are_limited_apart(limiter):
+    for _ in range(5):
+        limiter.hit("alice")
+
+    assert limiter.hit("bob").allowed
+    assert not limiter.hit("alice").allowed
+
+
+def test_rejected_hits_are_not_counted(limiter, clock):
+    for _ in range(5):
+        limiter.hit("alice")
+    for _ in range(20):
+        limiter.hit("alice")
+
+    # Hits of the previous window weigh by their overlap with the sliding one
+    clock.advance(60 + 60 * 0.4)
+    assert [limiter.hit("alice").allowed for _ in range(3)] == [True, True, False]
+
+
+def test_window_slides_past_old_hits(limiter, clock):
+    for _ in range(5):
+        limiter.hit("alice")
+
+    clock.advance(120)
+
+    assert all(limiter.hit("alice").allowed for _ in range(5))
+
+
+def test_retry_after_is_when_a_hit_is_allowed(limiter, clock):
+    for _ in range(5):
+        limiter.hit("alice")
+    clock.advance(30)
+
+    decision = limiter.hit("alice")
+    assert not decision.allowed
+
+    clock.advance(decision.retry_after + 0.01)
+    assert limiter.hit("alice").allowed
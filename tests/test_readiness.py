@@ -0,0 +1,69 @@
+import time
+
+import pytest
+import sqlalchemy as sa
+
+from health.readiness import DatabaseProbe, warm_up_pool
+
+
+def counting_engine(url: str) -> tuple[sa.Engine, list[str]]:
+    engine = sa.create_engine(url)
+    pings = list[str]()
+    sa.event.listen(
+        engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: pings.append(statement),
+    )
+    return engine, pings
+
+
+@pytest.fixture
+def database(tmp_path):
+    engine, pings = counting_engine(f"sqlite:///{tmp_path / 'health.sqlite'}")
+    yield engine, pings
+    engine.dispose()
+
+
+def test_probe_result_is_reused_until_it_expires(database):
+    engine, pings = database
+    probe = DatabaseProbe([engine], ttl=0.05)
+
+    assert all(probe.check() for _ in range(10))
+    assert len(pings) == 1
+
+    time.sleep(0.06)
+    assert probe.check()
+    assert len(pings) == 2
+
+
+def test_probe_fails_when_any_database_is_down(database, tmp_path):
+    engine, _ = database
+    down = sa.create_engine(f"sqlite:///{tmp_path / 'missing' / 'health.sqlite'}")
+    probe = DatabaseProbe([engine, down], ttl=60)
+
+    assert not probe.check()
+    assert not probe.check()
+
+
+def test_concurrent_probe_gets_the_last_result(database):
+    engine, pings = database
+    probe = DatabaseProbe([engine], ttl=0)
+    assert probe.check()
+
+    # Another probe is running
+    with probe._lock:
+        assert probe.check()
+    assert len(pings) == 1
+
+
+def test_warm_up_opens_pool_connections(tmp_path):
+    engine = sa.create_engine(
+        f"sqlite:///{tmp_path / 'health.sqlite'}",
+        poolclass=sa.QueuePool,
+        pool_size=3,
+    )
+
+    warm_up_pool(engine, 5)
+
+    assert engine.pool.checkedin() == 3
+    engine.dispose()
@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+import pytest
+import yaml
+
+from health.config import Config
+from health.reload import ReloadRejectedError, plan_reload, read_config
+
+SETTINGS = {
+    "db": {
+        "host": "localhost",
+        "database": "health",
+        "username": "health",
+        "password": "health",
+        "sslmode": "disable",
+    },
+    "app": {"secret": "secret"},
+    "log": {},
+}
+
+
+def config(**sections: dict) -> Config:
+    return Config.model_validate(
+        {
+            section: {**SETTINGS.get(section, {}), **sections.get(section, {})}
+            for section in SETTINGS.keys() | sections.keys()
+        }
+    )
+
+
+def test_unchanged_config_has_nothing_to_apply():
+    plan = plan_reload(config(), config())
+
+    assert plan.applied == plan.pending_restart == plan.rejected == []
+    assert plan.config == config()
+
+
+def test_settings_are_sorted_by_how_they_apply():
+    old = config()
+    new = config(
+        db={"pool_size": 20, "host": "elsewhere"},
+        app={"port": 9090, "readiness_ttl": 5},
+        log={"level": "debug"},
+    )
+
+    plan = plan_reload(old, new)
+
+    assert plan.applied == ["app.readiness_ttl", "db.pool_size", "log.level"]
+    assert plan.pending_restart == ["app.port"]
+    assert plan.rejected == ["db.host"]
+    assert plan.changed("db.pool_size")
+    assert plan.changed("log.*")
+    assert not plan.changed("app.port")
+
+
+def test_config_only_takes_applied_settings():
+    old = config()
+    plan = plan_reload(old, config(db={"pool_size": 20}, app={"port": 9090}))
+
+    assert plan.config.db.pool_size == 20
+    assert plan.config.app.port == old.app.port
+    assert old.db.pool_size == 5
+
+
+def test_pool_settings_wait_for_restart_with_shards():
+    shards = [{"database": "shard", "username": "u", "password": "p", "host": "h"}]
+    old = config(db={"shards": shards})
+
+    plan = plan_reload(old, config(db={"shards": shards, "pool_size": 20}))
+
+    assert plan.applied == []
+    assert plan.pending_restart == ["db.pool_size"]
+
+
+def test_read_config_rejects_the_whole_reload(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text(
+        yaml.safe_dump(
+            {**SETTINGS, "app": {"secret": "other"}, "log": {"level": "debug"}}
+        )
+    )
+    app = SimpleNamespace(config=config(), config_path=path)
+
+    with pytest.raises(ReloadRejectedError, match="app.secret"):
+        read_config(app)
+
+
+def test_read_config_without_file_is_rejected():
+    with pytest.raises(ReloadRejectedError):
+        read_config(SimpleNamespace(config=config(), config_path=None))
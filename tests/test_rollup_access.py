@@ -0,0 +1,112 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from health.app import init_app
+from health.config import Config
+
+ROLLUPS = {"kind": "heart_rate", "since": "2026-10-12", "until": "2026-10-18"}
+
+
+@pytest.fixture
+def client():
+    config = Config.model_validate(
+        {
+            "db": {
+                "host": "localhost",
+                "database": "health",
+                "username": "health",
+                "password": "health",
+                "sslmode": "disable",
+                "backend": "memory",
+            },
+            "app": {"secret": "secret"},
+            "log": {},
+            "rate_limit": {"enabled": False},
+            "audit": {"enabled": False},
+            "activity": {"enabled": False},
+        }
+    )
+    with TestClient(init_app(config)) as client:
+        yield client
+
+
+def sign_up(client: TestClient, kind: str) -> tuple[uuid.UUID, dict[str, str]]:
+    user_id = uuid.uuid4()
+    email = f"{user_id}@example.com"
+    client.post(
+        f"/users/{user_id}",
+        json={
+            "kind": kind,
+            "email": email,
+            "first_name": "A",
+            "last_name": "B",
+            "password": "password",
+        },
+    )
+    tokens = client.post(
+        "/users/auth/login", data={"username": email, "password": "password"}
+    ).json()
+    return user_id, {"Authorization": f"Bearer {tokens['access_token']}"}
+
+
+def rollups_of(client: TestClient, trainee_id: uuid.UUID, headers: dict) -> int:
+    response = client.get(
+        f"/measurements/trainees/{trainee_id}/rollups",
+        params=ROLLUPS,
+        headers=headers,
+    )
+    return response.status_code
+
+
+def test_trainee_reads_their_rollups(client):
+    trainee, headers = sign_up(client, "trainee")
+
+    assert rollups_of(client, trainee, headers) == 200
+
+
+def test_unlinked_coach_is_forbidden(client):
+    trainee, _ = sign_up(client, "trainee")
+    _, coach_headers = sign_up(client, "coach")
+
+    assert rollups_of(client, trainee, coach_headers) == 403
+
+
+def test_self_assigned_coach_is_forbidden(client):
+    trainee, _ = sign_up(client, "trainee")
+    coach, coach_headers = sign_up(client, "coach")
+    assigned = client.post(
+        f"/coaches/{coach}/trainees",
+        json={"trainee_ids": [str(trainee)]},
+        headers=coach_headers,
+    )
+    assert assigned.status_code == 200
+
+    assert rollups_of(client, trainee, coach_headers) == 403
+
+
+def test_accepted_coach_reads_rollups(client):
+    trainee, trainee_headers = sign_up(client, "trainee")
+    coach, coach_headers = sign_up(client, "coach")
+    client.post(
+        f"/coaches/{coach}/trainees",
+        json={"trainee_ids": [str(trainee)]},
+        headers=coach_headers,
+    )
+    accepted = client.post(
+        f"/trainees/{trainee}/coaches/{coach}/accept", headers=trainee_headers
+    )
+    assert accepted.status_code == 200
+
+    assert rollups_of(client, trainee, coach_headers) == 200
+
+    client.post(f"/trainees/{trainee}/coaches/{coach}/leave", headers=trainee_headers)
+    assert rollups_of(client, trainee, coach_headers) == 403
+
+
+def test_other_trainee_is_forbidden(client):
+    trainee, _ = sign_up(client, "trainee")
+    _, other_headers = sign_up(client, "trainee")
+
+    assert rollups_of(client, trainee, other_headers) == 403
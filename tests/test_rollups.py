@@ -0,0 +1,80 @@
+import uuid
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from measurements.domain import MeasurementKind, SampleSlice, Tier, rollups
+
+HEART_RATE, STEPS = MeasurementKind.HEART_RATE, MeasurementKind.STEPS
+
+
+def slice_of(samples: dict[tuple[uuid.UUID, int], list[float]]) -> SampleSlice:
+    trainee_ids = sorted({trainee_id for trainee_id, _ in samples})
+    positions = {trainee_id: i for i, trainee_id in enumerate(trainee_ids)}
+    sliced = SampleSlice(trainee_ids=trainee_ids)
+    # Interleaved, as rows come from storage
+    entries = [(key, value) for key, values in samples.items() for value in values]
+    for (trainee_id, kind), value in entries[::2] + entries[1::2]:
+        sliced.trainees.append(positions[trainee_id])
+        sliced.kinds.append(kind)
+        sliced.values.append(value)
+    return sliced
+
+
+def test_compute_days_reduces_each_trainee_and_kind():
+    rng = np.random.default_rng(7)
+    samples = {
+        (uuid.uuid4(), kind): rng.uniform(40, 200, size).tolist()
+        for kind, size in [(HEART_RATE, 1), (HEART_RATE, 10), (STEPS, 333)]
+    }
+    day = date(2026, 10, 14)
+
+    computed = rollups.compute_days(slice_of(samples), day)
+
+    assert len(computed) == 3
+    for rollup in computed:
+        values = samples[(rollup.trainee_id, rollup.kind)]
+        assert (rollup.tier, rollup.start, rollup.trend) == (Tier.DAY, day, None)
+        assert rollup.count == len(values)
+        assert rollup.total == pytest.approx(sum(values))
+        assert rollup.mean == pytest.approx(np.mean(values))
+        assert (rollup.minimum, rollup.maximum) == (min(values), max(values))
+        assert rollup.p50 == pytest.approx(np.percentile(values, 50))
+        assert rollup.p90 == pytest.approx(np.percentile(values, 90))
+
+
+def test_compute_days_of_no_samples():
+    assert rollups.compute_days(SampleSlice(), date(2026, 10, 14)) == []
+
+
+def test_compute_weeks_takes_percentiles_of_samples():
+    trainee_id, week = uuid.uuid4(), date(2026, 10, 12)
+    # Days of very different sizes, weighting daily percentiles is off
+    by_day = [[60.0] * 9 + [200.0], [100.0, 110.0, 120.0]]
+    days = [
+        rollup
+        for offset, values in enumerate(by_day)
+        for rollup in rollups.compute_days(
+            slice_of({(trainee_id, HEART_RATE): values}), week + timedelta(offset)
+        )
+    ]
+
+    (computed,) = rollups.compute_weeks(
+        slice_of({(trainee_id, HEART_RATE): sum(by_day, [])}), week, days
+    )
+
+    values = sum(by_day, [])
+    assert (computed.tier, computed.start, computed.count) == (Tier.WEEK, week, 13)
+    assert computed.p50 == pytest.approx(np.percentile(values, 50))
+    assert computed.p90 == pytest.approx(np.percentile(values, 90))
+    assert computed.trend == pytest.approx(days[1].mean - days[0].mean)
+
+
+def test_trend_needs_two_days():
+    trainee_id = uuid.uuid4()
+    (day,) = rollups.compute_days(
+        slice_of({(trainee_id, HEART_RATE): [60.0]}), date(2026, 10, 14)
+    )
+
+    assert rollups.trend([day]) is None
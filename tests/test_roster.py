@@ -0,0 +1,159 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from auth.domain import UserKind
+from auth.service_layer import auth
+from auth.service_layer.auth import AccessTokenClaims
+from roster.domain import LinkNotFound, RosterError
+from roster.service_layer import roster
+
+
+def claims_of(user_id: uuid.UUID, kind: UserKind) -> AccessTokenClaims:
+    now = datetime.now(timezone.utc)
+    return AccessTokenClaims(
+        user_id=user_id,
+        kind=kind,
+        issued_at=now,
+        expires_at=now + timedelta(minutes=5),
+        email=f"{user_id}@example.com",
+        first_name="A",
+        last_name="B",
+    )
+
+
+def create(users, kind: UserKind) -> uuid.UUID:
+    user_id = uuid.uuid4()
+    auth.create_user(users, user_id, kind, f"{user_id}@example.com", "pw", "A", "B")
+    return user_id
+
+
+@pytest.fixture
+def coach(users) -> uuid.UUID:
+    return create(users, UserKind.COACH)
+
+
+@pytest.fixture
+def trainees(users) -> list[uuid.UUID]:
+    return [create(users, UserKind.TRAINEE) for _ in range(25)]
+
+
+def assign(rosters, users, coach, trainee_ids):
+    claims = claims_of(coach, UserKind.COACH)
+    return roster.assign_trainees(rosters, users, claims, coach, trainee_ids)
+
+
+def test_assigning_counts_new_trainees_only(rosters, users, coach, trainees):
+    assert assign(rosters, users, coach, trainees[:10]).trainee_count == 10
+
+    changed = assign(rosters, users, coach, trainees[5:15] + trainees[5:8])
+
+    assert changed.trainee_count == 15
+
+
+def test_unassigning_counts_removed_trainees_only(rosters, users, coach, trainees):
+    assign(rosters, users, coach, trainees)
+    claims = claims_of(coach, UserKind.COACH)
+
+    changed = roster.unassign_trainees(
+        rosters, claims, coach, trainees[:5] + [uuid.uuid4()]
+    )
+
+    assert changed.trainee_count == 20
+    found, _ = roster.list_trainees(rosters, claims, coach, 1)
+    assert found.trainee_count == 20
+
+
+def test_trainees_are_listed_in_keyset_pages(rosters, users, coach, trainees):
+    assign(rosters, users, coach, trainees)
+    claims = claims_of(coach, UserKind.COACH)
+
+    pages, after = [], None
+    while True:
+        _, page = roster.list_trainees(rosters, claims, coach, 10, after)
+        pages.append([entry.trainee_id for entry in page])
+        if len(page) < 10:
+            break
+        after = page[-1].trainee_id
+
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert sum(pages, []) == sorted(trainees)
+
+
+def test_coaches_of_a_trainee_are_listed_in_pages(rosters, users, trainees):
+    coaches = sorted(create(users, UserKind.COACH) for _ in range(3))
+    for coach in coaches:
+        assign(rosters, users, coach, trainees[:1])
+    claims = claims_of(trainees[0], UserKind.TRAINEE)
+
+    first = roster.list_coaches(rosters, claims, trainees[0], 2)
+    rest = roster.list_coaches(rosters, claims, trainees[0], 2, first[-1].coach_id)
+
+    assert [entry.coach_id for entry in first + rest] == coaches
+
+
+def test_only_trainees_can_be_assigned(rosters, users, coach, trainees):
+    other_coach = create(users, UserKind.COACH)
+    unknown = uuid.uuid4()
+
+    for trainee_ids in ([unknown], [other_coach], [coach]):
+        with pytest.raises(RosterError):
+            assign(rosters, users, coach, trainees[:1] + trainee_ids)
+
+    with rosters:
+        assert rosters.roster_repo.get(coach).trainee_count == 0
+
+
+def test_only_the_coach_manages_their_roster(rosters, users, coach, trainees):
+    with pytest.raises(roster.PermissionDenied):
+        roster.assign_trainees(
+            rosters,
+            users,
+            claims_of(trainees[0], UserKind.TRAINEE),
+            coach,
+            trainees[1:2],
+        )
+
+
+def test_links_are_pending_until_accepted(rosters, users, coach, trainees):
+    assign(rosters, users, coach, trainees[:2])
+    claims = claims_of(trainees[0], UserKind.TRAINEE)
+
+    (pending,) = roster.list_coaches(rosters, claims, trainees[0], 10)
+    assert not pending.accepted
+
+    accepted = roster.accept_coach(rosters, claims, trainees[0], coach)
+    assert accepted.accepted_at is not None
+
+    with rosters:
+        assert rosters.roster_repo.get_link(coach, trainees[0]).accepted
+        assert not rosters.roster_repo.get_link(coach, trainees[1]).accepted
+
+
+def test_only_the_trainee_accepts_their_coach(rosters, users, coach, trainees):
+    assign(rosters, users, coach, trainees[:1])
+
+    with pytest.raises(roster.PermissionDenied):
+        roster.accept_coach(
+            rosters, claims_of(coach, UserKind.COACH), trainees[0], coach
+        )
+
+
+def test_unassigned_coach_cant_be_accepted(rosters, users, coach, trainees):
+    with pytest.raises(LinkNotFound):
+        roster.accept_coach(
+            rosters, claims_of(trainees[0], UserKind.TRAINEE), trainees[0], coach
+        )
+
+
+def test_trainee_leaves_the_roster(rosters, users, coach, trainees):
+    assign(rosters, users, coach, trainees[:2])
+    claims = claims_of(trainees[0], UserKind.TRAINEE)
+    roster.accept_coach(rosters, claims, trainees[0], coach)
+
+    roster.leave_coach(rosters, claims, trainees[0], coach)
+
+    assert roster.list_coaches(rosters, claims, trainees[0], 10) == []
+    with rosters:
+        assert rosters.roster_repo.get(coach).trainee_count == 1
@@ -0,0 +1,92 @@
+import uuid
+from datetime import timedelta
+
+import pytest
+
+from auth.domain import UserKind
+from auth.service_layer import auth
+from auth.service_layer.revocation import RevocationCache
+
+SECRET = "secret"
+
+
+@pytest.fixture(params=["users", "sql_users"])
+def uow(request):
+    return request.getfixturevalue(request.param)
+
+
+def sign_in(uow, times: int) -> tuple[uuid.UUID, list[uuid.UUID]]:
+    user = auth.create_user(
+        uow,
+        uuid.uuid4(),
+        UserKind.TRAINEE,
+        "john@example.com",
+        "password",
+        "John",
+        "Doe",
+    )
+    sessions = [
+        auth.validate_token(
+            auth.login("john@example.com", "password", uow, SECRET).access_token,
+            SECRET,
+        ).session_id
+        for _ in range(times)
+    ]
+    return user.id, sessions
+
+
+def test_sessions_are_paged_newest_first(uow):
+    user_id, _ = sign_in(uow, 5)
+
+    pages, after = list[list[uuid.UUID]](), None
+    while True:
+        page = auth.list_sessions(uow, user_id, 2, after)
+        if not page:
+            break
+        pages.append([s.authorization_id for s in page])
+        after = (page[-1].created_at, page[-1].authorization_id)
+
+    everything = auth.list_sessions(uow, user_id, 10)
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert sum(pages, []) == [s.authorization_id for s in everything]
+    assert [s.created_at for s in everything] == sorted(
+        (s.created_at for s in everything), reverse=True
+    )
+
+
+def test_logged_out_sessions_are_not_listed(uow):
+    revocations = RevocationCache(timedelta(minutes=5))
+    user_id, sessions = sign_in(uow, 2)
+
+    assert auth.logout(uow, revocations, user_id, sessions[0])
+    assert not auth.logout(uow, revocations, user_id, sessions[0])
+
+    listed = auth.list_sessions(uow, user_id, 10)
+    assert [s.authorization_id for s in listed] == [sessions[1]]
+    assert revocations.is_revoked(sessions[0])
+
+
+def test_logout_all_revokes_every_active_session(uow):
+    revocations = RevocationCache(timedelta(minutes=5))
+    user_id, sessions = sign_in(uow, 3)
+    auth.logout(uow, revocations, user_id, sessions[0])
+
+    revoked = auth.logout_all(uow, revocations, user_id)
+
+    assert sorted(revoked) == sorted(sessions[1:])
+    assert all(revocations.is_revoked(session) for session in sessions)
+    assert auth.list_sessions(uow, user_id, 10) == []
+    assert auth.logout_all(uow, revocations, user_id) == []
+
+
+def test_logout_all_leaves_other_users_signed_in(uow):
+    revocations = RevocationCache(timedelta(minutes=5))
+    user_id, _ = sign_in(uow, 1)
+    other = auth.create_user(
+        uow, uuid.uuid4(), UserKind.COACH, "jane@example.com", "password", "J", "D"
+    )
+    auth.login("jane@example.com", "password", uow, SECRET)
+
+    auth.logout_all(uow, revocations, user_id)
+
+    assert len(auth.list_sessions(uow, other.id, 10)) == 1
@@ -0,0 +1,157 @@
+import uuid
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+
+from auth.adapter.repository import Authorization, User
+from auth.adapter.sharding import SlotMover, UserDirectoryEntry
+from auth.domain import UserKind
+from auth.service_layer import ShardedUserUnitOfWork, SQLUserUnitOfWork, auth
+from common import AbstractMessageBus
+from common.sharding import (
+    SLOTS,
+    ShardSet,
+    ShardSlot,
+    SlotFrozenError,
+    SlotMap,
+    slot_of,
+    slot_of_tagged,
+    tagged_id,
+)
+from common.sql import Base
+
+SECRET = "secret"
+
+
+@pytest.fixture
+def shards(tmp_path) -> ShardSet:
+    engines = []
+    for index in range(2):
+        engine = sa.create_engine(f"sqlite:///{tmp_path / f'shard{index}.sqlite'}")
+        Base.metadata.create_all(engine)
+        engines.append(engine)
+    shards = ShardSet(engines)
+    shards.refresh()
+    yield shards
+    for engine in engines:
+        engine.dispose()
+
+
+def uow(shards: ShardSet) -> ShardedUserUnitOfWork:
+    return ShardedUserUnitOfWork(AbstractMessageBus(), shards)
+
+
+def create(uow, email: str, user_id: uuid.UUID | None = None) -> uuid.UUID:
+    user = auth.create_user(
+        uow, user_id or uuid.uuid4(), UserKind.TRAINEE, email, "password", "J", "D"
+    )
+    return user.id
+
+
+def count(engine: sa.Engine, model) -> int:
+    with engine.connect() as conn:
+        return conn.execute(sa.select(sa.func.count()).select_from(model)).scalar()
+
+
+def assign(shards: ShardSet, slots, shard: int, frozen: bool = False) -> None:
+    with shards.engines[0].begin() as conn:
+        conn.execute(
+            sa.insert(ShardSlot),
+            [{"slot": slot, "shard": shard, "frozen": frozen} for slot in slots],
+        )
+    shards.refresh()
+
+
+@pytest.mark.parametrize("slot", [0, 1, 513, SLOTS - 1])
+def test_tagged_id_carries_its_slot(slot):
+    id_ = tagged_id(slot)
+
+    assert id_.version == 8
+    assert slot_of_tagged(id_) == slot
+    assert tagged_id(slot) != id_
+
+
+def test_untagged_ids_have_no_slot():
+    assert slot_of_tagged(uuid.uuid4()) is None
+
+
+def test_slots_are_stable_and_spread():
+    keys = [uuid.uuid4() for _ in range(2000)]
+
+    assert [slot_of(key) for key in keys] == [slot_of(key) for key in keys]
+    assert all(0 <= slot_of(key) < SLOTS for key in keys)
+    assert len({slot_of(key) for key in keys}) > SLOTS // 2
+
+
+def test_unassigned_slots_stay_on_first_shard():
+    slots = SlotMap(2, {7: 1})
+
+    assert slots.shard_of_slot(7) == 1
+    assert slots.shard_of_slot(8) == 0
+
+
+def test_users_are_routed_to_the_shard_of_their_slot(shards):
+    assign(shards, range(0, SLOTS, 2), 1)
+    user_ids = [create(uow(shards), f"user{i}@example.com") for i in range(20)]
+
+    for user_id in user_ids:
+        owner = shards.engines[1 - slot_of(user_id) % 2]
+        with owner.connect() as conn:
+            assert conn.execute(sa.select(User).filter_by(user_id=user_id)).first()
+    assert count(shards.engines[0], UserDirectoryEntry) == 20
+    assert count(shards.engines[1], UserDirectoryEntry) == 0
+
+
+def test_authorizations_lead_to_the_shard_of_their_user(shards):
+    assign(shards, range(SLOTS), 1)
+    user_id = create(uow(shards), "john@example.com")
+
+    tokens = auth.login("JOHN@example.com", "password", uow(shards), SECRET)
+
+    claims = auth.decode_refresh_token(tokens.refresh_token, SECRET)
+    assert tokens.user_id == user_id
+    assert slot_of_tagged(claims.authorization_id) == slot_of(user_id)
+    assert auth.refresh(tokens.refresh_token, uow(shards), SECRET).user_id == user_id
+
+
+def test_frozen_slots_reject_writes(shards):
+    user_id = create(uow(shards), "john@example.com")
+    assign(shards, [slot_of(user_id)], 0, frozen=True)
+
+    with pytest.raises(SlotFrozenError):
+        auth.login("john@example.com", "password", uow(shards), SECRET)
+    with uow(shards) as reads:
+        assert reads.user_repo.get(user_id) is not None
+
+
+def test_mover_moves_users_with_their_sessions(shards):
+    user_ids = [create(uow(shards), f"user{i}@example.com") for i in range(10)]
+    tokens = auth.login("user0@example.com", "password", uow(shards), SECRET)
+
+    moved = SlotMover(shards, settle=0, batch_size=3).move(range(SLOTS), 1)
+
+    assert moved == 10
+    assert count(shards.engines[0], User) == 0
+    assert count(shards.engines[0], Authorization) == 0
+    assert count(shards.engines[1], User) == 10
+    assert (
+        auth.refresh(tokens.refresh_token, uow(shards), SECRET).user_id == (user_ids[0])
+    )
+
+
+def test_mover_prepares_users_written_before_sharding(shards):
+    single = SQLUserUnitOfWork(
+        AbstractMessageBus(), sessionmaker(shards.engines[0], expire_on_commit=False)
+    )
+    user_id = create(single, "John@example.com")
+    with shards.engines[0].begin() as conn:
+        conn.execute(sa.update(User).values(slot=None))
+
+    mover = SlotMover(shards, settle=0)
+    mover.prepare()
+    mover.move([slot_of(user_id)], 1)
+
+    tokens = auth.login("john@example.com", "password", uow(shards), SECRET)
+    assert tokens.user_id == user_id
+    assert count(shards.engines[1], User) == 1
@@ -0,0 +1,109 @@
+import threading
+import uuid
+
+import pytest
+
+from auth.domain import User, UserKind
+from auth.domain.events import UserCreated
+from common import ConflictError, InMemoryRepository, InMemoryUnitOfWork, MessageBus
+
+
+def new_user(email: str = "john@example.com") -> User:
+    return User.new(UserKind.TRAINEE, uuid.uuid4(), email, "John", "Doe", "pw")
+
+
+def test_changes_are_visible_after_commit_only(users, bus):
+    user = new_user()
+    with users:
+        users.user_repo.add(user)
+
+    with users:
+        assert users.user_repo.get(user.id) is None
+        users.user_repo.add(user)
+        users.commit()
+
+    with users:
+        assert users.user_repo.get(user.id).email == user.email
+
+
+def test_events_are_published_on_commit(users, bus):
+    published = []
+    bus.subscribe(UserCreated, published.append)
+    user = new_user()
+
+    with users:
+        users.user_repo.add(user)
+        assert published == []
+        users.commit()
+
+    assert [event.user_id for event in published] == [user.id]
+
+
+def test_taken_email_conflicts(users):
+    with users:
+        users.user_repo.add(new_user())
+        users.commit()
+
+    with users:
+        users.user_repo.add(new_user())
+        with pytest.raises(ConflictError):
+            users.commit()
+
+
+class Store:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.items = list[int]()
+
+
+class StagingRepository(InMemoryRepository):
+    fails = False
+
+    def __init__(self, store: Store) -> None:
+        self._store = store
+        self._staged = list[int]()
+
+    @property
+    def lock(self) -> threading.Lock:
+        return self._store.lock
+
+    def add(self, item: int) -> None:
+        self._staged.append(item)
+
+    def persist(self, item: int) -> None:
+        self.add(item)
+
+    def get(self, item_id: int) -> int | None:
+        return item_id if item_id in self._store.items else None
+
+    def collect_events(self):
+        return []
+
+    def check(self) -> None:
+        if self.fails:
+            raise ConflictError("Conflict")
+
+    def apply(self) -> None:
+        self._store.items.extend(self._staged)
+
+    def rollback(self) -> None:
+        self._staged.clear()
+
+
+class FailingRepository(StagingRepository):
+    fails = True
+
+
+def test_conflict_of_one_repository_leaves_the_others_untouched():
+    store = Store()
+    uow = InMemoryUnitOfWork(
+        MessageBus(),
+        [lambda: StagingRepository(store), lambda: FailingRepository(store)],
+    )
+
+    with uow:
+        uow._repositories[StagingRepository].add(1)
+        with pytest.raises(ConflictError):
+            uow.commit()
+
+    assert store.items == []
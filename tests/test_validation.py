@@ -0,0 +1,80 @@
+import math
+import struct
+from datetime import datetime, timezone
+
+import pytest
+
+from measurements.adapter.api.payloads import (
+    PayloadError,
+    parse_binary,
+    parse_ndjson,
+)
+from measurements.domain import MeasurementKind, validate
+
+NOW = datetime(2026, 10, 14, 12, tzinfo=timezone.utc)
+NOW_MS = int(NOW.timestamp() * 1000)
+HEART_RATE, STEPS = MeasurementKind.HEART_RATE, MeasurementKind.STEPS
+
+
+def test_validate_keeps_plausible_samples():
+    validated = validate([(HEART_RATE, NOW_MS, 60.0), (STEPS, NOW_MS - 1, 120)], NOW)
+
+    assert validated.rejected == 0
+    assert list(validated.samples.kinds) == [HEART_RATE, STEPS]
+    assert list(validated.samples.times) == [NOW_MS, NOW_MS - 1]
+    assert list(validated.samples.values) == [60.0, 120.0]
+
+
+@pytest.mark.parametrize(
+    "record, reason",
+    [
+        ((42, NOW_MS, 60.0), "Unknown kind"),
+        ((HEART_RATE, "now", 60.0), "Time is out of range"),
+        ((HEART_RATE, NOW_MS - 31 * 86_400_000, 60.0), "Time is out of range"),
+        ((HEART_RATE, NOW_MS + 6 * 60_000, 60.0), "Time is out of range"),
+        ((HEART_RATE, NOW_MS, 400.0), "Value is out of range"),
+        ((HEART_RATE, NOW_MS, math.nan), "Value is out of range"),
+        ((HEART_RATE, NOW_MS, True), "Value is out of range"),
+        ((HEART_RATE, NOW_MS, "60"), "Value is out of range"),
+    ],
+)
+def test_validate_rejects_implausible_samples(record, reason):
+    validated = validate([(HEART_RATE, NOW_MS, 60.0), record], NOW)
+
+    assert len(validated.samples) == 1
+    assert validated.rejected == 1
+    assert [(r.index, r.reason) for r in validated.rejections] == [(1, reason)]
+
+
+def test_validate_explains_first_rejections_only():
+    validated = validate([(42, NOW_MS, 1.0)] * 50, NOW)
+
+    assert validated.rejected == 50
+    assert len(validated.rejections) == 20
+
+
+def test_ndjson_lines_become_records():
+    body = (
+        b'{"kind": "heart_rate", "at": 1, "value": 72}\n\n'
+        b'{"kind": "nonsense", "at": 2, "value": 3}\n'
+        b"[1, 2]\n"
+    )
+
+    assert parse_ndjson(body) == [
+        (HEART_RATE, 1, 72),
+        (None, 2, 3),
+        (None, None, None),
+    ]
+
+
+def test_malformed_ndjson_line_is_named():
+    with pytest.raises(PayloadError, match="Line 2"):
+        parse_ndjson(b'{"kind": "steps", "at": 1, "value": 3}\n{"kind":\n')
+
+
+def test_binary_records_are_unpacked():
+    body = struct.pack("<Bqd", STEPS, NOW_MS, 120.0) * 2
+
+    assert list(parse_binary(body)) == [(STEPS, NOW_MS, 120.0)] * 2
+    with pytest.raises(PayloadError):
+        parse_binary(body[:-1])